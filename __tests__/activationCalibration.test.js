@@ -0,0 +1,89 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import {
+  buildTinyLlama,
+  describeWithPython,
+  runPythonJson,
+} from "../test-utils/python";
+
+const describeWithTorch = describeWithPython(
+  "torch",
+  "transformers",
+  "tokenizers",
+);
+
+// Calibrate a tiny model, then re-apply the scales to an untouched copy.
+const CALIBRATE_SCRIPT = `
+import copy, json, sys
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+sys.path.insert(0, "scripts")
+from activation_calibration import apply_scales, calibrate, load_calibration_texts
+
+model_dir, data_path = sys.argv[1:3]
+tokenizer = AutoTokenizer.from_pretrained(model_dir)
+model = AutoModelForCausalLM.from_pretrained(model_dir).eval()
+original = copy.deepcopy(model)
+texts = load_calibration_texts(data_path, num_samples=6)
+probe = tokenizer(texts[:2], return_tensors="pt", padding=True)
+with torch.no_grad():
+    before = model(**probe).logits
+    calibration = calibrate(model, tokenizer, texts, int8_fraction=0.25, batch_size=2, max_length=64)
+    after = model(**probe).logits
+    apply_scales(original, calibration["scales"])
+report = calibration["report"]
+errors = report["relative_int4_error"]
+print(json.dumps({
+    "texts": texts,
+    "logits_delta": (after - before).abs().max().item(),
+    "reapplied_delta": max(
+        (a - b).abs().max().item() for a, b in zip(original.state_dict().values(), model.state_dict().values())
+    ),
+    "module_bits": calibration["module_bits"],
+    "int8_modules": report["int8_modules"],
+    "top_errors": sorted(errors, key=errors.get, reverse=True)[: len(report["int8_modules"])],
+    "scaled_groups": report["scaled_groups"],
+}))
+`;
+
+describeWithTorch("activation-aware calibration", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "calibration-"));
+  const modelDir = path.join(tempDir, "model");
+  const dataPath = path.join(tempDir, "sft.jsonl");
+  buildTinyLlama(modelDir);
+  const records = Array.from({ length: 10 }, (_, i) => ({
+    instruction: `w${i} w${i + 3} w${i + 7} w${i + 11}`,
+    context: "",
+    tool_schema: "",
+    expected_tool_call: {
+      tools: [{ name: "web_search", args: { query: `w${i}` } }],
+    },
+    expected_answer: `w${i + 1} w${i + 2}`,
+  }));
+  fs.writeFileSync(
+    dataPath,
+    `${records.map((row) => JSON.stringify(row)).join("\n")}\n`,
+  );
+
+  it("folds scales without changing the model and keeps the most sensitive linears at int8", () => {
+    const result = runPythonJson(["-c", CALIBRATE_SCRIPT, modelDir, dataPath]);
+    // Sampled down to num_samples and rendered with the training template.
+    expect(result.texts).toHaveLength(6);
+    result.texts.forEach((text) => {
+      expect(text.startsWith("[SYSTEM]")).toBe(true);
+      expect(text).toContain("[ASSISTANT]TOOL_CALL:");
+    });
+
+    expect(result.scaled_groups).toBeGreaterThan(0);
+    expect(result.logits_delta).toBeLessThan(1e-4);
+    expect(result.reapplied_delta).toBe(0);
+
+    // 2 layers x 7 linears, a quarter of them (rounded) kept at int8.
+    const bits = Object.values(result.module_bits);
+    expect(bits).toHaveLength(14);
+    expect(bits.filter((value) => value === 8)).toHaveLength(4);
+    expect(bits.filter((value) => value === 4)).toHaveLength(10);
+    expect([...result.top_errors].sort()).toEqual(result.int8_modules);
+  });
+});
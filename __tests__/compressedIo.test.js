@@ -0,0 +1,118 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import zlib from "zlib";
+import { execFileSync } from "child_process";
+
+const event = (overrides) => ({
+  schema_version: "telemetry_v2",
+  timestamp: "2025-01-01T00:00:00Z",
+  prompt_id: "runtime_prompt",
+  prompt_version: "v1",
+  model_id: "model-a",
+  tool_calls: [],
+  retrieval_hits: [],
+  outcome: "success",
+  latency: 0,
+  redaction_applied: false,
+  ...overrides,
+});
+
+const telemetryLines = () => {
+  const events = [];
+  for (let i = 1; i <= 40; i += 1) {
+    const promptHash = `sha256_prompt_${i}`;
+    events.push(
+      event({
+        event_type: "prompt_received",
+        prompt_hash: promptHash,
+        prompt_preview: `Open page ${i} and mail ops@example.com`,
+      }),
+      event({
+        event_type: "tool_invocation",
+        prompt_hash: promptHash,
+        tool_name: "open_url",
+        tool_args_preview: { url: `https://example.com/${i}` },
+        success: true,
+        error: null,
+        latency: 10 * i,
+        latency_ms: 10 * i,
+      }),
+    );
+  }
+  return events.map((row) => `${JSON.stringify(row)}\n`).join("");
+};
+
+const run = (script, args) =>
+  execFileSync("python", [script, ...args], { encoding: "utf-8" });
+
+describe("compressed telemetry and dataset I/O", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "compressed-io-"));
+  const plainPath = path.join(tempDir, "telemetry.jsonl");
+  const gzipPath = path.join(tempDir, "telemetry.jsonl.gz");
+  const text = telemetryLines();
+  fs.writeFileSync(plainPath, text);
+  fs.writeFileSync(gzipPath, zlib.gzipSync(text));
+
+  it("converts gzip telemetry into gzip output with the same records", () => {
+    const plainOut = path.join(tempDir, "tool_calls.jsonl");
+    const gzipOut = path.join(tempDir, "tool_calls.jsonl.gz");
+    run("scripts/mlops/telemetry_to_tool_calls.py", [
+      "--telemetry",
+      plainPath,
+      "--output",
+      plainOut,
+    ]);
+    run("scripts/mlops/telemetry_to_tool_calls.py", [
+      "--telemetry",
+      gzipPath,
+      "--output",
+      gzipOut,
+    ]);
+
+    const compressed = fs.readFileSync(gzipOut);
+    expect(compressed.subarray(0, 2).toString("hex")).toBe("1f8b");
+    const records = zlib.gunzipSync(compressed).toString("utf-8");
+    expect(records).toBe(fs.readFileSync(plainOut, "utf-8"));
+    expect(records.trim().split("\n")).toHaveLength(40);
+    expect(records).toContain("[REDACTED_EMAIL]");
+  });
+
+  it("detects gzip from magic bytes when the suffix is plain", () => {
+    const misnamed = path.join(tempDir, "misnamed.jsonl");
+    fs.writeFileSync(
+      misnamed,
+      zlib.gzipSync('{"text": "  bonjour  ", "source": "fr"}\n'),
+    );
+    const output = path.join(tempDir, "pretrain.jsonl");
+    run("scripts/mlops/normalize_datasets.py", [
+      "--input",
+      misnamed,
+      "--output",
+      output,
+      "--mode",
+      "pretrain",
+    ]);
+    expect(JSON.parse(fs.readFileSync(output, "utf-8"))).toEqual({
+      text: "bonjour",
+      metadata: { source: "fr" },
+    });
+  });
+
+  it("reads gzip telemetry whole when sharding across workers", () => {
+    const reports = [plainPath, gzipPath].map((telemetry, i) => {
+      const report = path.join(tempDir, `latency_${i}.json`);
+      run("scripts/eval/telemetry_latency.py", [
+        "--telemetry",
+        telemetry,
+        "--report",
+        report,
+        "--workers",
+        "2",
+      ]);
+      return JSON.parse(fs.readFileSync(report, "utf-8"));
+    });
+    expect(reports[1]).toEqual(reports[0]);
+    expect(reports[1].events).toBe(40);
+  });
+});
@@ -0,0 +1,119 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import {
+  buildTinyLlama,
+  describeWithPython,
+  runPython,
+} from "../test-utils/python";
+
+const describeWithCoreML = describeWithPython(
+  "torch",
+  "transformers",
+  "coremltools",
+);
+
+describeWithCoreML("Core ML conversion cache", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "coreml-cache-"));
+  const modelDir = path.join(tempDir, "model");
+  const cacheDir = path.join(tempDir, "cache");
+  const artifactsPath = path.join(tempDir, "artifacts.json");
+  const profilesPath = path.join(tempDir, "profiles.json");
+  const profiles = { default: { context_length: 32, prefill_chunk: 8 } };
+  fs.writeFileSync(profilesPath, JSON.stringify({ profiles }));
+  buildTinyLlama(modelDir);
+
+  const fingerprint = (modelId, hfHome) =>
+    runPython(
+      [
+        "-c",
+        `import sys; sys.path.insert(0, "scripts")
+from convert_to_coreml import _model_fingerprint
+print(_model_fingerprint(sys.argv[1], None))`,
+        modelId,
+      ],
+      { env: { ...process.env, HF_HOME: hfHome, HF_HUB_OFFLINE: "1" } },
+    ).trim();
+
+  // Lay out a Hub cache entry whose main ref points at ``sha``.
+  const cacheSnapshot = (hfHome, repoId, sha) => {
+    const repoName = `models--${repoId.replace("/", "--")}`;
+    const repoDir = path.join(hfHome, "hub", repoName);
+    fs.mkdirSync(path.join(repoDir, "refs"), { recursive: true });
+    fs.mkdirSync(path.join(repoDir, "snapshots", sha), { recursive: true });
+    fs.copyFileSync(
+      path.join(modelDir, "config.json"),
+      path.join(repoDir, "snapshots", sha, "config.json"),
+    );
+    fs.writeFileSync(path.join(repoDir, "refs", "main"), sha);
+  };
+
+  it("pins Hub ids to the resolved revision and skips caching when it is unknown", () => {
+    const hfHome = path.join(tempDir, "hf_home");
+    const repoId = "example/tiny-llama";
+    const first = "a".repeat(40);
+    const second = "b".repeat(40);
+    cacheSnapshot(hfHome, repoId, first);
+    expect(fingerprint(repoId, hfHome)).toBe(`${repoId}@${first}`);
+    cacheSnapshot(hfHome, repoId, second);
+    expect(fingerprint(repoId, hfHome)).toBe(`${repoId}@${second}`);
+    expect(fingerprint("example/not-downloaded", hfHome)).toBe("None");
+  });
+
+  const convert = (...extraArgs) => {
+    runPython([
+      "scripts/convert_to_coreml.py",
+      "--hf_model",
+      modelDir,
+      "--out_prefix",
+      path.join(tempDir, "tiny"),
+      "--artifacts_path",
+      artifactsPath,
+      "--variants",
+      "fp16",
+      "--profiles_config",
+      profilesPath,
+      "--cache_dir",
+      cacheDir,
+      ...extraArgs,
+    ]);
+    return JSON.parse(fs.readFileSync(artifactsPath, "utf-8"));
+  };
+
+  it("reuses the fp16 program until the local checkpoint changes", () => {
+    const cold = convert().profiles[0];
+    expect(cold.cache_hits).toEqual({ traced: false, fp16: false });
+    const warmReport = convert();
+    const warm = warmReport.profiles[0];
+    expect(warm.cache_key).toBe(cold.cache_key);
+    expect(warm.cache_hits.fp16).toBe(true);
+    // No benchmark by default, so a cache hit never loads the torch model.
+    expect(warm.benchmark).toBeUndefined();
+    expect(warmReport.memory.phases.load).toBeUndefined();
+    const benchmarked = convert("--benchmark_tokens", "2");
+    expect(benchmarked.profiles[0].cache_hits.fp16).toBe(true);
+    expect(benchmarked.profiles[0].benchmark).toBeDefined();
+    expect(benchmarked.memory.phases.load).toBeDefined();
+
+    fs.appendFileSync(path.join(modelDir, "config.json"), "\n");
+    const changed = convert().profiles[0];
+    expect(changed.cache_key).not.toBe(cold.cache_key);
+    expect(changed.cache_hits.fp16).toBe(false);
+  });
+
+  it("runs a small quantize pool by default instead of one worker per CPU", () => {
+    const variants = ["--variants", "fp16,int8,int4-block"];
+    const report = convert(...variants);
+    expect(report.memory.jobs).toBe(2);
+    const statuses = report.artifacts.map((artifact) => artifact.status);
+    expect(statuses).toEqual(["ok", "ok", "ok"]);
+    const workers = Object.values(report.memory.phases).filter(
+      (phase) => phase.process === "worker",
+    );
+    expect(workers).toHaveLength(3);
+
+    expect(convert(...variants, "--jobs", "3").memory.jobs).toBe(3);
+    const lowMemory = convert(...variants, "--jobs", "3", "--low_memory");
+    expect(lowMemory.memory.jobs).toBe(1);
+  });
+});
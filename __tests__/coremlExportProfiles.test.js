@@ -0,0 +1,110 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { spawnSync } from "child_process";
+import {
+  buildTinyLlama,
+  describeWithPython,
+  runPython,
+  runPythonJson,
+} from "../test-utils/python";
+
+const describeWithCoreML = describeWithPython(
+  "torch",
+  "transformers",
+  "coremltools",
+);
+
+// Input shapes of a saved package, read from its spec.
+const INPUT_SHAPES_SCRIPT = `
+import json, sys
+import coremltools as ct
+spec = ct.models.MLModel(sys.argv[1], skip_model_load=True).get_spec()
+print(json.dumps({
+    item.name: list(item.type.multiArrayType.shape)
+    for item in spec.description.input
+}))
+`;
+
+describeWithCoreML("Core ML export profiles", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "coreml-profiles-"));
+  const modelDir = path.join(tempDir, "model");
+  const artifactsPath = path.join(tempDir, "artifacts.json");
+  const profilesPath = path.join(tempDir, "profiles.json");
+  fs.writeFileSync(
+    profilesPath,
+    JSON.stringify({
+      default_profiles: ["default"],
+      profiles: {
+        default: { context_length: 32, prefill_chunk: 8 },
+        b2: { context_length: 48, batch_size: 2, prefill_chunk: 4 },
+        broken: { context_length: 16, prefill_chunk: 32 },
+      },
+    }),
+  );
+  buildTinyLlama(modelDir);
+
+  const convertArgs = (...extraArgs) => [
+    "scripts/convert_to_coreml.py",
+    "--hf_model",
+    modelDir,
+    "--out_prefix",
+    path.join(tempDir, "tiny"),
+    "--artifacts_path",
+    artifactsPath,
+    "--variants",
+    "fp16",
+    "--profiles_config",
+    profilesPath,
+    "--no_cache",
+    ...extraArgs,
+  ];
+
+  it("exports one program per profile, loading the model once", () => {
+    const profileArgs = ["--profiles", "default,b2", "--benchmark_tokens", "2"];
+    runPython(convertArgs(...profileArgs));
+    const report = JSON.parse(fs.readFileSync(artifactsPath, "utf-8"));
+
+    // The default profile keeps the historical names; others carry their own.
+    const files = report.artifacts.map((artifact) => artifact.file);
+    expect(files.map((file) => path.basename(file))).toEqual([
+      "tiny-fp16.mlpackage",
+      "tiny-b2-fp16.mlpackage",
+    ]);
+    files.forEach((file) => expect(fs.existsSync(file)).toBe(true));
+
+    const [base, batched] = report.profiles;
+    expect(base.cache_key).not.toBe(batched.cache_key);
+    // keys+values x 2 layers x batch x 2 kv heads x context x head_dim x fp16.
+    expect(base.kv_cache_bytes).toBe(2 * 2 * 1 * 2 * 32 * 16 * 2);
+    expect(batched.kv_cache_bytes).toBe(2 * 2 * 2 * 2 * 48 * 16 * 2);
+    expect(batched.benchmark.decode_tokens).toBe(2 * 2);
+    expect(batched.benchmark.decode_tokens_per_s).toBeGreaterThan(0);
+
+    const phases = Object.keys(report.memory.phases);
+    expect(phases.filter((name) => name === "load")).toHaveLength(1);
+    expect(phases).toContain("convert:default");
+    expect(phases).toContain("convert:b2");
+
+    const inputShapes = runPythonJson(["-c", INPUT_SHAPES_SCRIPT, files[1]]);
+    expect(inputShapes.input_ids[0]).toBe(2);
+    expect(inputShapes.attention_mask[0]).toBe(2);
+  });
+
+  it("rejects unknown profiles and prefill chunks longer than the context", () => {
+    const run = (profile) =>
+      spawnSync("python", convertArgs("--profiles", profile), {
+        encoding: "utf-8",
+      });
+
+    const unknown = run("ctx64k");
+    expect(unknown.status).not.toBe(0);
+    expect(unknown.stderr).toContain("Unknown export profile 'ctx64k'");
+
+    const broken = run("broken");
+    expect(broken.status).not.toBe(0);
+    expect(broken.stderr).toContain(
+      "prefill_chunk must be within 1..context_length",
+    );
+  });
+});
@@ -0,0 +1,135 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import {
+  buildTinyLlama,
+  describeWithPython,
+  runPython,
+  runPythonJson,
+} from "../test-utils/python";
+
+const resolveWeightBits = (weightBits, constNames) => {
+  const script = `
+import json, sys
+sys.path.insert(0, "scripts")
+from coreml_weight_names import resolve_weight_bits
+
+weight_bits, const_names = json.load(sys.stdin)
+try:
+    print(json.dumps({"resolved": resolve_weight_bits(weight_bits, const_names)}))
+except ValueError as error:
+    print(json.dumps({"error": str(error)}))
+`;
+  return runPythonJson(["-c", script], {
+    input: JSON.stringify([weightBits, constNames]),
+    stdio: "pipe",
+  });
+};
+
+describe("Core ML weight-name resolution", () => {
+  it("keys bit-widths by the const ops of the program, including fp16 casts", () => {
+    const weightBits = {
+      model_model_embed_tokens_weight: 8,
+      model_lm_head_weight: 4,
+      kv_k: null,
+    };
+    const constNames = [
+      "model_model_embed_tokens_weight",
+      "model_lm_head_weight_to_fp16",
+      "kv_k",
+      "cast_2",
+    ];
+    const { resolved } = resolveWeightBits(weightBits, constNames);
+    expect(resolved).toEqual({
+      model_model_embed_tokens_weight: 8,
+      model_lm_head_weight_to_fp16: 4,
+      kv_k: null,
+    });
+  });
+
+  it("raises on names that match no const op instead of ignoring them", () => {
+    const { error } = resolveWeightBits(
+      { model_model_layers_9_mlp_up_proj_weight: 4, model_lm_head_weight: 4 },
+      ["model_lm_head_weight"],
+    );
+    expect(error).toContain("model_model_layers_9_mlp_up_proj_weight");
+    expect(error).not.toContain("model_lm_head_weight,");
+  });
+});
+
+const describeWithCoreML = describeWithPython(
+  "torch",
+  "transformers",
+  "coremltools",
+);
+
+describeWithCoreML("mixed-precision Core ML export", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "coreml-mixed-"));
+  const modelDir = path.join(tempDir, "model");
+  const artifactsPath = path.join(tempDir, "artifacts.json");
+  const profilesPath = path.join(tempDir, "profiles.json");
+  const profiles = { default: { context_length: 64, prefill_chunk: 16 } };
+  fs.writeFileSync(profilesPath, JSON.stringify({ profiles }));
+  buildTinyLlama(modelDir);
+
+  const convert = (opNameBits) => {
+    const bitsPath = path.join(tempDir, "weight_bits.json");
+    fs.writeFileSync(bitsPath, JSON.stringify({ op_name_bits: opNameBits }));
+    runPython([
+      "scripts/convert_to_coreml.py",
+      "--hf_model",
+      modelDir,
+      "--out_prefix",
+      path.join(tempDir, "tiny"),
+      "--artifacts_path",
+      artifactsPath,
+      "--variants",
+      "fp16",
+      "--weight_bits",
+      bitsPath,
+      "--profiles_config",
+      profilesPath,
+      "--benchmark_tokens",
+      "0",
+      "--cache_dir",
+      path.join(tempDir, "cache"),
+    ]);
+    const { artifacts } = JSON.parse(fs.readFileSync(artifactsPath, "utf-8"));
+    return artifacts.find((artifact) => artifact.variant === "mixed");
+  };
+
+  const attention = ["q_proj", "k_proj", "v_proj", "o_proj"];
+  const mlp = ["gate_proj", "up_proj", "down_proj"];
+  const moduleBits = {};
+  for (let layer = 0; layer < 2; layer += 1) {
+    const prefix = `model_model_layers_${layer}`;
+    attention.forEach((name) => {
+      moduleBits[`${prefix}_self_attn_${name}_weight`] = 4;
+    });
+    mlp.forEach((name) => {
+      moduleBits[`${prefix}_mlp_${name}_weight`] = 8;
+    });
+  }
+
+  it("records the mixed package's size against fp16 and its logits drift", () => {
+    const mixed = convert({ ...moduleBits, kv_k: null, kv_v: null });
+    expect(mixed.status).toBe("ok");
+    expect(mixed.bytes).toBeLessThan(mixed.fp16_bytes);
+    expect(mixed.size_ratio).toBeCloseTo(mixed.bytes / mixed.fp16_bytes, 3);
+    if (process.platform === "darwin") {
+      expect(mixed.logits_drift.status).toBe("ok");
+      expect(mixed.logits_drift.top1_agreement).toBeGreaterThan(0);
+    } else {
+      expect(mixed.logits_drift.status).toBe("unavailable");
+    }
+  });
+
+  it("fails the variant when a configured name is not in the program", () => {
+    const mixed = convert({
+      ...moduleBits,
+      model_model_layers_9_mlp_up_proj_weight: 4,
+    });
+    expect(mixed.status).toBe("failed");
+    expect(mixed.logits_drift).toBeUndefined();
+  });
+});
@@ -0,0 +1,165 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import zlib from "zlib";
+import { execFileSync } from "child_process";
+import { describeWithPython, runPythonJson } from "../test-utils/python";
+
+const runMixer = (args) =>
+  execFileSync("python", ["scripts/mlops/dataset_mixer.py", ...args], {
+    encoding: "utf-8",
+    stdio: ["pipe", "pipe", "ignore"],
+  });
+
+const describeWithTorch = describeWithPython("torch");
+
+// Reads a few examples in-process, then tries the same through one worker.
+const DATA_LOADER_SCRIPT = `
+import itertools, json, sys
+from torch.utils.data import DataLoader
+sys.path.insert(0, ".")
+from scripts.mlops.dataset_mixer import DatasetMixer, load_mixture
+from scripts.mlops.mixture_dataset import MixtureDataset
+
+def loader(num_workers):
+    dataset = MixtureDataset(DatasetMixer(load_mixture(sys.argv[1])))
+    return dataset, DataLoader(
+        dataset,
+        batch_size=None,
+        num_workers=num_workers,
+        multiprocessing_context="fork" if num_workers else None,
+    )
+
+dataset, in_process = loader(0)
+records = list(itertools.islice(in_process, 5))
+try:
+    next(iter(loader(1)[1]))
+    worker_error = None
+except ValueError as error:
+    worker_error = str(error)
+print(json.dumps({
+    "records": len(records),
+    "examples": dataset.examples,
+    "worker_error": worker_error,
+}))
+`;
+
+const toJsonl = (rows) =>
+  `${rows.map((row) => JSON.stringify(row)).join("\n")}\n`;
+
+describe("weighted dataset mixer", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "mixer-"));
+  const textRows = Array.from({ length: 2000 }, (_, i) => ({
+    text: `doc ${i}`,
+    source: "fr_web",
+  }));
+  const sftRows = Array.from({ length: 100 }, (_, i) => ({
+    instruction: `question ${i}`,
+    expected_tool_call: { tools: [] },
+    expected_answer: `answer ${i}`,
+  }));
+  const toolRows = Array.from({ length: 30 }, (_, i) => ({
+    query: `search ${i}`,
+    tool_name: "web_search",
+    tool_args: {},
+  }));
+  fs.writeFileSync(path.join(tempDir, "text.jsonl"), toJsonl(textRows));
+  fs.writeFileSync(
+    path.join(tempDir, "sft.jsonl.gz"),
+    zlib.gzipSync(toJsonl(sftRows)),
+  );
+  fs.writeFileSync(path.join(tempDir, "tool_calls.jsonl"), toJsonl(toolRows));
+
+  const writeMixture = (name, mixture) => {
+    const mixturePath = path.join(tempDir, name);
+    fs.writeFileSync(mixturePath, JSON.stringify(mixture));
+    return mixturePath;
+  };
+  const weighted = writeMixture("weighted.json", {
+    seed: 3,
+    shuffle_buffer: 64,
+    sources: [
+      { name: "text", path: "text.jsonl", weight: 0.6 },
+      { name: "sft", path: "sft.jsonl.gz", weight: 0.3, repeat: true },
+      { name: "tools", path: "tool_calls.jsonl", weight: 0.1, repeat: true },
+    ],
+  });
+
+  const kindOf = (line) => {
+    const record = JSON.parse(line);
+    if ("instruction" in record) return "sft";
+    if ("tool_name" in record) return "tools";
+    return "text";
+  };
+
+  it("draws sources in proportion to their weights, repeating small ones", () => {
+    const args = ["--mixture", weighted, "--output", "-", "--limit", "3000"];
+    const lines = runMixer(args).trim().split("\n");
+    expect(lines).toHaveLength(3000);
+    const counts = { text: 0, sft: 0, tools: 0 };
+    lines.forEach((line) => {
+      counts[kindOf(line)] += 1;
+    });
+    expect(Math.abs(counts.text / 3000 - 0.6)).toBeLessThan(0.05);
+    expect(Math.abs(counts.sft / 3000 - 0.3)).toBeLessThan(0.05);
+    expect(Math.abs(counts.tools / 3000 - 0.1)).toBeLessThan(0.03);
+    // 100 SFT records drawn ~900 times means the source rewound.
+    expect(counts.sft).toBeGreaterThan(sftRows.length);
+  });
+
+  it("is deterministic and resumes exactly from a saved state", () => {
+    const args = ["--mixture", weighted, "--output", "-"];
+    const full = runMixer([...args, "--limit", "1500"]);
+    expect(runMixer([...args, "--limit", "1500"])).toBe(full);
+
+    const statePath = path.join(tempDir, "mixture_state.json");
+    const head = runMixer([
+      ...args,
+      "--limit",
+      "611",
+      "--state-out",
+      statePath,
+    ]);
+    const state = JSON.parse(fs.readFileSync(statePath, "utf-8"));
+    expect(state.format).toBe("mixture_state_v1");
+    expect(state.yielded).toBe(611);
+    expect(Object.keys(state.sources)).toEqual(["text", "sft", "tools"]);
+    expect(state.buffer.length).toBeLessThanOrEqual(64);
+    const tail = runMixer([...args, "--limit", "889", "--state-in", statePath]);
+    expect(head + tail).toBe(full);
+  });
+
+  it("shuffles a finite mixture and emits every record once", () => {
+    const finite = writeMixture("finite.json", {
+      shuffle_buffer: 50,
+      sources: [
+        { path: "text.jsonl", weight: 2 },
+        { path: "tool_calls.jsonl" },
+      ],
+    });
+    const output = runMixer(["--mixture", finite, "--output", "-"]);
+    const lines = output.trim().split("\n");
+    expect(lines).toHaveLength(textRows.length + toolRows.length);
+    expect(new Set(lines).size).toBe(lines.length);
+    const texts = lines.filter((line) => kindOf(line) === "text");
+    expect(texts).not.toEqual(textRows.map((row) => JSON.stringify(row)));
+  });
+});
+
+describeWithTorch("mixture dataset", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "mixture-dataset-"));
+  const rows = Array.from({ length: 20 }, (_, i) => ({ text: `doc ${i}` }));
+  fs.writeFileSync(path.join(tempDir, "text.jsonl"), toJsonl(rows));
+  const mixturePath = path.join(tempDir, "mixture.json");
+  fs.writeFileSync(
+    mixturePath,
+    JSON.stringify({ sources: [{ path: "text.jsonl" }] }),
+  );
+
+  it("refuses DataLoader worker processes, even a single one", () => {
+    const result = runPythonJson(["-c", DATA_LOADER_SCRIPT, mixturePath]);
+    expect(result.records).toBe(5);
+    expect(result.examples).toBe(5);
+    expect(result.worker_error).toContain("MixtureDataset needs num_workers=0");
+  });
+});
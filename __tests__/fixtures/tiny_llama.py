@@ -0,0 +1,76 @@
+"""
+Build a tiny random Llama checkpoint (and optionally a LoRA adapter) for tests.
+
+    python __tests__/fixtures/tiny_llama.py OUT_DIR [--layers 2] [--lora ADAPTER_DIR] [--shards 2]
+
+OUT_DIR gets safetensors weights and a word-level tokenizer, so scripts that
+call ``from_pretrained`` on it run offline in a few seconds.
+"""
+
+import argparse
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+SPECIAL_TOKENS = ["<unk>", "<s>", "</s>", "<pad>"]
+VOCAB_SIZE = 256
+
+
+def build_tokenizer() -> PreTrainedTokenizerFast:
+    words = [f"w{index}" for index in range(VOCAB_SIZE - len(SPECIAL_TOKENS))]
+    vocab = {token: index for index, token in enumerate(SPECIAL_TOKENS + words)}
+    backend = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Whitespace()
+    return PreTrainedTokenizerFast(
+        tokenizer_object=backend,
+        unk_token="<unk>",
+        bos_token="<s>",
+        eos_token="</s>",
+        pad_token="<pad>",
+        # Like Llama tokenizers, so ``model(**batch)`` works.
+        model_input_names=["input_ids", "attention_mask"],
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("out_dir")
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--lora", default=None, help="Also save a LoRA adapter with non-zero B matrices here.")
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    config = LlamaConfig(
+        vocab_size=VOCAB_SIZE,
+        hidden_size=64,
+        intermediate_size=128,
+        num_hidden_layers=args.layers,
+        num_attention_heads=4,
+        num_key_value_heads=2,
+        max_position_embeddings=128,
+        tie_word_embeddings=False,
+    )
+    model = LlamaForCausalLM(config)
+    # Spread the weights over several shards when asked, to exercise sharded loaders.
+    shard_size = sum(p.numel() * p.element_size() for p in model.parameters()) // args.shards + 1
+    model.save_pretrained(args.out_dir, max_shard_size=shard_size if args.shards > 1 else "10GB")
+    build_tokenizer().save_pretrained(args.out_dir)
+
+    if args.lora:
+        from peft import LoraConfig, get_peft_model
+
+        lora_config = LoraConfig(
+            r=4,
+            lora_alpha=8,
+            target_modules=["q_proj", "v_proj", "gate_proj", "down_proj"],
+            init_lora_weights=False,
+            task_type="CAUSAL_LM",
+        )
+        get_peft_model(model, lora_config).save_pretrained(args.lora)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync, spawnSync } from "child_process";
+
+// The generator forks legacy KV tuples, which transformers dropped in 5.0
+// (CI pins 4.44).
+const LEGACY_CACHE_SCRIPT = `
+import tokenizers
+from transformers.cache_utils import DynamicCache
+DynamicCache.to_legacy_cache
+`;
+
+const legacyCacheAvailable =
+  spawnSync("python", ["-c", LEGACY_CACHE_SCRIPT]).status === 0;
+
+const describeWithLegacyCache = legacyCacheAvailable ? describe : describe.skip;
+
+const TOOLS = [
+  {
+    name: "web_search",
+    description: "w9",
+    parameters: { query: { type: "string", required: true } },
+  },
+];
+
+// Decode every case alone, unpadded and without a KV cache.
+const REFERENCE_SCRIPT = `
+import json, sys
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+sys.path.insert(0, ".")
+from scripts.eval.prompt_builder import runtime_prompt_parts
+
+model_dir, prompts_path, max_new_tokens, logits_steps = sys.argv[1], sys.argv[2], int(sys.argv[3]), int(sys.argv[4])
+tokenizer = AutoTokenizer.from_pretrained(model_dir)
+model = AutoModelForCausalLM.from_pretrained(model_dir).eval()
+eos_id = model.generation_config.eos_token_id
+with open("prompts/v1/runtime_prompt.json") as handle:
+    template = json.load(handle)
+with open(prompts_path) as handle:
+    cases = json.load(handle)["cases"]
+results = {}
+with torch.inference_mode():
+    for case in cases:
+        prefix, suffix = runtime_prompt_parts(case["user_prompt"], case["tools"], case.get("context", []), template)
+        sequence = torch.tensor([tokenizer(prefix + suffix)["input_ids"]])
+        tokens, logits = [], []
+        for step in range(max_new_tokens):
+            step_logits = model(input_ids=sequence, use_cache=False).logits[0, -1]
+            if step < logits_steps:
+                logits.append(step_logits.tolist())
+            token = int(step_logits.argmax())
+            tokens.append(token)
+            if token == eos_id:
+                break
+            sequence = torch.cat([sequence, torch.tensor([[token]])], dim=1)
+        results[case["stable_id"]] = {"tokens": tokens, "logits": logits}
+print(json.dumps(results))
+`;
+
+const MAX_DELTA_SCRIPT = `
+import json, sys
+import numpy as np
+generated = np.load(sys.argv[1])
+reference = json.load(open(sys.argv[2]))
+rows = [np.asarray(reference[case_id]["logits"]) for case_id in sys.argv[3:]]
+print(json.dumps({
+    "shape": list(generated.shape),
+    "max_delta": max(float(np.abs(generated[index] - row).max()) for index, row in enumerate(rows)),
+}))
+`;
+
+describeWithLegacyCache("batched reference-output generator", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "reference-outputs-"));
+  const modelDir = path.join(tempDir, "model");
+  const promptsPath = path.join(tempDir, "prompts.json");
+  execFileSync("python", ["__tests__/fixtures/tiny_llama.py", modelDir], {
+    stdio: "ignore",
+  });
+  // Three cases share a prefix and have suffixes of different lengths; one
+  // has no tools.
+  const cases = [
+    { stable_id: "short", user_prompt: "w1 w2 w3", tools: TOOLS },
+    {
+      stable_id: "long",
+      user_prompt: "w4 w5 w6 w7 w8 w9 w10 w11 w12",
+      tools: TOOLS,
+    },
+    {
+      stable_id: "context",
+      user_prompt: "w13",
+      tools: TOOLS,
+      context: [{ content: "w20 w21 w22" }],
+    },
+    { stable_id: "no-tools", user_prompt: "w30 w31", tools: [] },
+  ];
+  fs.writeFileSync(promptsPath, JSON.stringify({ cases }));
+
+  const generate = (name, ...extraArgs) => {
+    const output = path.join(tempDir, `${name}.jsonl`);
+    const report = JSON.parse(
+      execFileSync(
+        "python",
+        [
+          "scripts/eval/generate_reference_outputs.py",
+          "--hf_model",
+          modelDir,
+          "--prompts",
+          promptsPath,
+          "--output",
+          output,
+          "--max-new-tokens",
+          "6",
+          "--logits-steps",
+          "3",
+          ...extraArgs,
+        ],
+        { encoding: "utf-8", stdio: ["ignore", "pipe", "ignore"] },
+      ),
+    );
+    const entries = fs
+      .readFileSync(output, "utf-8")
+      .trim()
+      .split("\n")
+      .map((line) => JSON.parse(line));
+    return { report, entries };
+  };
+
+  it("decodes padded batches to the same tokens and logits as one case at a time", () => {
+    const batched = generate("batched", "--batch-size", "4");
+    expect(batched.report.entries).toBe(4);
+    // One batch per distinct prefix.
+    expect(batched.report.batches).toBe(2);
+    expect(batched.report.decode_tokens_per_s).toBeGreaterThan(0);
+    const ids = cases.map((item) => item.stable_id);
+    expect(batched.entries.map((entry) => entry.id)).toEqual(ids);
+    batched.entries.forEach((entry, index) => {
+      expect(entry.logits_index).toBe(index);
+      expect(typeof entry.response).toBe("string");
+    });
+
+    const referencePath = path.join(tempDir, "reference.json");
+    const referenceArgs = [modelDir, promptsPath, "6", "3"];
+    fs.writeFileSync(
+      referencePath,
+      execFileSync("python", ["-c", REFERENCE_SCRIPT, ...referenceArgs], {
+        encoding: "utf-8",
+        stdio: ["ignore", "pipe", "ignore"],
+      }),
+    );
+    const reference = JSON.parse(fs.readFileSync(referencePath, "utf-8"));
+    batched.entries.forEach((entry) => {
+      expect(entry.tokens).toEqual(reference[entry.id].tokens);
+    });
+    const logits = JSON.parse(
+      execFileSync(
+        "python",
+        [
+          "-c",
+          MAX_DELTA_SCRIPT,
+          batched.report.logits_output,
+          referencePath,
+          ...cases.map((item) => item.stable_id),
+        ],
+        { encoding: "utf-8" },
+      ),
+    );
+    expect(logits.shape).toEqual([4, 3, 256]);
+    expect(logits.max_delta).toBeLessThan(1e-4);
+
+    const single = generate("single", "--batch-size", "1");
+    expect(single.report.batches).toBe(4);
+    expect(single.entries.map((entry) => entry.tokens)).toEqual(
+      batched.entries.map((entry) => entry.tokens),
+    );
+  });
+
+  it("rejects more logits steps than new tokens", () => {
+    const result = spawnSync(
+      "python",
+      [
+        "scripts/eval/generate_reference_outputs.py",
+        "--hf_model",
+        modelDir,
+        "--prompts",
+        promptsPath,
+        "--output",
+        path.join(tempDir, "invalid.jsonl"),
+        "--max-new-tokens",
+        "2",
+        "--logits-steps",
+        "3",
+      ],
+      { encoding: "utf-8" },
+    );
+    expect(result.status).not.toBe(0);
+    expect(result.stderr).toContain(
+      "--logits-steps must be between 1 and --max-new-tokens",
+    );
+  });
+});
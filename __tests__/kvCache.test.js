@@ -0,0 +1,116 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync, spawnSync } from "child_process";
+
+// The caches subclass transformers' Cache as it was before 5.0 (CI pins 4.44).
+const CACHES_AVAILABLE_SCRIPT = `
+import sys
+import tokenizers
+sys.path.insert(0, "scripts")
+from coreml_kv_cache import StaticKeyValueCache
+StaticKeyValueCache(shape=(1, 1, 1, 1, 1))
+`;
+
+const cachesAvailable =
+  spawnSync("python", ["-c", CACHES_AVAILABLE_SCRIPT]).status === 0;
+
+const describeWithCaches = cachesAvailable ? describe : describe.skip;
+
+const FIXTURE = "__tests__/fixtures/tiny_llama.py";
+
+// Greedy decode with each cache and once more recomputing the full prefix.
+const DECODE_SCRIPT = `
+import json, sys
+import torch
+from transformers import AutoConfig, AutoModelForCausalLM
+sys.path.insert(0, "scripts")
+from bench_kv_cache import DecodeLoop, cache_shape
+
+config = AutoConfig.from_pretrained(sys.argv[1])
+model = AutoModelForCausalLM.from_pretrained(sys.argv[1]).eval()
+prompt = torch.randint(0, config.vocab_size, (2, 6), generator=torch.Generator().manual_seed(0))
+shape = cache_shape(config, batch_size=2, context_length=24)
+sequences = {}
+with torch.inference_mode():
+    for kv_cache in ("slice", "static"):
+        loop = DecodeLoop(model, kv_cache, shape, torch.float32)
+        tokens = [loop.step(prompt, 0)]
+        for position in range(6, 12):
+            tokens.append(loop.step(tokens[-1], position))
+        sequences[kv_cache] = torch.cat([prompt, *tokens], dim=1).tolist()
+    sequence = prompt
+    for _ in range(7):
+        next_token = model(input_ids=sequence, use_cache=False).logits[:, -1:].argmax(dim=-1)
+        sequence = torch.cat([sequence, next_token], dim=1)
+    sequences["uncached"] = sequence.tolist()
+print(json.dumps(sequences))
+`;
+
+describeWithCaches("Core ML export KV caches", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "kv-cache-"));
+  const modelDir = path.join(tempDir, "model");
+  execFileSync("python", [FIXTURE, modelDir], { stdio: "ignore" });
+
+  it("decodes the same tokens with the slice and static caches as without a cache", () => {
+    const sequences = JSON.parse(
+      execFileSync("python", ["-c", DECODE_SCRIPT, modelDir], {
+        encoding: "utf-8",
+        stdio: ["ignore", "pipe", "ignore"],
+      }),
+    );
+    expect(sequences.uncached[0]).toHaveLength(13);
+    expect(sequences.slice).toEqual(sequences.uncached);
+    expect(sequences.static).toEqual(sequences.uncached);
+  });
+
+  it("benchmarks both caches, with fewer host syncs per step for the static one", () => {
+    const report = JSON.parse(
+      execFileSync(
+        "python",
+        [
+          "scripts/bench_kv_cache.py",
+          "--model",
+          modelDir,
+          "--context_length",
+          "32",
+          "--prefill_tokens",
+          "8",
+          "--decode_tokens",
+          "8",
+          "--profile_steps",
+          "4",
+        ],
+        { encoding: "utf-8", stdio: ["ignore", "pipe", "ignore"] },
+      ),
+    );
+    const [slice, staticCache] = report.results;
+    expect(slice.kv_cache).toBe("slice");
+    expect(staticCache.kv_cache).toBe("static");
+    report.results.forEach((result) => {
+      expect(result.decode_tokens_per_s).toBeGreaterThan(0);
+      expect(result.allocations_per_step).toBeGreaterThan(0);
+    });
+    // The slice cache calls .item() per layer; the static one keeps lengths
+    // on device.
+    expect(staticCache.host_syncs_per_step).toBeLessThan(
+      slice.host_syncs_per_step,
+    );
+  });
+
+  it("rejects a run that does not fit in the context", () => {
+    const result = spawnSync(
+      "python",
+      [
+        "scripts/bench_kv_cache.py",
+        "--model",
+        modelDir,
+        "--context_length",
+        "16",
+      ],
+      { encoding: "utf-8" },
+    );
+    expect(result.status).not.toBe(0);
+    expect(result.stderr).toContain("must fit in context_length");
+  });
+});
@@ -0,0 +1,183 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { spawnSync } from "child_process";
+import {
+  describeWithPython,
+  runPython,
+  runPythonJson,
+} from "../test-utils/python";
+
+const describeWithNumpy = describeWithPython("numpy");
+
+// Reference logits (3 entries x 4 positions x 16 vocab) in every supported
+// format, plus a candidate whose argmax flips at flattened row 5.
+const FIXTURE_SCRIPT = `
+import json, struct, sys
+import numpy as np
+
+out = sys.argv[1]
+reference = np.random.default_rng(0).normal(size=(3, 4, 16)).astype(np.float32)
+np.save(f"{out}/reference.npy", reference)
+np.save(f"{out}/close.npy", reference + np.float32(0.01))
+diverged = reference.copy()
+row = diverged.reshape(-1, 16)[5]
+row[(row.argmax() + 1) % 16] = row.max() + 1.0
+np.save(f"{out}/diverged.npy", diverged)
+
+raw = (reference.view(np.uint32) >> 16).astype(np.uint16).tobytes()
+header = json.dumps({
+    "__metadata__": {"format": "pt"},
+    "logits": {"dtype": "BF16", "shape": list(reference.shape), "data_offsets": [0, len(raw)]},
+}).encode()
+with open(f"{out}/reference.safetensors", "wb") as handle:
+    handle.write(struct.pack("<Q", len(header)) + header + raw)
+with open(f"{out}/reference.json", "w") as handle:
+    json.dump({"logits": reference.tolist()}, handle)
+`;
+
+const ENGINE_SCRIPT = `
+import json, sys
+import numpy as np
+sys.path.insert(0, ".")
+from scripts.eval.logits_equivalence import compare_arrays, load_logits
+
+out = sys.argv[1]
+npy = load_logits(f"{out}/reference.npy")
+bf16 = load_logits(f"{out}/reference.safetensors")
+from_json = load_logits(f"{out}/reference.json")
+diverged = load_logits(f"{out}/diverged.npy")
+print(json.dumps({
+    "memmap": isinstance(npy, np.memmap),
+    "bf16_shape": list(bf16.shape),
+    "bf16_error": float(np.abs(bf16[:] - npy).max() / np.abs(npy).max()),
+    "json_delta": float(np.abs(from_json - npy).max()),
+    "identical": compare_arrays(npy, from_json),
+    "diverged": compare_arrays(npy, diverged),
+    "diverged_blocked": compare_arrays(npy, diverged, block_elements=16),
+}))
+`;
+
+describeWithNumpy("logits equivalence engine", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "logits-equivalence-"));
+  runPython(["-c", FIXTURE_SCRIPT, tempDir]);
+  const logitsPath = (name) => path.join(tempDir, name);
+
+  it("loads npy, bf16 safetensors and JSON logits and compares them row by row", () => {
+    const result = runPythonJson(["-c", ENGINE_SCRIPT, tempDir]);
+    expect(result.memmap).toBe(true);
+    expect(result.bf16_shape).toEqual([3, 4, 16]);
+    // bf16 keeps 8 mantissa bits.
+    expect(result.bf16_error).toBeLessThan(1e-2);
+    expect(result.json_delta).toBeLessThan(1e-6);
+
+    expect(result.identical.max_delta).toBeLessThan(1e-6);
+    expect(result.identical.top1_agreement).toBe(1);
+    expect(result.identical.top5_agreement).toBe(1);
+    expect(result.identical.first_divergent_position).toBeNull();
+    expect(result.identical.rows).toBe(12);
+
+    expect(result.diverged.first_divergent_position).toBe(5);
+    expect(result.diverged.top1_agreement).toBeCloseTo(11 / 12);
+    expect(result.diverged.kl_max).toBeGreaterThan(0);
+    // Streaming one row at a time gives the same summary.
+    const blocked = result.diverged_blocked;
+    expect(blocked.first_divergent_position).toBe(5);
+    expect(blocked.max_delta).toBeCloseTo(result.diverged.max_delta);
+    expect(blocked.kl_divergence).toBeCloseTo(result.diverged.kl_divergence);
+  });
+
+  it("fails the export check only when the max delta exceeds the threshold", () => {
+    const check = (candidate) =>
+      spawnSync(
+        "python",
+        [
+          "scripts/eval/export_equivalence.py",
+          "--reference",
+          logitsPath("reference.json"),
+          "--candidate",
+          logitsPath(candidate),
+          "--max-delta",
+          "0.05",
+        ],
+        { encoding: "utf-8" },
+      );
+
+    const close = check("close.npy");
+    expect(close.status).toBe(0);
+    const metrics = JSON.parse(close.stdout);
+    expect(metrics.max_delta).toBeCloseTo(0.01);
+    expect(metrics.top1_agreement).toBe(1);
+
+    const bf16 = check("reference.safetensors");
+    expect(bf16.status).toBe(0);
+
+    const diverged = check("diverged.npy");
+    expect(diverged.status).not.toBe(0);
+    expect(diverged.stderr).toContain("exceeds threshold 0.05");
+  });
+
+  it("reads per-entry rows from binary logits in the Python vs Core ML gate", () => {
+    const writeOutputs = (name, ids) => {
+      const file = logitsPath(name);
+      const rows = ids.map(([id, index]) => ({
+        id,
+        logits_index: index,
+        tokens: [1, 2],
+        response: "ok",
+      }));
+      fs.writeFileSync(file, rows.map((row) => JSON.stringify(row)).join("\n"));
+      return file;
+    };
+    const pythonOutput = writeOutputs("python.jsonl", [
+      ["a", 0],
+      ["b", 1],
+      ["c", 2],
+    ]);
+    // Same entries in a different row order on the Core ML side.
+    const coremlOutput = writeOutputs("coreml.jsonl", [
+      ["c", 2],
+      ["a", 0],
+      ["b", 1],
+    ]);
+    const gate = (coremlLogits) => {
+      const metricsPath = logitsPath(`metrics-${coremlLogits}.json`);
+      const result = spawnSync(
+        "python",
+        [
+          "eval/export_equivalence.py",
+          "--python-output",
+          pythonOutput,
+          "--coreml-output",
+          coremlOutput,
+          "--python-logits",
+          logitsPath("reference.npy"),
+          "--coreml-logits",
+          logitsPath(coremlLogits),
+          "--logits-tolerance",
+          "0.05",
+          "--metrics-output",
+          metricsPath,
+        ],
+        { encoding: "utf-8" },
+      );
+      return {
+        ...result,
+        metrics: JSON.parse(fs.readFileSync(metricsPath, "utf-8")),
+      };
+    };
+
+    const passing = gate("close.npy");
+    expect(passing.status).toBe(0);
+    expect(JSON.parse(passing.stdout)).toEqual({ status: "ok", entries: 3 });
+    expect(passing.metrics.rows).toBe(12);
+    expect(passing.metrics.top1_agreement).toBe(1);
+
+    const failing = gate("diverged.npy");
+    expect(failing.status).toBe(1);
+    const { failures } = JSON.parse(failing.stdout);
+    expect(failures).toHaveLength(1);
+    expect(failures[0]).toContain("Logits mismatch for b");
+    expect(failing.metrics.top1_agreement).toBeCloseTo(11 / 12);
+  });
+});
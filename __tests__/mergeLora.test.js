@@ -0,0 +1,88 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import {
+  buildTinyLlama,
+  describeWithPython,
+  runPython,
+  runPythonJson,
+} from "../test-utils/python";
+
+// transformers pulls in tokenizers and safetensors.
+const describeWithPeft = describeWithPython("torch", "transformers", "peft");
+
+// Merge in memory with PEFT, then diff every tensor with the merged checkpoint.
+const COMPARE_SCRIPT = `
+import json, sys
+from pathlib import Path
+from peft import PeftModel
+from safetensors.torch import load_file
+from transformers import AutoModelForCausalLM
+
+base_dir, lora_dir, merged_dir = sys.argv[1:4]
+reference = PeftModel.from_pretrained(AutoModelForCausalLM.from_pretrained(base_dir), lora_dir)
+reference = {name: tensor.detach() for name, tensor in reference.merge_and_unload().state_dict().items()}
+merged = {}
+for shard in sorted(Path(merged_dir).glob("*.safetensors")):
+    merged.update(load_file(shard))
+base = {}
+for shard in sorted(Path(base_dir).glob("*.safetensors")):
+    base.update(load_file(shard))
+print(json.dumps({
+    "missing": sorted(set(reference) - set(merged)),
+    "extra": sorted(set(merged) - set(reference)),
+    "max_delta": max((reference[name] - merged[name]).abs().max().item() for name in reference if name in merged),
+    "changed": sorted(name for name in merged if not (merged[name] == base[name]).all()),
+    "dtypes": sorted({str(tensor.dtype) for tensor in merged.values()}),
+}))
+`;
+
+describeWithPeft("LoRA merge", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "merge-lora-"));
+  const baseDir = path.join(tempDir, "base");
+  const loraDir = path.join(tempDir, "lora");
+  buildTinyLlama(baseDir, "--lora", loraDir, "--shards", "3");
+
+  it("streams shards into the same weights as PEFT merge_and_unload", () => {
+    const mergedDir = path.join(tempDir, "merged");
+    const stdout = runPython([
+      "scripts/merge_lora.py",
+      "--base_model",
+      baseDir,
+      "--lora_dir",
+      loraDir,
+      "--output_dir",
+      mergedDir,
+      "--mode",
+      "streaming",
+    ]);
+    // Progress lines come first; the stats JSON closes the output.
+    const stats = JSON.parse(stdout.slice(stdout.search(/^\{/m)));
+    const baseShards = fs
+      .readdirSync(baseDir)
+      .filter((name) => name.endsWith(".safetensors"));
+    expect(baseShards.length).toBeGreaterThan(1);
+    expect(stats.shards).toBe(baseShards.length);
+    // q, v, gate and down projections in each of the 2 layers.
+    expect(stats.lora_modules).toBe(8);
+    const mergedFile = (name) => fs.existsSync(path.join(mergedDir, name));
+    expect(mergedFile("model.safetensors.index.json")).toBe(true);
+    expect(mergedFile("tokenizer.json")).toBe(true);
+
+    const result = runPythonJson([
+      "-c",
+      COMPARE_SCRIPT,
+      baseDir,
+      loraDir,
+      mergedDir,
+    ]);
+    expect(result.missing).toEqual([]);
+    expect(result.extra).toEqual([]);
+    expect(result.max_delta).toBeLessThan(1e-5);
+    expect(result.changed).toHaveLength(8);
+    result.changed.forEach((name) => {
+      expect(name).toMatch(/\.(q_proj|v_proj|gate_proj|down_proj)\.weight$/);
+    });
+    expect(result.dtypes).toEqual(["torch.float32"]);
+  });
+});
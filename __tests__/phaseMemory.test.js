@@ -0,0 +1,42 @@
+import { execFileSync } from "child_process";
+
+// Load holds 200 MB then frees it; quantize only adds 20 MB on top of a
+// 50 MB block that outlives load.
+const PHASES_SCRIPT = `
+import json, sys, time
+sys.path.insert(0, "scripts")
+from phase_memory import PhaseMemoryMonitor
+
+MB = 1024 * 1024
+with PhaseMemoryMonitor(interval_s=0.01) as monitor:
+    with monitor.phase("load"):
+        kept = b"k" * (50 * MB)
+        weights = b"w" * (200 * MB)
+        time.sleep(0.1)
+        del weights
+    with monitor.phase("quantize"):
+        packed = b"q" * (20 * MB)
+        time.sleep(0.1)
+print(json.dumps(monitor.phases))
+`;
+
+describe("phase memory monitor", () => {
+  it("measures each phase from its own baseline instead of the process high-water mark", () => {
+    const phases = JSON.parse(
+      execFileSync("python", ["-c", PHASES_SCRIPT], { encoding: "utf-8" }),
+    );
+    const { load, quantize } = phases;
+    expect(load.process).toBe("main");
+    expect(load.peak_delta_mb).toBeGreaterThan(200);
+    expect(load.peak_rss_mb).toBeCloseTo(
+      load.baseline_rss_mb + load.peak_delta_mb,
+      0,
+    );
+
+    // The 200 MB load peak must not leak into the later phase.
+    expect(quantize.peak_rss_mb).toBeLessThan(load.peak_rss_mb - 100);
+    expect(quantize.baseline_rss_mb).toBeGreaterThan(load.baseline_rss_mb + 40);
+    expect(quantize.peak_delta_mb).toBeGreaterThan(15);
+    expect(quantize.peak_delta_mb).toBeLessThan(60);
+  });
+});
@@ -0,0 +1,184 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync, spawnSync } from "child_process";
+
+// Forks are built from legacy KV tuples, which transformers dropped in 5.0
+// (CI pins 4.44).
+const LEGACY_CACHE_SCRIPT = `
+import tokenizers
+from transformers.cache_utils import DynamicCache
+DynamicCache.to_legacy_cache
+`;
+
+const legacyCacheAvailable =
+  spawnSync("python", ["-c", LEGACY_CACHE_SCRIPT]).status === 0;
+
+const describeWithLegacyCache = legacyCacheAvailable ? describe : describe.skip;
+
+const TOOLS = [
+  {
+    name: "web_search",
+    description: "w9",
+    parameters: { query: { type: "string", required: true } },
+  },
+];
+
+// LRU bookkeeping, and decoding on a fork must leave the stored state
+// untouched.
+const CACHE_SCRIPT = `
+import json, sys
+import torch
+from transformers import AutoModelForCausalLM
+sys.path.insert(0, ".")
+from scripts.eval.prefix_cache import PrefixKVCache, state_bytes
+
+model = AutoModelForCausalLM.from_pretrained(sys.argv[1]).eval()
+first, second = tuple(range(4, 14)), tuple(range(20, 30))
+one_entry = state_bytes(PrefixKVCache(model, 0).get(first))
+
+cache = PrefixKVCache(model, one_entry)
+stored = cache.get(first)
+snapshot = [(key.clone(), value.clone()) for key, value in stored]
+fork = cache.fork(first, 3)
+with torch.inference_mode():
+    model(
+        input_ids=torch.tensor([[40], [41], [42]]),
+        past_key_values=fork,
+        cache_position=torch.tensor([len(first)]),
+        use_cache=True,
+    )
+unchanged = all(
+    torch.equal(key, old_key) and torch.equal(value, old_value)
+    for (key, value), (old_key, old_value) in zip(cache.get(first), snapshot)
+)
+cache.get(second)
+after_second = cache.stats()
+
+tiny = PrefixKVCache(model, one_entry - 1)
+tiny.get(first)
+tiny.get(first)
+print(json.dumps({
+    "unchanged": unchanged,
+    "fork_rows": fork.get_seq_length(),
+    "after_second": after_second,
+    "tiny": tiny.stats(),
+}))
+`;
+
+describeWithLegacyCache("shared-prefix KV cache", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "prefix-cache-"));
+  const modelDir = path.join(tempDir, "model");
+  const promptsPath = path.join(tempDir, "prompts.json");
+  execFileSync("python", ["__tests__/fixtures/tiny_llama.py", modelDir], {
+    stdio: "ignore",
+  });
+  // Three cases offer the same tools and so share a prefix; the last one
+  // does not.
+  fs.writeFileSync(
+    promptsPath,
+    JSON.stringify({
+      cases: [
+        { stable_id: "a", user_prompt: "w1 w2 w3", tools: TOOLS },
+        { stable_id: "b", user_prompt: "w4 w5 w6 w7 w8 w9", tools: TOOLS },
+        {
+          stable_id: "c",
+          user_prompt: "w13",
+          tools: TOOLS,
+          context: [{ content: "w20" }],
+        },
+        { stable_id: "d", user_prompt: "w30 w31", tools: [] },
+      ],
+    }),
+  );
+
+  const generate = (name, ...extraArgs) => {
+    const output = path.join(tempDir, `${name}.jsonl`);
+    const report = JSON.parse(
+      execFileSync(
+        "python",
+        [
+          "scripts/eval/generate_reference_outputs.py",
+          "--hf_model",
+          modelDir,
+          "--prompts",
+          promptsPath,
+          "--output",
+          output,
+          "--max-new-tokens",
+          "5",
+          "--logits-steps",
+          "2",
+          "--batch-size",
+          "1",
+          ...extraArgs,
+        ],
+        { encoding: "utf-8", stdio: ["ignore", "pipe", "ignore"] },
+      ),
+    );
+    const tokens = fs
+      .readFileSync(output, "utf-8")
+      .trim()
+      .split("\n")
+      .map((line) => JSON.parse(line).tokens);
+    return { report, tokens };
+  };
+
+  it("produces identical outputs with and without the prefix cache", () => {
+    const cached = generate("cached", "--measure-speedup");
+    const uncached = generate("uncached", "--prefix-cache-mb", "0");
+
+    expect(cached.tokens).toEqual(uncached.tokens);
+    const maxDelta = Number(
+      execFileSync(
+        "python",
+        [
+          "-c",
+          "import sys, numpy as np; print(float(np.abs(np.load(sys.argv[1]) - np.load(sys.argv[2])).max()))",
+          cached.report.logits_output,
+          uncached.report.logits_output,
+        ],
+        { encoding: "utf-8" },
+      ),
+    );
+    expect(maxDelta).toBeLessThan(1e-4);
+
+    // Two distinct prefixes, the shared one reused by two of its three batches.
+    expect(cached.report.prefix_cache.misses).toBe(2);
+    expect(cached.report.prefix_cache.hits).toBe(2);
+    expect(cached.report.prefix_cache.entries).toBe(2);
+    expect(cached.report.prefill_tokens_saved).toBeGreaterThan(0);
+    expect(cached.report.prefill_speedup).toBeGreaterThan(0);
+
+    expect(uncached.report.prefix_cache.misses).toBe(4);
+    expect(uncached.report.prefix_cache.entries).toBe(0);
+    expect(uncached.report.prefill_tokens_saved).toBe(0);
+  });
+
+  it("evicts least recently used prefixes and never writes the stored state", () => {
+    const result = JSON.parse(
+      execFileSync("python", ["-c", CACHE_SCRIPT, modelDir], {
+        encoding: "utf-8",
+        stdio: ["ignore", "pipe", "ignore"],
+      }),
+    );
+    expect(result.unchanged).toBe(true);
+    expect(result.fork_rows).toBe(11);
+    expect(result.after_second).toMatchObject({
+      entries: 1,
+      misses: 2,
+      hits: 2,
+      evictions: 1,
+    });
+    expect(result.after_second.bytes).toBeLessThanOrEqual(
+      result.after_second.max_bytes,
+    );
+    // A prefix bigger than the budget is recomputed every time.
+    expect(result.tiny).toMatchObject({
+      entries: 0,
+      bytes: 0,
+      misses: 2,
+      hits: 0,
+    });
+  });
+});
@@ -0,0 +1,181 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import crypto from "crypto";
+import { execFileSync } from "child_process";
+import PromptBuilder from "../src/core/prompt/PromptBuilder";
+import { buildPrompt } from "../src/utils/buildPrompt";
+
+const sha256 = (text) =>
+  crypto.createHash("sha256").update(text, "utf8").digest("hex");
+
+const goldenPath = path.join(
+  __dirname,
+  "..",
+  "scripts",
+  "eval",
+  "golden_prompts.json",
+);
+
+const readGoldenCases = () => {
+  const parsed = JSON.parse(fs.readFileSync(goldenPath, "utf-8"));
+  return Array.isArray(parsed) ? parsed : parsed.cases;
+};
+
+// Cases chosen to exercise the JS behaviour the Python renderer has to mirror:
+// localeCompare ordering, JSON.stringify key order and number formatting,
+// replaceAll "$" patterns, role labels and non-string context content.
+const runtimeCases = [
+  {
+    id: "collation",
+    user_prompt: "Pick a tool",
+    tools: [
+      "zeta",
+      "web.run",
+      "web_search",
+      "Weather",
+      "weather",
+      "getX",
+      "getx",
+      "get_x",
+      "Éclair",
+      "eclair",
+      "a10",
+      "a2",
+      "a-b",
+      "A_b",
+    ].map((name) => ({ name, description: `${name} tool`, parameters: {} })),
+    context: [],
+  },
+  {
+    id: "parameters",
+    user_prompt: "Use numbers",
+    tools: [
+      {
+        name: "calc",
+        description: "Costs $5 — pays $& and $$ and $' and $`",
+        parameters: {
+          b: { type: "number", default: 1.0 },
+          10: "ten",
+          2: "two",
+          a: [1.5, 1e21, 1e-7, 0.00001, 123456789012345678901, 0.1 + 0.2],
+          unicode: "naïve ✓ 😀 \u0007 \"quoted\" back\\slash\ttab",
+        },
+      },
+      { name: "skipped", description: "" },
+      { name: "noparams", description: "no parameters" },
+    ],
+    context: [],
+  },
+  {
+    id: "context",
+    user_prompt: "Continue the $& conversation",
+    tools: [],
+    context: [
+      "plain string",
+      "",
+      null,
+      { role: "user", content: "hello" },
+      { role: "assistant", content: { tool: "search", results: [1, 2] } },
+      { role: "tool", content: null },
+      { role: "", content: "no role" },
+      { content: ["list", 3] },
+      { role: "system" },
+    ],
+  },
+  ...readGoldenCases().map((entry) => ({
+    id: entry.stable_id,
+    user_prompt: entry.user_prompt,
+    tools: entry.tools,
+    context: entry.context,
+  })),
+];
+
+const userPromptCases = [
+  { id: "query-only", query: "What time is it?" },
+  { id: "text-emotion", query: "Help me", text_emotion: "anxious" },
+  {
+    id: "audio-wins",
+    query: "Help me",
+    text_emotion: "calm",
+    audio_emotion: "excited",
+  },
+  {
+    id: "context-and-emotion",
+    query: "Summarise",
+    text_emotion: "tired $&",
+    context: "Meeting notes: {emotion} $$ 😀",
+  },
+  { id: "empty-context", query: "Hi", text_emotion: "", context: "" },
+];
+
+class StaticToolRegistry {
+  constructor(tools) {
+    this.tools = tools;
+  }
+
+  getAvailableTools() {
+    return this.tools;
+  }
+}
+
+const renderWithPython = (cases) => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "prompt-parity-"));
+  const casesPath = path.join(tempDir, "cases.json");
+  fs.writeFileSync(casesPath, JSON.stringify(cases, null, 2));
+  const stdout = execFileSync(
+    "python",
+    ["scripts/eval/prompt_builder.py", "--cases", casesPath],
+    { encoding: "utf-8" },
+  );
+  return JSON.parse(stdout);
+};
+
+describe("Python prompt builder parity", () => {
+  const rendered = renderWithPython({
+    runtime_prompt_v1: runtimeCases,
+    user_prompt_builder_v1: userPromptCases,
+  });
+
+  it("renders runtime prompts byte-identical to PromptBuilder", () => {
+    expect(rendered.runtime_prompt_v1).toHaveLength(runtimeCases.length);
+    runtimeCases.forEach((entry, index) => {
+      const builder = new PromptBuilder(new StaticToolRegistry(entry.tools));
+      const expected = builder.build(entry.user_prompt, entry.context);
+      const actual = rendered.runtime_prompt_v1[index];
+      expect(actual.id).toBe(entry.id);
+      expect(actual.prompt).toBe(expected);
+      expect(actual.prompt_hash).toBe(sha256(expected));
+    });
+  });
+
+  it("renders user prompts byte-identical to buildPrompt", () => {
+    expect(rendered.user_prompt_builder_v1).toHaveLength(
+      userPromptCases.length,
+    );
+    userPromptCases.forEach((entry, index) => {
+      const expected = buildPrompt({
+        query: entry.query,
+        textEmotion: entry.text_emotion ?? null,
+        audioEmotion: entry.audio_emotion ?? null,
+        context: entry.context ?? "",
+      });
+      const actual = rendered.user_prompt_builder_v1[index];
+      expect(actual.id).toBe(entry.id);
+      expect(actual.prompt).toBe(expected);
+      expect(actual.prompt_hash).toBe(sha256(expected));
+    });
+  });
+
+  it("matches golden expected_prompt_hash values when present", () => {
+    const byId = new Map(
+      rendered.runtime_prompt_v1.map((entry) => [entry.id, entry]),
+    );
+    readGoldenCases().forEach((entry) => {
+      if (typeof entry.expected_prompt_hash === "undefined") return;
+      expect(byId.get(entry.stable_id).prompt_hash).toBe(
+        entry.expected_prompt_hash.toLowerCase(),
+      );
+    });
+  });
+});
@@ -0,0 +1,468 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync, spawnSync } from "child_process";
+
+// Echoes prompts like echo_model_server.py, but crashes on CRASH and hangs on
+// HANG.
+const FLAKY_SERVER = `
+import json, sys, time
+print(json.dumps({"ready": True}), flush=True)
+for line in sys.stdin:
+    request = json.loads(line)
+    if "CRASH" in request["prompt"]:
+        sys.exit(3)
+    if "HANG" in request["prompt"]:
+        time.sleep(30)
+    print(json.dumps({"id": request["id"], "output": request["prompt"]}), flush=True)
+`;
+
+// A --model-cmd that logs every prompt it is asked to run, then fails on CRASH.
+const COUNTING_MODEL = `
+import sys
+prompt = sys.stdin.read()
+with open(sys.argv[1], "a") as handle:
+    handle.write(prompt.replace("\\n", " ") + "\\n")
+if "CRASH" in prompt:
+    sys.exit(3)
+sys.stdout.write(prompt)
+`;
+
+const SHA256_SCRIPT = `
+import hashlib, sys
+print(hashlib.sha256(sys.argv[1].encode()).hexdigest())
+`;
+
+const MODEL_FIELDS = ["stable_id", "status", "model_rc", "model_out_sha256"];
+
+const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "prompt-regression-"));
+const flakyServerPath = path.join(tempDir, "flaky_server.py");
+fs.writeFileSync(flakyServerPath, FLAKY_SERVER);
+const countingModelPath = path.join(tempDir, "counting_model.py");
+fs.writeFileSync(countingModelPath, COUNTING_MODEL);
+
+const runRegression = (name, ...extraArgs) => {
+  const reportOut = path.join(tempDir, `${name}.json`);
+  const sarifOut = path.join(tempDir, `${name}.sarif`);
+  const result = spawnSync(
+    "python",
+    [
+      "scripts/eval/run_prompt_regression.py",
+      "--report-out",
+      reportOut,
+      "--sarif-out",
+      sarifOut,
+      ...extraArgs,
+    ],
+    { encoding: "utf-8" },
+  );
+  return {
+    status: result.status,
+    report: JSON.parse(fs.readFileSync(reportOut, "utf-8")),
+    sarif: JSON.parse(fs.readFileSync(sarifOut, "utf-8")),
+  };
+};
+
+// Golden-style cases with their baselines locked to the current rendering.
+const writeCases = (name, prompts) => {
+  const casesPath = path.join(tempDir, `${name}.json`);
+  const cases = prompts.map((prompt, index) => ({
+    stable_id: `${name}-${index}`,
+    user_prompt: prompt,
+    tools: [],
+    context: [],
+    expected: {
+      tool_calls: [],
+      json_valid: false,
+      refusal: false,
+      citations_required: false,
+    },
+  }));
+  fs.writeFileSync(casesPath, JSON.stringify({ cases }));
+  const { report } = runRegression(`${name}-baseline`, "--prompts", casesPath);
+  report.files[0].results.forEach((result, index) => {
+    cases[index].expected_prompt_hash = result.prompt_sha256;
+  });
+  fs.writeFileSync(casesPath, JSON.stringify({ cases }));
+  return casesPath;
+};
+
+const sha256 = (text) =>
+  execFileSync("python", ["-c", SHA256_SCRIPT, text], {
+    encoding: "utf-8",
+  }).trim();
+
+const modelResults = (report) =>
+  report.files[0].results.map((result) =>
+    Object.fromEntries(MODEL_FIELDS.map((field) => [field, result[field]])),
+  );
+
+describe("prompt regression model workers", () => {
+  const prompts = Array.from(
+    { length: 8 },
+    (_, index) => `Summarise note number ${index}.`,
+  );
+  const casesPath = writeCases("echo", prompts);
+
+  it("loads the model once per worker and matches per-case commands", () => {
+    const server = runRegression(
+      "server",
+      "--prompts",
+      casesPath,
+      "--model-server",
+      "python scripts/eval/echo_model_server.py --server --load-seconds 0",
+      "--concurrency",
+      "3",
+      "--no-cache",
+    );
+    expect(server.status).toBe(0);
+    expect(server.report.mode).toBe("full");
+    expect(server.report.model_run).toMatchObject({
+      mode: "server",
+      concurrency: 3,
+      cases: 8,
+      worker_starts: 3,
+    });
+    server.report.files[0].results.forEach((result, index) => {
+      expect(result.model_rc).toBe(0);
+      expect(result.model_out_sha256).toBe(sha256(prompts[index]));
+    });
+
+    const command = runRegression(
+      "command",
+      "--prompts",
+      casesPath,
+      "--model-cmd",
+      "python scripts/eval/echo_model_server.py --load-seconds 0",
+      "--concurrency",
+      "2",
+      "--no-cache",
+    );
+    expect(command.status).toBe(0);
+    expect(command.report.model_run).toMatchObject({
+      mode: "cmd",
+      concurrency: 2,
+      worker_starts: 8,
+    });
+    expect(modelResults(command.report)).toEqual(modelResults(server.report));
+  });
+
+  it("restarts crashed or hung workers and reports in case order", () => {
+    const flakyPath = writeCases("flaky", [
+      "first",
+      "CRASH here",
+      "third",
+      "HANG here",
+      "fifth",
+      "sixth",
+    ]);
+    const run = (concurrency) =>
+      runRegression(
+        `flaky-${concurrency}`,
+        "--prompts",
+        flakyPath,
+        "--model-server",
+        `python ${flakyServerPath}`,
+        "--model-timeout",
+        "1",
+        "--concurrency",
+        concurrency,
+        "--no-cache",
+      );
+
+    const sequential = run("1");
+    const parallel = run("3");
+    [sequential, parallel].forEach(({ status, report, sarif }) => {
+      expect(status).toBe(1);
+      expect(report.totals.mismatches).toBe(2);
+      const statuses = report.files[0].results.map(
+        (result) => result.model_rc ?? null,
+      );
+      expect(statuses).toEqual([0, null, 0, null, 0, 0]);
+      const messages = sarif.runs[0].results.map(
+        (result) => result.message.text,
+      );
+      expect(messages).toHaveLength(2);
+      expect(messages[0]).toContain("model-server failed (rc=3)");
+      expect(messages[1]).toContain("model-server failed (rc=124)");
+      expect(messages[1]).toContain("timed out after 1s");
+    });
+    // Each failure kills its worker, and the next case gets a fresh one.
+    expect(sequential.report.model_run.worker_starts).toBe(3);
+    expect(modelResults(parallel.report)).toEqual(
+      modelResults(sequential.report),
+    );
+    expect(parallel.sarif.runs[0].results).toEqual(
+      sequential.sarif.runs[0].results,
+    );
+  });
+
+  it("rejects --model-cmd together with --model-server", () => {
+    const result = spawnSync(
+      "python",
+      [
+        "scripts/eval/run_prompt_regression.py",
+        "--report-out",
+        path.join(tempDir, "both.json"),
+        "--sarif-out",
+        path.join(tempDir, "both.sarif"),
+        "--model-cmd",
+        "cat",
+        "--model-server",
+        "cat",
+      ],
+      { encoding: "utf-8" },
+    );
+    expect(result.status).toBe(2);
+    expect(result.stderr).toContain(
+      "--model-cmd and --model-server are mutually exclusive",
+    );
+  });
+});
+
+describe("prompt regression result cache", () => {
+  const casesPath = writeCases("cached", [
+    "alpha",
+    "beta",
+    "CRASH gamma",
+    "delta",
+  ]);
+  const cacheDir = path.join(tempDir, "cache");
+  const callsPath = path.join(tempDir, "calls.log");
+  const runCached = (name, ...extraArgs) => {
+    fs.writeFileSync(callsPath, "");
+    const result = runRegression(
+      name,
+      "--prompts",
+      casesPath,
+      "--model-cmd",
+      `python ${countingModelPath} ${callsPath}`,
+      "--cache-dir",
+      cacheDir,
+      ...extraArgs,
+    );
+    const calls = fs
+      .readFileSync(callsPath, "utf-8")
+      .trim()
+      .split("\n")
+      .filter(Boolean);
+    return { ...result, calls };
+  };
+
+  it("reuses successful results and always retries failures", () => {
+    const first = runCached("cache-first");
+    expect(first.status).toBe(1);
+    expect(first.calls).toHaveLength(4);
+    expect(first.report.model_cache).toEqual({
+      enabled: true,
+      hits: 0,
+      misses: 4,
+    });
+
+    const second = runCached("cache-second");
+    expect(second.status).toBe(1);
+    expect(second.calls).toEqual(["CRASH gamma"]);
+    expect(second.report.model_cache).toEqual({
+      enabled: true,
+      hits: 3,
+      misses: 1,
+    });
+    expect(modelResults(second.report)).toEqual(modelResults(first.report));
+    expect(second.sarif.runs[0].results).toEqual(first.sarif.runs[0].results);
+
+    const bypassed = runCached("cache-bypassed", "--no-cache");
+    expect(bypassed.calls).toHaveLength(4);
+    expect(bypassed.report.model_cache).toEqual({
+      enabled: false,
+      hits: 0,
+      misses: 4,
+    });
+  });
+
+  it("keys results by case content, model and timeout", () => {
+    runCached("cache-warm");
+    const cases = JSON.parse(fs.readFileSync(casesPath, "utf-8"));
+    // Same rendered prompt, different expectations: only that case reruns.
+    cases.cases[0].expected.refusal = true;
+    fs.writeFileSync(casesPath, JSON.stringify(cases));
+    expect(runCached("cache-edited").calls).toEqual(["alpha", "CRASH gamma"]);
+
+    const retimed = runCached("cache-timeout", "--model-timeout", "60");
+    expect(retimed.calls).toHaveLength(4);
+
+    // A manifest names the model, so the command line can change freely.
+    const manifestPath = path.join(tempDir, "manifest.json");
+    fs.writeFileSync(manifestPath, JSON.stringify({ model_hash: "abc123" }));
+    const manifested = runCached(
+      "cache-manifest",
+      "--model-manifest",
+      manifestPath,
+    );
+    expect(manifested.calls).toHaveLength(4);
+    const renamed = runRegression(
+      "cache-manifest-renamed",
+      "--prompts",
+      casesPath,
+      "--model-cmd",
+      `python -u ${countingModelPath} ${callsPath}`,
+      "--cache-dir",
+      cacheDir,
+      "--model-manifest",
+      manifestPath,
+    );
+    expect(renamed.report.model_cache).toEqual({
+      enabled: true,
+      hits: 3,
+      misses: 1,
+    });
+  });
+
+  it("treats unreadable cache entries as misses", () => {
+    runCached("cache-fill");
+    const entries = fs
+      .readdirSync(cacheDir, { recursive: true })
+      .map((name) => path.join(cacheDir, name))
+      .filter((file) => file.endsWith(".json"));
+    expect(entries.length).toBeGreaterThan(0);
+    entries.forEach((file) => fs.writeFileSync(file, "{not json"));
+    const rerun = runCached("cache-corrupt");
+    expect(rerun.calls).toHaveLength(4);
+    expect(rerun.report.model_cache.hits).toBe(0);
+    expect(runCached("cache-repaired").report.model_cache.hits).toBe(3);
+  });
+});
+
+describe("sharded prompt regression", () => {
+  // A locked file with one broken baseline and a file with no baselines, both
+  // pretty-printed so findings land on different lines.
+  const lockedPath = writeCases("locked", [
+    "one",
+    "two",
+    "three",
+    "four",
+    "five",
+  ]);
+  const locked = JSON.parse(fs.readFileSync(lockedPath, "utf-8"));
+  locked.cases[2].expected_prompt_hash = "0".repeat(64);
+  const lockedText = JSON.stringify(locked, null, 2);
+  fs.writeFileSync(lockedPath, lockedText);
+  const unlockedPath = path.join(tempDir, "unlocked.json");
+  const unlockedCases = ["six", "seven", "eight"].map((prompt, index) => ({
+    stable_id: `unlocked-${index}`,
+    user_prompt: prompt,
+    tools: [],
+    context: [],
+    expected: locked.cases[0].expected,
+  }));
+  const unlockedText = JSON.stringify({ cases: unlockedCases }, null, 2);
+  fs.writeFileSync(unlockedPath, unlockedText);
+
+  const promptArgs = ["--prompts", lockedPath, "--prompts", unlockedPath];
+  const shards = ["1/3", "2/3", "3/3"].map((shard) =>
+    runRegression(`shard-${shard[0]}`, ...promptArgs, "--shard", shard),
+  );
+  const caseIds = (report) =>
+    report.files.flatMap((file) => file.results.map((row) => row.stable_id));
+  const merge = (name, reports, sarifs) => {
+    const reportOut = path.join(tempDir, `${name}.json`);
+    const sarifOut = path.join(tempDir, `${name}.sarif`);
+    const result = spawnSync(
+      "python",
+      [
+        "scripts/eval/run_prompt_regression.py",
+        "merge",
+        ...reports.flatMap((index) => [
+          "--report",
+          path.join(tempDir, `shard-${index}.json`),
+        ]),
+        ...sarifs.flatMap((index) => [
+          "--sarif",
+          path.join(tempDir, `shard-${index}.sarif`),
+        ]),
+        "--report-out",
+        reportOut,
+        "--sarif-out",
+        sarifOut,
+      ],
+      { encoding: "utf-8" },
+    );
+    return { ...result, reportOut, sarifOut };
+  };
+
+  it("deals cases round-robin over every case of every file", () => {
+    expect(shards.map(({ report }) => caseIds(report))).toEqual([
+      ["locked-0", "locked-3", "unlocked-1"],
+      ["locked-1", "locked-4", "unlocked-2"],
+      ["locked-2", "unlocked-0"],
+    ]);
+    expect(shards.map(({ report }) => report.shard)).toEqual([
+      { index: 1, count: 3 },
+      { index: 2, count: 3 },
+      { index: 3, count: 3 },
+    ]);
+    // Only the shard holding the broken baseline fails.
+    expect(shards.map(({ status }) => status)).toEqual([0, 0, 1]);
+  });
+
+  it("merges shard reports given in any order into the unsharded pair", () => {
+    const whole = runRegression("unsharded", ...promptArgs);
+    expect(whole.status).toBe(1);
+    expect(whole.report.totals).toMatchObject({
+      cases_total: 8,
+      mismatches: 1,
+      missing_baselines: 3,
+    });
+
+    const merged = merge("merged", [3, 1, 2], [2, 3, 1]);
+    expect(merged.status).toBe(1);
+    const report = JSON.parse(fs.readFileSync(merged.reportOut, "utf-8"));
+    expect({ ...report, ts: whole.report.ts }).toEqual(whole.report);
+    const sarif = JSON.parse(fs.readFileSync(merged.sarifOut, "utf-8"));
+    expect(sarif).toEqual(whole.sarif);
+  });
+
+  it("points SARIF findings at the stable_id of each case", () => {
+    const texts = { [lockedPath]: lockedText, [unlockedPath]: unlockedText };
+    const { sarif } = runRegression("located", ...promptArgs);
+    expect(sarif.runs[0].results).toHaveLength(4);
+    sarif.runs[0].results.forEach(({ properties, locations }) => {
+      const lines = texts[properties.prompts_path].split("\n");
+      const index = lines.findIndex((text) =>
+        text.includes(`"stable_id": "${properties.stable_id}"`),
+      );
+      expect(index).toBeGreaterThan(0);
+      expect(locations[0].physicalLocation.region).toEqual({
+        startLine: index + 1,
+        startColumn: lines[index].indexOf(`"${properties.stable_id}"`) + 1,
+      });
+    });
+  });
+
+  it("rejects bad shard numbers and incomplete shard sets", () => {
+    ["0/3", "4/3", "2"].forEach((shard) => {
+      const result = spawnSync(
+        "python",
+        [
+          "scripts/eval/run_prompt_regression.py",
+          "--report-out",
+          path.join(tempDir, "bad-shard.json"),
+          "--sarif-out",
+          path.join(tempDir, "bad-shard.sarif"),
+          "--shard",
+          shard,
+        ],
+        { encoding: "utf-8" },
+      );
+      expect(result.status).toBe(2);
+      expect(result.stderr).toContain(
+        "--shard must look like i/N with 1 <= i <= N",
+      );
+    });
+
+    const partial = merge("partial", [1, 2], [1, 2]);
+    expect(partial.status).toBe(2);
+    expect(partial.stderr).toContain(
+      "expected shard reports 1/2 .. 2/2, got 1/3, 2/3",
+    );
+  });
+});
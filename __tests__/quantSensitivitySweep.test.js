@@ -0,0 +1,77 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import {
+  buildTinyLlama,
+  describeWithPython,
+  runPython,
+} from "../test-utils/python";
+
+const describeWithTorch = describeWithPython(
+  "torch",
+  "transformers",
+  "tokenizers",
+);
+
+describeWithTorch("quantization sensitivity sweep", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "quant-sweep-"));
+  const modelDir = path.join(tempDir, "model");
+  const promptsPath = path.join(tempDir, "prompts.jsonl");
+  const outputPath = path.join(tempDir, "sweep.json");
+
+  // A coremltools that fails to import, to prove the sweep never needs it.
+  const blockedDir = path.join(tempDir, "blocked");
+  fs.mkdirSync(path.join(blockedDir, "coremltools"), { recursive: true });
+  fs.writeFileSync(
+    path.join(blockedDir, "coremltools", "__init__.py"),
+    'raise ImportError("coremltools is not installed here")\n',
+  );
+
+  buildTinyLlama(modelDir);
+  const prompts = Array.from({ length: 6 }, (_, i) => ({
+    instruction: `w${i} w${i + 3} w${i + 7}`,
+    context: "",
+    tool_schema: "",
+    expected_tool_call: { tools: [] },
+    expected_answer: `w${i + 1}`,
+  }));
+  fs.writeFileSync(
+    promptsPath,
+    `${prompts.map((row) => JSON.stringify(row)).join("\n")}\n`,
+  );
+
+  it("runs without coremltools and maps module bits to Core ML const names", () => {
+    runPython(
+      [
+        "scripts/quant_sensitivity_sweep.py",
+        "--hf_model",
+        modelDir,
+        "--prompts",
+        promptsPath,
+        "--output",
+        outputPath,
+        "--num-prompts",
+        "4",
+        "--max-length",
+        "32",
+        "--jobs",
+        "1",
+        "--max-delta",
+        "0.03",
+      ],
+      { env: { ...process.env, PYTHONPATH: blockedDir } },
+    );
+    const report = JSON.parse(fs.readFileSync(outputPath, "utf-8"));
+    expect(report.within_threshold).toBe(true);
+    expect(report.metrics.max_delta).toBeLessThanOrEqual(0.03);
+    expect(report.weight_bytes.mixed).toBeGreaterThan(report.weight_bytes.int4);
+    expect(report.weight_bytes.mixed).toBeLessThan(report.weight_bytes.fp16);
+
+    Object.entries(report.module_bits).forEach(([name, bits]) => {
+      const constName = `model_${name.replace(/\./g, "_")}_weight`;
+      expect(report.op_name_bits[constName]).toBe(bits >= 16 ? null : bits);
+    });
+    expect(report.op_name_bits.kv_k).toBeNull();
+    expect(report.op_name_bits.kv_v).toBeNull();
+  });
+});
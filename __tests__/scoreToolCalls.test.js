@@ -0,0 +1,112 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync } from "child_process";
+
+const writeJsonl = (filePath, rows) => {
+  fs.writeFileSync(filePath, rows.map((row) => JSON.stringify(row)).join("\n"));
+};
+
+describe("tool call scorer", () => {
+  it("scores TOOL_CALL and JSON calls against the tool schemas", () => {
+    const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "score-tools-"));
+    const outputsPath = path.join(tempDir, "outputs.jsonl");
+    const toolPath = path.join(tempDir, "tool.json");
+    const detailsPath = path.join(tempDir, "details.json");
+
+    writeJsonl(outputsPath, [
+      {
+        response: 'TOOL_CALL: open_url(url="https://example.com")',
+        latency_ms: 100,
+      },
+      { response: "TOOL_CALL: open_url()", latency_ms: 300 },
+      {
+        response: JSON.stringify({ tool: "get_battery_info", args: {} }),
+        latency_ms: 200,
+      },
+      { response: "TOOL_CALL: not_a_tool(x=1)" },
+      { response: "no tool call here" },
+    ]);
+
+    execFileSync("python", [
+      "scripts/eval/score_tool_calls.py",
+      "--outputs",
+      outputsPath,
+      "--output",
+      toolPath,
+      "--details",
+      detailsPath,
+      "--workers",
+      "2",
+    ]);
+
+    const tool = JSON.parse(fs.readFileSync(toolPath, "utf-8"));
+    expect(tool).toEqual({ valid_rate: 0.5 });
+
+    const details = JSON.parse(fs.readFileSync(detailsPath, "utf-8"));
+    expect(details.outputs).toBe(5);
+    expect(details.attempted_calls).toBe(4);
+    expect(details.unknown_tool_calls).toBe(1);
+    expect(details.per_tool.open_url).toEqual({
+      calls: 2,
+      valid: 1,
+      valid_rate: 0.5,
+    });
+    expect(details.latency_ms.p50).toBe(200);
+  });
+
+  it("reports a null valid_rate when no output attempted a tool call", () => {
+    const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "score-tools-"));
+    const outputsPath = path.join(tempDir, "outputs.jsonl");
+    const toolPath = path.join(tempDir, "tool.json");
+    writeJsonl(outputsPath, [
+      { response: "It is sunny today." },
+      { response: JSON.stringify({ answer: "no tools needed" }) },
+    ]);
+
+    execFileSync("python", [
+      "scripts/eval/score_tool_calls.py",
+      "--outputs",
+      outputsPath,
+      "--output",
+      toolPath,
+    ]);
+    expect(JSON.parse(fs.readFileSync(toolPath, "utf-8"))).toEqual({
+      valid_rate: null,
+    });
+
+    // The summary gate treats an unmeasured rate as nothing to compare.
+    const writeJson = (name, payload) => {
+      const filePath = path.join(tempDir, name);
+      fs.writeFileSync(filePath, JSON.stringify(payload));
+      return filePath;
+    };
+    const summaryPath = path.join(tempDir, "summary.json");
+    execFileSync("python", [
+      "scripts/eval/write_eval_summary.py",
+      "--prompt-regression",
+      writeJson("prompt.json", { passed: 1, failures: 0 }),
+      "--tool-json",
+      toolPath,
+      "--retrieval",
+      writeJson("retrieval.json", { mrr: 0.4, ndcg: 0.5 }),
+      "--latency",
+      writeJson("latency.json", { p95_latency_ms: 120 }),
+      "--memory",
+      writeJson("memory.json", { peak_memory_mb: 512 }),
+      "--baseline",
+      writeJson("baseline.json", {
+        prompt_regression: { passed: 1, failures: 0 },
+        tool_json_validity: { valid_rate: 0.9 },
+        retrieval: { mrr: 0.3, ndcg: 0.4 },
+        latency: { p95_latency_ms: 150 },
+        memory: { peak_memory_mb: 600 },
+      }),
+      "--output",
+      summaryPath,
+    ]);
+    const summary = JSON.parse(fs.readFileSync(summaryPath, "utf-8"));
+    expect(summary.status).toBe("pass");
+    expect(summary.tool_json_validity).toEqual({ valid_rate: null });
+  });
+});
@@ -0,0 +1,137 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync, spawnSync } from "child_process";
+
+const record = (toolName, i, overrides = {}) => ({
+  prompt_id: "runtime_prompt",
+  prompt_version: i % 2 === 0 ? "v1" : "v2",
+  model_id: "model-a",
+  prompt_hash: `sha256_${toolName}_${i}`,
+  tool_name: toolName,
+  tool_args: {},
+  success: true,
+  error: null,
+  ...overrides,
+});
+
+const runSample = (args) =>
+  execFileSync("python", ["scripts/mlops/stratified_sample.py", ...args], {
+    encoding: "utf-8",
+    stdio: ["pipe", "pipe", "ignore"],
+  });
+
+const readLines = (filePath) =>
+  fs.readFileSync(filePath, "utf-8").trim().split("\n");
+
+describe("stratified reservoir sampling", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "stratified-"));
+  const inputPath = path.join(tempDir, "tool_calls.jsonl");
+  const rows = [];
+  for (let i = 0; i < 400; i += 1) {
+    rows.push(record("web_search", i));
+    if (i % 40 === 0) rows.push(record("set_brightness", i));
+    if (i % 100 === 0) {
+      rows.push(record("web_search", i, { success: false, error: "timeout" }));
+    }
+  }
+  const lines = rows.map((row) => JSON.stringify(row));
+  fs.writeFileSync(inputPath, `${lines.join("\n")}\n`);
+
+  it("caps each stratum at its quota and keeps rare strata whole", () => {
+    const quotasPath = path.join(tempDir, "quotas.json");
+    fs.writeFileSync(
+      quotasPath,
+      JSON.stringify({
+        default: 25,
+        strata: { "tool_name=web_search,success=false": 1 },
+      }),
+    );
+    const outputPath = path.join(tempDir, "balanced.jsonl");
+    const reportPath = path.join(tempDir, "report.json");
+    runSample([
+      "--input",
+      inputPath,
+      "--output",
+      outputPath,
+      "--quotas",
+      quotasPath,
+      "--report",
+      reportPath,
+    ]);
+
+    const kept = readLines(outputPath);
+    const report = JSON.parse(fs.readFileSync(reportPath, "utf-8"));
+    expect(report.records).toBe(rows.length);
+    const byKey = Object.fromEntries(
+      report.strata.map((row) => [
+        `${row.tool_name}|${row.prompt_version}|${row.success}`,
+        row,
+      ]),
+    );
+    expect(byKey["web_search|v1|true"]).toMatchObject({ seen: 200, kept: 25 });
+    expect(byKey["set_brightness|v1|true"]).toMatchObject({
+      seen: 10,
+      kept: 10,
+    });
+    expect(byKey["web_search|v1|false"]).toMatchObject({ seen: 4, kept: 1 });
+    expect(kept).toHaveLength(report.kept);
+    expect(kept.filter((line) => line.includes("set_brightness"))).toHaveLength(
+      10,
+    );
+
+    // Kept lines are byte-identical to the input and stay in input order.
+    const positions = kept.map((line) => lines.indexOf(line));
+    expect(positions.every((position) => position >= 0)).toBe(true);
+    expect(positions).toEqual([...positions].sort((a, b) => a - b));
+  });
+
+  it("is deterministic for a seed and reads from stdin", () => {
+    const args = ["--output", "-", "--by", "tool_name", "--quota", "5"];
+    const fromFile = runSample(["--input", inputPath, ...args]);
+    const fromStdin = execFileSync(
+      "python",
+      ["scripts/mlops/stratified_sample.py", "--input", "-", ...args],
+      {
+        encoding: "utf-8",
+        input: fs.readFileSync(inputPath),
+        stdio: ["pipe", "pipe", "ignore"],
+      },
+    );
+    expect(fromStdin).toBe(fromFile);
+    expect(fromFile.trim().split("\n")).toHaveLength(10);
+
+    const reseeded = runSample(["--input", inputPath, ...args, "--seed", "7"]);
+    expect(reseeded).not.toBe(fromFile);
+  });
+
+  it("rejects quotas that are not non-negative integers", () => {
+    const quotasPath = path.join(tempDir, "bad_quotas.json");
+    const run = (quotas) => {
+      fs.writeFileSync(quotasPath, JSON.stringify(quotas));
+      return spawnSync(
+        "python",
+        [
+          "scripts/mlops/stratified_sample.py",
+          "--input",
+          inputPath,
+          "--output",
+          path.join(tempDir, "rejected.jsonl"),
+          "--quotas",
+          quotasPath,
+        ],
+        { encoding: "utf-8" },
+      );
+    };
+    ["2000", 2.5, -1, true].forEach((quota) => {
+      const result = run({ default: quota });
+      expect(result.status).not.toBe(0);
+      expect(result.stderr).toContain(
+        "Default quota must be a non-negative integer",
+      );
+    });
+    const override = run({ strata: { "tool_name=web_search": "3" } });
+    expect(override.status).not.toBe(0);
+    expect(override.stderr).toContain("must be a non-negative integer");
+  });
+});
@@ -0,0 +1,105 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync } from "child_process";
+
+const at = (ms) => new Date(Date.UTC(2025, 0, 1) + ms).toISOString();
+
+const event = (overrides) => ({
+  schema_version: "telemetry_v2",
+  prompt_id: "runtime_prompt",
+  prompt_version: "v1",
+  model_id: "model-test",
+  tool_calls: [],
+  retrieval_hits: [],
+  outcome: "success",
+  latency: 0,
+  redaction_applied: false,
+  ...overrides,
+});
+
+describe("telemetry critical paths", () => {
+  it("breaks requests down into retrieval, tool and generation time", () => {
+    const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "critical-path-"));
+    const telemetryPath = path.join(tempDir, "telemetry.jsonl");
+    const reportPath = path.join(tempDir, "report.json");
+    const tracePath = path.join(tempDir, "trace.json");
+    const events = [
+      event({
+        event_type: "prompt_received",
+        timestamp: at(0),
+        prompt_hash: "slow",
+      }),
+      event({
+        event_type: "retrieval",
+        timestamp: at(40),
+        query_hash: "slow",
+        latency_ms: 40,
+      }),
+      event({
+        event_type: "prompt_received",
+        timestamp: at(50),
+        prompt_hash: "fast",
+      }),
+      event({
+        event_type: "final_response",
+        timestamp: at(150),
+        prompt_hash: "fast",
+      }),
+      event({
+        event_type: "prompt_received",
+        timestamp: at(200),
+        prompt_hash: "abandoned",
+      }),
+      event({
+        event_type: "tool_invocation",
+        timestamp: at(1240),
+        prompt_hash: "slow",
+        tool_name: "web_search",
+        latency_ms: 1000,
+      }),
+      event({
+        event_type: "final_response",
+        timestamp: at(1500),
+        prompt_hash: "slow",
+      }),
+    ];
+    fs.writeFileSync(
+      telemetryPath,
+      events.map((row) => JSON.stringify(row)).join("\n"),
+    );
+
+    execFileSync("python", [
+      "scripts/eval/telemetry_critical_path.py",
+      "--telemetry",
+      telemetryPath,
+      "--output",
+      reportPath,
+      "--chrome-trace",
+      tracePath,
+    ]);
+
+    const report = JSON.parse(fs.readFileSync(reportPath, "utf-8"));
+    expect(report.completed).toBe(2);
+    expect(report.incomplete).toBe(1);
+    expect(report.stages["tool:web_search"].total_ms).toBe(1000);
+    expect(report.stages.generation.total_ms).toBe(560);
+    expect(report.slowest.map((request) => request.prompt_hash)).toEqual([
+      "slow",
+      "fast",
+    ]);
+    expect(report.slowest[0].total_ms).toBe(1500);
+    expect(report.slowest[0].segments).toEqual([
+      { stage: "retrieval", start_ms: 0, dur_ms: 40 },
+      { stage: "generation", start_ms: 40, dur_ms: 200 },
+      { stage: "tool:web_search", start_ms: 240, dur_ms: 1000 },
+      { stage: "generation", start_ms: 1240, dur_ms: 260 },
+    ]);
+
+    const trace = JSON.parse(fs.readFileSync(tracePath, "utf-8"));
+    const toolSlice = trace.traceEvents.find(
+      (entry) => entry.ph === "X" && entry.name === "tool:web_search",
+    );
+    expect(toolSlice).toMatchObject({ tid: 1, ts: 240000, dur: 1000000 });
+  });
+});
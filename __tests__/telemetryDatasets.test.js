@@ -106,6 +106,7 @@ describe("telemetry dataset scripts", () => {
     const toolCall = JSON.parse(toolCallLines[0]);
     expect(toolCall.tool_name).toBe("open_url");
     expect(toolCall.tool_args.url).toBe("https://example.com");
+    expect(toolCall.query).toBe("Open https://example.com");
 
     const tripleLines = fs
       .readFileSync(triplesPath, "utf-8")
@@ -117,4 +118,60 @@ describe("telemetry dataset scripts", () => {
     expect(triple.positive).toBe("doc-1");
     expect(triple.hard_negative).toBe("doc-3");
   });
+
+  it("chains redaction and conversion over stdin/stdout", () => {
+    const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "telemetry-pipe-"));
+    const telemetryPath = writeTelemetry(tempDir);
+    const redacted = execFileSync(
+      "python",
+      [
+        "scripts/mlops/telemetry_redaction.py",
+        "--input",
+        telemetryPath,
+        "--output",
+        "-",
+      ],
+      { encoding: "utf-8", stdio: ["pipe", "pipe", "ignore"] },
+    );
+    expect(redacted.trim().split("\n")).toHaveLength(3);
+
+    const toolCalls = execFileSync(
+      "python",
+      [
+        "scripts/mlops/telemetry_to_tool_calls.py",
+        "--telemetry",
+        "-",
+        "--output",
+        "-",
+      ],
+      { encoding: "utf-8", input: redacted, stdio: ["pipe", "pipe", "ignore"] },
+    );
+    const lines = toolCalls.trim().split("\n");
+    expect(lines).toHaveLength(1);
+    expect(JSON.parse(lines[0]).tool_name).toBe("open_url");
+  });
+
+  it("stops at --max-records without leaving a partial dataset", () => {
+    const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "telemetry-limit-"));
+    const telemetryPath = writeTelemetry(tempDir);
+    fs.appendFileSync(telemetryPath, fs.readFileSync(telemetryPath, "utf-8"));
+    const outputPath = path.join(tempDir, "tool_calls.jsonl");
+
+    expect(() =>
+      execFileSync(
+        "python",
+        [
+          "scripts/mlops/telemetry_to_tool_calls.py",
+          "--telemetry",
+          telemetryPath,
+          "--output",
+          outputPath,
+          "--max-records",
+          "1",
+        ],
+        { stdio: "ignore" },
+      ),
+    ).toThrow();
+    expect(fs.readdirSync(tempDir)).toEqual(["telemetry.jsonl"]);
+  });
 });
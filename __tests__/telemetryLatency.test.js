@@ -0,0 +1,100 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync } from "child_process";
+
+const event = (overrides) => ({
+  schema_version: "telemetry_v2",
+  timestamp: "2025-01-01T00:00:00Z",
+  prompt_id: "runtime_prompt",
+  prompt_version: "v1",
+  model_id: "model-a",
+  tool_calls: [],
+  retrieval_hits: [],
+  outcome: "success",
+  redaction_applied: false,
+  ...overrides,
+});
+
+const runLatency = (args) =>
+  execFileSync("python", ["scripts/eval/telemetry_latency.py", ...args], {
+    encoding: "utf-8",
+  });
+
+const readJson = (filePath) => JSON.parse(fs.readFileSync(filePath, "utf-8"));
+
+describe("telemetry latency sketches", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "latency-"));
+  const telemetryPath = path.join(tempDir, "telemetry.jsonl");
+  const events = [];
+  for (let i = 1; i <= 200; i += 1) {
+    const slow = i % 2 === 0;
+    events.push(
+      event({ event_type: "prompt_received", latency: 0 }),
+      event({
+        event_type: "tool_invocation",
+        tool_name: slow ? "web_search" : "open_url",
+        model_id: slow ? "model-b" : "model-a",
+        prompt_version: slow ? "v2" : "v1",
+        latency_ms: slow ? 1000 + i : i,
+        latency: slow ? 1000 + i : i,
+      }),
+    );
+  }
+  fs.writeFileSync(
+    telemetryPath,
+    events.map((row) => JSON.stringify(row)).join("\n"),
+  );
+
+  it("writes p95_latency_ms for the eval summary and per-dimension tables", () => {
+    const latencyPath = path.join(tempDir, "latency.json");
+    const reportPath = path.join(tempDir, "report.json");
+    runLatency([
+      "--telemetry",
+      telemetryPath,
+      "--output",
+      latencyPath,
+      "--report",
+      reportPath,
+      "--workers",
+      "2",
+    ]);
+
+    const latency = readJson(latencyPath);
+    expect(Object.keys(latency)).toEqual(["p95_latency_ms"]);
+    // Exact p95 of the 200 tool latencies is 1180; sketches stay within 1%.
+    expect(Math.abs(latency.p95_latency_ms - 1180) / 1180).toBeLessThan(0.01);
+
+    const report = readJson(reportPath);
+    expect(report.events).toBe(200);
+    expect(report.skipped.event_type).toBe(200);
+    expect(report.latency_ms.tool_name.open_url.count).toBe(100);
+    expect(report.latency_ms.tool_name.open_url.max).toBe(199);
+    expect(report.latency_ms.model_id["model-b"].min).toBe(1002);
+    const p50 = report.latency_ms.prompt_version.v2.p50;
+    expect(Math.abs(p50 - 1100) / 1100).toBeLessThan(0.01);
+  });
+
+  it("merges shard sketches into the single-pass report", () => {
+    const singlePath = path.join(tempDir, "single.json");
+    runLatency(["--telemetry", telemetryPath, "--report", singlePath]);
+
+    const sketchArgs = [];
+    [1, 2, 3].forEach((shard) => {
+      const sketchPath = path.join(tempDir, `shard-${shard}.json`);
+      runLatency([
+        "--telemetry",
+        telemetryPath,
+        "--shard",
+        `${shard}/3`,
+        "--sketch-out",
+        sketchPath,
+      ]);
+      sketchArgs.push("--sketch", sketchPath);
+    });
+    const mergedPath = path.join(tempDir, "merged.json");
+    runLatency(["merge", ...sketchArgs, "--report", mergedPath]);
+
+    expect(readJson(mergedPath)).toEqual(readJson(singlePath));
+  });
+});
@@ -0,0 +1,183 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync } from "child_process";
+
+const event = (overrides) => ({
+  schema_version: "telemetry_v2",
+  timestamp: "2025-01-01T00:00:00Z",
+  prompt_id: "runtime_prompt",
+  prompt_version: "v1",
+  model_id: "model-a",
+  tool_calls: [],
+  retrieval_hits: [],
+  outcome: "success",
+  latency: 0,
+  redaction_applied: false,
+  ...overrides,
+});
+
+const promptEvents = (i) => {
+  const promptHash = `sha256_prompt_${i}`;
+  const version = i % 2 === 0 ? "v2" : "v1";
+  const timestamp = `2025-01-0${1 + (i % 3)}T00:00:0${i % 10}Z`;
+  const tool = i % 3 === 0 ? "web_search" : "open_url";
+  return [
+    event({
+      event_type: "prompt_received",
+      timestamp,
+      prompt_version: version,
+      prompt_hash: promptHash,
+      prompt_preview: `Find item ${i}`,
+    }),
+    event({
+      event_type: "tool_invocation",
+      timestamp,
+      prompt_version: version,
+      prompt_hash: promptHash,
+      tool_name: tool,
+      tool_args_preview:
+        tool === "web_search"
+          ? { query: `item ${i}` }
+          : { url: `https://example.com/${i}` },
+      success: i % 4 !== 0,
+      error: i % 4 !== 0 ? null : "timeout",
+      latency: 10 + i,
+    }),
+    event({
+      event_type: "retrieval",
+      timestamp,
+      prompt_version: version,
+      query_hash: promptHash,
+      query_preview: `Find item ${i}`,
+      retrieval_hits: [`doc-${i}`],
+      retrieval_trace: {
+        candidate_ids: [`doc-${i}`, `doc-${i + 1}`],
+        candidate_scores: [0.9, 0.4],
+      },
+      latency: 5,
+    }),
+  ];
+};
+
+const toLines = (events) =>
+  events.map((row) => `${JSON.stringify(row)}\n`).join("");
+
+const runStore = (args) =>
+  execFileSync("python", ["scripts/mlops/telemetry_store.py", ...args], {
+    encoding: "utf-8",
+  });
+
+describe("telemetry store", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "telemetry-store-"));
+  const telemetryPath = path.join(tempDir, "telemetry.jsonl");
+  const dbPath = path.join(tempDir, "telemetry.sqlite");
+  const events = [];
+  for (let i = 1; i <= 12; i += 1) {
+    events.push(...promptEvents(i));
+  }
+
+  it("ingests only lines appended since the last run", () => {
+    fs.writeFileSync(telemetryPath, toLines(events.slice(0, 18)));
+    const partial = JSON.stringify(events[18]);
+    fs.appendFileSync(telemetryPath, partial.slice(0, 20));
+    let result = JSON.parse(
+      runStore(["ingest", "--telemetry", telemetryPath, "--db", dbPath]),
+    );
+    expect(result.ingested).toBe(18);
+
+    fs.appendFileSync(
+      telemetryPath,
+      `${partial.slice(20)}\n${toLines(events.slice(19))}`,
+    );
+    result = JSON.parse(
+      runStore(["ingest", "--telemetry", telemetryPath, "--db", dbPath]),
+    );
+    expect(result.ingested).toBe(events.length - 18);
+
+    result = JSON.parse(
+      runStore(["ingest", "--telemetry", telemetryPath, "--db", dbPath]),
+    );
+    expect(result.ingested).toBe(0);
+    expect(runStore(["query", "--db", dbPath, "--count"]).trim()).toBe(
+      String(events.length),
+    );
+  });
+
+  it("filters on indexed columns and groups counts", () => {
+    const failed = runStore([
+      "query",
+      "--db",
+      dbPath,
+      "--tool-name",
+      "open_url",
+      "--failed",
+      "--count",
+    ]);
+    // Failures are every 4th prompt; open_url covers those not divisible by 3.
+    expect(failed.trim()).toBe("2");
+
+    const byVersion = JSON.parse(
+      runStore([
+        "query",
+        "--db",
+        dbPath,
+        "--event-type",
+        "tool_invocation",
+        "--since",
+        "2025-01-02T00:00:00Z",
+        "--group-by",
+        "prompt_version",
+      ]),
+    );
+    expect(byVersion).toEqual({ v1: 4, v2: 4 });
+  });
+
+  it("feeds the dataset converters the same events as the JSONL file", () => {
+    const outputs = {};
+    ["telemetry", "store"].forEach((source) => {
+      const toolCallsPath = path.join(tempDir, `tool_calls_${source}.jsonl`);
+      const triplesPath = path.join(tempDir, `triples_${source}.jsonl`);
+      const sourceArgs =
+        source === "store"
+          ? ["--store", dbPath]
+          : ["--telemetry", telemetryPath];
+      execFileSync("python", [
+        "scripts/mlops/telemetry_to_tool_calls.py",
+        ...sourceArgs,
+        "--output",
+        toolCallsPath,
+      ]);
+      execFileSync("python", [
+        "scripts/mlops/telemetry_to_retrieval_triples.py",
+        ...sourceArgs,
+        "--output",
+        triplesPath,
+      ]);
+      outputs[source] = [
+        fs.readFileSync(toolCallsPath, "utf-8"),
+        fs.readFileSync(triplesPath, "utf-8"),
+      ];
+    });
+    expect(outputs.store).toEqual(outputs.telemetry);
+    expect(outputs.store[0].trim().split("\n")).toHaveLength(12);
+
+    const filteredPath = path.join(tempDir, "tool_calls_v2.jsonl");
+    execFileSync("python", [
+      "scripts/mlops/telemetry_to_tool_calls.py",
+      "--store",
+      dbPath,
+      "--prompt-version",
+      "v2",
+      "--output",
+      filteredPath,
+    ]);
+    const filtered = fs
+      .readFileSync(filteredPath, "utf-8")
+      .trim()
+      .split("\n")
+      .map((line) => JSON.parse(line));
+    expect(filtered).toHaveLength(6);
+    expect(filtered.every((row) => row.prompt_version === "v2")).toBe(true);
+  });
+});
@@ -0,0 +1,36 @@
+import { execFileSync } from "child_process";
+import ToolHandler from "../src/core/tools/ToolHandler";
+
+const sampleGrammar = (args) =>
+  JSON.parse(
+    execFileSync(
+      "python",
+      ["scripts/eval/tool_call_grammar.py", "--samples", "300", ...args],
+      { encoding: "utf-8", maxBuffer: 64 * 1024 * 1024 },
+    ),
+  );
+
+describe("TOOL_CALL grammar", () => {
+  const handler = new ToolHandler({ getTool: () => null });
+  const report = sampleGrammar(["--seed", "7"]);
+
+  it("covers every tool schema", () => {
+    expect(report.mode).toBe("call");
+    expect(report.skipped).toEqual({});
+    expect(report.tools).toBeGreaterThan(0);
+  });
+
+  it("only emits calls ToolHandler parses as the Python scorer does", () => {
+    expect(report.samples).toHaveLength(300);
+    report.samples.forEach((sample) => {
+      expect(sample.calls).toHaveLength(1);
+      expect(handler.parse(sample.text)).toEqual(sample.calls);
+    });
+  });
+
+  it("only emits arguments that satisfy the tool schemas", () => {
+    report.samples.forEach((sample) => {
+      expect(sample.valid).toBe(true);
+    });
+  });
+});
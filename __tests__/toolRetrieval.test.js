@@ -0,0 +1,161 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync } from "child_process";
+import PromptBuilder from "../src/core/prompt/PromptBuilder";
+import { scoreTools, selectTools } from "../src/core/tools/toolIndex";
+
+const catalog = [
+  {
+    name: "toggle_flashlight",
+    description: "Turn the flashlight on or off",
+    parameters: { on: { type: "boolean", required: true } },
+  },
+  {
+    name: "send_message",
+    description: "Compose and send SMS/iMessage",
+    parameters: {
+      recipient: { type: "string", required: true },
+      body: { type: "string", required: true },
+    },
+  },
+  {
+    name: "get_battery_info",
+    description: "Get battery level and charging state",
+    parameters: {},
+  },
+  {
+    name: "open_url",
+    description: "Open a URL in the browser",
+    parameters: { url: { type: "string", required: true } },
+  },
+];
+
+const history = [
+  ["torch on", "toggle_flashlight"],
+  ["it's dark, I need the torch", "toggle_flashlight"],
+  ["text mom I'm late", "send_message"],
+  ["how much juice is left", "get_battery_info"],
+  ["go to example.com", "open_url"],
+];
+
+const queries = [
+  "torch please",
+  "text Sam that dinner is ready",
+  "how much juice do I have",
+  "naïve café ΣΟΦΟΣ 東京",
+  "???",
+];
+
+describe("tool retrieval index", () => {
+  const tempDir = fs.mkdtempSync(path.join(os.tmpdir(), "tool-index-"));
+  const catalogPath = path.join(tempDir, "tools.json");
+  const callsPath = path.join(tempDir, "tool_calls.jsonl");
+  const indexPath = path.join(tempDir, "index.json");
+  fs.writeFileSync(catalogPath, JSON.stringify(catalog));
+  fs.writeFileSync(
+    callsPath,
+    history
+      .map(([query, toolName], i) =>
+        JSON.stringify({
+          prompt_hash: `hash-${i}`,
+          query,
+          tool_name: toolName,
+          tool_args: {},
+        }),
+      )
+      .join("\n"),
+  );
+  execFileSync("python", [
+    "scripts/mlops/tool_retrieval.py",
+    "build",
+    "--tool-calls",
+    callsPath,
+    "--tools",
+    catalogPath,
+    "--output",
+    indexPath,
+    "--k",
+    "2",
+  ]);
+  const index = JSON.parse(fs.readFileSync(indexPath, "utf-8"));
+
+  it("selects the same tools with the same scores as the Python builder", () => {
+    const python = JSON.parse(
+      execFileSync(
+        "python",
+        [
+          "scripts/mlops/tool_retrieval.py",
+          "select",
+          "--index",
+          indexPath,
+          ...queries.flatMap((query) => ["--query", query]),
+        ],
+        { encoding: "utf-8" },
+      ),
+    );
+    queries.forEach((query, i) => {
+      const { selected, fallback } = selectTools(index, query);
+      expect(selected).toEqual(python[i].selected);
+      expect(fallback).toBe(python[i].fallback);
+      expect(scoreTools(index, query)).toEqual(python[i].scores);
+    });
+  });
+
+  it("uses query history and falls back to every tool without signal", () => {
+    expect(selectTools(index, "torch please").selected[0]).toBe(
+      "toggle_flashlight",
+    );
+    expect(selectTools(index, "how much juice do I have").selected[0]).toBe(
+      "get_battery_info",
+    );
+    expect(selectTools(index, "???")).toEqual({
+      selected: catalog.map((tool) => tool.name).sort(),
+      fallback: true,
+    });
+  });
+
+  it("lists only the selected tools in the runtime prompt", () => {
+    const registry = {
+      getAvailableTools: () => [
+        ...catalog,
+        { name: "new_tool", description: "Not in the index" },
+      ],
+    };
+    const prompt = new PromptBuilder(registry, {
+      toolIndex: index,
+      maxTools: 1,
+    }).build("torch please");
+    expect(prompt).toContain("Tool: toggle_flashlight");
+    expect(prompt).toContain("Tool: new_tool");
+    expect(prompt).not.toContain("Tool: send_message");
+    expect(new PromptBuilder(registry).build("torch please")).toContain(
+      "Tool: send_message",
+    );
+  });
+
+  it("reports recall and prompt tokens saved against logged calls", () => {
+    const report = JSON.parse(
+      execFileSync(
+        "python",
+        [
+          "scripts/eval/tool_retrieval_eval.py",
+          "--tool-calls",
+          callsPath,
+          "--tools",
+          catalogPath,
+          "--holdout",
+          "0",
+          "--k",
+          "1,4",
+        ],
+        { encoding: "utf-8" },
+      ),
+    );
+    expect(report.eval_queries).toBe(history.length);
+    expect(report.k["4"].recall).toBe(1);
+    expect(report.k["1"].prompt_tokens.saved_rate).toBeGreaterThan(
+      report.k["4"].prompt_tokens.saved_rate,
+    );
+  });
+});
@@ -0,0 +1,87 @@
+import fs from "fs";
+import os from "os";
+import path from "path";
+import { execFileSync } from "child_process";
+
+const runRegistry = (body, schemasDir = "") =>
+  JSON.parse(
+    execFileSync(
+      "python",
+      [
+        "-c",
+        `import json, sys
+sys.path.insert(0, ".")
+from scripts.mlops.tool_schema_registry import ToolSchemaRegistry, get_registry
+registry = get_registry(sys.argv[1] or None)
+${body}`,
+        schemasDir,
+      ],
+      { encoding: "utf-8" },
+    ),
+  );
+
+describe("tool schema registry", () => {
+  it("validates calls against the compiled schemas", () => {
+    const result = runRegistry(`print(json.dumps({
+    "count": len(registry),
+    "valid": registry.validate("add_contact", {"name": "Ada", "phone": "+33123456789"}),
+    "errors": registry.validate("add_contact", {"phone": 33, "nickname": "A"}),
+    "not_object": registry.validate("add_contact", ["Ada"]),
+    "unknown": registry.validate("teleport", {}),
+    "shared": get_registry() is registry,
+}))`);
+    expect(result.count).toBe(fs.readdirSync("schemas/tools").length);
+    expect(result.valid).toEqual([]);
+    expect(result.errors).toEqual([
+      "add_contact missing required field: name",
+      "add_contact field phone has invalid type",
+      "add_contact has unknown field: nickname",
+    ]);
+    expect(result.not_object).toEqual(["add_contact args must be an object"]);
+    expect(result.unknown).toEqual(["teleport has no tool schema"]);
+    expect(result.shared).toBe(true);
+  });
+
+  it("does not grow with unknown or unhashable tool names", () => {
+    const result = runRegistry(`before = len(registry._validators)
+for index in range(10000):
+    registry.get(f"made_up_{index}")
+print(json.dumps({
+    "before": before,
+    "after": len(registry._validators),
+    "names": len(registry.tool_names),
+    "unhashable": registry.get(["web_search"]),
+    "contains": ["web_search" in registry, "made_up_1" in registry],
+}))`);
+    expect(result.after).toBe(result.before);
+    expect(result.names).toBe(result.before);
+    expect(result.unhashable).toBeNull();
+    expect(result.contains).toEqual([true, false]);
+  });
+
+  it("compiles type unions and open schemas from a custom directory", () => {
+    const schemasDir = fs.mkdtempSync(path.join(os.tmpdir(), "tool-schemas-"));
+    fs.writeFileSync(
+      path.join(schemasDir, "set_timer.schema.json"),
+      JSON.stringify({
+        type: "object",
+        properties: {
+          seconds: { type: ["integer", "null"] },
+          label: { type: "string" },
+        },
+        required: ["seconds"],
+      }),
+    );
+    const result = runRegistry(
+      `print(json.dumps([
+    registry.is_valid("set_timer", {"seconds": 30, "extra": True}),
+    registry.is_valid("set_timer", {"seconds": None}),
+    registry.is_valid("set_timer", {"seconds": True}),
+    registry.is_valid("set_timer", {"seconds": 1.5}),
+    registry.is_valid("web_search", {"query": "x"}),
+]))`,
+      schemasDir,
+    );
+    expect(result).toEqual([true, true, false, false, false]);
+  });
+});
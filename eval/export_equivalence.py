@@ -4,6 +4,18 @@ import re
 import sys
 from pathlib import Path
 
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.logits_equivalence import (  # noqa: E402
+    DEFAULT_TOP_K,
+    LogitsComparison,
+    as_rows,
+    compare_entries,
+    load_logits,
+)
 
 REFUSAL_PATTERN = re.compile(
     r"\b(can't|cannot|won't|unable to|not able to|refuse|decline)\b",
@@ -26,9 +38,42 @@ def load_outputs(path: Path) -> dict:
 
 
 def logits_max_diff(a: list, b: list) -> float:
-    if len(a) != len(b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if a.shape != b.shape:
         return float("inf")
-    return max(abs(x - y) for x, y in zip(a, b)) if a else 0.0
+    return float(np.abs(a - b).max()) if a.size else 0.0
+
+
+def _row_index(outputs: dict) -> dict:
+    """Entry id -> row in the binary logits file: ``logits_index`` or file order."""
+    return {
+        entry_id: entry.get("logits_index", position)
+        for position, (entry_id, entry) in enumerate(outputs.items())
+    }
+
+
+def logits_diffs(py_outputs: dict, core_outputs: dict, args, comparison: LogitsComparison) -> dict:
+    """Max absolute logit delta per entry present on both sides."""
+    shared = [entry_id for entry_id in py_outputs if core_outputs.get(entry_id)]
+    if not (args.python_logits and args.coreml_logits):
+        diffs = {}
+        for entry_id in shared:
+            py_logits = np.asarray(py_outputs[entry_id].get("logits", []), dtype=np.float64)
+            core_logits = np.asarray(core_outputs[entry_id].get("logits", []), dtype=np.float64)
+            diffs[entry_id] = logits_max_diff(py_logits, core_logits)
+            if py_logits.shape == core_logits.shape and py_logits.size:
+                comparison.update(as_rows(py_logits), as_rows(core_logits))
+        return diffs
+
+    py_array = load_logits(args.python_logits)
+    core_array = load_logits(args.coreml_logits)
+    if tuple(py_array.shape[1:]) != tuple(core_array.shape[1:]):
+        return {entry_id: float("inf") for entry_id in shared}
+    py_rows, core_rows = _row_index(py_outputs), _row_index(core_outputs)
+    pairs = [(py_rows[entry_id], core_rows[entry_id]) for entry_id in shared]
+    deltas = compare_entries(py_array, core_array, pairs, comparison)
+    return dict(zip(shared, deltas))
 
 
 def json_valid(text: str) -> bool:
@@ -46,10 +91,25 @@ def main() -> None:
     parser.add_argument("--python-output", required=True)
     parser.add_argument("--coreml-output", required=True)
     parser.add_argument("--logits-tolerance", type=float, default=1e-3)
+    parser.add_argument(
+        "--python-logits",
+        help="Optional .npy/.safetensors logits, one leading-axis row per entry "
+        "(entry 'logits_index' or JSONL order); replaces inline 'logits' lists.",
+    )
+    parser.add_argument("--coreml-logits")
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
+    parser.add_argument(
+        "--metrics-output",
+        help="Optional path for aggregate logits metrics (KL, top-k agreement, ...).",
+    )
     args = parser.parse_args()
+    if bool(args.python_logits) != bool(args.coreml_logits):
+        parser.error("--python-logits and --coreml-logits must be given together")
 
     py_outputs = load_outputs(Path(args.python_output))
     core_outputs = load_outputs(Path(args.coreml_output))
+    comparison = LogitsComparison(args.top_k)
+    diffs = logits_diffs(py_outputs, core_outputs, args, comparison)
 
     failures = []
     for entry_id, py_entry in py_outputs.items():
@@ -57,9 +117,7 @@ def main() -> None:
         if not core_entry:
             failures.append(f"Missing CoreML entry for {entry_id}")
             continue
-        py_logits = py_entry.get("logits", [])
-        core_logits = core_entry.get("logits", [])
-        diff = logits_max_diff(py_logits, core_logits)
+        diff = diffs[entry_id]
         if diff > args.logits_tolerance:
             failures.append(
                 f"Logits mismatch for {entry_id}: max diff {diff}"
@@ -81,6 +139,10 @@ def main() -> None:
         if json_valid(py_response) != json_valid(core_response):
             failures.append(f"JSON validity mismatch for {entry_id}")
 
+    if args.metrics_output:
+        with open(args.metrics_output, "w", encoding="utf-8") as handle:
+            json.dump(comparison.summary(), handle, indent=2)
+
     if failures:
         print(json.dumps({"failures": failures}, indent=2))
         sys.exit(1)
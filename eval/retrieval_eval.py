@@ -4,16 +4,23 @@ import subprocess
 import sys
 from pathlib import Path
 
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import open_text, strip_compression_suffix  # noqa: E402
+
 
 def load_documents(directory: Path) -> list[dict]:
     docs = []
     for path in sorted(directory.glob("**/*")):
         if path.is_dir():
             continue
-        text = path.read_text(encoding="utf-8", errors="ignore").strip()
+        with open_text(path, errors="ignore") as handle:
+            text = handle.read().strip()
         if not text:
             continue
-        docs.append({"id": path.relative_to(directory).as_posix(), "text": text})
+        doc_id = strip_compression_suffix(path.relative_to(directory)).as_posix()
+        docs.append({"id": doc_id, "text": text})
     return docs
 
 
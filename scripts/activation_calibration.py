@@ -0,0 +1,285 @@
+"""
+Activation-aware calibration for Core ML weight compression.
+
+Representative prompts are sampled from ``telemetry_to_sft`` output, rendered
+with the training prompt template and run through the torch model on CPU.
+Forward hooks on every decoder ``nn.Linear`` record the mean absolute input
+activation per channel plus a small sample of input rows.
+
+Those statistics drive two decisions:
+
+* AWQ-style scale search. For each group of linears that share an input
+  (``input_layernorm`` -> q/k/v, ``post_attention_layernorm`` -> gate/up and
+  ``up_proj`` -> ``down_proj``) a per-channel scale ``s = mean|x| ** alpha`` is
+  searched so that int4 quantization of ``W * s`` reproduces ``W x`` best on
+  the sampled rows. ``1 / s`` is folded into the producer (norm weight or
+  ``up_proj`` rows), so the fp16 model is unchanged up to rounding.
+* Per-layer bit-widths. After scaling, each linear's relative output error
+  under int4 is measured and the most sensitive fraction is kept at int8.
+"""
+
+import json
+import random
+from pathlib import Path
+
+import torch
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_TEMPLATE = REPO_ROOT / "prompts" / "v1" / "training_prompt.json"
+
+
+def load_calibration_texts(
+    path: str,
+    num_samples: int,
+    seed: int = 0,
+    template_path: str | None = None,
+) -> list[str]:
+    data_path = Path(path)
+    if not data_path.exists():
+        raise FileNotFoundError(f"Calibration data not found: {data_path}")
+    with open(template_path or DEFAULT_TEMPLATE, "r", encoding="utf-8") as handle:
+        template = json.load(handle)
+
+    records = []
+    with data_path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            if line.strip():
+                records.append(json.loads(line))
+    if not records:
+        raise ValueError(f"Calibration data is empty: {data_path}")
+    if len(records) > num_samples:
+        records = random.Random(seed).sample(records, num_samples)
+
+    texts = []
+    for record in records:
+        tool_call = record.get("expected_tool_call", {})
+        if not isinstance(tool_call, str):
+            tool_call = json.dumps(tool_call, ensure_ascii=False)
+        user_prompt = template["user_prompt_template"].format(
+            instruction=record.get("instruction", ""),
+            context=record.get("context", ""),
+            schema=record.get("tool_schema", ""),
+        )
+        assistant = template["assistant_template"].format(
+            tool=tool_call,
+            answer=record.get("expected_answer", ""),
+        )
+        texts.append(f"[SYSTEM]{template['system_prompt']}\n[USER]{user_prompt}\n[ASSISTANT]{assistant}")
+    return texts
+
+
+def _decoder_layers(model):
+    layers = getattr(getattr(model, "model", None), "layers", None)
+    if layers is None:
+        raise AttributeError("Calibration expects a decoder model exposing model.layers")
+    return layers
+
+
+def _linear_names(model) -> dict:
+    prefix = "model.layers"
+    names = {}
+    for index, layer in enumerate(_decoder_layers(model)):
+        for name, module in layer.named_modules():
+            if isinstance(module, torch.nn.Linear):
+                names[module] = f"{prefix}.{index}.{name}"
+    return names
+
+
+@torch.inference_mode()
+def collect_activation_stats(
+    model,
+    tokenizer,
+    texts: list[str],
+    batch_size: int = 4,
+    max_length: int = 512,
+    max_rows: int = 256,
+    seed: int = 0,
+) -> dict[str, dict]:
+    """Return ``{module_name: {"abs_mean": Tensor[in], "rows": Tensor[n, in]}}``.
+
+    Padding tokens are excluded, ``rows`` keeps at most ``max_rows`` randomly
+    chosen token activations per module for the scale and error searches.
+    """
+    names = _linear_names(model)
+    generator = torch.Generator().manual_seed(seed)
+    stats = {name: {"abs_sum": None, "count": 0, "rows": []} for name in names.values()}
+    token_mask = {}
+
+    def hook(module, inputs):
+        entry = stats[names[module]]
+        rows = inputs[0][token_mask["value"]].float()
+        abs_sum = rows.abs().sum(dim=0)
+        entry["abs_sum"] = abs_sum if entry["abs_sum"] is None else entry["abs_sum"] + abs_sum
+        entry["count"] += rows.shape[0]
+        keep = torch.randperm(rows.shape[0], generator=generator)[: max_rows // 4 or 1]
+        entry["rows"].append(rows[keep])
+
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    handles = [module.register_forward_pre_hook(hook) for module in names]
+    try:
+        for start in range(0, len(texts), batch_size):
+            batch = tokenizer(
+                texts[start : start + batch_size],
+                return_tensors="pt",
+                padding=True,
+                truncation=True,
+                max_length=max_length,
+            )
+            token_mask["value"] = batch["attention_mask"].bool()
+            model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"], use_cache=False)
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    result = {}
+    for name, entry in stats.items():
+        if not entry["count"]:
+            continue
+        rows = torch.cat(entry["rows"])
+        if rows.shape[0] > max_rows:
+            rows = rows[torch.randperm(rows.shape[0], generator=generator)[:max_rows]]
+        result[name] = {"abs_mean": entry["abs_sum"] / entry["count"], "rows": rows}
+    return result
+
+
+def fake_quantize(weight: torch.Tensor, nbits: int = 4, block_size: int = 32) -> torch.Tensor:
+    """Symmetric per-block quantize/dequantize along the input axis, as Core ML's int4 per_block."""
+    out_features, in_features = weight.shape
+    block_size = min(block_size, in_features)
+    padded = -in_features % block_size
+    blocks = torch.nn.functional.pad(weight.float(), (0, padded)).reshape(out_features, -1, block_size)
+    max_level = 2 ** (nbits - 1) - 1
+    scale = blocks.abs().amax(dim=-1, keepdim=True).clamp(min=1e-8) / max_level
+    quantized = torch.clamp(torch.round(blocks / scale), -max_level - 1, max_level) * scale
+    return quantized.reshape(out_features, -1)[:, :in_features]
+
+
+def _output_error(weights: list[torch.Tensor], rows: torch.Tensor, scale: torch.Tensor, nbits: int) -> float:
+    error = 0.0
+    scaled_rows = rows / scale
+    for weight in weights:
+        weight = weight.float()
+        reference = rows @ weight.T
+        quantized = scaled_rows @ fake_quantize(weight * scale, nbits).T
+        error += (quantized - reference).pow(2).sum().item()
+    return error
+
+
+def search_scale(
+    weights: list[torch.Tensor],
+    stats: dict,
+    nbits: int = 4,
+    grid: int = 20,
+) -> tuple[torch.Tensor, float]:
+    """Grid-search ``alpha`` in ``s = mean|x| ** alpha`` minimising int4 output error."""
+    abs_mean = stats["abs_mean"].clamp(min=1e-5)
+    rows = stats["rows"]
+    best_alpha, best_scale = 0.0, torch.ones_like(abs_mean)
+    best_error = _output_error(weights, rows, best_scale, nbits)
+    for step in range(1, grid):
+        alpha = step / grid
+        scale = abs_mean.pow(alpha)
+        scale = scale / (scale.max() * scale.min()).sqrt()
+        error = _output_error(weights, rows, scale, nbits)
+        if error < best_error:
+            best_alpha, best_scale, best_error = alpha, scale, error
+    return best_scale, best_alpha
+
+
+def _scale_groups(model):
+    for index, layer in enumerate(_decoder_layers(model)):
+        prefix = f"model.layers.{index}"
+        attn, mlp = layer.self_attn, layer.mlp
+        yield (
+            f"{prefix}.input_layernorm",
+            layer.input_layernorm,
+            [f"{prefix}.self_attn.{name}" for name in ("q_proj", "k_proj", "v_proj")],
+            [attn.q_proj, attn.k_proj, attn.v_proj],
+        )
+        yield (
+            f"{prefix}.post_attention_layernorm",
+            layer.post_attention_layernorm,
+            [f"{prefix}.mlp.{name}" for name in ("gate_proj", "up_proj")],
+            [mlp.gate_proj, mlp.up_proj],
+        )
+        yield (f"{prefix}.mlp.up_proj", mlp.up_proj, [f"{prefix}.mlp.down_proj"], [mlp.down_proj])
+
+
+@torch.no_grad()
+def apply_scales(model, scales: dict[str, torch.Tensor]) -> None:
+    """Fold ``1 / s`` into each producer and ``s`` into the consuming linears."""
+    for producer_name, producer, _consumer_names, consumers in _scale_groups(model):
+        scale = scales.get(producer_name)
+        if scale is None:
+            continue
+        if isinstance(producer, torch.nn.Linear):
+            producer.weight.copy_((producer.weight.float() / scale[:, None]).to(producer.weight.dtype))
+            if producer.bias is not None:
+                producer.bias.copy_((producer.bias.float() / scale).to(producer.bias.dtype))
+        else:
+            producer.weight.copy_((producer.weight.float() / scale).to(producer.weight.dtype))
+        for consumer in consumers:
+            consumer.weight.copy_((consumer.weight.float() * scale).to(consumer.weight.dtype))
+
+
+@torch.no_grad()
+def calibrate(
+    model,
+    tokenizer,
+    texts: list[str],
+    int8_fraction: float = 0.1,
+    batch_size: int = 4,
+    max_length: int = 512,
+    seed: int = 0,
+) -> dict:
+    """Search and fold AWQ scales into ``model`` and pick per-linear bit-widths.
+
+    Returns ``{"scales", "module_bits", "report"}``; ``module_bits`` maps torch
+    module names to 4 or 8 and ``scales`` can be re-applied with
+    ``apply_scales`` to a freshly loaded copy of the same checkpoint.
+    """
+    stats = collect_activation_stats(model, tokenizer, texts, batch_size, max_length, seed=seed)
+    scales, alphas = {}, {}
+    for producer_name, _producer, consumer_names, consumers in _scale_groups(model):
+        if consumer_names[0] not in stats:
+            continue
+        scale, alpha = search_scale([consumer.weight for consumer in consumers], stats[consumer_names[0]])
+        if alpha:
+            scales[producer_name] = scale
+        alphas[producer_name] = alpha
+    apply_scales(model, scales)
+
+    # Inputs of scaled consumers are divided by the scale folded into their producer.
+    input_scales = {
+        consumer_name: scales[producer_name]
+        for producer_name, _producer, consumer_names, _consumers in _scale_groups(model)
+        if producer_name in scales
+        for consumer_name in consumer_names
+    }
+    errors = {}
+    for module, name in _linear_names(model).items():
+        if name not in stats:
+            continue
+        rows = stats[name]["rows"]
+        if name in input_scales:
+            rows = rows / input_scales[name]
+        weight = module.weight.float()
+        reference = rows @ weight.T
+        quantized = rows @ fake_quantize(weight).T
+        errors[name] = ((quantized - reference).pow(2).sum() / reference.pow(2).sum().clamp(min=1e-12)).item()
+
+    ranked = sorted(errors, key=errors.get, reverse=True)
+    keep_int8 = set(ranked[: round(len(ranked) * int8_fraction)])
+    module_bits = {name: 8 if name in keep_int8 else 4 for name in sorted(errors)}
+    return {
+        "scales": scales,
+        "module_bits": module_bits,
+        "report": {
+            "samples": len(texts),
+            "scaled_groups": len(scales),
+            "int8_modules": sorted(keep_int8),
+            "alphas": alphas,
+            "relative_int4_error": {name: round(errors[name], 6) for name in sorted(errors)},
+        },
+    }
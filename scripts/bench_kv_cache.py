@@ -0,0 +1,153 @@
+"""
+Decode-loop micro-benchmark comparing the KV caches used for Core ML export.
+
+Runs a short prefill followed by greedy single-token decode steps on CPU for
+each cache implementation and reports tokens/sec, allocations per step and
+host syncs per step, as recorded by ``torch.profiler``. The
+profiler folds allocations into the op that made them, so an allocation is
+counted once per allocating op call plus any unattributed ``[memory]`` event.
+
+A host sync is counted per ``aten::_local_scalar_dense`` call. ``.item()``
+records an ``aten::item`` event that dispatches to it, so counting both
+would report every sync twice. The static cache itself never syncs; the one
+sync per step it still reports comes from the model's forward.
+"""
+
+import argparse
+import json
+import time
+
+import torch
+from torch.profiler import ProfilerActivity, profile
+from transformers import AutoConfig, AutoModelForCausalLM
+
+from coreml_kv_cache import KV_CACHE_CLASSES, decode_attention_mask
+
+DEFAULT_MODEL = "hf-internal-testing/tiny-random-LlamaForCausalLM"
+SYNC_OPS = {"aten::_local_scalar_dense"}
+
+
+def cache_shape(config, batch_size: int, context_length: int) -> tuple:
+    num_heads = config.num_attention_heads
+    num_kv_heads = getattr(config, "num_key_value_heads", None) or num_heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // num_heads
+    return (config.num_hidden_layers, batch_size, num_kv_heads, context_length, head_dim)
+
+
+class DecodeLoop:
+    def __init__(self, model, kv_cache: str, shape: tuple, dtype: torch.dtype):
+        self.model = model
+        self.kv_cache = kv_cache
+        self.batch_size, self.context_length = shape[1], shape[3]
+        self.cache = KV_CACHE_CLASSES[kv_cache](shape=shape, dtype=dtype)
+
+    def step(self, input_ids: torch.Tensor, start: int) -> torch.Tensor:
+        end = start + input_ids.shape[1]
+        if self.kv_cache == "static":
+            attention_mask = decode_attention_mask(self.batch_size, self.context_length, end)
+        else:
+            attention_mask = torch.ones((self.batch_size, end), dtype=torch.int32)
+        logits = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=self.cache,
+            cache_position=torch.arange(start, end, dtype=torch.int32),
+            use_cache=True,
+        ).logits
+        return logits[:, -1:].argmax(dim=-1)
+
+
+def benchmark_cache(model, config, kv_cache: str, args) -> dict:
+    dtype = getattr(torch, args.dtype)
+    shape = cache_shape(config, args.batch_size, args.context_length)
+    loop = DecodeLoop(model, kv_cache, shape, dtype)
+    generator = torch.Generator().manual_seed(args.seed)
+    prompt = torch.randint(0, config.vocab_size, (args.batch_size, args.prefill_tokens), generator=generator)
+
+    with torch.inference_mode():
+        # Warm up on a throwaway cache so one-off kernel setup is not timed.
+        warmup = DecodeLoop(model, kv_cache, shape, dtype)
+        warmup.step(warmup.step(prompt, 0), args.prefill_tokens)
+        del warmup
+
+        started = time.perf_counter()
+        token = loop.step(prompt, 0)
+        prefill_s = time.perf_counter() - started
+
+        position = args.prefill_tokens
+        started = time.perf_counter()
+        for _ in range(args.decode_tokens):
+            token = loop.step(token, position)
+            position += 1
+        decode_s = time.perf_counter() - started
+
+        profiled_steps = min(args.profile_steps, args.context_length - position)
+        with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+            for _ in range(profiled_steps):
+                token = loop.step(token, position)
+                position += 1
+
+    events = prof.events()
+    allocations = [
+        event.cpu_memory_usage if event.name == "[memory]" else event.self_cpu_memory_usage
+        for event in events
+    ]
+    allocations = [size for size in allocations if size > 0]
+    syncs = sum(1 for event in events if event.name in SYNC_OPS)
+    steps = max(profiled_steps, 1)
+    return {
+        "kv_cache": kv_cache,
+        "prefill_tokens_per_s": round(args.batch_size * args.prefill_tokens / prefill_s, 2),
+        "decode_tokens_per_s": round(args.batch_size * args.decode_tokens / decode_s, 2),
+        "allocations_per_step": round(len(allocations) / steps, 2),
+        "allocated_bytes_per_step": round(sum(allocations) / steps),
+        "host_syncs_per_step": round(syncs / steps, 2),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=DEFAULT_MODEL, help="Local path or hub id of a small causal LM.")
+    ap.add_argument("--caches", default=",".join(KV_CACHE_CLASSES), help="Comma-separated cache implementations.")
+    ap.add_argument("--context_length", type=int, default=256)
+    ap.add_argument("--batch_size", type=int, default=1)
+    ap.add_argument("--prefill_tokens", type=int, default=32)
+    ap.add_argument("--decode_tokens", type=int, default=64)
+    ap.add_argument("--profile_steps", type=int, default=8)
+    ap.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], default="float32")
+    ap.add_argument("--threads", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = ap.parse_args()
+
+    caches = [name.strip() for name in args.caches.split(",") if name.strip()]
+    unknown = [name for name in caches if name not in KV_CACHE_CLASSES]
+    if unknown:
+        raise SystemExit(f"Unknown KV cache implementations: {', '.join(unknown)}")
+    if args.prefill_tokens + args.decode_tokens + args.profile_steps > args.context_length:
+        raise SystemExit("prefill_tokens + decode_tokens + profile_steps must fit in context_length")
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    config = AutoConfig.from_pretrained(args.model)
+    model = AutoModelForCausalLM.from_pretrained(args.model, torch_dtype=getattr(torch, args.dtype))
+    model.eval()
+
+    report = {
+        "model": args.model,
+        "device": "cpu",
+        "dtype": args.dtype,
+        "threads": torch.get_num_threads(),
+        "context_length": args.context_length,
+        "batch_size": args.batch_size,
+        "results": [benchmark_cache(model, config, name, args) for name in caches],
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            handle.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
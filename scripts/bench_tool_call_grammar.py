@@ -0,0 +1,162 @@
+"""
+Per-token overhead of grammar-constrained ``TOOL_CALL`` decoding.
+
+Compiles the grammar from ``schemas/tools``, builds its token masks for
+``--tokenizer`` (timed cold in a fresh cache directory, then loaded warm), and
+greedy-decodes ``--decodes`` rows in batches of ``--batch_size`` from random
+logits through ``ToolCallLogitsProcessor``. Masking and the DFA step are timed
+separately from the argmax they wrap and reported in microseconds per
+generated token. Every finished output is parsed as ``ToolHandler`` would and
+validated against its schema; the run fails if any finished output is invalid
+or if the export does not round-trip.
+"""
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import AutoTokenizer
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.score_tool_calls import parse_tool_call_markers  # noqa: E402
+from scripts.eval.tool_call_grammar import (  # noqa: E402
+    MODES,
+    GrammarMasks,
+    TokenVocabulary,
+    ToolCallLogitsProcessor,
+    compile_tool_grammar,
+    load_or_build_masks,
+)
+from scripts.mlops.tool_schema_registry import DEFAULT_TOOL_SCHEMAS_DIR, ToolSchemaRegistry  # noqa: E402
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tokenizer", required=True, help="HF tokenizer name or path.")
+    ap.add_argument("--tools-dir", default=str(DEFAULT_TOOL_SCHEMAS_DIR))
+    ap.add_argument("--mode", choices=MODES, default="call")
+    ap.add_argument("--decodes", type=int, default=256)
+    ap.add_argument("--batch_size", type=int, default=8)
+    ap.add_argument("--max_steps", type=int, default=256)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--threads", type=int, default=1)
+    ap.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = ap.parse_args()
+
+    torch.manual_seed(args.seed)
+    torch.set_num_threads(args.threads)
+    random.seed(args.seed)
+
+    registry = ToolSchemaRegistry(Path(args.tools_dir))
+    started = time.perf_counter()
+    dfa = compile_tool_grammar(registry, mode=args.mode)
+    compile_s = time.perf_counter() - started
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    vocab = TokenVocabulary.from_tokenizer(tokenizer)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        started = time.perf_counter()
+        masks, cold_hit = load_or_build_masks(dfa, vocab, Path(cache_dir))
+        cold_s = time.perf_counter() - started
+        started = time.perf_counter()
+        warm, warm_hit = load_or_build_masks(dfa, vocab, Path(cache_dir))
+        warm_s = time.perf_counter() - started
+        export_path = Path(cache_dir) / "export.tcgm"
+        export_bytes = masks.save(export_path)
+        exported = GrammarMasks.load(export_path)
+    if cold_hit or not warm_hit:
+        raise SystemExit("mask cache did not miss cold and hit warm")
+    if not (
+        np.array_equal(exported.masks, masks.masks)
+        and np.array_equal(exported.mask_index, masks.mask_index)
+        and np.array_equal(exported.dfa.transitions, dfa.transitions)
+    ):
+        raise SystemExit("binary export does not round-trip")
+
+    vocab_size = len(vocab)
+    processor = ToolCallLogitsProcessor(masks, vocab)
+    mask_s = advance_s = argmax_s = 0.0
+    generated = finished = valid = 0
+    invalid_examples = []
+    for offset in range(0, args.decodes, args.batch_size):
+        rows = min(args.batch_size, args.decodes - offset)
+        processor.reset(rows)
+        outputs = [bytearray() for _ in range(rows)]
+        for _ in range(args.max_steps):
+            active = [row for row, state in enumerate(processor.states) if state >= 0]
+            if not active:
+                break
+            logits = torch.randn(rows, vocab_size)
+
+            started = time.perf_counter()
+            logits.argmax(dim=-1)
+            argmax_s += time.perf_counter() - started
+
+            started = time.perf_counter()
+            processor.mask_(logits)
+            mask_s += time.perf_counter() - started
+            tokens = logits.argmax(dim=-1).tolist()
+
+            started = time.perf_counter()
+            processor.advance(tokens)
+            advance_s += time.perf_counter() - started
+
+            generated += len(active)
+            for row in active:
+                if processor.states[row] >= 0:
+                    outputs[row] += vocab.tokens[tokens[row]]
+        for row, state in enumerate(processor.states):
+            if state >= 0:
+                continue  # ran out of steps
+            finished += 1
+            text = outputs[row].decode("utf-8", errors="replace")
+            calls, malformed = parse_tool_call_markers(text)
+            if not malformed and all(registry.is_valid(name, call_args) for name, call_args in calls):
+                valid += 1
+            elif len(invalid_examples) < 5:
+                invalid_examples.append(text)
+
+    def per_token_us(seconds: float) -> float:
+        return round(seconds / max(generated, 1) * 1e6, 2)
+
+    report = {
+        "mode": args.mode,
+        "tokenizer": args.tokenizer,
+        "vocab_size": vocab_size,
+        "states": dfa.num_states,
+        "unique_masks": int(masks.masks.shape[0]),
+        "dead_states": len(masks.dead_states()),
+        "compile_s": round(compile_s, 4),
+        "masks_cold_s": round(cold_s, 4),
+        "masks_warm_s": round(warm_s, 4),
+        "export_bytes": export_bytes,
+        "decodes": args.decodes,
+        "batch_size": args.batch_size,
+        "generated_tokens": generated,
+        "finished": finished,
+        "valid": valid,
+        "valid_rate": round(valid / finished, 6) if finished else 0.0,
+        "us_per_token": {
+            "mask": per_token_us(mask_s),
+            "advance": per_token_us(advance_s),
+            "overhead": per_token_us(mask_s + advance_s),
+            "argmax": per_token_us(argmax_s),
+        },
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+    if invalid_examples:
+        raise SystemExit(f"constrained outputs failed validation: {invalid_examples}")
+
+
+if __name__ == "__main__":
+    main()
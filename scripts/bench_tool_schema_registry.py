@@ -0,0 +1,145 @@
+"""
+Throughput benchmark for tool-argument validation on synthetic tool events.
+
+Generates ``tool_invocation``-style (tool_name, args) pairs from the schemas in
+``schemas/tools``: valid calls, missing required fields, wrong types, unknown
+fields, non-object args and unknown tool names. Each pair is validated three
+ways and the events/sec of each is reported:
+
+- ``per_event_load``: read and parse the tool's schema file for every event,
+  as ``telemetry_to_tool_calls.py`` used to;
+- ``registry_validate``: ``ToolSchemaRegistry.validate`` (error messages);
+- ``registry_is_valid``: ``ToolSchemaRegistry.is_valid`` (boolean fast path).
+
+The first two must produce identical error lists; the run fails otherwise.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.tool_schema_registry import (  # noqa: E402
+    DEFAULT_TOOL_SCHEMAS_DIR,
+    SCHEMA_SUFFIX,
+    ToolSchemaRegistry,
+    ToolValidator,
+)
+
+SAMPLE_VALUES = {
+    "string": "example",
+    "number": 1.5,
+    "integer": 3,
+    "boolean": True,
+    "object": {"key": "value"},
+    "array": ["item"],
+    "null": None,
+}
+
+
+def _sample(spec: dict, wrong: bool = False):
+    expected = spec.get("type", "string")
+    if isinstance(expected, list):
+        expected = expected[0]
+    if wrong:
+        return [] if expected != "array" else "not-an-array"
+    return SAMPLE_VALUES.get(expected, "example")
+
+
+def synthetic_events(registry: ToolSchemaRegistry, count: int, seed: int) -> list[tuple]:
+    rng = random.Random(seed)
+    names = list(registry.tool_names)
+    events = []
+    for _ in range(count):
+        name = rng.choice(names)
+        schema = registry.schema(name)
+        properties = schema.get("properties", {})
+        args = {key: _sample(spec) for key, spec in properties.items() if rng.random() < 0.7}
+        args.update({key: _sample(properties[key]) for key in schema.get("required", [])})
+        roll = rng.random()
+        if roll < 0.05 and schema.get("required"):
+            args.pop(rng.choice(schema["required"]))
+        elif roll < 0.10 and properties:
+            key = rng.choice(list(properties))
+            args[key] = _sample(properties[key], wrong=True)
+        elif roll < 0.13:
+            args["unexpected_field"] = "x"
+        elif roll < 0.15:
+            args = "not-an-object"
+        elif roll < 0.17:
+            name = f"unknown_tool_{rng.randrange(8)}"
+        events.append((name, args))
+    return events
+
+
+def validate_per_event_load(schemas_dir: Path, tool_name: str, args) -> list[str]:
+    """The old path: open and parse the schema file for every event."""
+    if not isinstance(args, dict):
+        return [f"{tool_name} args must be an object"]
+    schema_path = schemas_dir / f"{tool_name}{SCHEMA_SUFFIX}"
+    if not schema_path.exists():
+        return [f"{tool_name} has no tool schema"]
+    with schema_path.open("r", encoding="utf-8") as handle:
+        schema = json.load(handle)
+    return ToolValidator(tool_name, schema).errors(args)
+
+
+def _timed(fn, events: list[tuple]) -> tuple[list, float]:
+    started = time.perf_counter()
+    results = [fn(name, args) for name, args in events]
+    return results, time.perf_counter() - started
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--schemas_dir", default=str(DEFAULT_TOOL_SCHEMAS_DIR))
+    ap.add_argument("--events", type=int, default=200000)
+    ap.add_argument("--baseline_events", type=int, default=20000, help="Events for the slow per-event-load path.")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = ap.parse_args()
+
+    schemas_dir = Path(args.schemas_dir)
+    started = time.perf_counter()
+    registry = ToolSchemaRegistry(schemas_dir)
+    compile_s = time.perf_counter() - started
+    events = synthetic_events(registry, args.events, args.seed)
+
+    baseline_events = events[: args.baseline_events]
+    baseline, baseline_s = _timed(lambda name, call: validate_per_event_load(schemas_dir, name, call), baseline_events)
+    errors, validate_s = _timed(registry.validate, events)
+    flags, is_valid_s = _timed(registry.is_valid, events)
+
+    if baseline != errors[: len(baseline)]:
+        raise SystemExit("registry_validate disagrees with per_event_load")
+    if flags != [not found for found in errors]:
+        raise SystemExit("registry_is_valid disagrees with registry_validate")
+
+    def rate(count: int, seconds: float) -> float:
+        return round(count / seconds, 1) if seconds else float("inf")
+
+    report = {
+        "tools": len(registry),
+        "compile_s": round(compile_s, 4),
+        "events": len(events),
+        "invalid_rate": round(sum(1 for found in errors if found) / len(events), 4) if events else 0.0,
+        "events_per_s": {
+            "per_event_load": rate(len(baseline_events), baseline_s),
+            "registry_validate": rate(len(events), validate_s),
+            "registry_is_valid": rate(len(events), is_valid_s),
+        },
+        "unknown_tool_lookups": registry.unknown_lookups,
+    }
+    report["speedup"] = round(report["events_per_s"]["registry_validate"] / report["events_per_s"]["per_event_load"], 1)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
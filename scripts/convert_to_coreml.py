@@ -12,112 +12,284 @@ Environment:
 """
 
 import argparse
+import gc
+import hashlib
 import json
 import os
+import shutil
 import subprocess
 import sys
+import time
 import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 
 import coremltools as ct
 import coremltools.optimize as cto
 import numpy as np
 import torch
-from huggingface_hub import login
-from transformers import AutoConfig, AutoModelForCausalLM
-from transformers.cache_utils import Cache
+import transformers
+from huggingface_hub import login, model_info, snapshot_download
+from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer
+
+from activation_calibration import apply_scales, calibrate, load_calibration_texts
+from coreml_kv_cache import (  # noqa: F401 - re-exported for existing imports
+    KV_CACHE_CLASSES,
+    SliceUpdateKeyValueCache,
+    StaticKeyValueCache,
+    decode_attention_mask,
+)
+from coreml_weight_names import coreml_weight_bits, coreml_weight_name, resolve_weight_bits  # noqa: F401 - re-exported
+from phase_memory import PhaseMemoryMonitor
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.logits_equivalence import compare_arrays  # noqa: E402
 
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+DEFAULT_VARIANTS = ("fp16", "int8", "int4-lut")
+DEFAULT_CACHE_DIR = os.path.join("build", "coreml_cache")
+# Every quantize worker loads its own copy of the fp16 program.
+DEFAULT_JOBS = 2
+DEFAULT_PROFILES_CONFIG = os.path.join(os.path.dirname(__file__), "coreml_export_profiles.json")
+DEFAULT_PROFILE = "default"
+DEFAULT_KV_CACHE = "slice"
 
-class SliceUpdateKeyValueCache(Cache):
-    def __init__(self, *, shape, dtype=torch.float32):
-        super().__init__()
-        self.register_buffer("k", torch.zeros(shape, dtype=dtype))
-        self.register_buffer("v", torch.zeros(shape, dtype=dtype))
-        self.register_buffer(
-            "_current_length",
-            torch.zeros(shape[0], dtype=torch.int32),
-            persistent=False,
+
+def _quantize_int8(model):
+    return cto.coreml.linear_quantize_weights(
+        model,
+        config=cto.coreml.OptimizationConfig(
+            global_config=cto.coreml.OpLinearQuantizerConfig(
+                mode="linear_symmetric",
+            ),
+        ),
+    )
+
+
+def _quantize_int4_block(model):
+    return cto.coreml.linear_quantize_weights(
+        model,
+        config=cto.coreml.OptimizationConfig(
+            global_config=cto.coreml.OpLinearQuantizerConfig(
+                mode="linear_symmetric",
+                dtype="int4",
+                granularity="per_block",
+                block_size=32,
+            ),
+        ),
+    )
+
+
+def _palettize(nbits):
+    def quantize(model):
+        return cto.coreml.palettize_weights(
+            model,
+            config=cto.coreml.OptimizationConfig(
+                global_config=cto.coreml.OpPalettizerConfig(
+                    mode="kmeans",
+                    nbits=nbits,
+                ),
+            ),
         )
 
-    def __len__(self):
-        return int(self._current_length.max().item())
-
-    def update(self, k_state, v_state, layer_idx, cache_kwargs=None):
-        position = (cache_kwargs or {}).get("cache_position", None)
-        if position is None:
-            raise ValueError("cache_position required")
-        position = torch.as_tensor(position)
-        if position.ndim > 1:
-            position = position.reshape(-1)
-        start = int(position.min().item())
-        end = int(position.max().item() + 1)
-        seq_len = k_state.shape[2]
-        if end - start != seq_len:
-            raise ValueError(
-                "cache_position must describe a contiguous range matching the incoming sequence length"
+    return quantize
+
+
+def _quantize_mixed(model, weight_bits: dict):
+    """int4 per-block weights with per-op overrides keyed by Core ML const name.
+
+    ``weight_bits`` values are 4, 8 or ``None`` (leave the weight in fp16).
+    """
+    op_name_configs = {}
+    for op_name, nbits in weight_bits.items():
+        if nbits is None:
+            op_name_configs[op_name] = None
+        elif nbits == 8:
+            op_name_configs[op_name] = cto.coreml.OpLinearQuantizerConfig(mode="linear_symmetric")
+        elif nbits == 4:
+            op_name_configs[op_name] = cto.coreml.OpLinearQuantizerConfig(
+                mode="linear_symmetric",
+                dtype="int4",
+                granularity="per_block",
+                block_size=32,
             )
-        if end > self.k.shape[3]:
-            raise ValueError("cache_position exceeds allocated cache size")
-        self.k[layer_idx, :, : k_state.shape[1], start:end, :] = k_state
-        self.v[layer_idx, :, : v_state.shape[1], start:end, :] = v_state
-        current = max(int(self._current_length[layer_idx].item()), end)
-        self._current_length[layer_idx] = torch.tensor(
-            current,
-            device=self._current_length.device,
-            dtype=self._current_length.dtype,
-        )
-        return (
-            self.k[layer_idx, :, :, :current, :],
-            self.v[layer_idx, :, :, :current, :],
-        )
+        else:
+            raise ValueError(f"Unsupported bit-width {nbits} for {op_name}")
+    return cto.coreml.linear_quantize_weights(
+        model,
+        config=cto.coreml.OptimizationConfig(
+            global_config=cto.coreml.OpLinearQuantizerConfig(
+                mode="linear_symmetric",
+                dtype="int4",
+                granularity="per_block",
+                block_size=32,
+            ),
+            op_name_configs=op_name_configs,
+        ),
+    )
 
-    def get_seq_length(self, _=0):
-        return int(self._current_length.max().item())
 
+# Variant suffix -> quantizer applied to the cached fp16 program. Pool workers
+# look quantizers up by suffix, so only the name crosses the process boundary.
+QUANTIZATION_VARIANTS = {
+    "fp16": None,
+    "int8": _quantize_int8,
+    "int4-lut": _palettize(4),
+    "int6-lut": _palettize(6),
+    "int4-block": _quantize_int4_block,
+    "int4-awq": _quantize_mixed,
+    "mixed": _quantize_mixed,
+}
+# Variants whose quantizer also takes a per-op bit-width map.
+MIXED_PRECISION_VARIANTS = {"int4-awq", "mixed"}
+CALIBRATED_VARIANT = "int4-awq"
+SWEEP_VARIANT = "mixed"
+# Prompt length used to measure a mixed-precision package's logits drift.
+DRIFT_TOKENS = 8
 
-def convert(
-    hf_model_path: str,
-    out_prefix: str,
-    artifacts_path: str = "coreml_artifacts.json",
-    hf_token: str | None = None,
-    manifest_path: str | None = None,
-):
+
+def _package_bytes(path: str) -> int:
+    total_bytes = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            total_bytes += os.path.getsize(os.path.join(root, file_name))
+    return total_bytes
+
+
+def _hub_revision(repo_id: str) -> str | None:
+    """Commit sha ``repo_id`` resolves to now: asked from the Hub, else the local snapshot."""
+    try:
+        return model_info(repo_id).sha
+    except Exception:  # noqa: BLE001 - offline, gated or unknown ids fail differently
+        pass
+    try:
+        return Path(snapshot_download(repo_id, local_files_only=True)).name
+    except Exception:  # noqa: BLE001 - nothing cached for this id
+        return None
+
+
+def _model_fingerprint(hf_model_path: str, manifest_path: str | None) -> str | None:
+    """Identity of the source weights, or ``None`` when a Hub id's revision cannot be resolved."""
     if manifest_path:
-        subprocess.run(
-            [
-                sys.executable,
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "mlops",
-                    "verify_export_manifest.py",
-                ),
-                "--manifest",
-                manifest_path,
-                "--model-path",
-                hf_model_path,
-            ],
-            check=True,
-        )
-    if hf_token:
+        with open(manifest_path, "r", encoding="utf-8") as handle:
+            return json.load(handle)["model_hash"]
+    model_dir = Path(hf_model_path)
+    if not model_dir.is_dir():
+        # A bare Hub id names whatever main points at today; pin the commit.
+        revision = _hub_revision(hf_model_path)
+        return f"{hf_model_path}@{revision}" if revision else None
+    # Without a manifest, hash file names, sizes and mtimes so cache lookups
+    # stay cheap even for multi-gigabyte checkpoints.
+    hasher = hashlib.sha256()
+    for file_path in sorted(p for p in model_dir.rglob("*") if p.is_file()):
+        stat = file_path.stat()
+        hasher.update(file_path.relative_to(model_dir).as_posix().encode("utf-8"))
+        hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return hasher.hexdigest()
+
+
+def conversion_cache_key(model_fingerprint: str | None, params: dict) -> str:
+    payload = {
+        "model": model_fingerprint,
+        "params": params,
+        "versions": {
+            "torch": torch.__version__,
+            "transformers": transformers.__version__,
+            "coremltools": ct.__version__,
+        },
+    }
+    encoded = json.dumps(payload, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def _file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def run_variant(
+    suffix: str,
+    source_package: str,
+    target_package: str,
+    weight_bits: dict | None = None,
+    drift_inputs: dict | None = None,
+) -> dict:
+    """Quantize the cached fp16 program into ``target_package``.
+
+    Runs inside a pool worker; the returned wall time and peak RSS belong to
+    this variant alone because every worker handles a single task. Given
+    ``drift_inputs``, a mixed-precision package is also compared with the
+    fp16 program on them.
+    """
+    result = {"variant": suffix, "status": "ok", "error": None}
+    with PhaseMemoryMonitor() as monitor, monitor.phase(suffix, process="worker"):
         try:
-            login(token=hf_token)
-            print("Authenticated with Hugging Face Hub")
-        except Exception as exc:  # pragma: no cover - hub failures bubble up
-            raise RuntimeError(
-                "Failed to authenticate with Hugging Face Hub"
-            ) from exc
+            if os.path.exists(target_package):
+                shutil.rmtree(target_package)
+            quantize = QUANTIZATION_VARIANTS[suffix]
+            if quantize is None:
+                shutil.copytree(source_package, target_package)
+            elif suffix in MIXED_PRECISION_VARIANTS:
+                if weight_bits is None:
+                    raise ValueError(f"Variant '{suffix}' needs a per-layer bit-width map")
+                model = ct.models.MLModel(source_package, skip_model_load=True)
+                quantize(model, resolve_weight_bits(weight_bits, _const_names(model))).save(target_package)
+                if drift_inputs is not None:
+                    result["logits_drift"] = _logits_drift(source_package, target_package, drift_inputs)
+            else:
+                model = ct.models.MLModel(source_package, skip_model_load=True)
+                quantize(model).save(target_package)
+        except Exception as exc:  # noqa: BLE001 - upstream tooling raises many types
+            result.update({"status": "failed", "error": str(exc)})
+    result["memory"] = monitor.phases[suffix]
+    result["wall_time_s"] = result["memory"]["wall_time_s"]
+    result["peak_rss_mb"] = result["memory"]["peak_rss_mb"]
+    return result
 
-    config = AutoConfig.from_pretrained(hf_model_path)
-    base_model = AutoModelForCausalLM.from_pretrained(
-        hf_model_path,
-        torch_dtype=torch.float16,
-    )
-    base_model.eval()
 
+def _const_names(model) -> set:
+    """Names of the const ops in a saved ML program, read from the spec without loading weights."""
+    names = set()
+    for function in model.get_spec().mlProgram.functions.values():
+        for block in function.block_specializations.values():
+            for op in block.operations:
+                if op.type == "const":
+                    names.update(output.name for output in op.outputs)
+    return names
+
+
+def _drift_inputs(profile: dict, kv_cache: str) -> dict:
+    """A fixed prompt chunk on which quantized logits are compared with fp16."""
+    batch_size = profile["batch_size"]
+    length = min(profile["prefill_chunk"], DRIFT_TOKENS)
+    input_ids = np.arange(batch_size * length, dtype=np.int32) % 97 + 1
+    return {
+        "input_ids": input_ids.reshape(batch_size, length),
+        "attention_mask": _attention_mask(kv_cache, batch_size, profile["context_length"], length).numpy(),
+        "cache_position": np.arange(length, dtype=np.int32),
+    }
+
+
+def _logits_drift(reference_package: str, candidate_package: str, inputs: dict) -> dict:
+    if sys.platform != "darwin":
+        return {"status": "unavailable", "reason": "Core ML predictions need macOS"}
+    logits = [
+        ct.models.MLModel(package, compute_units=ct.ComputeUnit.CPU_ONLY).predict(inputs)["logits"]
+        for package in (reference_package, candidate_package)
+    ]
+    return {"status": "ok", **compare_arrays(*(np.asarray(array, dtype=np.float32) for array in logits))}
+
+
+def _kv_cache_shape(config, model, batch_size: int, context_length: int) -> tuple:
     num_layers = getattr(config, "num_hidden_layers", None)
     if num_layers is None:
-        base_layers = getattr(getattr(base_model, "model", None), "layers", None)
+        base_layers = getattr(getattr(model, "model", None), "layers", None)
         if base_layers is None:
             raise AttributeError(
                 "Unable to determine number of decoder layers from model or config",
@@ -144,8 +316,7 @@ def convert(
             "Model config is missing num_attention_heads/n_head information",
         )
     head_dim = config.hidden_size // num_attention_heads
-    batch_size, context_length = 1, 256
-    kv_shape = (
+    return (
         num_layers,
         batch_size,
         num_key_value_heads,
@@ -153,26 +324,106 @@ def convert(
         head_dim,
     )
 
-    class Wrapper(torch.nn.Module):
-        def __init__(self, model):
-            super().__init__()
-            self.model = model
-            self.kv = SliceUpdateKeyValueCache(shape=kv_shape, dtype=torch.float16)
-
-        @torch.no_grad()
-        def forward(self, input_ids, attention_mask, cache_position):
-            out = self.model(
-                input_ids=input_ids,
-                attention_mask=attention_mask,
-                past_key_values=self.kv,
-                cache_position=cache_position,
-                use_cache=True,
-            )
-            return out.logits
 
-    wrapped_model = Wrapper(base_model).eval()
+class Wrapper(torch.nn.Module):
+    def __init__(self, model, kv_shape, kv_cache: str = DEFAULT_KV_CACHE):
+        super().__init__()
+        self.model = model
+        self.kv = KV_CACHE_CLASSES[kv_cache](shape=kv_shape, dtype=torch.float16)
+
+    @torch.no_grad()
+    def forward(self, input_ids, attention_mask, cache_position):
+        out = self.model(
+            input_ids=input_ids,
+            attention_mask=attention_mask,
+            past_key_values=self.kv,
+            cache_position=cache_position,
+            use_cache=True,
+        )
+        return out.logits
+
+
+def load_export_profiles(config_path: str, names: list[str] | None) -> list[dict]:
+    with open(config_path, "r", encoding="utf-8") as handle:
+        config = json.load(handle)
+    declared = config.get("profiles", {})
+    selected = names or config.get("default_profiles") or [DEFAULT_PROFILE]
+    profiles = []
+    for name in selected:
+        if name not in declared:
+            raise ValueError(f"Unknown export profile '{name}' in {config_path}")
+        entry = declared[name]
+        context_length = int(entry["context_length"])
+        batch_size = int(entry.get("batch_size", 1))
+        prefill_chunk = int(entry.get("prefill_chunk", context_length))
+        if not 1 <= prefill_chunk <= context_length:
+            raise ValueError(f"Profile '{name}' prefill_chunk must be within 1..context_length")
+        if batch_size < 1:
+            raise ValueError(f"Profile '{name}' batch_size must be positive")
+        profiles.append(
+            {
+                "name": name,
+                "context_length": context_length,
+                "batch_size": batch_size,
+                "prefill_chunk": prefill_chunk,
+            }
+        )
+    return profiles
+
+
+def kv_cache_bytes(kv_shape: tuple, bytes_per_value: int = 2) -> int:
+    # Keys and values each hold layers x batch x kv_heads x context x head_dim.
+    total = 2 * bytes_per_value
+    for dim in kv_shape:
+        total *= dim
+    return total
+
+
+def _load_model(hf_model_path: str, low_memory: bool = False):
+    config = AutoConfig.from_pretrained(hf_model_path)
+    # low_cpu_mem_usage builds the module on the meta device and loads each
+    # checkpoint tensor straight into place instead of allocating random
+    # weights first; it needs accelerate.
+    base_model = AutoModelForCausalLM.from_pretrained(
+        hf_model_path,
+        torch_dtype=torch.float16,
+        low_cpu_mem_usage=low_memory,
+    )
+    base_model.eval()
+    return config, base_model
+
+
+def _calibrate_model(
+    base_model,
+    hf_model_path: str,
+    calibration_data: str,
+    calibration: dict | None,
+    samples: int,
+    int8_fraction: float,
+    calibration_path: str | None,
+) -> dict:
+    if calibration is not None:
+        apply_scales(base_model, calibration["scales"])
+        return calibration
+    tokenizer = AutoTokenizer.from_pretrained(hf_model_path)
+    texts = load_calibration_texts(calibration_data, samples)
+    calibration = calibrate(base_model, tokenizer, texts, int8_fraction)
+    if calibration_path:
+        torch.save(calibration, calibration_path)
+    return calibration
+
+
+def _attention_mask(kv_cache: str, batch_size: int, context_length: int, end: int) -> torch.Tensor:
+    if kv_cache == "static":
+        return decode_attention_mask(batch_size, context_length, end)
+    return torch.ones((batch_size, end), dtype=torch.int32)
+
+
+def _trace_model(base_model, kv_shape: tuple, kv_cache: str = DEFAULT_KV_CACHE):
+    batch_size, context_length = kv_shape[1], kv_shape[3]
+    wrapped_model = Wrapper(base_model, kv_shape, kv_cache).eval()
     example_input_ids = torch.zeros((batch_size, 1), dtype=torch.int32)
-    example_attention_mask = torch.ones((batch_size, 1), dtype=torch.int32)
+    example_attention_mask = _attention_mask(kv_cache, batch_size, context_length, 1)
     example_cache_position = torch.tensor([0], dtype=torch.int32)
 
     with torch.inference_mode():
@@ -181,11 +432,25 @@ def convert(
             (example_input_ids, example_attention_mask, example_cache_position),
             check_trace=False,
         )
+    return traced
+
 
-    sequence_range = ct.RangeDim(lower_bound=1, upper_bound=context_length, default=1)
+def convert_traced(
+    traced,
+    fp16_path: str,
+    batch_size: int,
+    context_length: int,
+    prefill_chunk: int,
+    kv_cache: str = DEFAULT_KV_CACHE,
+) -> None:
+    sequence_range = ct.RangeDim(lower_bound=1, upper_bound=prefill_chunk, default=1)
     inputs = [
         ct.TensorType("input_ids", (batch_size, sequence_range), np.int32),
-        ct.TensorType("attention_mask", (batch_size, sequence_range), np.int32),
+        ct.TensorType(
+            "attention_mask",
+            (batch_size, context_length if kv_cache == "static" else sequence_range),
+            np.int32,
+        ),
         ct.TensorType("cache_position", (sequence_range,), np.int32),
     ]
     outputs = [ct.TensorType("logits", dtype=np.float16)]
@@ -199,61 +464,337 @@ def convert(
         minimum_deployment_target=ct.target.iOS18,
         skip_model_load=True,
     )
+    del traced
+    gc.collect()
+    if os.path.exists(fp16_path):
+        shutil.rmtree(fp16_path)
+    mlpackage_model.save(fp16_path)
 
-    artifacts = []
 
-    def save_package(model, suffix):
-        name = f"{out_prefix}-{suffix}.mlpackage"
-        model.save(name)
-        total_bytes = 0
-        for root, _, files in os.walk(name):
-            for file_name in files:
-                total_bytes += os.path.getsize(os.path.join(root, file_name))
-        artifacts.append({"file": name, "bytes": total_bytes})
-
-    quantization_steps = [
-        ("fp16", lambda m: m),
-        (
-            "int8",
-            lambda m: cto.coreml.linear_quantize_weights(
-                m,
-                config=cto.coreml.OptimizationConfig(
-                    global_config=cto.coreml.OpLinearQuantizerConfig(
-                        mode="linear_symmetric",
-                    ),
-                ),
-            ),
-        ),
-        (
-            "int4-lut",
-            lambda m: cto.coreml.palettize_weights(
-                m,
-                config=cto.coreml.OptimizationConfig(
-                    global_config=cto.coreml.OpPalettizerConfig(
-                        mode="kmeans",
-                        nbits=4,
-                    ),
-                ),
-            ),
-        ),
-    ]
+def convert_traced_file(
+    traced_path: str,
+    fp16_path: str,
+    batch_size: int,
+    context_length: int,
+    prefill_chunk: int,
+    kv_cache: str = DEFAULT_KV_CACHE,
+) -> dict:
+    """Pool-worker entry point: convert a saved TorchScript module to fp16 Core ML."""
+    with PhaseMemoryMonitor() as monitor, monitor.phase("convert", process="worker"):
+        convert_traced(torch.jit.load(traced_path), fp16_path, batch_size, context_length, prefill_chunk, kv_cache)
+    return monitor.phases["convert"]
 
-    last_successful_model = mlpackage_model
-    for suffix, quantize in quantization_steps:
+
+def benchmark_profile(
+    base_model,
+    kv_shape: tuple,
+    prefill_chunk: int,
+    decode_tokens: int,
+    kv_cache: str = DEFAULT_KV_CACHE,
+) -> dict:
+    """Measure CPU torch throughput of the wrapped model for one profile.
+
+    Prefill runs ``prefill_chunk``-sized slices over half the context window
+    and decode then generates ``decode_tokens`` single-token steps, so both
+    phases are timed separately on the same cache layout the export uses.
+    """
+    batch_size, context_length = kv_shape[1], kv_shape[3]
+    decode_tokens = max(0, min(decode_tokens, context_length // 2))
+    prefill_tokens = max(1, min(context_length - decode_tokens, max(prefill_chunk, context_length // 2)))
+    wrapped_model = Wrapper(base_model, kv_shape, kv_cache).eval()
+
+    def step(start: int, length: int) -> None:
+        input_ids = torch.ones((batch_size, length), dtype=torch.int32)
+        attention_mask = _attention_mask(kv_cache, batch_size, context_length, start + length)
+        cache_position = torch.arange(start, start + length, dtype=torch.int32)
+        wrapped_model(input_ids, attention_mask, cache_position)
+
+    with torch.inference_mode():
+        step(0, 1)  # warm-up so one-off allocations are not timed
+        started = time.perf_counter()
+        for start in range(0, prefill_tokens, prefill_chunk):
+            step(start, min(prefill_chunk, prefill_tokens - start))
+        prefill_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for offset in range(decode_tokens):
+            step(prefill_tokens + offset, 1)
+        decode_s = time.perf_counter() - started
+
+    return {
+        "device": "cpu",
+        "prefill_tokens": prefill_tokens * batch_size,
+        "prefill_tokens_per_s": round(prefill_tokens * batch_size / prefill_s, 2) if prefill_s else None,
+        "decode_tokens": decode_tokens * batch_size,
+        "decode_tokens_per_s": round(decode_tokens * batch_size / decode_s, 2) if decode_s else None,
+    }
+
+
+def convert(
+    hf_model_path: str,
+    out_prefix: str,
+    artifacts_path: str = "coreml_artifacts.json",
+    hf_token: str | None = None,
+    manifest_path: str | None = None,
+    variants: tuple[str, ...] = DEFAULT_VARIANTS,
+    cache_dir: str | None = DEFAULT_CACHE_DIR,
+    jobs: int | None = None,
+    profiles: list[dict] | None = None,
+    benchmark_tokens: int = 0,
+    kv_cache: str = DEFAULT_KV_CACHE,
+    low_memory: bool = False,
+    calibration_data: str | None = None,
+    calibration_samples: int = 128,
+    calibration_int8_fraction: float = 0.1,
+    weight_bits_path: str | None = None,
+):
+    unknown = [suffix for suffix in variants if suffix not in QUANTIZATION_VARIANTS]
+    if unknown:
+        raise ValueError(f"Unknown quantization variants: {', '.join(unknown)}")
+    if kv_cache not in KV_CACHE_CLASSES:
+        raise ValueError(f"Unknown KV cache implementation '{kv_cache}'")
+    if profiles is None:
+        profiles = load_export_profiles(DEFAULT_PROFILES_CONFIG, [DEFAULT_PROFILE])
+    if manifest_path:
+        subprocess.run(
+            [
+                sys.executable,
+                os.path.join(
+                    os.path.dirname(__file__),
+                    "mlops",
+                    "verify_export_manifest.py",
+                ),
+                "--manifest",
+                manifest_path,
+                "--model-path",
+                hf_model_path,
+            ],
+            check=True,
+        )
+    if hf_token:
         try:
-            candidate = quantize(mlpackage_model)
-        except Exception as exc:  # noqa: BLE001 - upstream tooling raises many types
+            login(token=hf_token)
+            print("Authenticated with Hugging Face Hub")
+        except Exception as exc:  # pragma: no cover - hub failures bubble up
+            raise RuntimeError(
+                "Failed to authenticate with Hugging Face Hub"
+            ) from exc
+
+    model_fingerprint = _model_fingerprint(hf_model_path, manifest_path)
+    if model_fingerprint is None and cache_dir:
+        print(f"Could not resolve the Hub revision of {hf_model_path}; converting without the cache.")
+        cache_dir = None
+
+    calibration = None
+    calibration_key = None
+    calibration_path = None
+    if calibration_data:
+        calibration_key = conversion_cache_key(
+            model_fingerprint,
+            {
+                "calibration_data": _file_sha256(calibration_data),
+                "samples": calibration_samples,
+                "int8_fraction": calibration_int8_fraction,
+            },
+        )
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            calibration_path = os.path.join(cache_dir, f"calibration-{calibration_key}.pt")
+            if os.path.exists(calibration_path):
+                calibration = torch.load(calibration_path, weights_only=True)
+        if CALIBRATED_VARIANT not in variants:
+            variants = (*variants, CALIBRATED_VARIANT)
+    elif CALIBRATED_VARIANT in variants:
+        raise ValueError(f"Variant '{CALIBRATED_VARIANT}' needs --calibration_data")
+    sweep_weight_bits = None
+    if weight_bits_path:
+        with open(weight_bits_path, "r", encoding="utf-8") as handle:
+            sweep_weight_bits = json.load(handle)["op_name_bits"]
+        if SWEEP_VARIANT not in variants:
+            variants = (*variants, SWEEP_VARIANT)
+    elif SWEEP_VARIANT in variants:
+        raise ValueError(f"Variant '{SWEEP_VARIANT}' needs --weight_bits")
+
+    monitor = PhaseMemoryMonitor().start()
+    config = AutoConfig.from_pretrained(hf_model_path)
+    base_model = None
+    profile_reports = []
+    jobs_to_run = []
+    pending_conversions = []
+    for profile in profiles:
+        batch_size = profile["batch_size"]
+        context_length = profile["context_length"]
+        prefill_chunk = profile["prefill_chunk"]
+        conversion_params = {
+            "batch_size": batch_size,
+            "context_length": context_length,
+            "prefill_chunk": prefill_chunk,
+            "kv_cache": kv_cache,
+            "dtype": "float16",
+            "compute_units": "CPU_AND_NE",
+            "minimum_deployment_target": "iOS18",
+        }
+        if calibration_key:
+            # AWQ scales are folded into the weights, so they change the program.
+            conversion_params["calibration"] = calibration_key
+        cache_key = conversion_cache_key(model_fingerprint, conversion_params)
+        if cache_dir:
+            cache_path = os.path.join(cache_dir, cache_key)
+        else:
+            cache_path = os.path.join(os.path.dirname(os.path.abspath(out_prefix)), f".coreml-{cache_key}")
+        os.makedirs(cache_path, exist_ok=True)
+        traced_path = os.path.join(cache_path, "traced.pt")
+        fp16_path = os.path.join(cache_path, "fp16.mlpackage")
+        cache_hits = {
+            "traced": bool(cache_dir) and os.path.exists(traced_path),
+            "fp16": bool(cache_dir) and os.path.exists(fp16_path),
+        }
+
+        needs_model = benchmark_tokens > 0 or not (cache_hits["fp16"] or cache_hits["traced"])
+        needs_model = needs_model or bool(calibration_data and calibration is None)
+        if needs_model and base_model is None:
+            with monitor.phase("load"):
+                config, base_model = _load_model(hf_model_path, low_memory)
+            if calibration_data:
+                with monitor.phase("calibrate"):
+                    calibration = _calibrate_model(
+                        base_model,
+                        hf_model_path,
+                        calibration_data,
+                        calibration,
+                        calibration_samples,
+                        calibration_int8_fraction,
+                        calibration_path,
+                    )
+        kv_shape = _kv_cache_shape(config, base_model, batch_size, context_length)
+
+        if not cache_hits["fp16"]:
+            if cache_hits["traced"]:
+                traced = None if low_memory else torch.jit.load(traced_path)
+            else:
+                with monitor.phase(f"trace:{profile['name']}"):
+                    traced = _trace_model(base_model, kv_shape, kv_cache)
+                if cache_dir or low_memory:
+                    torch.jit.save(traced, traced_path)
+
+            if low_memory:
+                # Convert in a fresh process once the eager model is gone, so
+                # torch weights and the MIL program are never resident together.
+                del traced
+                gc.collect()
+                pending_conversions.append((profile, traced_path, fp16_path))
+            else:
+                with monitor.phase(f"convert:{profile['name']}"):
+                    convert_traced(traced, fp16_path, batch_size, context_length, prefill_chunk, kv_cache)
+                del traced
+        else:
+            print(f"Reusing cached fp16 program {fp16_path}")
+
+        report = {
+            **profile,
+            "cache_key": cache_key,
+            "cache_hits": cache_hits,
+            "kv_cache_bytes": kv_cache_bytes(kv_shape),
+            "kv_cache_mb": round(kv_cache_bytes(kv_shape) / (1024 * 1024), 2),
+        }
+        if benchmark_tokens > 0:
+            with monitor.phase(f"benchmark:{profile['name']}"):
+                report["benchmark"] = benchmark_profile(
+                    base_model, kv_shape, prefill_chunk, benchmark_tokens, kv_cache
+                )
+        profile_reports.append(report)
+
+        # The default profile keeps the historical artifact names.
+        prefix = out_prefix if profile["name"] == DEFAULT_PROFILE else f"{out_prefix}-{profile['name']}"
+        for suffix in variants:
+            jobs_to_run.append((profile, cache_path, fp16_path, f"{prefix}-{suffix}.mlpackage", suffix))
+
+    del base_model
+    gc.collect()
+
+    for profile, traced_path, fp16_path in pending_conversions:
+        with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+            stats = pool.submit(
+                convert_traced_file,
+                traced_path,
+                fp16_path,
+                profile["batch_size"],
+                profile["context_length"],
+                profile["prefill_chunk"],
+                kv_cache,
+            ).result()
+        monitor.record(f"convert:{profile['name']}", stats)
+
+    # Each worker handles one variant and exits, so its peak RSS is the
+    # variant's own and no quantized program outlives its save. Low-memory
+    # mode runs them one at a time.
+    if low_memory:
+        jobs = 1
+    elif jobs is None:
+        jobs = max(1, min(len(jobs_to_run), DEFAULT_JOBS))
+    variant_weight_bits = {
+        CALIBRATED_VARIANT: coreml_weight_bits(calibration["module_bits"]) if calibration else None,
+        SWEEP_VARIANT: sweep_weight_bits,
+    }
+    with monitor.phase("quantize"):
+        with ProcessPoolExecutor(max_workers=jobs, max_tasks_per_child=1) as pool:
+            futures = [
+                pool.submit(
+                    run_variant,
+                    suffix,
+                    fp16_path,
+                    name,
+                    variant_weight_bits.get(suffix),
+                    _drift_inputs(profile, kv_cache) if suffix in MIXED_PRECISION_VARIANTS else None,
+                )
+                for profile, _cache_path, fp16_path, name, suffix in jobs_to_run
+            ]
+            results = [future.result() for future in futures]
+    for (profile, _cache_path, _fp16_path, _name, suffix), result in zip(jobs_to_run, results):
+        monitor.record(f"quantize:{profile['name']}:{suffix}", result["memory"])
+    monitor.close()
+
+    artifacts = []
+    last_successful = {}
+    for (profile, _cache_path, fp16_path, name, _suffix), result in zip(jobs_to_run, results):
+        if result["status"] == "ok":
+            last_successful[profile["name"]] = name
+        else:
             print(
-                f"Quantization '{suffix}' failed ({exc}); exporting previous precision."
+                f"Quantization '{result['variant']}' failed ({result['error']}); exporting previous precision."
             )
-            model_to_save = last_successful_model
-        else:
-            model_to_save = candidate
-            last_successful_model = model_to_save
-        save_package(model_to_save, suffix)
+            fallback = last_successful.get(profile["name"], fp16_path)
+            if os.path.exists(name):
+                shutil.rmtree(name)
+            shutil.copytree(fallback, name)
+        artifact = {
+            "file": name,
+            "bytes": _package_bytes(name),
+            "profile": profile["name"],
+            "variant": result["variant"],
+            "status": result["status"],
+            "wall_time_s": result["wall_time_s"],
+            "peak_rss_mb": result["peak_rss_mb"],
+        }
+        if "logits_drift" in result:
+            artifact["fp16_bytes"] = _package_bytes(fp16_path)
+            artifact["size_ratio"] = round(artifact["bytes"] / artifact["fp16_bytes"], 4)
+            artifact["logits_drift"] = result["logits_drift"]
+        artifacts.append(artifact)
+
+    if not cache_dir:
+        for cache_path in {job[1] for job in jobs_to_run}:
+            shutil.rmtree(cache_path, ignore_errors=True)
 
+    report = {
+        "artifacts": artifacts,
+        "profiles": profile_reports,
+        "memory": {"low_memory": low_memory, "jobs": jobs, "phases": monitor.phases},
+    }
+    if calibration:
+        report["calibration"] = {"cache_key": calibration_key, **calibration["report"]}
     with open(artifacts_path, "w") as f:
-        json.dump({"artifacts": artifacts}, f, indent=2)
+        json.dump(report, f, indent=2)
     print(
         f"Artifacts written to {artifacts_path}:",
         json.dumps(artifacts, indent=2),
@@ -271,6 +812,74 @@ if __name__ == "__main__":
         default=None,
         help="Path to export manifest for verification.",
     )
+    ap.add_argument(
+        "--variants",
+        default=",".join(DEFAULT_VARIANTS),
+        help=f"Comma-separated quantization variants ({', '.join(QUANTIZATION_VARIANTS)}).",
+    )
+    ap.add_argument(
+        "--cache_dir",
+        default=DEFAULT_CACHE_DIR,
+        help="Directory for cached traced/fp16 programs.",
+    )
+    ap.add_argument(
+        "--no_cache",
+        action="store_true",
+        help="Always re-trace and re-convert instead of reusing cached programs.",
+    )
+    ap.add_argument(
+        "--profiles",
+        default=None,
+        help="Comma-separated export profiles (default: the config's default_profiles).",
+    )
+    ap.add_argument(
+        "--profiles_config",
+        default=DEFAULT_PROFILES_CONFIG,
+        help="JSON file declaring named export profiles.",
+    )
+    ap.add_argument(
+        "--benchmark_tokens",
+        type=int,
+        default=0,
+        help="Decode steps for a per-profile CPU torch benchmark (default: 0, off). "
+        "The benchmark needs the eager model, so it forces a full load even on a cache hit.",
+    )
+    ap.add_argument(
+        "--kv_cache",
+        choices=sorted(KV_CACHE_CLASSES),
+        default=DEFAULT_KV_CACHE,
+        help="KV cache traced into the model; static keeps a fixed-size buffer and a full-context mask.",
+    )
+    ap.add_argument(
+        "--low_memory",
+        action="store_true",
+        help="Load weights lazily, convert in a separate process after the torch model is freed "
+        "and quantize variants one at a time.",
+    )
+    ap.add_argument(
+        "--calibration_data",
+        default=None,
+        help="telemetry_to_sft JSONL used for activation-aware calibration; adds the int4-awq variant.",
+    )
+    ap.add_argument("--calibration_samples", type=int, default=128)
+    ap.add_argument(
+        "--calibration_int8_fraction",
+        type=float,
+        default=0.1,
+        help="Fraction of linears with the largest int4 error kept at int8 in int4-awq.",
+    )
+    ap.add_argument(
+        "--weight_bits",
+        default=None,
+        help="quant_sensitivity_sweep.py output; adds the mixed variant built from its op_name_bits.",
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=None,
+        help=f"Parallel quantization workers (default: {DEFAULT_JOBS}). Each holds its own copy of the "
+        "fp16 program, so size this to memory, not CPUs; --low_memory forces 1.",
+    )
     args = ap.parse_args()
     token = args.hf_token or os.getenv("HF_TOKEN")
     convert(
@@ -279,6 +888,20 @@ if __name__ == "__main__":
         args.artifacts_path,
         token,
         args.manifest,
+        variants=tuple(v.strip() for v in args.variants.split(",") if v.strip()),
+        cache_dir=None if args.no_cache else args.cache_dir,
+        jobs=args.jobs,
+        profiles=load_export_profiles(
+            args.profiles_config,
+            [name.strip() for name in args.profiles.split(",") if name.strip()] if args.profiles else None,
+        ),
+        benchmark_tokens=args.benchmark_tokens,
+        kv_cache=args.kv_cache,
+        low_memory=args.low_memory,
+        calibration_data=args.calibration_data,
+        calibration_samples=args.calibration_samples,
+        calibration_int8_fraction=args.calibration_int8_fraction,
+        weight_bits_path=args.weight_bits,
     )
 
 
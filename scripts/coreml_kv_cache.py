@@ -0,0 +1,130 @@
+"""
+Key/value caches used when tracing decoder models for Core ML export.
+
+``SliceUpdateKeyValueCache`` tracks the filled length on the host and hands the
+model a slice of the buffer that grows with every step. ``StaticKeyValueCache``
+never leaves the device: positions are scattered into a fixed-size buffer, the
+whole buffer is returned and unwritten slots are hidden by the attention mask,
+so every decode step runs the same shapes without ``.item()`` syncs.
+"""
+
+import torch
+from transformers.cache_utils import Cache
+
+
+class SliceUpdateKeyValueCache(Cache):
+    def __init__(self, *, shape, dtype=torch.float32):
+        super().__init__()
+        self.register_buffer("k", torch.zeros(shape, dtype=dtype))
+        self.register_buffer("v", torch.zeros(shape, dtype=dtype))
+        self.register_buffer(
+            "_current_length",
+            torch.zeros(shape[0], dtype=torch.int32),
+            persistent=False,
+        )
+
+    def __len__(self):
+        return int(self._current_length.max().item())
+
+    def update(self, k_state, v_state, layer_idx, cache_kwargs=None):
+        position = (cache_kwargs or {}).get("cache_position", None)
+        if position is None:
+            raise ValueError("cache_position required")
+        position = torch.as_tensor(position)
+        if position.ndim > 1:
+            position = position.reshape(-1)
+        start = int(position.min().item())
+        end = int(position.max().item() + 1)
+        seq_len = k_state.shape[2]
+        if end - start != seq_len:
+            raise ValueError(
+                "cache_position must describe a contiguous range matching the incoming sequence length"
+            )
+        if end > self.k.shape[3]:
+            raise ValueError("cache_position exceeds allocated cache size")
+        self.k[layer_idx, :, : k_state.shape[1], start:end, :] = k_state
+        self.v[layer_idx, :, : v_state.shape[1], start:end, :] = v_state
+        current = max(int(self._current_length[layer_idx].item()), end)
+        self._current_length[layer_idx] = torch.tensor(
+            current,
+            device=self._current_length.device,
+            dtype=self._current_length.dtype,
+        )
+        return (
+            self.k[layer_idx, :, :, :current, :],
+            self.v[layer_idx, :, :, :current, :],
+        )
+
+    def get_seq_length(self, _=0):
+        return int(self._current_length.max().item())
+
+
+class StaticKeyValueCache(Cache):
+    """Fixed-size cache that never syncs to the host.
+
+    Buffers are stored position-major, ``(layers, context, batch, heads,
+    head_dim)``, so each ``update`` is a single ``index_put_`` of the incoming
+    positions into the base buffer. That is the form both eager PyTorch and
+    the Core ML converter handle without host syncs (coremltools lowers it to
+    ``scatter_nd``; it has no ``index_copy_`` conversion).
+
+    ``update`` returns the whole ``context_length`` buffer. Callers must pass
+    an ``attention_mask`` spanning that buffer with zeros after the last
+    written position (see ``decode_attention_mask``); the causal mask built
+    from it hides every slot that has not been filled yet. Lengths are kept
+    as tensors, so ``get_seq_length`` returns a 0-d tensor.
+    """
+
+    def __init__(self, *, shape, dtype=torch.float32):
+        super().__init__()
+        num_layers, batch_size, num_heads, context_length, head_dim = shape
+        buffer_shape = (num_layers, context_length, batch_size, num_heads, head_dim)
+        self.register_buffer("k", torch.zeros(buffer_shape, dtype=dtype))
+        self.register_buffer("v", torch.zeros(buffer_shape, dtype=dtype))
+        self.register_buffer(
+            "_current_length",
+            torch.zeros(num_layers, dtype=torch.int64),
+            persistent=False,
+        )
+
+    def update(self, k_state, v_state, layer_idx, cache_kwargs=None):
+        position = (cache_kwargs or {}).get("cache_position", None)
+        if position is None:
+            raise ValueError("cache_position required")
+        position = torch.as_tensor(position, device=self.k.device).reshape(-1).long()
+        layer = torch.full_like(position, layer_idx)
+        self.k.index_put_((layer, position), k_state.to(self.k.dtype).permute(2, 0, 1, 3))
+        self.v.index_put_((layer, position), v_state.to(self.v.dtype).permute(2, 0, 1, 3))
+        if not torch.jit.is_tracing():
+            # Exported graphs carry the length in the attention mask instead.
+            self._current_length[layer_idx] = torch.maximum(
+                self._current_length[layer_idx],
+                position.max() + 1,
+            )
+        return (
+            self.k[layer_idx].permute(1, 2, 0, 3),
+            self.v[layer_idx].permute(1, 2, 0, 3),
+        )
+
+    def get_seq_length(self, layer_idx=0):
+        return self._current_length[layer_idx or 0]
+
+    def get_max_length(self):
+        return self.k.shape[1]
+
+    def reset(self):
+        self.k.zero_()
+        self.v.zero_()
+        self._current_length.zero_()
+
+
+KV_CACHE_CLASSES = {
+    "slice": SliceUpdateKeyValueCache,
+    "static": StaticKeyValueCache,
+}
+
+
+def decode_attention_mask(batch_size: int, context_length: int, end) -> torch.Tensor:
+    """Attention mask over the full static buffer with positions ``< end`` visible."""
+    positions = torch.arange(context_length, dtype=torch.int32)
+    return (positions < end).to(torch.int32).unsqueeze(0).expand(batch_size, context_length)
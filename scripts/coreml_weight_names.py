@@ -0,0 +1,47 @@
+"""
+Core ML weight const names for the modules of the exported ``Wrapper``.
+
+Shared by ``convert_to_coreml.py`` and ``quant_sensitivity_sweep.py``; it
+imports nothing, so the torch-only sweep runs where coremltools is not
+installed.
+"""
+
+# The KV cache buffers are traced as constants; keep them uncompressed.
+KV_CACHE_CONSTS = ("kv_k", "kv_v")
+
+
+def coreml_weight_name(module_name: str) -> str:
+    """Name of the const op ct.convert gives ``module_name``'s weight inside ``Wrapper``."""
+    return "model_" + module_name.replace(".", "_") + "_weight"
+
+
+def coreml_weight_bits(module_bits: dict) -> dict:
+    """Map torch module bit-widths to ``op_name_configs`` keys; 16 bits stays fp16."""
+    weight_bits = {
+        coreml_weight_name(name): None if bits >= 16 else bits for name, bits in module_bits.items()
+    }
+    weight_bits.update({name: None for name in KV_CACHE_CONSTS})
+    return weight_bits
+
+
+def resolve_weight_bits(weight_bits: dict, const_names) -> dict:
+    """Key ``weight_bits`` by the const ops that exist in the converted program.
+
+    An fp32 source gets its weights cast in the program, so the const may be
+    named ``<name>_to_fp16``. ``op_name_configs`` ignores keys that match no
+    op, so a missing name would silently leave that weight at the global
+    config; raise instead.
+    """
+    const_names = set(const_names)
+    resolved = {}
+    missing = []
+    for name, bits in weight_bits.items():
+        if name in const_names:
+            resolved[name] = bits
+        elif f"{name}_to_fp16" in const_names:
+            resolved[f"{name}_to_fp16"] = bits
+        else:
+            missing.append(name)
+    if missing:
+        raise ValueError(f"Weight-bit names match no const op in the program: {', '.join(sorted(missing))}")
+    return resolved
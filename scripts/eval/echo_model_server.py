@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Deterministic stand-in model for full-mode prompt regression.
+
+It sleeps for ``--load-seconds`` to mimic model loading and then echoes each
+prompt back. Without ``--server`` it answers one prompt read from stdin, as
+``--model-cmd`` expects. With ``--server`` it prints ``{"ready": true}``
+after loading and then answers JSON-lines requests until stdin closes, as
+``--model-server`` expects. Both modes produce the same output for the same
+prompt, so their ``model_out_sha256`` values match.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import time
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description="Echo stand-in for the prompt regression model worker.")
+    p.add_argument("--server", action="store_true", help="Speak the JSON-lines worker protocol on stdin/stdout.")
+    p.add_argument("--load-seconds", type=float, default=2.0, help="Simulated model load time.")
+    p.add_argument("--delay-seconds", type=float, default=0.0, help="Simulated per-prompt latency.")
+    args = p.parse_args()
+
+    time.sleep(args.load_seconds)
+    if not args.server:
+        prompt = sys.stdin.read()
+        time.sleep(args.delay_seconds)
+        sys.stdout.write(prompt)
+        return 0
+
+    print(json.dumps({"ready": True}), flush=True)
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        time.sleep(args.delay_seconds)
+        print(json.dumps({"id": request.get("id"), "output": request.get("prompt", "")}), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
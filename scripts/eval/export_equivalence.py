@@ -1,8 +1,19 @@
 import argparse
 import json
-import math
+import sys
 from pathlib import Path
 
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.logits_equivalence import (  # noqa: E402
+    DEFAULT_TOP_K,
+    compare_arrays,
+    load_logits,
+)
+
 
 def load_outputs(path: Path) -> dict:
     if not path.exists():
@@ -14,43 +25,45 @@ def load_outputs(path: Path) -> dict:
 def compare_logits(reference: list[float], candidate: list[float]) -> dict:
     if len(reference) != len(candidate):
         raise ValueError("Logit lengths do not match")
-    deltas = [abs(r - c) for r, c in zip(reference, candidate)]
-    return {
-        "max_delta": max(deltas) if deltas else 0,
-        "mean_delta": sum(deltas) / len(deltas) if deltas else 0,
-        "rmse": math.sqrt(sum(d * d for d in deltas) / len(deltas))
-        if deltas
-        else 0,
-    }
+    metrics = compare_arrays(
+        np.asarray(reference, dtype=np.float64).reshape(-1),
+        np.asarray(candidate, dtype=np.float64).reshape(-1),
+    )
+    return {key: metrics[key] for key in ("max_delta", "mean_delta", "rmse")}
+
+
+def _load_side(path: str, label: str):
+    if Path(path).suffix != ".json":
+        return load_logits(path)
+    logits = load_outputs(Path(path)).get("logits")
+    if not isinstance(logits, list):
+        raise ValueError(
+            f"Expected 'logits' to be a list in {label} "
+            f"but found {type(logits).__name__}"
+        )
+    return np.asarray(logits, dtype=np.float64)
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Compare reference and candidate export outputs."
     )
-    parser.add_argument("--reference", required=True)
+    parser.add_argument(
+        "--reference",
+        required=True,
+        help="JSON with a 'logits' list, or a .npy/.safetensors logits array.",
+    )
     parser.add_argument("--candidate", required=True)
     parser.add_argument("--max-delta", type=float, default=0.15)
+    parser.add_argument("--top-k", type=int, default=DEFAULT_TOP_K)
     args = parser.parse_args()
 
-    reference = load_outputs(Path(args.reference))
-    candidate = load_outputs(Path(args.candidate))
-
-    ref_logits = reference.get("logits")
-    cand_logits = candidate.get("logits")
-
-    if not isinstance(ref_logits, list):
-        raise ValueError(
-            "Expected 'logits' to be a list in reference "
-            f"but found {type(ref_logits).__name__}"
-        )
-    if not isinstance(cand_logits, list):
-        raise ValueError(
-            "Expected 'logits' to be a list in candidate "
-            f"but found {type(cand_logits).__name__}"
-        )
+    reference = _load_side(args.reference, "reference")
+    candidate = _load_side(args.candidate, "candidate")
+    if reference.shape != candidate.shape:
+        raise ValueError("Logit lengths do not match")
 
-    metrics = compare_logits(ref_logits, cand_logits)
+    metrics = compare_arrays(reference, candidate, top_k=args.top_k)
     print(json.dumps(metrics, indent=2))
     if metrics["max_delta"] > args.max_delta:
         raise SystemExit(
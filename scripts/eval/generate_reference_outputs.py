@@ -0,0 +1,426 @@
+"""
+Generate the Python side of an export-equivalence run.
+
+Golden (``scripts/eval/golden_prompts.json``) and redteam
+(``eval/redteam_tool_injection.json``) cases are rendered with
+``prompts/v1/runtime_prompt.json`` and decoded greedily on CPU with an HF model,
+optionally with a LoRA adapter merged in. The output JSONL holds the ``id``,
+``tokens``, ``response`` and ``logits_index`` entries read by
+``eval/export_equivalence.py``; the logits of the first ``--logits-steps``
+decode steps go to an ``(entries, steps, vocab)`` ``.npy`` file for its
+``--python-logits`` option.
+
+Everything up to the context section (intro, tool list and instructions) is
+identical for cases that offer the same tools, so its KV state comes from a
+``PrefixKVCache`` (``scripts/eval/prefix_cache.py``) and is forked for every
+batch that uses it. Cases are grouped by prefix, sorted by suffix length and
+packed into batches under a padded-token budget, which keeps padding small.
+``--measure-speedup`` re-runs the same batches' prefill without the cache and
+reports the wall-clock ratio.
+
+``--tool-grammar call|text`` constrains decoding with the ``TOOL_CALL`` grammar
+of ``scripts/eval/tool_call_grammar.py``, compiled from ``--tools-dir``. Its
+token masks are cached per tokenizer under ``--tool-grammar-cache``. The
+recorded logits are the model's own, from before masking.
+"""
+
+import argparse
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+from transformers.cache_utils import DynamicCache
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.prefix_cache import PrefixKVCache  # noqa: E402
+from scripts.eval.prompt_builder import runtime_prompt_parts  # noqa: E402
+from scripts.eval.tool_call_grammar import (  # noqa: E402
+    DEFAULT_CACHE_DIR as DEFAULT_TOOL_GRAMMAR_CACHE,
+    MODES as TOOL_GRAMMAR_MODES,
+    TokenVocabulary,
+    ToolCallLogitsProcessor,
+    compile_tool_grammar,
+    load_or_build_masks,
+)
+from scripts.mlops.tool_schema_registry import ToolSchemaRegistry  # noqa: E402
+
+DEFAULT_TEMPLATE = REPO_ROOT / "prompts" / "v1" / "runtime_prompt.json"
+DEFAULT_TOOLS_DIR = REPO_ROOT / "schemas" / "tools"
+DEFAULT_PROMPTS = [
+    REPO_ROOT / "scripts" / "eval" / "golden_prompts.json",
+    REPO_ROOT / "eval" / "redteam_tool_injection.json",
+]
+
+
+def load_schema_tools(tools_dir: Path) -> list[dict]:
+    """Tool entries for cases that do not list their own, built from JSON schemas."""
+    tools = []
+    for path in sorted(Path(tools_dir).glob("*.schema.json")):
+        with path.open("r", encoding="utf-8") as handle:
+            schema = json.load(handle)
+        required = set(schema.get("required", []))
+        name = schema.get("title") or path.name.split(".")[0]
+        tools.append(
+            {
+                "name": name,
+                "description": schema.get("description") or name,
+                "parameters": {
+                    key: {**spec, "required": key in required}
+                    for key, spec in schema.get("properties", {}).items()
+                },
+            }
+        )
+    return tools
+
+
+def load_cases(paths: list[Path], default_tools: list[dict]) -> list[dict]:
+    """Golden (``{cases: [...]}`` or list) and redteam case files as flat cases."""
+    cases, seen = [], set()
+    for path in paths:
+        if not path.exists():
+            raise FileNotFoundError(f"Prompt file not found: {path}")
+        with path.open("r", encoding="utf-8") as handle:
+            parsed = json.load(handle)
+        entries = parsed.get("cases", []) if isinstance(parsed, dict) else parsed
+        for entry in entries:
+            case_id = entry.get("stable_id") or entry.get("id")
+            if not case_id:
+                raise ValueError(f"Case without stable_id or id in {path}")
+            if case_id in seen:
+                raise ValueError(f"Duplicate case id {case_id} in {path}")
+            seen.add(case_id)
+            cases.append(
+                {
+                    "id": case_id,
+                    "user_prompt": entry.get("user_prompt", entry.get("prompt", "")),
+                    "tools": entry.get("tools", default_tools),
+                    "context": entry.get("context") or [],
+                }
+            )
+    return cases
+
+
+def render_prompt(template: dict, case: dict) -> tuple[str, str]:
+    """Render ``case`` as ``PromptBuilder.build`` does, split into (shared prefix, suffix)."""
+    return runtime_prompt_parts(case["user_prompt"], case["tools"], case["context"], template)
+
+
+def encode_cases(tokenizer, template: dict, cases: list[dict]) -> list[dict]:
+    """Token ids per case, split at the longest prefix shared with its rendered prefix.
+
+    The full prompt is tokenized in one piece so merges across the prefix
+    boundary match a plain tokenization; only the tokens both agree on are
+    taken from the shared KV state.
+    """
+    prefix_tokens = {}
+    encoded = []
+    for case in cases:
+        prefix, suffix = render_prompt(template, case)
+        if prefix not in prefix_tokens:
+            prefix_tokens[prefix] = tokenizer(prefix)["input_ids"] if prefix else []
+        full = tokenizer(prefix + suffix)["input_ids"]
+        shared = 0
+        for left, right in zip(prefix_tokens[prefix], full[:-1]):
+            if left != right:
+                break
+            shared += 1
+        encoded.append({"prefix_ids": tuple(full[:shared]), "suffix_ids": full[shared:]})
+    return encoded
+
+
+def plan_batches(encoded: list[dict], batch_size: int, max_batch_tokens: int, max_new_tokens: int) -> list[list[int]]:
+    """Case indices grouped by shared prefix, sorted by suffix length, packed under the token budget."""
+    groups: dict[tuple, list[int]] = {}
+    for index, entry in enumerate(encoded):
+        groups.setdefault(entry["prefix_ids"], []).append(index)
+    batches = []
+    for prefix_ids, indices in groups.items():
+        indices.sort(key=lambda index: len(encoded[index]["suffix_ids"]))
+        batch: list[int] = []
+        for index in indices:
+            # Sorted ascending, so the new case sets the padded width.
+            width = len(prefix_ids) + len(encoded[index]["suffix_ids"]) + max_new_tokens
+            if batch and (len(batch) >= batch_size or (len(batch) + 1) * width > max_batch_tokens):
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+    return batches
+
+
+def load_model(hf_model: str, lora_dir: str | None, dtype: str):
+    model = AutoModelForCausalLM.from_pretrained(hf_model, torch_dtype=getattr(torch, dtype))
+    if lora_dir:
+        from peft import PeftModel
+
+        model = PeftModel.from_pretrained(model, lora_dir).merge_and_unload()
+    model.eval()
+    return model
+
+
+@torch.inference_mode()
+def prefill_uncached(model, rows: list[list[int]], pad_id: int) -> float:
+    """Wall time of a cache-free prefill of left-padded full prompts."""
+    width = max(len(row) for row in rows)
+    input_ids = torch.full((len(rows), width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+    for index, row in enumerate(rows):
+        input_ids[index, width - len(row) :] = torch.tensor(row)
+        attention_mask[index, width - len(row) :] = 1
+    position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+    started = time.perf_counter()
+    model(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids, use_cache=False)
+    return time.perf_counter() - started
+
+
+@torch.inference_mode()
+def decode_batch(
+    model,
+    cache: DynamicCache,
+    prefix_length: int,
+    suffixes: list[list[int]],
+    pad_id: int,
+    eos_ids: set[int],
+    max_new_tokens: int,
+    logits_steps: int,
+    constraint: ToolCallLogitsProcessor | None = None,
+) -> dict:
+    """Greedy decode left-padded ``suffixes`` after a shared cached prefix,
+    masked by ``constraint`` when given."""
+    batch, width = len(suffixes), max(len(suffix) for suffix in suffixes)
+    input_ids = torch.full((batch, width), pad_id, dtype=torch.long)
+    attention_mask = torch.zeros((batch, prefix_length + width), dtype=torch.long)
+    attention_mask[:, :prefix_length] = 1
+    for row, suffix in enumerate(suffixes):
+        input_ids[row, width - len(suffix) :] = torch.tensor(suffix)
+        attention_mask[row, prefix_length + width - len(suffix) :] = 1
+    # Padding sits between the prefix and each suffix, so positions come from the mask.
+    position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)[:, prefix_length:]
+
+    started = time.perf_counter()
+    outputs = model(
+        input_ids=input_ids,
+        attention_mask=attention_mask,
+        position_ids=position_ids,
+        past_key_values=cache,
+        cache_position=torch.arange(prefix_length, prefix_length + width),
+        use_cache=True,
+    )
+    prefill_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    logits = outputs.logits[:, -1].float()
+    cache = outputs.past_key_values
+    step_logits = np.zeros((batch, logits_steps, logits.shape[-1]), dtype=np.float32)
+    tokens: list[list[int]] = [[] for _ in range(batch)]
+    finished = torch.zeros(batch, dtype=torch.bool)
+    next_position = position_ids[:, -1:] + 1
+    if constraint is not None:
+        constraint.reset(batch)
+    for step in range(max_new_tokens):
+        if step < logits_steps:
+            step_logits[~finished.numpy(), step] = logits[~finished].numpy()
+        if constraint is not None:
+            constraint.mask_(logits)
+        next_tokens = logits.argmax(dim=-1)
+        if constraint is not None:
+            constraint.advance(next_tokens.tolist())
+        for row in range(batch):
+            if not finished[row]:
+                tokens[row].append(int(next_tokens[row]))
+                finished[row] = int(next_tokens[row]) in eos_ids
+        if bool(finished.all()) or step == max_new_tokens - 1:
+            break
+        next_tokens = torch.where(finished, torch.full_like(next_tokens, pad_id), next_tokens)
+        attention_mask = torch.cat([attention_mask, torch.ones((batch, 1), dtype=torch.long)], dim=1)
+        outputs = model(
+            input_ids=next_tokens[:, None],
+            attention_mask=attention_mask,
+            position_ids=next_position,
+            past_key_values=cache,
+            cache_position=torch.tensor([attention_mask.shape[1] - 1]),
+            use_cache=True,
+        )
+        next_position = next_position + 1
+        logits = outputs.logits[:, -1].float()
+        cache = outputs.past_key_values
+    return {
+        "tokens": tokens,
+        "logits": step_logits,
+        "prefill_s": prefill_s,
+        "decode_s": time.perf_counter() - started,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Generate reference outputs for export equivalence.")
+    parser.add_argument("--hf_model", required=True)
+    parser.add_argument("--lora_dir", default=None, help="Optional LoRA adapter merged before decoding.")
+    parser.add_argument(
+        "--prompts",
+        action="append",
+        default=[],
+        help="Golden or redteam prompt JSON (repeatable). Defaults to both bundled sets.",
+    )
+    parser.add_argument("--output", required=True, help="JSONL for eval/export_equivalence.py --python-output.")
+    parser.add_argument("--logits-output", default=None, help="Defaults to <output>.logits.npy.")
+    parser.add_argument("--template", default=str(DEFAULT_TEMPLATE))
+    parser.add_argument("--tools-dir", default=str(DEFAULT_TOOLS_DIR))
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--logits-steps", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-batch-tokens", type=int, default=16384)
+    parser.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], default="float32")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument(
+        "--prefix-cache-mb",
+        type=float,
+        default=512,
+        help="Byte budget of the shared-prefix KV cache; 0 recomputes the prefix for every batch.",
+    )
+    parser.add_argument(
+        "--tool-grammar",
+        choices=TOOL_GRAMMAR_MODES,
+        default=None,
+        help="Constrain decoding to TOOL_CALL outputs: 'call' forces one call, 'text' only checks calls.",
+    )
+    parser.add_argument("--tool-grammar-cache", default=str(DEFAULT_TOOL_GRAMMAR_CACHE))
+    parser.add_argument(
+        "--measure-speedup",
+        action="store_true",
+        help="Also time a cache-free prefill of the same batches and report the speedup.",
+    )
+    args = parser.parse_args()
+    if not 1 <= args.logits_steps <= args.max_new_tokens:
+        parser.error("--logits-steps must be between 1 and --max-new-tokens")
+
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with open(args.template, "r", encoding="utf-8") as handle:
+        template = json.load(handle)
+    prompt_paths = [Path(path) for path in args.prompts] or DEFAULT_PROMPTS
+    cases = load_cases(prompt_paths, load_schema_tools(Path(args.tools_dir)))
+    if not cases:
+        raise ValueError("No prompt cases to run")
+
+    tokenizer = AutoTokenizer.from_pretrained(args.hf_model)
+    model = load_model(args.hf_model, args.lora_dir, args.dtype)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id
+    eos_ids = model.generation_config.eos_token_id
+    eos_ids = set(eos_ids if isinstance(eos_ids, list) else [eos_ids]) - {None}
+
+    constraint, grammar_report = None, None
+    if args.tool_grammar:
+        started = time.perf_counter()
+        dfa = compile_tool_grammar(ToolSchemaRegistry(Path(args.tools_dir)), mode=args.tool_grammar)
+        vocab = TokenVocabulary.from_tokenizer(tokenizer, eos_ids)
+        masks, cache_hit = load_or_build_masks(dfa, vocab, Path(args.tool_grammar_cache))
+        constraint = ToolCallLogitsProcessor(masks, vocab)
+        grammar_report = {
+            "mode": args.tool_grammar,
+            "tools": len(dfa.tools),
+            "states": dfa.num_states,
+            "unique_masks": int(masks.masks.shape[0]),
+            "cache_hit": cache_hit,
+            "setup_s": round(time.perf_counter() - started, 4),
+        }
+
+    encoded = encode_cases(tokenizer, template, cases)
+    batches = plan_batches(encoded, args.batch_size, args.max_batch_tokens, args.max_new_tokens)
+
+    output_path = Path(args.output)
+    logits_path = Path(args.logits_output) if args.logits_output else output_path.with_suffix(".logits.npy")
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    logits_path.parent.mkdir(parents=True, exist_ok=True)
+    vocab_size = model.get_output_embeddings().weight.shape[0]
+    logits_file = np.lib.format.open_memmap(
+        logits_path, mode="w+", dtype=np.float32, shape=(len(cases), args.logits_steps, vocab_size)
+    )
+
+    with torch.inference_mode():
+        # Keep one-off kernel setup out of the timings.
+        model(input_ids=torch.tensor([[pad_id]]), use_cache=False)
+
+    wall_started = time.perf_counter()
+    prefix_cache = PrefixKVCache(model, int(args.prefix_cache_mb * 1024 * 1024))
+    decode_s = prefill_s = 0.0
+    tokens: list[list[int] | None] = [None] * len(cases)
+    for batch in batches:
+        prefix_ids = encoded[batch[0]]["prefix_ids"]
+        result = decode_batch(
+            model,
+            prefix_cache.fork(prefix_ids, len(batch)),
+            len(prefix_ids),
+            [encoded[index]["suffix_ids"] for index in batch],
+            pad_id,
+            eos_ids,
+            args.max_new_tokens,
+            args.logits_steps,
+            constraint,
+        )
+        prefill_s += result["prefill_s"]
+        decode_s += result["decode_s"]
+        for row, index in enumerate(batch):
+            tokens[index] = result["tokens"][row]
+            logits_file[index] = result["logits"][row]
+    logits_file.flush()
+    del logits_file
+    wall_s = time.perf_counter() - wall_started
+
+    with output_path.open("w", encoding="utf-8") as handle:
+        for index, case in enumerate(cases):
+            entry = {
+                "id": case["id"],
+                "tokens": tokens[index],
+                "response": tokenizer.decode(tokens[index], skip_special_tokens=True),
+                "logits_index": index,
+            }
+            handle.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    prompt_tokens = sum(len(entry["prefix_ids"]) + len(entry["suffix_ids"]) for entry in encoded)
+    cache_stats = prefix_cache.stats()
+    cached_prefill_s = cache_stats["compute_s"] + prefill_s
+    generated_tokens = sum(len(case_tokens) for case_tokens in tokens)
+    report = {
+        "hf_model": args.hf_model,
+        "lora_dir": args.lora_dir,
+        "entries": len(cases),
+        "batches": len(batches),
+        "prompt_tokens": prompt_tokens,
+        "prefill_tokens_saved": cache_stats["prefill_tokens_saved"],
+        "prefix_cache": cache_stats,
+        "generated_tokens": generated_tokens,
+        "prefill_s": round(cached_prefill_s, 4),
+        "prefill_tokens_per_s": round(prompt_tokens / max(cached_prefill_s, 1e-9), 2),
+        "decode_tokens_per_s": round(generated_tokens / max(decode_s, 1e-9), 2),
+        "tokens_per_s": round(generated_tokens / max(wall_s, 1e-9), 2),
+        "wall_s": round(wall_s, 3),
+        "output": str(output_path),
+        "logits_output": str(logits_path),
+    }
+    if grammar_report:
+        report["tool_grammar"] = grammar_report
+    if args.measure_speedup:
+        uncached_prefill_s = sum(
+            prefill_uncached(
+                model,
+                [list(encoded[index]["prefix_ids"]) + encoded[index]["suffix_ids"] for index in batch],
+                pad_id,
+            )
+            for batch in batches
+        )
+        report["uncached_prefill_s"] = round(uncached_prefill_s, 4)
+        report["prefill_speedup"] = round(uncached_prefill_s / max(cached_prefill_s, 1e-9), 2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
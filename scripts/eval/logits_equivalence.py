@@ -0,0 +1,240 @@
+"""
+Shared logits comparison engine for the export-equivalence checks.
+
+Logits are read from ``.npy`` files (memory-mapped with ``np.load``),
+``.safetensors`` files (the tensor's byte range is memory-mapped straight from
+disk, including bf16) or, for older outputs, JSON lists. Arrays are viewed as
+``(rows, vocab)`` and compared a block of rows at a time, so a 128k-vocab x
+1k-prompt comparison only ever holds one block of each side in memory.
+
+Besides max/mean/RMSE of the absolute logit delta, the comparison reports the
+mean and max KL divergence of the candidate's softmax from the reference's,
+top-1 and top-k agreement, and the first row whose argmax differs.
+"""
+
+import json
+import struct
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_TOP_K = 5
+# Elements per side per block: 4M float64 values is 32 MB.
+DEFAULT_BLOCK_ELEMENTS = 1 << 22
+SAFETENSORS_DTYPES = {
+    "F64": np.float64,
+    "F32": np.float32,
+    "F16": np.float16,
+    "BF16": np.uint16,
+}
+
+
+class BFloat16Array:
+    """Read-only bf16 view over a ``uint16`` memmap, widened to float32 on access."""
+
+    def __init__(self, raw: np.ndarray):
+        self.raw = raw
+
+    @property
+    def shape(self) -> tuple:
+        return self.raw.shape
+
+    @property
+    def ndim(self) -> int:
+        return self.raw.ndim
+
+    def reshape(self, *shape) -> "BFloat16Array":
+        return BFloat16Array(self.raw.reshape(*shape))
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    def __getitem__(self, index) -> np.ndarray:
+        return (np.asarray(self.raw[index]).astype(np.uint32) << 16).view(np.float32)
+
+
+def _load_safetensors(path: Path, key: str | None):
+    with path.open("rb") as handle:
+        (header_size,) = struct.unpack("<Q", handle.read(8))
+        header = json.loads(handle.read(header_size))
+    header.pop("__metadata__", None)
+    if key is None:
+        key = next(iter(header)) if len(header) == 1 else "logits"
+    if key not in header:
+        raise KeyError(f"Tensor '{key}' not found in {path}")
+    info = header[key]
+    dtype = SAFETENSORS_DTYPES.get(info["dtype"])
+    if dtype is None:
+        raise ValueError(f"Unsupported logits dtype {info['dtype']} in {path}")
+    start, _end = info["data_offsets"]
+    array = np.memmap(path, dtype=dtype, mode="r", offset=8 + header_size + start, shape=tuple(info["shape"]))
+    return BFloat16Array(array) if info["dtype"] == "BF16" else array
+
+
+def load_logits(path: str | Path, key: str | None = None):
+    """Open logits without reading them: a memmap for binary files, an array for JSON.
+
+    ``key`` selects the safetensors tensor (default: the only tensor, else
+    ``logits``) or the JSON field (default ``logits``).
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Logits file not found: {path}")
+    if path.suffix == ".npy":
+        return np.load(path, mmap_mode="r")
+    if path.suffix == ".safetensors":
+        return _load_safetensors(path, key)
+    if path.suffix == ".json":
+        with path.open("r", encoding="utf-8") as handle:
+            data = json.load(handle)
+        if isinstance(data, dict):
+            data = data.get(key or "logits")
+        if not isinstance(data, list):
+            raise ValueError(f"Expected a logits list in {path} but found {type(data).__name__}")
+        return np.asarray(data, dtype=np.float64)
+    raise ValueError(f"Unsupported logits format: {path}")
+
+
+def as_rows(array):
+    """View logits shaped ``(..., vocab)`` as ``(rows, vocab)``; a flat vector is one row."""
+    if array.ndim == 1:
+        return array.reshape(1, -1)
+    return array.reshape(-1, array.shape[-1])
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+
+
+class LogitsComparison:
+    """Running comparison of reference and candidate logits, fed block by block."""
+
+    def __init__(self, top_k: int = DEFAULT_TOP_K):
+        self.top_k = top_k
+        self.rows = 0
+        self.elements = 0
+        self.max_delta = 0.0
+        self.abs_sum = 0.0
+        self.square_sum = 0.0
+        self.kl_sum = 0.0
+        self.kl_max = 0.0
+        self.top1_matches = 0
+        self.top_k_overlap = 0.0
+        self.first_divergent_position = None
+
+    def update(self, reference, candidate) -> np.ndarray:
+        """Add a ``(rows, vocab)`` block and return each row's max absolute delta."""
+        reference = np.asarray(reference, dtype=np.float64)
+        candidate = np.asarray(candidate, dtype=np.float64)
+        if reference.shape != candidate.shape:
+            raise ValueError(f"Logit shapes do not match: {reference.shape} vs {candidate.shape}")
+        rows, vocab = reference.shape
+        if not vocab:
+            self.rows += rows
+            return np.zeros(rows)
+
+        delta = np.abs(reference - candidate)
+        row_max = delta.max(axis=1)
+        self.max_delta = max(self.max_delta, float(row_max.max(initial=0.0)))
+        self.abs_sum += float(delta.sum())
+        self.square_sum += float(np.square(delta).sum())
+        self.elements += delta.size
+        del delta
+
+        reference_log = _log_softmax(reference)
+        candidate_log = _log_softmax(candidate)
+        kl = np.maximum((np.exp(reference_log) * (reference_log - candidate_log)).sum(axis=1), 0.0)
+        self.kl_sum += float(kl.sum())
+        self.kl_max = max(self.kl_max, float(kl.max(initial=0.0)))
+        del reference_log, candidate_log
+
+        mismatches = np.flatnonzero(reference.argmax(axis=1) != candidate.argmax(axis=1))
+        self.top1_matches += rows - mismatches.size
+        if self.first_divergent_position is None and mismatches.size:
+            self.first_divergent_position = self.rows + int(mismatches[0])
+
+        k = min(self.top_k, vocab)
+        reference_top = np.argpartition(-reference, k - 1, axis=1)[:, :k]
+        candidate_top = np.argpartition(-candidate, k - 1, axis=1)[:, :k]
+        overlap = (reference_top[:, :, None] == candidate_top[:, None, :]).any(axis=2).sum(axis=1)
+        self.top_k_overlap += float(overlap.sum()) / k
+
+        self.rows += rows
+        return row_max
+
+    def summary(self) -> dict:
+        if not self.elements:
+            return {
+                "max_delta": 0,
+                "mean_delta": 0,
+                "rmse": 0,
+                "rows": self.rows,
+                "first_divergent_position": None,
+            }
+        return {
+            "max_delta": self.max_delta,
+            "mean_delta": self.abs_sum / self.elements,
+            "rmse": float(np.sqrt(self.square_sum / self.elements)),
+            "kl_divergence": self.kl_sum / self.rows,
+            "kl_max": self.kl_max,
+            "top1_agreement": self.top1_matches / self.rows,
+            f"top{self.top_k}_agreement": self.top_k_overlap / self.rows,
+            "rows": self.rows,
+            "first_divergent_position": self.first_divergent_position,
+        }
+
+
+def _block_rows(vocab: int, block_elements: int) -> int:
+    return max(1, block_elements // max(vocab, 1))
+
+
+def compare_arrays(
+    reference,
+    candidate,
+    top_k: int = DEFAULT_TOP_K,
+    block_elements: int = DEFAULT_BLOCK_ELEMENTS,
+) -> dict:
+    """Compare two logits arrays of the same shape, streaming blocks of rows."""
+    if tuple(reference.shape) != tuple(candidate.shape):
+        raise ValueError(f"Logit shapes do not match: {tuple(reference.shape)} vs {tuple(candidate.shape)}")
+    reference_rows, candidate_rows = as_rows(reference), as_rows(candidate)
+    comparison = LogitsComparison(top_k)
+    step = _block_rows(reference_rows.shape[1], block_elements)
+    for start in range(0, reference_rows.shape[0], step):
+        comparison.update(reference_rows[start : start + step], candidate_rows[start : start + step])
+    return comparison.summary()
+
+
+def compare_entries(
+    reference,
+    candidate,
+    pairs: list[tuple[int, int]],
+    comparison: LogitsComparison,
+    block_elements: int = DEFAULT_BLOCK_ELEMENTS,
+) -> list[float]:
+    """Max absolute delta per ``(reference_index, candidate_index)`` pair.
+
+    Each index selects one entry along the leading axis, whose remaining axes
+    are ``([positions,] vocab)``. Only the selected entries are read, a block
+    at a time, and every block also feeds ``comparison``.
+    """
+    entry_shape = tuple(reference.shape[1:])
+    if entry_shape != tuple(candidate.shape[1:]):
+        raise ValueError(
+            f"Logit shapes do not match: {tuple(reference.shape[1:])} vs {tuple(candidate.shape[1:])}"
+        )
+    entry_size = int(np.prod(entry_shape))
+    vocab = entry_shape[-1] if entry_shape else 1
+    step = _block_rows(entry_size, block_elements)
+    deltas = []
+    for start in range(0, len(pairs), step):
+        block = pairs[start : start + step]
+        reference_index = np.array([pair[0] for pair in block])
+        candidate_index = np.array([pair[1] for pair in block])
+        row_max = comparison.update(
+            np.asarray(reference[reference_index]).reshape(-1, vocab),
+            np.asarray(candidate[candidate_index]).reshape(-1, vocab),
+        )
+        deltas.extend(row_max.reshape(len(block), -1).max(axis=1, initial=0.0).tolist())
+    return deltas
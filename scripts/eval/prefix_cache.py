@@ -0,0 +1,100 @@
+"""
+Shared-prefix KV cache for the offline eval/generation path.
+
+Cases rendered with ``prompts/v1/runtime_prompt.json`` share everything up to
+the context section: the intro, the tool list and the instructions.
+``PrefixKVCache`` computes the KV state of each distinct prefix once and keeps
+it in an LRU bounded by a byte budget. It hands out forks: per-batch
+``DynamicCache`` objects whose rows are broadcast views of the stored state.
+Decoding only ever concatenates onto those views, so the stored state is
+never written and any number of forks can use it at once.
+"""
+
+import time
+from collections import OrderedDict
+
+import torch
+from transformers.cache_utils import DynamicCache
+
+
+def state_bytes(state: tuple) -> int:
+    return sum(tensor.numel() * tensor.element_size() for layer in state for tensor in layer)
+
+
+class PrefixKVCache:
+    """LRU of prefix KV states keyed by token ids, bounded by ``max_bytes``.
+
+    A prefix larger than the whole budget is computed for the fork that asked
+    for it but not stored. With a budget of 0 every fork recomputes its prefix
+    once per batch.
+    """
+
+    def __init__(self, model, max_bytes: int):
+        self.model = model
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.tokens_requested = 0
+        self.tokens_computed = 0
+        self.compute_s = 0.0
+
+    @torch.inference_mode()
+    def _prefill(self, prefix_ids: tuple) -> tuple:
+        cache = self.model(
+            input_ids=torch.tensor([prefix_ids]),
+            past_key_values=DynamicCache(),
+            use_cache=True,
+        ).past_key_values
+        return cache.to_legacy_cache()
+
+    def get(self, prefix_ids: tuple) -> tuple:
+        """Legacy per-layer ``(key, value)`` state of ``prefix_ids`` for one row."""
+        state = self._entries.get(prefix_ids)
+        if state is not None:
+            self._entries.move_to_end(prefix_ids)
+            self.hits += 1
+            return state
+
+        self.misses += 1
+        started = time.perf_counter()
+        state = self._prefill(prefix_ids)
+        self.compute_s += time.perf_counter() - started
+        self.tokens_computed += len(prefix_ids)
+        size = state_bytes(state)
+        if size <= self.max_bytes:
+            self._entries[prefix_ids] = state
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _evicted_ids, evicted = self._entries.popitem(last=False)
+                self.bytes -= state_bytes(evicted)
+                self.evictions += 1
+        return state
+
+    def fork(self, prefix_ids: tuple, batch_size: int) -> DynamicCache:
+        """A fresh cache for ``batch_size`` rows that all start with ``prefix_ids``."""
+        if not prefix_ids:
+            return DynamicCache()
+        self.tokens_requested += len(prefix_ids) * batch_size
+        state = self.get(prefix_ids)
+        return DynamicCache.from_legacy_cache(
+            tuple(
+                (key.expand(batch_size, -1, -1, -1), value.expand(batch_size, -1, -1, -1))
+                for key, value in state
+            )
+        )
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "prefill_tokens_computed": self.tokens_computed,
+            "prefill_tokens_saved": self.tokens_requested - self.tokens_computed,
+            "compute_s": round(self.compute_s, 4),
+        }
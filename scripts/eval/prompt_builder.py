@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Python renderer for the runtime_prompt_v1 and user_prompt_builder_v1 templates.
+
+Output is byte-identical to the JS builders (src/core/prompt/PromptBuilder.js +
+promptTemplate.js, and src/utils/buildPrompt.ts), so prompt hashes can be computed
+and checked without Node. The JS semantics that matter are reproduced explicitly:
+
+- tools are sorted with String.prototype.localeCompare (ICU root collation);
+- parameters and non-string context content go through JSON.stringify
+  (integer-like keys first, JS number formatting, escaped lone surrogates);
+- placeholders are filled with String.prototype.replaceAll, whose replacement
+  string expands $$, $&, $` and $'.
+
+__tests__/promptBuilderParity.test.js renders the same fixture cases through both
+builders and compares them byte for byte.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import math
+import re
+import unicodedata
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+REGISTRY_PATH = REPO_ROOT / "prompts" / "registry.json"
+RUNTIME_PROMPT_ID = "runtime_prompt_v1"
+USER_PROMPT_BUILDER_ID = "user_prompt_builder_v1"
+
+_TEMPLATES: Dict[str, Dict[str, Any]] = {}
+
+
+def load_template(prompt_id: str, registry_path: Path = REGISTRY_PATH) -> Dict[str, Any]:
+    key = f"{registry_path}:{prompt_id}"
+    if key not in _TEMPLATES:
+        registry = json.loads(registry_path.read_text(encoding="utf-8"))
+        entry = registry["prompts"].get(prompt_id)
+        if not entry:
+            raise ValueError(f"Unknown prompt registry id: {prompt_id}")
+        template_path = registry_path.parent.parent / entry["template_file"]
+        _TEMPLATES[key] = json.loads(template_path.read_text(encoding="utf-8"))
+    return _TEMPLATES[key]
+
+
+# ---------------------------
+# JS built-ins
+# ---------------------------
+
+_JS_ESCAPES = {'"': '\\"', "\\": "\\\\", "\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_JS_ESCAPE_RE = re.compile(r'["\\\x00-\x1f\ud800-\udfff]')
+_ARRAY_INDEX_RE = re.compile(r"0|[1-9][0-9]*")
+_LONE_SURROGATE_RE = re.compile(r"[\ud800-\udfff]")
+
+
+def _js_string(text: str) -> str:
+    def escape(match: "re.Match[str]") -> str:
+        char = match.group(0)
+        return _JS_ESCAPES.get(char) or f"\\u{ord(char):04x}"
+
+    return '"' + _JS_ESCAPE_RE.sub(escape, text) + '"'
+
+
+def js_number(value: float) -> str:
+    """Number.prototype.toString for a finite double (ECMA-262 Number::toString)."""
+    if value == 0:
+        return "0"
+    if value < 0:
+        return "-" + js_number(-value)
+    # repr() gives the shortest round-tripping digits, as JS does.
+    _sign, digit_tuple, exponent = Decimal(repr(float(value))).normalize().as_tuple()
+    digits = "".join(map(str, digit_tuple))
+    k = len(digits)
+    n = k + exponent
+    if k <= n <= 21:
+        return digits + "0" * (n - k)
+    if 0 < n <= 21:
+        return digits[:n] + "." + digits[n:]
+    if -6 < n <= 0:
+        return "0." + "0" * -n + digits
+    e = n - 1
+    mantissa = digits if k == 1 else digits[0] + "." + digits[1:]
+    return f"{mantissa}e{'+' if e >= 0 else '-'}{abs(e)}"
+
+
+def _js_key_order(obj: Dict[str, Any]) -> List[str]:
+    # Integer-like keys (array indices) enumerate first, ascending; then insertion order.
+    keys = [str(key) for key in obj]
+    index_keys = sorted(
+        (key for key in keys if _ARRAY_INDEX_RE.fullmatch(key) and int(key) < 2**32 - 1),
+        key=int,
+    )
+    index_set = set(index_keys)
+    return index_keys + [key for key in keys if key not in index_set]
+
+
+def js_json_stringify(value: Any) -> str:
+    """JSON.stringify(value) for JSON-compatible Python values."""
+    if value is None or value is True or value is False:
+        return {None: "null", True: "true", False: "false"}[value]
+    if isinstance(value, str):
+        return _js_string(value)
+    if isinstance(value, int):
+        # JSON.parse yields doubles; integers past 2**53 round like in JS.
+        return str(value) if abs(value) < 2**53 else js_number(float(value))
+    if isinstance(value, float):
+        return js_number(value) if math.isfinite(value) else "null"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(js_json_stringify(item) for item in value) + "]"
+    if isinstance(value, dict):
+        values = {str(key): item for key, item in value.items()}
+        return "{" + ",".join(f"{_js_string(key)}:{js_json_stringify(values[key])}" for key in _js_key_order(values)) + "}"
+    raise TypeError(f"Cannot stringify {type(value).__name__}")
+
+
+def js_replace_all(text: str, search: str, replacement: str) -> str:
+    """String.prototype.replaceAll with a string pattern, including $-substitutions."""
+    if search == "":
+        raise ValueError("empty search strings are not supported")
+    parts: List[str] = []
+    last = 0
+    position = text.find(search)
+    while position != -1:
+        parts.append(text[last:position])
+        i = 0
+        while i < len(replacement):
+            char = replacement[i]
+            following = replacement[i + 1] if i + 1 < len(replacement) else ""
+            if char == "$" and following in ("$", "&", "`", "'"):
+                parts.append(
+                    {
+                        "$": "$",
+                        "&": search,
+                        "`": text[:position],
+                        "'": text[position + len(search) :],
+                    }[following]
+                )
+                i += 2
+                continue
+            parts.append(char)
+            i += 1
+        last = position + len(search)
+        position = text.find(search, last)
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+# ICU root collation order of printable ASCII (primary level, letters case-folded).
+_ASCII_COLLATION = " _-,;:!?.'\"()[]{}@*/\\&#%`^+<=>|~$0123456789abcdefghijklmnopqrstuvwxyz"
+_ASCII_PRIMARY = {char: index for index, char in enumerate(_ASCII_COLLATION)}
+# ICU secondary (accent) order of the common Latin combining marks.
+_MARK_COLLATION = "\u0301\u0300\u0306\u0302\u030c\u030a\u0308\u030b\u0303\u0307\u0338\u0327\u0328\u0304\u0335\u031b\u0323\u0331"
+_MARK_SECONDARY = {char: index + 1 for index, char in enumerate(_MARK_COLLATION)}
+
+
+def locale_compare_key(text: str) -> Tuple[List[int], List[Tuple[int, ...]], List[int]]:
+    """
+    Sort key matching String.prototype.localeCompare for ASCII and accented Latin text:
+    primary (base characters, case-insensitive) < secondary (accents) < tertiary
+    (lowercase before uppercase). Other characters sort after ASCII letters by code point.
+    """
+    primary: List[int] = []
+    secondary: List[Tuple[int, ...]] = []
+    tertiary: List[int] = []
+    for char in unicodedata.normalize("NFD", text):
+        if unicodedata.combining(char):
+            if secondary:
+                secondary[-1] += (_MARK_SECONDARY.get(char, len(_MARK_COLLATION) + ord(char)),)
+            continue
+        if ord(char) < 0x20 or ord(char) == 0x7F:
+            continue  # completely ignorable controls
+        lower = char.lower() if len(char.lower()) == 1 else char
+        primary.append(_ASCII_PRIMARY.get(lower, len(_ASCII_COLLATION) + ord(lower)))
+        secondary.append(())
+        tertiary.append(1 if char != lower else 0)
+    return primary, secondary, tertiary
+
+
+# ---------------------------
+# runtime_prompt_v1 (PromptBuilder.build)
+# ---------------------------
+
+def _truthy(value: Any) -> bool:
+    return bool(value) and not (isinstance(value, float) and math.isnan(value))
+
+
+def format_tool_description(tool: Dict[str, Any], template: Optional[Dict[str, Any]] = None) -> str:
+    template = template or load_template(RUNTIME_PROMPT_ID)
+    parameters = js_json_stringify(tool.get("parameters") or {})
+    text = js_replace_all(template["tool_format"], "{name}", str(tool["name"]))
+    text = js_replace_all(text, "{description}", str(tool["description"]))
+    return js_replace_all(text, "{parameters}", parameters)
+
+
+def format_context_entry(entry: Any) -> str:
+    if entry is None:
+        return ""
+    if isinstance(entry, str):
+        return entry
+    if not isinstance(entry, dict):
+        return ""  # entry.content is undefined -> filtered out
+    role = entry.get("role")
+    role_label = f"{str(role)[0].upper()}{str(role)[1:]}:" if _truthy(role) else ""
+    content = entry.get("content")
+    if isinstance(content, str):
+        text = content
+    elif "content" in entry:
+        text = js_json_stringify(content)
+    else:
+        text = "undefined" if role_label else ""  # JSON.stringify(undefined)
+    return f"{role_label} {text}" if role_label else text
+
+
+def runtime_prompt_parts(
+    user_prompt: str,
+    tools: List[Dict[str, Any]],
+    context: Optional[List[Any]] = None,
+    template: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, str]:
+    """
+    The runtime prompt split into (shared prefix, per-case suffix).
+
+    The prefix covers the intro, tool list, instructions and context title, which
+    only depend on the tools; prefix + suffix is exactly build_runtime_prompt().
+    """
+    template = template or load_template(RUNTIME_PROMPT_ID)
+    selected = [
+        {"name": tool["name"], "description": tool["description"], "parameters": tool.get("parameters") or {}}
+        for tool in tools or []
+        if isinstance(tool, dict) and _truthy(tool.get("name")) and _truthy(tool.get("description"))
+    ]
+    selected.sort(key=lambda tool: locale_compare_key(str(tool["name"])))
+    tools_desc = "\n".join(format_tool_description(tool, template) for tool in selected)
+    context_lines = "\n".join(line for line in map(format_context_entry, context or []) if line)
+
+    shared = [
+        template["system_intro"],
+        tools_desc,
+        template["instructions_title"],
+        template["instructions"],
+        template["context_title"],
+    ]
+    per_case = [
+        context_lines,
+        f"{template['user_prefix']} {user_prompt}",
+        template["assistant_prefix"],
+    ]
+    prefix = "\n".join(section for section in shared if section != "")
+    suffix = "\n".join(section for section in per_case if section != "")
+    return (prefix + "\n" if prefix else ""), suffix
+
+
+def build_runtime_prompt(
+    user_prompt: str,
+    tools: List[Dict[str, Any]],
+    context: Optional[List[Any]] = None,
+    template: Optional[Dict[str, Any]] = None,
+) -> str:
+    prefix, suffix = runtime_prompt_parts(user_prompt, tools, context, template)
+    return prefix + suffix
+
+
+# ---------------------------
+# user_prompt_builder_v1 (src/utils/buildPrompt.ts)
+# ---------------------------
+
+def build_user_prompt(
+    query: str,
+    text_emotion: Optional[str] = None,
+    audio_emotion: Optional[str] = None,
+    context: Optional[str] = None,
+    template: Optional[Dict[str, Any]] = None,
+) -> str:
+    template = template or load_template(USER_PROMPT_BUILDER_ID)
+    emotion = audio_emotion if audio_emotion is not None else text_emotion
+    prompt = query
+    if emotion:
+        prompt = js_replace_all(template["emotion_prefix"], "{emotion}", emotion) + prompt
+    if context:
+        prompt = js_replace_all(template["context_prefix"], "{context}", context) + prompt
+    return prompt
+
+
+def prompt_hash(prompt: str) -> str:
+    # Node hashes UTF-16 strings as UTF-8, replacing lone surrogates with U+FFFD.
+    return hashlib.sha256(_LONE_SURROGATE_RE.sub("�", prompt).encode("utf-8")).hexdigest()
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def render_cases(cases: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[Dict[str, Any]]]:
+    """Render {runtime_prompt_v1: [...], user_prompt_builder_v1: [...]} fixture cases."""
+    rendered: Dict[str, List[Dict[str, Any]]] = {RUNTIME_PROMPT_ID: [], USER_PROMPT_BUILDER_ID: []}
+    for case in cases.get(RUNTIME_PROMPT_ID, []):
+        prompt = build_runtime_prompt(case["user_prompt"], case.get("tools") or [], case.get("context") or [])
+        rendered[RUNTIME_PROMPT_ID].append({"id": case["id"], "prompt": prompt, "prompt_hash": prompt_hash(prompt)})
+    for case in cases.get(USER_PROMPT_BUILDER_ID, []):
+        prompt = build_user_prompt(
+            case["query"],
+            case.get("text_emotion"),
+            case.get("audio_emotion"),
+            case.get("context"),
+        )
+        rendered[USER_PROMPT_BUILDER_ID].append({"id": case["id"], "prompt": prompt, "prompt_hash": prompt_hash(prompt)})
+    return rendered
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Render runtime/user prompts exactly like the JS builders.")
+    p.add_argument("--cases", required=True, help="JSON with runtime_prompt_v1 and/or user_prompt_builder_v1 case lists.")
+    args = p.parse_args(argv)
+    cases = json.loads(Path(args.cases).read_text(encoding="utf-8"))
+    print(json.dumps(render_cases(cases), indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,16 +4,21 @@ import sys
 from collections import defaultdict
 from pathlib import Path
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import open_text  # noqa: E402
+
 
 def load_pairs(path: Path) -> list[dict]:
-    with path.open("r", encoding="utf-8") as handle:
+    with open_text(path) as handle:
         return [json.loads(line) for line in handle if line.strip()]
 
 
 def load_retrieval_events(path: Path) -> dict[str, list[dict]]:
     events: dict[str, list[dict]] = defaultdict(list)
     duplicates = 0
-    with path.open("r", encoding="utf-8") as handle:
+    with open_text(path) as handle:
         for line in handle:
             if not line.strip():
                 continue
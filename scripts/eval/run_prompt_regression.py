@@ -4,12 +4,24 @@ from __future__ import annotations
 import argparse
 import hashlib
 import json
+import os
+import queue
 import re
 import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.prompt_builder import build_runtime_prompt, prompt_hash  # noqa: E402
 
 
 # ---------------------------
@@ -41,46 +53,132 @@ def _is_plain_object(x: Any) -> bool:
     return isinstance(x, dict)
 
 
-def _normalise_golden(parsed: Any) -> Dict[str, Any]:
-    # legacy: [ ...cases ]
-    if isinstance(parsed, list):
-        return {"cases": parsed}
+# ---------------------------
+# Streaming golden loader
+# ---------------------------
+
+_LAYOUT_ERROR = "prompt JSON must be either an array OR { cases: [...] }"
+_JSON_WS = re.compile(r"[ \t\n\r]*")
+
+
+@dataclass(frozen=True)
+class CaseLocation:
+    offset: int  # UTF-8 byte offset in the prompts file
+    line: int  # 1-based
+    column: int  # 1-based, in characters
+
 
-    # current: { cases: [ ...cases ], ...meta }
-    if isinstance(parsed, dict) and isinstance(parsed.get("cases"), list):
-        return parsed
+class _PositionTracker:
+    """
+    Maps increasing character positions of a document to byte offsets and line/column.
+    Positions must only move forward, so locating every case costs one pass in total.
+    """
 
-    raise ValueError("prompt JSON must be either an array OR { cases: [...] }")
+    def __init__(self, raw: str):
+        self.raw = raw
+        self.ascii = raw.isascii()
+        self.pos = 0
+        self.offset = 0
+        self.line = 1
+        self.line_start = 0
+
+    def advance(self, pos: int) -> CaseLocation:
+        if pos > self.pos:
+            newlines = self.raw.count("\n", self.pos, pos)
+            if newlines:
+                self.line += newlines
+                self.line_start = self.raw.rfind("\n", self.pos, pos) + 1
+            self.offset += pos - self.pos if self.ascii else len(self.raw[self.pos : pos].encode("utf-8"))
+            self.pos = pos
+        return CaseLocation(offset=self.offset, line=self.line, column=pos - self.line_start + 1)
+
+
+def _skip_ws(raw: str, pos: int) -> int:
+    return _JSON_WS.match(raw, pos).end()
+
+
+def _expect(raw: str, pos: int, token: str) -> int:
+    pos = _skip_ws(raw, pos)
+    if not raw.startswith(token, pos):
+        raise json.JSONDecodeError(f"Expecting '{token}'", raw, pos)
+    return pos + 1
+
+
+def _case_location(raw: str, start: int, end: int, entry: Any, tracker: _PositionTracker) -> CaseLocation:
+    # SARIF regions point at the stable_id value when it can be found inside the case.
+    pos = start
+    sid = entry.get("stable_id") if isinstance(entry, dict) else None
+    if isinstance(sid, str) and sid:
+        key = raw.find('"stable_id"', start, end)
+        if key != -1:
+            value = raw.find(f'"{sid}"', key + len('"stable_id"'), end)
+            if value != -1:
+                pos = value
+    return tracker.advance(pos)
+
+
+def _iter_array(raw: str, pos: int, decoder: json.JSONDecoder, tracker: _PositionTracker):
+    """Yield (location, element) for the array starting at raw[pos]; returns the position after it."""
+    pos = _skip_ws(raw, pos + 1)
+    if raw.startswith("]", pos):
+        return pos + 1
+    while True:
+        entry, end = decoder.raw_decode(raw, pos)
+        yield _case_location(raw, pos, end, entry, tracker), entry
+        pos = _skip_ws(raw, end)
+        if raw.startswith(",", pos):
+            pos = _skip_ws(raw, pos + 1)
+            continue
+        return _expect(raw, pos, "]")
 
 
-def _best_effort_case_location(raw_json: str, stable_id: str) -> Tuple[int, int]:
+def iter_golden_cases(raw: str) -> Iterator[Tuple[CaseLocation, Any]]:
     """
-    Best-effort line/column finder for SARIF regions.
-    We search for the stable_id string occurrence in the raw JSON text.
+    Stream (location, case) pairs from a prompt JSON document in one pass.
+
+    Accepts the legacy array layout and the current { cases: [...], ...meta } layout.
+    Cases are decoded one at a time, so only the current case is materialised.
+    Malformed JSON raises ValueError when the parser reaches it, after the cases
+    before it have been yielded.
     """
-    if not stable_id or stable_id in ("(unknown)", "(file)"):
-        return (1, 1)
-
-    needle = f"\"stable_id\""
-    idx = raw_json.find(needle)
-    # Prefer finding around the specific stable_id value
-    stable_val = f"\"{stable_id}\""
-    idx2 = raw_json.find(stable_val)
-    if idx2 != -1:
-        idx = idx2
-
-    if idx == -1:
-        return (1, 1)
-
-    # Compute 1-based line/column
-    before = raw_json[:idx]
-    line = before.count("\n") + 1
-    last_nl = before.rfind("\n")
-    if last_nl == -1:
-        col = idx + 1
+    decoder = json.JSONDecoder()
+    tracker = _PositionTracker(raw)
+    pos = _skip_ws(raw, 0)
+
+    if raw.startswith("[", pos):
+        pos = yield from _iter_array(raw, pos, decoder, tracker)
+    elif raw.startswith("{", pos):
+        found_cases = False
+        pos = _skip_ws(raw, pos + 1)
+        if raw.startswith("}", pos):
+            pos += 1
+        else:
+            while True:
+                if not raw.startswith('"', pos):
+                    raise json.JSONDecodeError("Expecting property name enclosed in double quotes", raw, pos)
+                key, pos = decoder.raw_decode(raw, pos)
+                pos = _skip_ws(raw, _expect(raw, pos, ":"))
+                if key == "cases":
+                    if found_cases or not raw.startswith("[", pos):
+                        raise ValueError(_LAYOUT_ERROR)
+                    pos = yield from _iter_array(raw, pos, decoder, tracker)
+                    found_cases = True
+                else:
+                    _meta, pos = decoder.raw_decode(raw, pos)
+                pos = _skip_ws(raw, pos)
+                if raw.startswith(",", pos):
+                    pos = _skip_ws(raw, pos + 1)
+                    continue
+                pos = _expect(raw, pos, "}")
+                break
+        if not found_cases:
+            raise ValueError(_LAYOUT_ERROR)
     else:
-        col = idx - last_nl
-    return (line, max(1, col))
+        raise ValueError(_LAYOUT_ERROR)
+
+    pos = _skip_ws(raw, pos)
+    if pos != len(raw):
+        raise json.JSONDecodeError("Extra data", raw, pos)
 
 
 # ---------------------------
@@ -95,6 +193,19 @@ class Finding:
     message: str
     expected_hash: Optional[str] = None
     actual_hash: Optional[str] = None
+    location: Optional[CaseLocation] = None
+
+
+@dataclass
+class ModelJob:
+    prompts_path: str
+    stable_id: str
+    prompt: str
+    file_entry: Dict[str, Any]
+    result: Dict[str, Any]
+    finding_slot: int
+    cache_key: Optional[str] = None
+    location: Optional[CaseLocation] = None
 
 
 # ---------------------------
@@ -123,7 +234,7 @@ def _sarif_result(rule_id: str, level: str, message: str, props: Dict[str, Any],
     }
 
 
-def build_sarif(findings: List[Finding], rule_meta: Dict[str, Any]) -> Dict[str, Any]:
+def build_sarif(findings: List[Finding]) -> Dict[str, Any]:
     tool = {
         "driver": {
             "name": "offLLM prompt regression",
@@ -158,8 +269,7 @@ def build_sarif(findings: List[Finding], rule_meta: Dict[str, Any]) -> Dict[str,
         }
 
         # Always include at least one location (GitHub Code Scanning requires it).
-        line = rule_meta.get((f.prompts_path, f.stable_id), (1, 1))[0]
-        col = rule_meta.get((f.prompts_path, f.stable_id), (1, 1))[1]
+        line, col = (f.location.line, f.location.column) if f.location else (1, 1)
         locs = [_sarif_location(f.prompts_path, line, col)]
 
         if f.kind == "schema":
@@ -264,18 +374,376 @@ def _run_model_cmd(model_cmd: str, prompt: str, timeout_s: int = 120) -> Tuple[i
     This is intentionally generic. Your OFFLLM_EVAL_MODEL_CMD should accept input on stdin
     and emit output on stdout.
     """
-    p = subprocess.run(
-        model_cmd,
-        input=prompt.encode("utf-8"),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        shell=True,
-        timeout=timeout_s,
-        check=False,
-    )
+    try:
+        p = subprocess.run(
+            model_cmd,
+            input=prompt.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=True,
+            timeout=timeout_s,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        return 124, "", f"timed out after {timeout_s}s"
     return p.returncode, p.stdout.decode("utf-8", errors="replace"), p.stderr.decode("utf-8", errors="replace")
 
 
+class ModelWorkerError(RuntimeError):
+    def __init__(self, message: str, rc: int = 1) -> None:
+        super().__init__(message)
+        self.rc = rc
+
+
+def _pump_lines(stream: Any, sink: "queue.Queue[Optional[str]]") -> None:
+    for line in stream:
+        sink.put(line)
+    sink.put(None)
+
+
+def _pump_tail(stream: Any, tail: deque) -> None:
+    for line in stream:
+        tail.append(line)
+
+
+class ModelServer:
+    """
+    One long-lived model worker speaking JSON lines on stdin/stdout.
+
+    The worker is started lazily with the --model-server shell command and must print
+    {"ready": true} once the model is loaded. Each request is {"id": n, "prompt": "..."};
+    the worker answers on one line with {"id": n, "output": "..."} or {"id": n, "error": "..."}.
+    A worker that times out, crashes or breaks the protocol is killed and restarted
+    before its next case, so one bad case cannot poison the rest.
+    """
+
+    def __init__(self, cmd: str, startup_timeout_s: int) -> None:
+        self.cmd = cmd
+        self.startup_timeout_s = startup_timeout_s
+        self.proc: Optional[subprocess.Popen] = None
+        self.lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self.stderr_tail: deque = deque(maxlen=20)
+        self.next_id = 0
+        self.starts = 0
+
+    def _read(self, timeout_s: float, what: str) -> Dict[str, Any]:
+        try:
+            line = self.lines.get(timeout=timeout_s)
+        except queue.Empty:
+            raise ModelWorkerError(f"{what} timed out after {timeout_s}s", rc=124) from None
+        if line is None:
+            rc = self.proc.wait() if self.proc else 1
+            tail = "".join(self.stderr_tail).strip()[-500:]
+            raise ModelWorkerError(f"worker exited during {what} (rc={rc}). stderr: {tail}", rc=rc or 1)
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            raise ModelWorkerError(f"worker wrote a non-JSON line during {what}: {line.strip()[:200]}") from None
+        if not isinstance(message, dict):
+            raise ModelWorkerError(f"worker wrote a non-object line during {what}")
+        return message
+
+    def _start(self) -> None:
+        self.proc = subprocess.Popen(
+            self.cmd,
+            shell=True,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            bufsize=1,
+        )
+        self.starts += 1
+        self.lines = queue.Queue()
+        self.stderr_tail = deque(maxlen=20)
+        threading.Thread(target=_pump_lines, args=(self.proc.stdout, self.lines), daemon=True).start()
+        threading.Thread(target=_pump_tail, args=(self.proc.stderr, self.stderr_tail), daemon=True).start()
+        if self._read(self.startup_timeout_s, "startup").get("ready") is not True:
+            raise ModelWorkerError('worker did not announce {"ready": true}')
+
+    def request(self, prompt: str, timeout_s: int) -> Tuple[int, str, str]:
+        try:
+            if self.proc is None:
+                self._start()
+            self.next_id += 1
+            try:
+                self.proc.stdin.write(json.dumps({"id": self.next_id, "prompt": prompt}) + "\n")
+                self.proc.stdin.flush()
+            except (BrokenPipeError, OSError):
+                raise ModelWorkerError("worker closed its stdin") from None
+            response = self._read(timeout_s, "request")
+            if response.get("id") != self.next_id:
+                raise ModelWorkerError(f"response id {response.get('id')!r} does not match request {self.next_id}")
+        except ModelWorkerError as e:
+            self.close(kill=True)
+            return e.rc, "", str(e)
+        if "error" in response:
+            return 1, "", str(response["error"])
+        return 0, str(response.get("output", "")), ""
+
+    def close(self, kill: bool = False) -> None:
+        if self.proc is None:
+            return
+        if kill:
+            self.proc.kill()
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+def run_model_jobs(jobs: List[ModelJob], args: argparse.Namespace) -> Tuple[List[Tuple[int, str, str]], Dict[str, Any]]:
+    """
+    Fan jobs out over --concurrency workers (persistent servers or per-case commands).
+    Results come back in job order whatever order the cases finish in.
+    """
+    concurrency = max(1, min(int(args.concurrency), len(jobs)))
+    servers: List[ModelServer] = []
+    if (args.model_server or "").strip():
+        idle: "queue.Queue[ModelServer]" = queue.Queue()
+        servers = [ModelServer(args.model_server, int(args.model_startup_timeout)) for _ in range(concurrency)]
+        for server in servers:
+            idle.put(server)
+
+        def run(job: ModelJob) -> Tuple[int, str, str]:
+            server = idle.get()
+            try:
+                return server.request(job.prompt, int(args.model_timeout))
+            finally:
+                idle.put(server)
+
+    else:
+
+        def run(job: ModelJob) -> Tuple[int, str, str]:
+            return _run_model_cmd(args.model_cmd, job.prompt, timeout_s=int(args.model_timeout))
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(run, jobs))
+    finally:
+        for server in servers:
+            server.close()
+    stats = {
+        "mode": "server" if servers else "cmd",
+        "concurrency": concurrency,
+        "cases": len(jobs),
+        "worker_starts": sum(server.starts for server in servers) if servers else len(jobs),
+        "wall_s": round(time.perf_counter() - started, 3),
+    }
+    return outcomes, stats
+
+
+# ---------------------------
+# Result cache (full mode)
+# ---------------------------
+
+DEFAULT_CACHE_DIR = Path("build") / "prompt_regression_cache"
+
+
+def _model_fingerprint(args: argparse.Namespace) -> str:
+    """
+    Identity of the model under test: the export manifest's model_hash when given,
+    otherwise the model command itself.
+    """
+    if args.model_manifest:
+        model_hash = _read_json(Path(args.model_manifest)).get("model_hash")
+        if not isinstance(model_hash, str) or not model_hash:
+            raise ValueError(f"model_hash missing from export manifest {args.model_manifest}")
+        return _sha256_hex(json.dumps({"model_hash": model_hash}))
+    return _sha256_hex(json.dumps({"model_cmd": (args.model_server or args.model_cmd).strip()}))
+
+
+def _result_cache_key(entry: Dict[str, Any], fingerprint: str, timeout_s: int) -> str:
+    payload = {
+        "case": _sha256_hex(json.dumps(entry, sort_keys=True, ensure_ascii=False)),
+        "expected_prompt_hash": entry.get("expected_prompt_hash"),
+        "model": fingerprint,
+        "timeout_s": timeout_s,
+    }
+    return _sha256_hex(json.dumps(payload, sort_keys=True))
+
+
+class ResultCache:
+    """
+    Content-addressed store of successful model runs: one small JSON file per key
+    holding model_rc and model_out_sha256. Failures are never stored, so flaky
+    timeouts and crashes are retried on the next run.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.json"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            value = _read_json(self._path(key))
+        except (OSError, ValueError):
+            value = None
+        if not (
+            isinstance(value, dict)
+            and value.get("model_rc") == 0
+            and isinstance(value.get("model_out_sha256"), str)
+        ):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"model_rc": 0, "model_out_sha256": value["model_out_sha256"]}
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(value, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+# ---------------------------
+# Shard merge
+# ---------------------------
+
+_FILE_COUNT_KEYS = ("cases_total", "cases_checked", "schema_errors", "missing_baselines", "mismatches")
+
+
+def merge_reports(reports: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine the JSON reports of --shard 1/N .. N/N (in any order) into the report a
+    single unsharded run writes. Shards deal cases round-robin by their ordinal across
+    all files, so per-file results are interleaved back in that order.
+    """
+    shards = sorted(reports, key=lambda r: (r.get("shard") or {}).get("index", 1))
+    count = len(shards)
+    seen = [(r.get("shard") or {"index": 1, "count": 1}) for r in shards]
+    if [s["index"] for s in seen] != list(range(1, count + 1)) or any(s["count"] != count for s in seen):
+        got = ", ".join(f"{s['index']}/{s['count']}" for s in seen)
+        raise ValueError(f"expected shard reports 1/{count} .. {count}/{count}, got {got}")
+    first = shards[0]
+    for other in shards[1:]:
+        if other["prompts"] != first["prompts"] or other["mode"] != first["mode"]:
+            raise ValueError("shard reports come from different runs (prompts or mode differ)")
+
+    merged: Dict[str, Any] = {
+        "tool": first["tool"],
+        "ts": _utc_now_iso(),
+        "prompts": first["prompts"],
+        "mode": first["mode"],
+        "failed": any(r["failed"] for r in shards),
+        "files": [],
+        "totals": {},
+    }
+
+    ordinal = 0
+    for entries in zip(*(r["files"] for r in shards)):
+        file_entry: Dict[str, Any] = {"path": entries[0]["path"], "results": []}
+        for key in _FILE_COUNT_KEYS:
+            file_entry[key] = sum(e[key] for e in entries)
+        case_results = [iter(e["results"][: e["cases_total"]]) for e in entries]
+        for _ in range(file_entry["cases_total"]):
+            file_entry["results"].append(next(case_results[ordinal % count]))
+            ordinal += 1
+        # Every shard parses the whole file, so a load error is reported by each of them.
+        load_errors = [e["results"][e["cases_total"] :] for e in entries if len(e["results"]) > e["cases_total"]]
+        if load_errors:
+            file_entry["results"].extend(load_errors[0])
+            file_entry["schema_errors"] -= len(load_errors) - 1
+        merged["files"].append(file_entry)
+
+    for key in first["totals"]:
+        if key in _FILE_COUNT_KEYS:
+            merged["totals"][key] = sum(f[key] for f in merged["files"])
+        else:
+            merged["totals"][key] = sum(r["totals"].get(key, 0) for r in shards)
+
+    runs = [r["model_run"] for r in shards if "model_run" in r]
+    if runs:
+        merged["model_run"] = {
+            "mode": runs[0]["mode"],
+            "concurrency": runs[0]["concurrency"],
+            "cases": sum(run["cases"] for run in runs),
+            "worker_starts": sum(run["worker_starts"] for run in runs),
+            "wall_s": max(run["wall_s"] for run in runs),
+        }
+    caches = [r["model_cache"] for r in shards if "model_cache" in r]
+    if caches:
+        merged["model_cache"] = {
+            "enabled": any(c["enabled"] for c in caches),
+            "hits": sum(c["hits"] for c in caches),
+            "misses": sum(c["misses"] for c in caches),
+        }
+    return merged
+
+
+def merge_sarif(sarifs: List[Dict[str, Any]], prompts: List[str]) -> Dict[str, Any]:
+    """Combine shard SARIF logs; results are ordered by file, then by case location."""
+    results: List[Dict[str, Any]] = []
+    load_errors = set()
+    for sarif in sarifs:
+        for result in sarif["runs"][0]["results"]:
+            props = result.get("properties") or {}
+            if props.get("stable_id") == "(file)":
+                key = (props.get("prompts_path"), result["message"]["text"])
+                if key in load_errors:
+                    continue
+                load_errors.add(key)
+            results.append(result)
+
+    file_order = {path: i for i, path in enumerate(prompts)}
+
+    def position(result: Dict[str, Any]) -> Tuple[int, bool, int, int]:
+        props = result.get("properties") or {}
+        region = result["locations"][0]["physicalLocation"]["region"]
+        return (
+            file_order.get(props.get("prompts_path"), len(file_order)),
+            props.get("stable_id") == "(file)",
+            region["startLine"],
+            region["startColumn"],
+        )
+
+    merged = build_sarif([])
+    merged["runs"][0]["results"] = sorted(results, key=position)
+    return merged
+
+
+def merge_main(argv: List[str]) -> int:
+    p = argparse.ArgumentParser(
+        prog="run_prompt_regression.py merge",
+        description="Merge --shard i/N JSON + SARIF reports into a single report pair.",
+    )
+    p.add_argument("--report", action="append", required=True, help="Shard JSON report (repeatable, any order).")
+    p.add_argument("--sarif", action="append", required=True, help="Shard SARIF report (repeatable, any order).")
+    p.add_argument("--report-out", required=True, help="Path to write the merged JSON report.")
+    p.add_argument("--sarif-out", required=True, help="Path to write the merged SARIF report.")
+    p.add_argument("--no-fail", action="store_true", help="Never exit non-zero (useful for CI diagnostics).")
+    args = p.parse_args(argv)
+    if len(args.sarif) != len(args.report):
+        p.error("pass one --sarif per --report")
+
+    try:
+        report = merge_reports([_read_json(Path(path)) for path in args.report])
+    except (KeyError, ValueError) as e:
+        p.error(f"cannot merge shard reports: {e}")
+    sarif = merge_sarif([_read_json(Path(path)) for path in args.sarif], report["prompts"])
+
+    _write_json(Path(args.report_out), report)
+    _write_json(Path(args.sarif_out), sarif)
+
+    if args.no_fail:
+        return 0
+    return 1 if report["failed"] else 0
+
+
 # ---------------------------
 # CLI
 # ---------------------------
@@ -297,8 +765,48 @@ def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
         default="",
         help="Optional: command to run model evaluation (read prompt on stdin). If omitted, schema-only mode.",
     )
+    p.add_argument(
+        "--model-server",
+        default="",
+        help="Optional: command starting a persistent JSON-lines model worker (see ModelServer). "
+        "Replaces --model-cmd so the model is loaded once per worker instead of once per case.",
+    )
+    p.add_argument("--concurrency", type=int, default=1, help="Cases run in parallel (one worker each).")
     p.add_argument("--model-timeout", type=int, default=120, help="Timeout seconds for model command per prompt.")
-    return p.parse_args(argv)
+    p.add_argument(
+        "--model-manifest",
+        default="",
+        help="Optional export manifest whose model_hash identifies the model in result cache keys "
+        "(defaults to the model command string).",
+    )
+    p.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help="Directory of cached full-mode results keyed by case, baseline hash, model and timeout.",
+    )
+    p.add_argument("--no-cache", action="store_true", help="Always run the model, ignoring cached results.")
+    p.add_argument(
+        "--model-startup-timeout",
+        type=int,
+        default=600,
+        help="Timeout seconds for a --model-server worker to load and report ready.",
+    )
+    p.add_argument(
+        "--shard",
+        default="1/1",
+        help="Check only shard i of N (1-based, e.g. 2/4); cases are dealt round-robin. "
+        "Combine shard reports with the 'merge' command.",
+    )
+    args = p.parse_args(argv)
+    shard = re.fullmatch(r"(\d+)/(\d+)", args.shard.strip())
+    if not shard or not 1 <= int(shard.group(1)) <= int(shard.group(2)):
+        p.error("--shard must look like i/N with 1 <= i <= N")
+    args.shard_index, args.shard_count = int(shard.group(1)), int(shard.group(2))
+    if (args.model_cmd or "").strip() and (args.model_server or "").strip():
+        p.error("--model-cmd and --model-server are mutually exclusive")
+    if args.concurrency < 1:
+        p.error("--concurrency must be at least 1")
+    return args
 
 
 # ---------------------------
@@ -306,6 +814,9 @@ def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
 # ---------------------------
 
 def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["merge"]:
+        return merge_main(argv[1:])
     args = parse_args(argv)
 
     prompts_paths = [Path(p) for p in (args.prompts or [])]
@@ -314,15 +825,16 @@ def main(argv: Optional[List[str]] = None) -> int:
 
     report_out = Path(args.report_out)
     sarif_out = Path(args.sarif_out)
+    full_mode = bool((args.model_cmd or "").strip() or (args.model_server or "").strip())
+    model_label = "model-server" if (args.model_server or "").strip() else "model-cmd"
 
     findings: List[Finding] = []
-    rule_meta: Dict[Tuple[str, str], Tuple[int, int]] = {}
 
     report: Dict[str, Any] = {
         "tool": "offLLM prompt regression",
         "ts": _utc_now_iso(),
         "prompts": [str(p) for p in prompts_paths],
-        "mode": "full" if (args.model_cmd or "").strip() else "schema_only",
+        "mode": "full" if full_mode else "schema_only",
         "failed": False,
         "files": [],
         "totals": {
@@ -335,7 +847,18 @@ def main(argv: Optional[List[str]] = None) -> int:
         },
     }
 
+    if args.shard_count > 1:
+        report["shard"] = {"index": args.shard_index, "count": args.shard_count}
+    shard_index, shard_count = args.shard_index, args.shard_count
+    ordinal = 0
+
     any_hard_fail = False
+    model_jobs: List[ModelJob] = []
+    result_cache: Optional[ResultCache] = None
+    fingerprint = ""
+    if full_mode and not args.no_cache:
+        result_cache = ResultCache(Path(args.cache_dir))
+        fingerprint = _model_fingerprint(args)
 
     for prompts_path in prompts_paths:
         file_entry: Dict[str, Any] = {
@@ -348,35 +871,36 @@ def main(argv: Optional[List[str]] = None) -> int:
             "results": [],
         }
 
+        # Cases stream from a single pass over the file; a malformed file is reported
+        # once the parser reaches the problem, after the cases before it.
+        load_error: Optional[Exception] = None
         try:
-            raw = _read_text(prompts_path)
-            parsed = json.loads(raw)
-            golden = _normalise_golden(parsed)
+            cases = iter_golden_cases(_read_text(prompts_path))
         except Exception as e:
-            msg = f"Failed to load prompts: {e}"
-            findings.append(Finding(prompts_path=str(prompts_path), stable_id="(file)", kind="schema", message=msg))
-            report["totals"]["schema_errors"] += 1
-            file_entry["schema_errors"] += 1
-            file_entry["results"].append({"stable_id": "(file)", "status": "schema_error", "error": msg})
-            report["files"].append(file_entry)
-            any_hard_fail = True
-            continue
-
-        cases = golden.get("cases", [])
-        file_entry["cases_total"] = len(cases)
-        report["totals"]["cases_total"] += len(cases)
-
-        # record best-effort locations for SARIF
-        # (if file is huge, still fine—this is one pass per file)
-        for entry in cases:
-            if _is_plain_object(entry):
-                sid = str(entry.get("stable_id", "(unknown)"))
-                rule_meta[(str(prompts_path), sid)] = _best_effort_case_location(raw, sid)
+            load_error, cases = e, iter(())
+
+        while load_error is None:
+            try:
+                location, entry = next(cases)
+            except StopIteration:
+                break
+            except ValueError as e:
+                load_error = e
+                break
+
+            # Round-robin over every case of every file, so shards stay balanced
+            # however the cases are spread across files.
+            ordinal += 1
+            if (ordinal - 1) % shard_count != shard_index - 1:
+                continue
+            file_entry["cases_total"] += 1
+            report["totals"]["cases_total"] += 1
 
-        for entry in cases:
             if not _is_plain_object(entry):
                 msg = "case entry must be an object"
-                findings.append(Finding(prompts_path=str(prompts_path), stable_id="(unknown)", kind="schema", message=msg))
+                findings.append(
+                    Finding(prompts_path=str(prompts_path), stable_id="(unknown)", kind="schema", message=msg, location=location)
+                )
                 report["totals"]["schema_errors"] += 1
                 file_entry["schema_errors"] += 1
                 file_entry["results"].append({"stable_id": "(unknown)", "status": "schema_error", "error": msg})
@@ -387,7 +911,9 @@ def main(argv: Optional[List[str]] = None) -> int:
             errs = _validate_case(entry)
             if errs:
                 msg = "; ".join(errs)
-                findings.append(Finding(prompts_path=str(prompts_path), stable_id=stable_id, kind="schema", message=msg))
+                findings.append(
+                    Finding(prompts_path=str(prompts_path), stable_id=stable_id, kind="schema", message=msg, location=location)
+                )
                 report["totals"]["schema_errors"] += 1
                 file_entry["schema_errors"] += 1
                 file_entry["results"].append({"stable_id": stable_id, "status": "schema_error", "error": msg})
@@ -396,42 +922,124 @@ def main(argv: Optional[List[str]] = None) -> int:
 
             report["totals"]["cases_checked"] += 1
             file_entry["cases_checked"] += 1
-            file_entry["results"].append({"stable_id": stable_id, "status": "schema_ok"})
+            # Rendered exactly like PromptBuilder.build (see scripts/eval/prompt_builder.py).
+            actual_hash = prompt_hash(
+                build_runtime_prompt(str(entry["user_prompt"]), entry.get("tools") or [], entry.get("context") or [])
+            )
+            file_entry["results"].append({"stable_id": stable_id, "status": "schema_ok", "prompt_sha256": actual_hash})
 
             eph = entry.get("expected_prompt_hash")
             if eph is None:
-                msg = "expected_prompt_hash missing (baseline not locked yet)"
-                findings.append(Finding(prompts_path=str(prompts_path), stable_id=stable_id, kind="missing_baseline", message=msg))
+                msg = f"expected_prompt_hash missing (baseline not locked yet); current hash {actual_hash}"
+                findings.append(
+                    Finding(
+                        prompts_path=str(prompts_path),
+                        stable_id=stable_id,
+                        kind="missing_baseline",
+                        message=msg,
+                        actual_hash=actual_hash,
+                        location=location,
+                    )
+                )
                 report["totals"]["missing_baselines"] += 1
                 file_entry["missing_baselines"] += 1
                 if args.strict:
                     any_hard_fail = True
                 continue
 
-            # If model-cmd provided, do “full mode” checks (optional, generic).
-            # NOTE: This does NOT build the prompt itself (that’s Jest territory in your repo).
-            # It merely proves the model command can run on input and produces output.
-            if (args.model_cmd or "").strip():
-                user_prompt = entry.get("user_prompt", "")
-                rc, out, err = _run_model_cmd(args.model_cmd, str(user_prompt), timeout_s=int(args.model_timeout))
-                if rc != 0:
-                    msg = f"model-cmd failed (rc={rc}). stderr: {err.strip()[:500]}"
-                    findings.append(Finding(prompts_path=str(prompts_path), stable_id=stable_id, kind="mismatch", message=msg))
-                    report["totals"]["mismatches"] += 1
-                    file_entry["mismatches"] += 1
-                    any_hard_fail = True
-                else:
-                    # deterministic “smoke hash” of model output (not a golden hash)
-                    smoke_hash = _sha256_hex(out)
-                    file_entry["results"][-1].update({"model_rc": 0, "model_out_sha256": smoke_hash})
+            if eph.lower() != actual_hash:
+                msg = f"rendered prompt hash {actual_hash} does not match expected_prompt_hash {eph}"
+                findings.append(
+                    Finding(
+                        prompts_path=str(prompts_path),
+                        stable_id=stable_id,
+                        kind="mismatch",
+                        message=msg,
+                        expected_hash=eph,
+                        actual_hash=actual_hash,
+                        location=location,
+                    )
+                )
+                report["totals"]["mismatches"] += 1
+                file_entry["mismatches"] += 1
+                file_entry["results"][-1]["status"] = "prompt_mismatch"
+                any_hard_fail = True
+                continue
+
+            # If a model is configured, queue “full mode” checks (optional, generic).
+            # The model receives the raw user_prompt; the rendered prompt is covered by
+            # the hash check above. This proves the model command can run on input and
+            # produces output.
+            if full_mode:
+                cache_key = None
+                if result_cache is not None:
+                    cache_key = _result_cache_key(entry, fingerprint, int(args.model_timeout))
+                    cached = result_cache.get(cache_key)
+                    if cached is not None:
+                        file_entry["results"][-1].update(cached)
+                        continue
+                model_jobs.append(
+                    ModelJob(
+                        prompts_path=str(prompts_path),
+                        stable_id=stable_id,
+                        prompt=str(entry.get("user_prompt", "")),
+                        file_entry=file_entry,
+                        result=file_entry["results"][-1],
+                        finding_slot=len(findings),
+                        location=location,
+                        cache_key=cache_key,
+                    )
+                )
+
+        if load_error is not None:
+            msg = f"Failed to load prompts: {load_error}"
+            findings.append(Finding(prompts_path=str(prompts_path), stable_id="(file)", kind="schema", message=msg))
+            report["totals"]["schema_errors"] += 1
+            file_entry["schema_errors"] += 1
+            file_entry["results"].append({"stable_id": "(file)", "status": "schema_error", "error": msg})
+            any_hard_fail = True
 
         report["files"].append(file_entry)
 
+    if model_jobs:
+        outcomes, report["model_run"] = run_model_jobs(model_jobs, args)
+        # Walk backwards so inserting a finding never shifts a slot still to be filled;
+        # findings land exactly where a sequential run would have put them.
+        for job, (rc, out, err) in reversed(list(zip(model_jobs, outcomes))):
+            if rc != 0:
+                msg = f"{model_label} failed (rc={rc}). stderr: {err.strip()[:500]}"
+                findings.insert(
+                    job.finding_slot,
+                    Finding(
+                        prompts_path=job.prompts_path,
+                        stable_id=job.stable_id,
+                        kind="mismatch",
+                        message=msg,
+                        location=job.location,
+                    ),
+                )
+                report["totals"]["mismatches"] += 1
+                job.file_entry["mismatches"] += 1
+                any_hard_fail = True
+            else:
+                # deterministic “smoke hash” of model output (not a golden hash)
+                outcome = {"model_rc": 0, "model_out_sha256": _sha256_hex(out)}
+                job.result.update(outcome)
+                if result_cache is not None and job.cache_key:
+                    result_cache.put(job.cache_key, outcome)
+
+    if full_mode:
+        report["model_cache"] = {
+            "enabled": result_cache is not None,
+            "hits": result_cache.hits if result_cache else 0,
+            "misses": result_cache.misses if result_cache else len(model_jobs),
+        }
+
     report["failed"] = bool(any_hard_fail)
 
     # Always write artifacts
     _write_json(report_out, report)
-    _write_json(sarif_out, build_sarif(findings, rule_meta))
+    _write_json(sarif_out, build_sarif(findings))
 
     # Exit policy
     if args.no_fail:
@@ -0,0 +1,450 @@
+#!/usr/bin/env python3
+"""
+Score tool-call validity of model outputs and write the ``valid_rate`` that
+``write_eval_summary.py --tool-json`` consumes.
+
+Each JSONL line holds one model output (``--response-field``, default
+``response``) and optionally its latency (``--latency-field``, default
+``latency_ms``). Tool calls are read in two forms:
+
+- ``TOOL_CALL: name(param="value")`` as instructed by
+  ``prompts/v1/runtime_prompt.json``, parsed the way ``ToolHandler.parse``
+  does (balanced parentheses, quoted/bare/JSON values, ``_coerceValue``);
+- JSON responses: ``{"name"|"tool": ..., "arguments"|"args": ...}``, a list of
+  those, or ``{"tool_calls": [...]}`` with OpenAI-style ``function`` entries.
+
+Arguments are checked with the compiled validators of
+``scripts/mlops/tool_schema_registry.py``. A call counts as attempted when its
+marker or JSON entry is found; malformed calls are attempted and invalid.
+
+The file is split into newline-aligned byte ranges that a process pool scores
+independently; partial counts are merged at the end. ``--output`` gets only
+``valid_rate`` (the summary compares every key against its baseline), which is
+null when no output attempted a tool call;
+``--details`` gets per-tool rates, error counts and latency percentiles.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import detect_compression, open_binary, skip_to  # noqa: E402
+from scripts.mlops.tool_schema_registry import get_registry  # noqa: E402
+
+TOOL_CALL_MARKER = "TOOL_CALL:"
+LATENCY_PERCENTILES = (50, 95, 99)
+
+# JS WhiteSpace and LineTerminator: what /\s/ matches and String.prototype.trim strips.
+JS_WHITESPACE = "\t\n\v\f\r \u00a0\u1680" + "".join(map(chr, range(0x2000, 0x200B))) + "\u2028\u2029\u202f\u205f\u3000\ufeff"
+
+_NAME_RE = re.compile(r"[A-Za-z_][\w-]*", re.ASCII)
+_WS_RE = re.compile(f"[{JS_WHITESPACE}]*")
+_BARE_VALUE_RE = re.compile(f"[^{JS_WHITESPACE},]*")
+_JS_DECIMAL_RE = re.compile(r"[+-]?(?:Infinity|(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)", re.ASCII)
+_JS_RADIX_RE = re.compile(r"0(?:[xX](?P<x>[0-9a-fA-F]+)|[oO](?P<o>[0-7]+)|[bB](?P<b>[01]+))")
+_JS_RADIX = {"x": 16, "o": 8, "b": 2}
+
+
+class MalformedToolCall(ValueError):
+    pass
+
+
+# ---------------------------
+# TOOL_CALL parsing (mirrors src/core/tools/ToolHandler.js)
+# ---------------------------
+
+def _scan_balanced(text: str, start: int, open_char: str, close_char: str, depth: int = 0) -> tuple[int, bool]:
+    in_quote = None
+    escaped = False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif in_quote:
+            if ch == in_quote:
+                in_quote = None
+        elif ch == '"' or ch == "'":
+            in_quote = ch
+        elif ch == open_char:
+            depth += 1
+        elif ch == close_char:
+            depth -= 1
+            if depth == 0:
+                return i, True
+    return len(text), False
+
+
+def _js_number(value: str) -> Optional[float]:
+    """Number(value) for a non-blank string, or None where JS gives NaN."""
+    text = value.strip(JS_WHITESPACE)
+    radix_match = _JS_RADIX_RE.fullmatch(text)
+    if _JS_DECIMAL_RE.fullmatch(text):
+        number = float(text.replace("Infinity", "inf"))
+    elif radix_match:
+        kind = radix_match.lastgroup
+        number = float(int(radix_match.group(kind), _JS_RADIX[kind]))
+    else:
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def _json_parse(text: str) -> Any:
+    """JSON.parse: unlike json.loads, NaN and Infinity are not JSON."""
+    return json.loads(text, parse_constant=_reject_json_constant)
+
+
+def _reject_json_constant(name: str) -> Any:
+    raise ValueError(f"{name} is not valid JSON")
+
+
+def coerce_value(value: str) -> Any:
+    if value == "true":
+        return True
+    if value == "false":
+        return False
+    trimmed = value.strip(JS_WHITESPACE)
+    if trimmed:
+        number = _js_number(value)
+        if number is not None:
+            return number
+    if trimmed.startswith(("{", "[")):
+        try:
+            return _json_parse(value)
+        except ValueError:
+            return value
+    return value
+
+
+def parse_tool_args(text: str) -> dict:
+    args: dict = {}
+    cursor, length = 0, len(text)
+    while cursor < length:
+        while cursor < length and text[cursor] in JS_WHITESPACE + ",":
+            cursor += 1
+        if cursor >= length:
+            break
+        key_match = _NAME_RE.match(text, cursor)
+        if not key_match:
+            raise MalformedToolCall("Malformed argument string")
+        key = key_match.group(0)
+        cursor = _WS_RE.match(text, key_match.end()).end()
+        if cursor >= length or text[cursor] != "=":
+            raise MalformedToolCall("Malformed argument string")
+        cursor = _WS_RE.match(text, cursor + 1).end()
+        if cursor >= length:
+            raise MalformedToolCall("Malformed argument string")
+
+        char = text[cursor]
+        if char in ('"', "'"):
+            cursor += 1
+            chars = []
+            escaped = closed = False
+            while cursor < length:
+                ch = text[cursor]
+                cursor += 1
+                if escaped:
+                    chars.append(ch)
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == char:
+                    closed = True
+                    break
+                else:
+                    chars.append(ch)
+            if escaped or not closed:
+                raise MalformedToolCall("Malformed argument string")
+            value = coerce_value("".join(chars))
+        elif char in ("{", "["):
+            end, closed = _scan_balanced(text, cursor, char, "}" if char == "{" else "]")
+            if not closed:
+                raise MalformedToolCall("Malformed argument string")
+            raw = text[cursor : end + 1]
+            try:
+                value = _json_parse(raw)
+            except ValueError:
+                value = raw
+            cursor = end + 1
+        else:
+            end = _BARE_VALUE_RE.match(text, cursor).end()
+            value = coerce_value(text[cursor:end].strip(JS_WHITESPACE))
+            cursor = end
+        args[key] = value
+    return args
+
+
+def parse_tool_call_markers(response: str) -> tuple[list[tuple[str, Any]], int]:
+    """(calls, malformed) for every TOOL_CALL marker; unparsable args give ``None`` args."""
+    calls: list[tuple[str, Any]] = []
+    malformed = 0
+    position = response.find(TOOL_CALL_MARKER)
+    while position != -1:
+        cursor = _WS_RE.match(response, position + len(TOOL_CALL_MARKER)).end()
+        next_search = position + len(TOOL_CALL_MARKER)
+        name_match = _NAME_RE.match(response, cursor)
+        if not name_match:
+            malformed += 1
+        else:
+            name = name_match.group(0)
+            cursor = _WS_RE.match(response, name_match.end()).end()
+            if cursor >= len(response) or response[cursor] != "(":
+                calls.append((name, None))
+            else:
+                end, closed = _scan_balanced(response, cursor + 1, "(", ")", 1)
+                if not closed:
+                    calls.append((name, None))
+                else:
+                    try:
+                        calls.append((name, parse_tool_args(response[cursor + 1 : end].strip(JS_WHITESPACE))))
+                    except MalformedToolCall:
+                        calls.append((name, None))
+                    next_search = end + 1
+        position = response.find(TOOL_CALL_MARKER, next_search)
+    return calls, malformed
+
+
+# ---------------------------
+# JSON tool calls
+# ---------------------------
+
+def parse_json_tool_calls(payload: Any) -> tuple[list[tuple[str, Any]], int]:
+    if isinstance(payload, dict) and isinstance(payload.get("tool_calls"), list):
+        items = payload["tool_calls"]
+    elif isinstance(payload, list):
+        items = payload
+    else:
+        items = [payload]
+    calls: list[tuple[str, Any]] = []
+    malformed = 0
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        entry = item["function"] if isinstance(item.get("function"), dict) else item
+        name = entry.get("name", entry.get("tool"))
+        if name is None:
+            continue  # a JSON answer, not a tool call
+        if not isinstance(name, str):
+            malformed += 1
+            continue
+        args = entry.get("arguments", entry.get("args", {}))
+        if isinstance(args, str):
+            try:
+                args = json.loads(args)
+            except ValueError:
+                args = None
+        calls.append((name, args))
+    return calls, malformed
+
+
+def extract_tool_calls(response: str) -> tuple[list[tuple[str, Any]], int]:
+    stripped = response.strip()
+    if stripped.startswith(("{", "[")):
+        try:
+            payload = json.loads(stripped)
+        except ValueError:
+            payload = None
+        if payload is not None:
+            calls, malformed = parse_json_tool_calls(payload)
+            if calls or malformed:
+                return calls, malformed
+    if TOOL_CALL_MARKER not in response:
+        return [], 0
+    return parse_tool_call_markers(response)
+
+
+# ---------------------------
+# Sharded scoring
+# ---------------------------
+
+def line_range_shards(path: Path, shards: int) -> list[tuple[int, int]]:
+    """Split ``path`` into up to ``shards`` byte ranges that start at line starts."""
+    if detect_compression(path):
+        # Compressed streams cannot be entered mid-file; read them as one range.
+        return [(0, sys.maxsize)]
+    size = path.stat().st_size
+    bounds = [0]
+    with path.open("rb") as handle:
+        for index in range(1, shards):
+            offset = size * index // shards
+            if offset <= bounds[-1]:
+                continue
+            handle.seek(offset - 1)
+            handle.readline()  # to the first line starting at or after offset
+            bounds.append(handle.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def _new_counts() -> dict:
+    return {
+        "outputs": 0,
+        "unreadable_outputs": 0,
+        "outputs_with_calls": 0,
+        "attempted_calls": 0,
+        "valid_calls": 0,
+        "malformed_calls": 0,
+        "unknown_tool_calls": 0,
+        "per_tool": {},
+        "latencies": array("d"),
+    }
+
+
+def score_range(path: str, start: int, end: int, response_field: str, latency_field: str) -> dict:
+    registry = get_registry()
+    counts = _new_counts()
+    per_tool = counts["per_tool"]
+    latencies = counts["latencies"]
+    with open_binary(path) as handle:
+        skip_to(handle, start)
+        position = start
+        while position < end:
+            line = handle.readline()
+            if not line:
+                break
+            position += len(line)
+            if not line.strip():
+                continue
+            counts["outputs"] += 1
+            try:
+                entry = json.loads(line)
+                response = entry[response_field]
+            except (ValueError, KeyError, TypeError):
+                counts["unreadable_outputs"] += 1
+                continue
+            latency = entry.get(latency_field)
+            if isinstance(latency, (int, float)) and not isinstance(latency, bool) and math.isfinite(latency):
+                latencies.append(latency)
+            if not isinstance(response, str):
+                counts["unreadable_outputs"] += 1
+                continue
+
+            calls, malformed = extract_tool_calls(response)
+            if not calls and not malformed:
+                continue
+            counts["outputs_with_calls"] += 1
+            counts["attempted_calls"] += len(calls) + malformed
+            counts["malformed_calls"] += malformed
+            for name, args in calls:
+                tool = per_tool.get(name)
+                if tool is None:
+                    tool = per_tool[name] = [0, 0]
+                tool[0] += 1
+                validator = registry.get(name)
+                if validator is None:
+                    counts["unknown_tool_calls"] += 1
+                elif args is None:
+                    counts["malformed_calls"] += 1
+                elif validator.is_valid(args):
+                    tool[1] += 1
+                    counts["valid_calls"] += 1
+    return counts
+
+
+def merge_counts(parts: list[dict]) -> dict:
+    merged = _new_counts()
+    for part in parts:
+        for key, value in part.items():
+            if key == "per_tool":
+                for name, (calls, valid) in value.items():
+                    tool = merged["per_tool"].setdefault(name, [0, 0])
+                    tool[0] += calls
+                    tool[1] += valid
+            elif key == "latencies":
+                merged["latencies"].extend(value)
+            else:
+                merged[key] += value
+    return merged
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Linearly interpolated percentile (numpy's default) of sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = (len(sorted_values) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (rank - low)
+
+
+def _rate(numerator: int, denominator: int) -> Optional[float]:
+    # None (null in JSON) when nothing was attempted, which is not 0% valid.
+    return round(numerator / denominator, 6) if denominator else None
+
+
+def build_report(counts: dict) -> dict:
+    latencies = sorted(counts["latencies"])
+    report = {key: value for key, value in counts.items() if key not in ("per_tool", "latencies")}
+    report["valid_rate"] = _rate(counts["valid_calls"], counts["attempted_calls"])
+    report["per_tool"] = {
+        name: {"calls": calls, "valid": valid, "valid_rate": _rate(valid, calls)}
+        for name, (calls, valid) in sorted(counts["per_tool"].items())
+    }
+    report["latency_ms"] = {"count": len(latencies)}
+    for q in LATENCY_PERCENTILES:
+        report["latency_ms"][f"p{q}"] = round(percentile(latencies, q), 3)
+    return report
+
+
+def score_file(path: Path, workers: int, shards_per_worker: int, response_field: str, latency_field: str) -> dict:
+    ranges = line_range_shards(path, max(1, workers * shards_per_worker))
+    jobs = [(str(path), start, end, response_field, latency_field) for start, end in ranges]
+    if workers <= 1 or len(jobs) <= 1:
+        return merge_counts([score_range(*job) for job in jobs])
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return merge_counts(list(pool.map(score_range, *zip(*jobs))))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Score tool-call validity of model outputs (JSONL).")
+    parser.add_argument("--outputs", required=True, help="Model outputs JSONL.")
+    parser.add_argument("--output", required=True, help="Path for {valid_rate} as read by write_eval_summary.")
+    parser.add_argument("--details", default=None, help="Optional path for per-tool rates and latency percentiles.")
+    parser.add_argument("--response-field", default="response")
+    parser.add_argument("--latency-field", default="latency_ms")
+    parser.add_argument("--workers", type=int, default=None, help="Scoring processes (default: CPU count).")
+    parser.add_argument("--shards-per-worker", type=int, default=4)
+    args = parser.parse_args()
+
+    outputs_path = Path(args.outputs)
+    if not outputs_path.exists():
+        raise FileNotFoundError(f"Outputs not found: {outputs_path}")
+    workers = args.workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    counts = score_file(outputs_path, workers, args.shards_per_worker, args.response_field, args.latency_field)
+    report = build_report(counts)
+    report["wall_s"] = round(time.perf_counter() - started, 3)
+    report["workers"] = workers
+    if not report["outputs"]:
+        raise ValueError(f"No model outputs in {outputs_path}")
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("w", encoding="utf-8") as handle:
+        json.dump({"valid_rate": report["valid_rate"]}, handle, indent=2)
+        handle.write("\n")
+    if args.details:
+        details_path = Path(args.details)
+        details_path.parent.mkdir(parents=True, exist_ok=True)
+        with details_path.open("w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+
+    print(json.dumps({key: report[key] for key in ("outputs", "attempted_calls", "valid_rate", "latency_ms", "wall_s")}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Per-request critical paths reconstructed from telemetry JSONL.
+
+A request is the run of events sharing one prompt hash: ``prompt_received``
+opens it, ``retrieval`` (whose ``query_hash`` hashes the same prompt) and
+``tool_invocation`` events fill it, ``final_response`` closes it. Events are
+logged when a stage ends, so a stage spans ``[timestamp - latency_ms,
+timestamp]``; the request spans from ``prompt_received`` to
+``final_response``.
+
+Each instant of a request is credited to one stage: the retrieval or tool span
+active at that time (when spans overlap, the one that ends last, as it gates
+the next step), else ``generation``, which covers prompt building and model
+decoding between stages. The breakdown therefore sums to the request's
+wall time.
+
+Events are read in one pass, in log (time) order. Requests that started more
+than ``--window-s`` seconds before the newest timestamp seen, or the oldest
+beyond ``--max-open``, are evicted and counted as incomplete, so memory is
+bounded by the window rather than the log. Only the ``--top`` slowest requests
+are kept (a heap); per-stage totals and DDSketch quantiles cover every request.
+``--output`` gets the JSON report and ``--chrome-trace`` the slowest requests
+in Chrome trace format (chrome://tracing or ui.perfetto.dev), one row per
+request, aligned at its start.
+"""
+
+import argparse
+import heapq
+import json
+import sys
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.telemetry_latency import DDSketch  # noqa: E402
+from scripts.mlops.compressed_io import open_text  # noqa: E402
+
+GENERATION = "generation"
+RETRIEVAL = "retrieval"
+DEFAULT_WINDOW_S = 600.0
+DEFAULT_MAX_OPEN = 10000
+DEFAULT_TOP = 20
+
+
+def parse_timestamp_ms(value: Any) -> Optional[float]:
+    if not isinstance(value, str) or not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        return None
+    return parsed.timestamp() * 1000.0
+
+
+def _latency_ms(event: dict) -> float:
+    for field in ("latency_ms", "latency"):
+        value = event.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0:
+            return float(value)
+    return 0.0
+
+
+class Request:
+    __slots__ = ("prompt_hash", "model_id", "prompt_version", "start_ms", "end_ms", "spans")
+
+    def __init__(self, prompt_hash: str, event: dict, start_ms: float):
+        self.prompt_hash = prompt_hash
+        self.model_id = event.get("model_id")
+        self.prompt_version = event.get("prompt_version")
+        self.start_ms = start_ms
+        self.end_ms: Optional[float] = None
+        # (start_ms, end_ms, stage)
+        self.spans: list[tuple[float, float, str]] = []
+
+    def add_span(self, stage: str, end_ms: float, latency_ms: float) -> None:
+        self.spans.append((end_ms - latency_ms, end_ms, stage))
+
+
+def critical_path(request: Request) -> list[tuple[float, float, str]]:
+    """Consecutive ``(start_ms, end_ms, stage)`` segments covering the request."""
+    start, end = request.start_ms, request.end_ms
+    spans = [(max(s, start), min(e, end), stage) for s, e, stage in request.spans if min(e, end) > max(s, start)]
+    bounds = sorted({start, end, *(s for s, _, _ in spans), *(e for _, e, _ in spans)})
+    segments: list[tuple[float, float, str]] = []
+    for left, right in zip(bounds, bounds[1:]):
+        active = [span for span in spans if span[0] <= left and span[1] >= right]
+        # The span ending last gates what follows; ties go to the longer span.
+        stage = max(active, key=lambda span: (span[1], span[1] - span[0], span[2]))[2] if active else GENERATION
+        if segments and segments[-1][2] == stage and segments[-1][1] == left:
+            segments[-1] = (segments[-1][0], right, stage)
+        else:
+            segments.append((left, right, stage))
+    return segments
+
+
+def breakdown(segments: Iterable[tuple[float, float, str]]) -> dict[str, float]:
+    totals: dict[str, float] = {}
+    for left, right, stage in segments:
+        totals[stage] = totals.get(stage, 0.0) + (right - left)
+    return totals
+
+
+class CriticalPathBuilder:
+    def __init__(self, window_s: float = DEFAULT_WINDOW_S, max_open: int = DEFAULT_MAX_OPEN, top: int = DEFAULT_TOP):
+        self.window_ms = window_s * 1000.0
+        self.max_open = max_open
+        self.top = top
+        # Insertion order is start order, so eviction pops from the front.
+        self.open: "OrderedDict[str, Request]" = OrderedDict()
+        self.watermark_ms = float("-inf")
+        self.counts = {
+            "events": 0,
+            "unreadable": 0,
+            "unmatched": 0,
+            "completed": 0,
+            "incomplete": 0,
+            "peak_open": 0,
+        }
+        self.stage_ms: dict[str, float] = {}
+        self.stage_requests: dict[str, int] = {}
+        self.stage_sketches: dict[str, DDSketch] = {}
+        self.total_sketch = DDSketch()
+        self.total_ms = 0.0
+        self._slowest: list[tuple[float, int, dict]] = []
+        self._sequence = 0
+
+    def add(self, event: dict) -> None:
+        self.counts["events"] += 1
+        timestamp = parse_timestamp_ms(event.get("timestamp"))
+        event_type = event.get("event_type")
+        key = event.get("query_hash") if event_type == "retrieval" else event.get("prompt_hash")
+        if timestamp is None or not isinstance(key, str) or not key:
+            self.counts["unmatched"] += 1
+            return
+        if timestamp > self.watermark_ms:
+            self.watermark_ms = timestamp
+            self._evict_stale()
+
+        request = self.open.get(key)
+        if event_type == "prompt_received":
+            if request is not None:
+                self._drop(key)  # the same prompt again before the first finished
+            self.open[key] = Request(key, event, timestamp)
+            if len(self.open) > self.max_open:
+                self._drop(next(iter(self.open)))
+            self.counts["peak_open"] = max(self.counts["peak_open"], len(self.open))
+            return
+        if request is None:
+            self.counts["unmatched"] += 1
+            return
+        if event_type == "retrieval":
+            request.add_span(RETRIEVAL, timestamp, _latency_ms(event))
+        elif event_type == "tool_invocation":
+            request.add_span(f"tool:{event.get('tool_name') or 'unknown'}", timestamp, _latency_ms(event))
+        elif event_type == "final_response":
+            request.end_ms = max(timestamp, request.start_ms)
+            del self.open[key]
+            self._complete(request)
+
+    def _evict_stale(self) -> None:
+        horizon = self.watermark_ms - self.window_ms
+        while self.open:
+            key, request = next(iter(self.open.items()))
+            if request.start_ms >= horizon:
+                break
+            self._drop(key)
+
+    def _drop(self, key: str) -> None:
+        del self.open[key]
+        self.counts["incomplete"] += 1
+
+    def _complete(self, request: Request) -> None:
+        segments = critical_path(request)
+        stages = breakdown(segments)
+        total = request.end_ms - request.start_ms
+        self.counts["completed"] += 1
+        self.total_ms += total
+        self.total_sketch.add(total)
+        for stage, ms in stages.items():
+            self.stage_ms[stage] = self.stage_ms.get(stage, 0.0) + ms
+            self.stage_requests[stage] = self.stage_requests.get(stage, 0) + 1
+            sketch = self.stage_sketches.get(stage)
+            if sketch is None:
+                sketch = self.stage_sketches[stage] = DDSketch()
+            sketch.add(ms)
+        if self.top <= 0:
+            return
+        entry = {
+            "prompt_hash": request.prompt_hash,
+            "model_id": request.model_id,
+            "prompt_version": request.prompt_version,
+            "start": datetime.fromtimestamp(request.start_ms / 1000.0, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z",
+            "total_ms": round(total, 3),
+            "breakdown_ms": {stage: round(ms, 3) for stage, ms in sorted(stages.items(), key=lambda item: -item[1])},
+            "segments": [
+                {"stage": stage, "start_ms": round(left - request.start_ms, 3), "dur_ms": round(right - left, 3)}
+                for left, right, stage in segments
+            ],
+        }
+        self._sequence += 1
+        item = (total, -self._sequence, entry)
+        if len(self._slowest) < self.top:
+            heapq.heappush(self._slowest, item)
+        elif item > self._slowest[0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def finish(self) -> None:
+        """Requests still open at the end of the input never completed."""
+        self.counts["incomplete"] += len(self.open)
+        self.open.clear()
+
+    def slowest(self) -> list[dict]:
+        return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+    def report(self) -> dict:
+        stages = {}
+        for stage in sorted(self.stage_ms, key=lambda name: -self.stage_ms[name]):
+            sketch = self.stage_sketches[stage]
+            stages[stage] = {
+                "requests": self.stage_requests[stage],
+                "total_ms": round(self.stage_ms[stage], 3),
+                "share": round(self.stage_ms[stage] / self.total_ms, 6) if self.total_ms else 0.0,
+                "p50_ms": round(sketch.quantile(0.5), 3),
+                "p95_ms": round(sketch.quantile(0.95), 3),
+            }
+        return {
+            **self.counts,
+            "window_s": self.window_ms / 1000.0,
+            "request_ms": self.total_sketch.summary(),
+            "stages": stages,
+            "slowest": self.slowest(),
+        }
+
+
+def chrome_trace(slowest: list[dict]) -> dict:
+    """Chrome trace events for the slowest requests, one thread row each."""
+    events: list[dict] = [{"name": "process_name", "ph": "M", "pid": 1, "tid": 0, "args": {"name": "slowest requests"}}]
+    for rank, request in enumerate(slowest, start=1):
+        label = f"#{rank} {request['prompt_hash'][:12]} {request['total_ms']:g}ms"
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": rank, "args": {"name": label}})
+        events.append({"name": "thread_sort_index", "ph": "M", "pid": 1, "tid": rank, "args": {"sort_index": rank}})
+        events.append(
+            {
+                "name": "request",
+                "cat": "request",
+                "ph": "X",
+                "pid": 1,
+                "tid": rank,
+                "ts": 0,
+                "dur": round(request["total_ms"] * 1000),
+                "args": {key: request[key] for key in ("prompt_hash", "model_id", "prompt_version", "start", "breakdown_ms")},
+            }
+        )
+        for segment in request["segments"]:
+            events.append(
+                {
+                    "name": segment["stage"],
+                    "cat": segment["stage"].split(":", 1)[0],
+                    "ph": "X",
+                    "pid": 1,
+                    "tid": rank,
+                    "ts": round(segment["start_ms"] * 1000),
+                    "dur": round(segment["dur_ms"] * 1000),
+                }
+            )
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def iter_events(paths: Iterable[Path], builder: CriticalPathBuilder) -> Iterator[dict]:
+    for path in paths:
+        with open_text(path) as handle:
+            for line in handle:
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    builder.counts["unreadable"] += 1
+                    continue
+                if isinstance(event, dict):
+                    yield event
+                else:
+                    builder.counts["unreadable"] += 1
+
+
+def format_stage_table(report: dict) -> str:
+    rows = report["stages"]
+    width = max([len("stage"), *(len(stage) for stage in rows)])
+    lines = [f"{'stage':<{width}}  {'share':>7}  {'total_ms':>12}  {'p50_ms':>10}  {'p95_ms':>10}  {'requests':>8}"]
+    for stage, row in rows.items():
+        lines.append(
+            f"{stage:<{width}}  {row['share']:>7.1%}  {row['total_ms']:>12.1f}  "
+            f"{row['p50_ms']:>10.1f}  {row['p95_ms']:>10.1f}  {row['requests']:>8}"
+        )
+    return "\n".join(lines)
+
+
+def _write_json(path: Path, payload: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2)
+        handle.write("\n")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reconstruct per-request critical paths from telemetry JSONL.")
+    parser.add_argument("--telemetry", action="append", required=True, help="Telemetry JSONL in time order (repeatable).")
+    parser.add_argument("--window-s", type=float, default=DEFAULT_WINDOW_S, help="Evict requests open this long.")
+    parser.add_argument("--max-open", type=int, default=DEFAULT_MAX_OPEN, help="Most requests held open at once.")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="Slowest requests kept in the report and trace.")
+    parser.add_argument("--output", default=None, help="Path for the JSON report.")
+    parser.add_argument("--chrome-trace", default=None, help="Path for a Chrome trace of the slowest requests.")
+    args = parser.parse_args()
+
+    paths = [Path(path) for path in args.telemetry]
+    for path in paths:
+        if not path.exists():
+            raise FileNotFoundError(f"Telemetry not found: {path}")
+    builder = CriticalPathBuilder(args.window_s, args.max_open, args.top)
+    for event in iter_events(paths, builder):
+        builder.add(event)
+    builder.finish()
+    if not builder.counts["completed"]:
+        raise ValueError("No completed requests (prompt_received ... final_response) in telemetry")
+
+    report = builder.report()
+    print(format_stage_table(report))
+    print(json.dumps({key: report[key] for key in ("events", "completed", "incomplete", "peak_open", "request_ms")}))
+    if args.output:
+        _write_json(Path(args.output), report)
+    if args.chrome_trace:
+        _write_json(Path(args.chrome_trace), chrome_trace(report["slowest"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""
+Latency quantiles from telemetry JSONL, per tool, model and prompt version.
+
+One streaming pass feeds every event's latency (``latency_ms``, else
+``latency``) into DDSketch quantile sketches: overall and per ``event_type``,
+``tool_name``, ``model_id`` and ``prompt_version``. A sketch stores counts in
+logarithmic buckets whose width bounds the relative error of every quantile by
+``--relative-accuracy`` (1% by default), and keeps at most ``--max-bins``
+buckets by collapsing the lowest ones, so memory depends on the number of
+distinct dimension values (capped by ``--max-values``), not on event count.
+
+Sketches merge exactly by adding bucket counts, which gives three ways to
+parallelise:
+
+- ``--workers`` scores newline-aligned byte ranges in a process pool;
+- ``--shard i/N`` reads only the i-th of N byte ranges of each file;
+- ``--sketch-out`` writes the raw sketches, and the ``merge`` command combines
+  sketch files from shards, devices or days into one report.
+
+Only ``tool_invocation`` and ``retrieval`` events are measured by default;
+``prompt_received`` and ``final_response`` carry a placeholder latency of 0.
+``--output`` gets only ``p95_latency_ms`` of the overall sketch, the latency
+JSON ``write_eval_summary.py --latency`` consumes (the summary compares every
+key against its baseline); ``--report`` gets the full p50/p95/p99 tables.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.score_tool_calls import line_range_shards  # noqa: E402
+from scripts.mlops.compressed_io import open_binary, skip_to  # noqa: E402
+
+DIMENSIONS = ("event_type", "tool_name", "model_id", "prompt_version")
+DEFAULT_EVENT_TYPES = ("tool_invocation", "retrieval")
+QUANTILES = (50, 95, 99)
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BINS = 2048
+DEFAULT_MAX_VALUES = 1000
+OTHER_VALUE = "(other)"
+SKETCH_FORMAT = "ddsketch_v1"
+# Latencies at or below this many milliseconds share the zero bucket.
+MIN_INDEXABLE_MS = 1e-6
+
+
+# ---------------------------
+# DDSketch
+# ---------------------------
+
+class DDSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (Masson et al.,
+    VLDB 2019). Bucket ``k`` counts values in ``(gamma**(k-1), gamma**k]`` and
+    is reported as the midpoint that is within ``relative_accuracy`` of both
+    ends. Past ``max_bins`` buckets, the lowest are collapsed into one, which
+    only costs accuracy at the low quantiles.
+    """
+
+    __slots__ = ("relative_accuracy", "max_bins", "gamma", "_log_gamma", "bins", "zero_count", "count", "sum", "min", "max")
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY, max_bins: int = DEFAULT_MAX_BINS):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be in (0, 1), got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins: dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def key(self, value: float) -> Optional[int]:
+        """The bucket of a positive ``value``; None for the zero bucket."""
+        return math.ceil(math.log(value) / self._log_gamma) if value > MIN_INDEXABLE_MS else None
+
+    def add(self, value: float, key: Optional[int] = None) -> None:
+        """Record ``value``; ``key`` may be passed when already computed for an equal-accuracy sketch."""
+        if key is None:
+            key = self.key(value)
+        if key is None:
+            self.zero_count += 1
+        else:
+            bins = self.bins
+            bins[key] = bins.get(key, 0) + 1
+            if len(bins) > self.max_bins:
+                self._collapse()
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _collapse(self) -> None:
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        if excess <= 0:
+            return
+        target = keys[excess]
+        self.bins[target] += sum(self.bins.pop(key) for key in keys[:excess])
+
+    def merge(self, other: "DDSketch") -> None:
+        if not math.isclose(other.relative_accuracy, self.relative_accuracy):
+            raise ValueError(
+                f"cannot merge sketches with relative accuracy {other.relative_accuracy} "
+                f"and {self.relative_accuracy}"
+            )
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return self.min
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                value = 2 * self.gamma**key / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def summary(self, quantiles: Iterable[int] = QUANTILES) -> dict:
+        row: dict[str, Any] = {"count": self.count}
+        if self.count:
+            row["mean"] = round(self.sum / self.count, 3)
+            row["min"] = round(self.min, 3)
+            row["max"] = round(self.max, 3)
+        for q in quantiles:
+            value = self.quantile(q / 100)
+            row[f"p{q}"] = round(value, 3) if value is not None else None
+        return row
+
+    def to_dict(self) -> dict:
+        keys = sorted(self.bins)
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "zero_count": self.zero_count,
+            "keys": keys,
+            "counts": [self.bins[key] for key in keys],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "DDSketch":
+        sketch = cls(data["relative_accuracy"], data["max_bins"])
+        sketch.bins = dict(zip(data["keys"], data["counts"]))
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min = data["min"]
+            sketch.max = data["max"]
+        return sketch
+
+
+# ---------------------------
+# Streaming pass
+# ---------------------------
+
+class LatencySketches:
+    """The overall sketch plus one sketch per value of each dimension."""
+
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_bins: int = DEFAULT_MAX_BINS,
+        max_values: int = DEFAULT_MAX_VALUES,
+    ):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.max_values = max_values
+        self.all = DDSketch(relative_accuracy, max_bins)
+        self.dimensions: dict[str, dict[str, DDSketch]] = {dimension: {} for dimension in DIMENSIONS}
+        self.events = 0
+        self.skipped = {"unreadable": 0, "event_type": 0, "no_latency": 0}
+
+    def _sketch(self, dimension: str, value: str) -> DDSketch:
+        sketches = self.dimensions[dimension]
+        sketch = sketches.get(value)
+        if sketch is None:
+            if len(sketches) >= self.max_values and value != OTHER_VALUE:
+                return self._sketch(dimension, OTHER_VALUE)
+            sketch = sketches[value] = DDSketch(self.relative_accuracy, self.max_bins)
+        return sketch
+
+    def add_event(self, event: dict, value: float) -> None:
+        key = self.all.key(value)
+        self.all.add(value, key)
+        self.events += 1
+        for dimension in DIMENSIONS:
+            label = event.get(dimension)
+            if isinstance(label, str) and label:
+                self._sketch(dimension, label).add(value, key)
+
+    def merge(self, other: "LatencySketches") -> None:
+        self.all.merge(other.all)
+        self.events += other.events
+        for reason, count in other.skipped.items():
+            self.skipped[reason] = self.skipped.get(reason, 0) + count
+        for dimension, sketches in other.dimensions.items():
+            for value, sketch in sketches.items():
+                self._sketch(dimension, value).merge(sketch)
+
+    def to_dict(self) -> dict:
+        return {
+            "format": SKETCH_FORMAT,
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "max_values": self.max_values,
+            "events": self.events,
+            "skipped": self.skipped,
+            "all": self.all.to_dict(),
+            "dimensions": {
+                dimension: {value: sketch.to_dict() for value, sketch in sorted(sketches.items())}
+                for dimension, sketches in self.dimensions.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "LatencySketches":
+        if data.get("format") != SKETCH_FORMAT:
+            raise ValueError(f"not a {SKETCH_FORMAT} sketch file")
+        sketches = cls(data["relative_accuracy"], data["max_bins"], data["max_values"])
+        sketches.all = DDSketch.from_dict(data["all"])
+        sketches.events = data["events"]
+        sketches.skipped = dict(data["skipped"])
+        for dimension, values in data["dimensions"].items():
+            sketches.dimensions[dimension] = {value: DDSketch.from_dict(sketch) for value, sketch in values.items()}
+        return sketches
+
+    def report(self, quantiles: Iterable[int] = QUANTILES) -> dict:
+        quantiles = tuple(quantiles)
+        return {
+            "events": self.events,
+            "skipped": self.skipped,
+            "relative_accuracy": self.relative_accuracy,
+            "latency_ms": {
+                "all": self.all.summary(quantiles),
+                **{
+                    dimension: {value: sketch.summary(quantiles) for value, sketch in sorted(sketches.items())}
+                    for dimension, sketches in self.dimensions.items()
+                },
+            },
+        }
+
+
+def _event_latency(event: dict) -> Optional[float]:
+    for field in ("latency_ms", "latency"):
+        value = event.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value) and value >= 0:
+            return float(value)
+    return None
+
+
+def sketch_range(
+    path: str,
+    start: int,
+    end: int,
+    event_types: Optional[frozenset],
+    relative_accuracy: float,
+    max_bins: int,
+    max_values: int,
+) -> LatencySketches:
+    sketches = LatencySketches(relative_accuracy, max_bins, max_values)
+    with open_binary(path) as handle:
+        skip_to(handle, start)
+        position = start
+        while position < end:
+            line = handle.readline()
+            if not line:
+                break
+            position += len(line)
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                sketches.skipped["unreadable"] += 1
+                continue
+            if not isinstance(event, dict):
+                sketches.skipped["unreadable"] += 1
+                continue
+            if event_types is not None and event.get("event_type") not in event_types:
+                sketches.skipped["event_type"] += 1
+                continue
+            value = _event_latency(event)
+            if value is None:
+                sketches.skipped["no_latency"] += 1
+                continue
+            sketches.add_event(event, value)
+    return sketches
+
+
+def sketch_files(
+    paths: list[Path],
+    event_types: Optional[frozenset] = frozenset(DEFAULT_EVENT_TYPES),
+    workers: int = 1,
+    shards_per_worker: int = 4,
+    shard: tuple[int, int] = (1, 1),
+    relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+    max_bins: int = DEFAULT_MAX_BINS,
+    max_values: int = DEFAULT_MAX_VALUES,
+) -> LatencySketches:
+    shard_index, shard_count = shard
+    jobs = []
+    for path in paths:
+        # Shard i takes the i-th contiguous slice of the file's ranges, which
+        # are then spread over the workers.
+        ranges = line_range_shards(path, shard_count * max(1, workers * shards_per_worker))
+        ranges = ranges[(shard_index - 1) * len(ranges) // shard_count : shard_index * len(ranges) // shard_count]
+        jobs.extend((str(path), start, end, event_types, relative_accuracy, max_bins, max_values) for start, end in ranges)
+
+    merged = LatencySketches(relative_accuracy, max_bins, max_values)
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            merged.merge(sketch_range(*job))
+        return merged
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(sketch_range, *zip(*jobs)):
+            merged.merge(part)
+    return merged
+
+
+# ---------------------------
+# Output
+# ---------------------------
+
+def format_tables(report: dict, quantiles: Iterable[int] = QUANTILES) -> str:
+    columns = ["count"] + [f"p{q}" for q in quantiles]
+    sections = [("all", {"*": report["latency_ms"]["all"]})]
+    sections += [(dimension, report["latency_ms"][dimension]) for dimension in DIMENSIONS if report["latency_ms"][dimension]]
+    lines = []
+    for dimension, rows in sections:
+        width = max(len(dimension), *(len(value) for value in rows))
+        lines.append(f"{dimension:<{width}}  " + "  ".join(f"{column:>10}" for column in columns))
+        for value, row in rows.items():
+            cells = ["-" if row[column] is None else f"{row[column]:g}" for column in columns]
+            lines.append(f"{value:<{width}}  " + "  ".join(f"{cell:>10}" for cell in cells))
+        lines.append("")
+    return "\n".join(lines)
+
+
+def _write_json(path: Path, payload: Any) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as handle:
+        json.dump(payload, handle, indent=2, sort_keys=True)
+        handle.write("\n")
+
+
+def write_outputs(sketches: LatencySketches, args: argparse.Namespace) -> None:
+    quantiles = tuple(int(q) for q in args.quantiles.split(","))
+    report = sketches.report(quantiles)
+    print(format_tables(report, quantiles))
+    if args.report:
+        _write_json(Path(args.report), report)
+    if args.output:
+        p95 = sketches.all.quantile(0.95)
+        if p95 is None:
+            raise ValueError("No latency samples; cannot write p95_latency_ms")
+        _write_json(Path(args.output), {"p95_latency_ms": round(p95, 3)})
+    if getattr(args, "sketch_out", None):
+        _write_json(Path(args.sketch_out), sketches.to_dict())
+
+
+def _add_output_args(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--output", default=None, help="Path for {p95_latency_ms} as read by write_eval_summary.")
+    parser.add_argument("--report", default=None, help="Path for the p50/p95/p99 tables as JSON.")
+    parser.add_argument("--quantiles", default=",".join(map(str, QUANTILES)), help="Comma-separated percentiles.")
+
+
+def merge_main(argv: list[str]) -> int:
+    p = argparse.ArgumentParser(
+        prog="telemetry_latency.py merge",
+        description="Merge --sketch-out files from shards into one latency report.",
+    )
+    p.add_argument("--sketch", action="append", required=True, help="Sketch file (repeatable, any order).")
+    p.add_argument("--sketch-out", default=None, help="Optional path for the merged sketches.")
+    _add_output_args(p)
+    args = p.parse_args(argv)
+
+    merged: Optional[LatencySketches] = None
+    for path in args.sketch:
+        with Path(path).open("r", encoding="utf-8") as handle:
+            part = LatencySketches.from_dict(json.load(handle))
+        if merged is None:
+            merged = part
+        else:
+            try:
+                merged.merge(part)
+            except ValueError as e:
+                p.error(f"cannot merge {path}: {e}")
+    write_outputs(merged, args)
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["merge"]:
+        return merge_main(argv[1:])
+    p = argparse.ArgumentParser(description="Latency quantiles from telemetry JSONL per tool, model and prompt version.")
+    p.add_argument("--telemetry", action="append", required=True, help="Telemetry JSONL (repeatable).")
+    p.add_argument(
+        "--event-type",
+        action="append",
+        default=None,
+        help=f"Event types to measure (repeatable; default: {', '.join(DEFAULT_EVENT_TYPES)}; 'all' for every type).",
+    )
+    p.add_argument("--relative-accuracy", type=float, default=DEFAULT_RELATIVE_ACCURACY)
+    p.add_argument("--max-bins", type=int, default=DEFAULT_MAX_BINS)
+    p.add_argument("--max-values", type=int, default=DEFAULT_MAX_VALUES, help="Distinct values kept per dimension.")
+    p.add_argument("--workers", type=int, default=None, help="Processes (default: CPU count).")
+    p.add_argument("--shards-per-worker", type=int, default=4)
+    p.add_argument("--shard", default="1/1", help="Read only byte-range shard i of N of each file (e.g. 2/4).")
+    p.add_argument("--sketch-out", default=None, help="Path for the raw sketches, for the 'merge' command.")
+    _add_output_args(p)
+    args = p.parse_args(argv)
+
+    shard = re.fullmatch(r"(\d+)/(\d+)", args.shard.strip())
+    if not shard or not 1 <= int(shard.group(1)) <= int(shard.group(2)):
+        p.error("--shard must look like i/N with 1 <= i <= N")
+    paths = [Path(path) for path in args.telemetry]
+    for path in paths:
+        if not path.exists():
+            raise FileNotFoundError(f"Telemetry not found: {path}")
+    event_types = args.event_type or list(DEFAULT_EVENT_TYPES)
+    sketches = sketch_files(
+        paths,
+        event_types=None if "all" in event_types else frozenset(event_types),
+        workers=args.workers or os.cpu_count() or 1,
+        shards_per_worker=args.shards_per_worker,
+        shard=(int(shard.group(1)), int(shard.group(2))),
+        relative_accuracy=args.relative_accuracy,
+        max_bins=args.max_bins,
+        max_values=args.max_values,
+    )
+    write_outputs(sketches, args)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
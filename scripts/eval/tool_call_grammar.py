@@ -0,0 +1,1004 @@
+#!/usr/bin/env python3
+"""
+Grammar-constrained decoding for ``TOOL_CALL`` outputs.
+
+``compile_tool_grammar`` turns the tool schemas (``schemas/tools``) and the
+call syntax read by ``ToolHandler.parse`` into a byte-level DFA. It accepts
+``TOOL_CALL: name(key=value, ...)`` with:
+
+- known tool names and property names only, in schema order, with every
+  ``required`` property present;
+- string values quoted with ``"``, escaping only ``\\"`` and ``\\\\``,
+  well-formed UTF-8, and never text that ``_coerceValue`` would turn into a
+  number or boolean: no leading whitespace, digit, sign, ``.``, ``{`` or
+  ``[``, and not ``true``, ``false`` or ``Infinity``;
+- quoted enum members, bare ``true``/``false``, bare numbers (no exponent and
+  no ``-0``; no sign when ``minimum >= 0``; small bounded integer ranges are
+  spelled out) and JSON arrays of numbers or booleans.
+
+Other numeric ranges and string formats (``format``, ``pattern``, length
+limits) are not enforced. ``ToolSchemaRegistry`` checks only required
+fields, types and unknown fields, so a constrained call can still break
+them. Optional properties the grammar cannot express are left out. A tool with such a
+required property is left out too and listed in ``ByteDFA.skipped``. In
+``call`` mode the output is exactly one call. In ``text`` mode free text is
+allowed and only what follows a ``TOOL_CALL:`` marker is constrained.
+
+``build_grammar_masks`` walks every token of a ``TokenVocabulary`` through
+the DFA from every state at once with numpy, giving one allowed-token
+bitmask per state (EOS only in accepting states). ``load_or_build_masks``
+caches the result under ``build/tool_grammar_cache``, keyed by grammar and
+tokenizer hash. ``ToolCallLogitsProcessor`` applies the masks in the
+reference generator.
+
+The cache file is also the export for the on-device runtimes, all
+little-endian::
+
+    header    "TCGM", u16 version, u8 mode (0 call, 1 text), u8 state
+              width W (2 or 4 bytes), u32 states, u32 byte classes,
+              u32 vocab size, u32 masks, 32-byte grammar sha256,
+              32-byte tokenizer sha256
+    u8[256]                 byte -> byte class
+    u8[states]              accepting flags, padded to 4 bytes
+    iW[states, classes]     next state, -1 rejects; state 0 is the start;
+                            padded to 4 bytes
+    u32[states]             mask index per state
+    u32[masks]              mask offsets, relative to the first mask
+    masks                   u8 kind, 3 pad bytes, u32 count, then
+                            kind 0: ceil(vocab / 8) bitmap bytes, bit i of
+                                    byte i // 8 (LSB first) allows token i
+                            kind 1: count u32 allowed token ids
+                            kind 2: count u32 blocked token ids
+                            each padded to 4 bytes
+
+A runtime masks logits with the mask of its current state, samples, and then
+steps the DFA over the sampled token's bytes.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import struct
+import sys
+import time
+from collections import OrderedDict, deque
+from math import ceil, floor
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.tool_schema_registry import (  # noqa: E402
+    DEFAULT_TOOL_SCHEMAS_DIR,
+    ToolSchemaRegistry,
+    get_registry,
+)
+
+TOOL_CALL_MARKER = b"TOOL_CALL:"
+MODES = ("call", "text")
+DEFAULT_CACHE_DIR = Path("build") / "tool_grammar_cache"
+REJECT = -1
+MAX_INTEGER_DIGITS = 15
+MAX_FRACTION_DIGITS = 6
+MAX_ENUMERATED_INTEGERS = 256
+
+_QUOTE, _BACKSLASH, _SPACE = ord('"'), ord("\\"), ord(" ")
+_PRINTABLE = tuple(byte for byte in range(0x20, 0x7F) if byte not in (_QUOTE, _BACKSLASH))
+_NUMERIC_START = frozenset(b" 0123456789+-.{[")
+_STRING_KEYWORDS = (b"true", b"false", b"Infinity")
+# Unicode Zs characters plus U+2028/U+2029 and U+FEFF: what JS trims before Number().
+_JS_SPACES = tuple(
+    chr(code).encode("utf-8")
+    for code in (0xA0, 0x1680, *range(0x2000, 0x200B), 0x2028, 0x2029, 0x202F, 0x205F, 0x3000, 0xFEFF)
+)
+# Lead byte -> (second byte range, continuation bytes after the second).
+_UTF8_LEADS = {
+    **{lead: (0x80, 0xBF, 0) for lead in range(0xC2, 0xE0)},
+    0xE0: (0xA0, 0xBF, 1),
+    **{lead: (0x80, 0xBF, 1) for lead in (*range(0xE1, 0xED), 0xEE, 0xEF)},
+    0xED: (0x80, 0x9F, 1),
+    0xF0: (0x90, 0xBF, 2),
+    **{lead: (0x80, 0xBF, 2) for lead in range(0xF1, 0xF4)},
+    0xF4: (0x80, 0x8F, 2),
+}
+
+_MAGIC = b"TCGM"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHBBIIII32s32s")
+_MASK_HEADER = struct.Struct("<B3xI")
+_DENSE, _ALLOW, _BLOCK = 0, 1, 2
+
+
+class UnsupportedSchema(ValueError):
+    pass
+
+
+# ---------------------------
+# Grammar compilation
+# ---------------------------
+
+
+class _Builder:
+    """Mutable byte automaton; ``finish`` freezes it into a ``ByteDFA``."""
+
+    def __init__(self) -> None:
+        self.edges: list[dict[int, int]] = []
+        self.accepting: set[int] = set()
+        self._copies: list[tuple[int, int]] = []
+        self._utf8: dict[tuple, int] = {}
+
+    def state(self) -> int:
+        self.edges.append({})
+        return len(self.edges) - 1
+
+    def edge(self, source: int, byte: int, target: int) -> None:
+        if self.edges[source].setdefault(byte, target) != target:
+            raise ValueError(f"Conflicting tool grammar transitions on byte {byte:#04x}")
+
+    def fill(self, source: int, byte: int, target: int) -> None:
+        """Add an edge unless ``source`` already has one for ``byte``."""
+        self.edges[source].setdefault(byte, target)
+
+    def path(self, source: int, data: bytes) -> int:
+        """Follow, or create, the states spelling ``data`` from ``source``."""
+        for byte in data:
+            target = self.edges[source].get(byte)
+            if target is None:
+                target = self.state()
+                self.edges[source][byte] = target
+            source = target
+        return source
+
+    def copy(self, target: int, source: int) -> None:
+        """Give ``target`` all of ``source``'s edges once the automaton is complete."""
+        self._copies.append((target, source))
+
+    def utf8_tail(self, remaining: int, target: int) -> int:
+        """State that reads ``remaining`` continuation bytes, then moves to ``target``."""
+        if remaining == 0:
+            return target
+        key = ("tail", remaining, target)
+        if key not in self._utf8:
+            state = self._utf8[key] = self.state()
+            following = self.utf8_tail(remaining - 1, target)
+            for byte in range(0x80, 0xC0):
+                self.edge(state, byte, following)
+        return self._utf8[key]
+
+    def utf8_lead(self, lead: int, target: int) -> int:
+        low, high, remaining = _UTF8_LEADS[lead]
+        key = ("lead", low, high, remaining, target)
+        if key not in self._utf8:
+            state = self._utf8[key] = self.state()
+            following = self.utf8_tail(remaining, target)
+            for byte in range(low, high + 1):
+                self.edge(state, byte, following)
+        return self._utf8[key]
+
+    def finish(self, start: int, mode: str, tools: tuple, skipped: dict) -> "ByteDFA":
+        changed = True
+        while changed:
+            changed = False
+            for target, source in self._copies:
+                for byte, state in self.edges[source].items():
+                    if byte not in self.edges[target]:
+                        self.edge(target, byte, state)
+                        changed = True
+        # Only states that can still reach acceptance are kept, so no edge leads
+        # into a dead end; breadth-first renumbering puts the start at 0.
+        sources: list[list[int]] = [[] for _ in self.edges]
+        for state, edges in enumerate(self.edges):
+            for target in edges.values():
+                sources[target].append(state)
+        live, stack = set(self.accepting), list(self.accepting)
+        while stack:
+            for source in sources[stack.pop()]:
+                if source not in live:
+                    live.add(source)
+                    stack.append(source)
+        if start not in live:
+            raise ValueError("Tool grammar accepts nothing")
+        order, index = [start], {start: 0}
+        for state in order:
+            for byte in sorted(self.edges[state]):
+                target = self.edges[state][byte]
+                if target in live and target not in index:
+                    index[target] = len(order)
+                    order.append(target)
+        transitions = np.full((len(order), 256), REJECT, dtype=np.int32)
+        for new, old in enumerate(order):
+            for byte, target in self.edges[old].items():
+                if target in index:
+                    transitions[new, byte] = index[target]
+        accepting = np.array([old in self.accepting for old in order], dtype=bool)
+        return ByteDFA(transitions, accepting, mode, tools, skipped)
+
+
+class ByteDFA:
+    """Byte-level automaton; state 0 is the start and -1 rejects."""
+
+    def __init__(self, transitions: np.ndarray, accepting: np.ndarray, mode: str, tools=(), skipped=None):
+        self.transitions = transitions
+        self.accepting = accepting
+        self.mode = mode
+        self.tools = tuple(tools)
+        self.skipped = dict(skipped or {})
+        self._rows: Optional[list[list[int]]] = None
+        digest = hashlib.sha256(mode.encode("utf-8"))
+        digest.update(np.ascontiguousarray(transitions, dtype="<i4").tobytes())
+        digest.update(accepting.astype(np.uint8).tobytes())
+        self.sha256 = digest.hexdigest()
+
+    @property
+    def num_states(self) -> int:
+        return int(self.transitions.shape[0])
+
+    def step(self, state: int, data: bytes) -> int:
+        if self._rows is None:
+            self._rows = self.transitions.tolist()
+        rows = self._rows
+        for byte in data:
+            if state < 0:
+                break
+            state = rows[state][byte]
+        return state
+
+    def accepts(self, data: bytes) -> bool:
+        state = self.step(0, data)
+        return state >= 0 and bool(self.accepting[state])
+
+    def byte_classes(self) -> tuple[np.ndarray, np.ndarray]:
+        """(byte -> class, states x classes table) with identical byte columns merged."""
+        columns, byte_class = np.unique(self.transitions.T, axis=0, return_inverse=True)
+        return byte_class.reshape(-1).astype(np.uint8), np.ascontiguousarray(columns.T)
+
+    def distance_to_accept(self) -> np.ndarray:
+        """Fewest bytes from each state to an accepting state; -1 when none is reachable."""
+        sources: list[list[int]] = [[] for _ in range(self.num_states)]
+        for state, row in enumerate(self.transitions.tolist()):
+            for target in set(row) - {REJECT}:
+                sources[target].append(state)
+        distance = np.full(self.num_states, -1, dtype=np.int64)
+        queue = deque(np.flatnonzero(self.accepting).tolist())
+        distance[list(queue)] = 0
+        while queue:
+            state = queue.popleft()
+            for source in sources[state]:
+                if distance[source] < 0:
+                    distance[source] = distance[state] + 1
+                    queue.append(source)
+        return distance
+
+
+def _value_type(spec: dict) -> str:
+    """The grammar's value form for a property spec; raises UnsupportedSchema."""
+    enum = spec.get("enum")
+    if enum is not None:
+        if enum and all(isinstance(member, str) and _is_plain_string(member) for member in enum):
+            return "enum"
+        raise UnsupportedSchema("enum members must be strings that stay strings")
+    expected = spec.get("type", "string")
+    for entry in expected if isinstance(expected, list) else [expected]:
+        if entry in ("string", "boolean", "integer", "number"):
+            return entry
+        if entry == "array":
+            items = spec.get("items")
+            item_type = items.get("type") if isinstance(items, dict) else None
+            if item_type in ("number", "integer", "boolean"):
+                return "array"
+            raise UnsupportedSchema(f"array items of type {item_type!r}")
+    raise UnsupportedSchema(f"type {expected!r}")
+
+
+def _is_plain_string(text: str) -> bool:
+    data = text.encode("utf-8")
+    return not data or (
+        data[0] not in _NUMERIC_START
+        and data not in _STRING_KEYWORDS
+        and not data.startswith(_JS_SPACES)
+        and not (data.startswith(b"Infinity") and not data[8:].decode("utf-8").strip())
+    )
+
+
+def _utf8_char(b: _Builder, source: int, other: int, space: Optional[int]) -> None:
+    """Edges from ``source`` for one non-ASCII character: JS whitespace to ``space``
+    (rejected when None), anything else to ``other``."""
+    spaces: dict[int, list[bytes]] = {}
+    for sequence in _JS_SPACES:
+        spaces.setdefault(sequence[0], []).append(sequence)
+    for lead, (low, high, remaining) in _UTF8_LEADS.items():
+        if lead not in spaces:
+            b.fill(source, lead, b.utf8_lead(lead, other))
+            continue
+        state = b.state()
+        b.edge(source, lead, state)
+        for second in range(low, high + 1):
+            matches = [sequence for sequence in spaces[lead] if sequence[1] == second]
+            if not matches:
+                b.edge(state, second, b.utf8_tail(remaining, other))
+            elif remaining == 0:
+                if space is not None:
+                    b.edge(state, second, space)
+            else:
+                third_state = b.state()
+                b.edge(state, second, third_state)
+                for third in range(0x80, 0xC0):
+                    if any(sequence[2] == third for sequence in matches):
+                        if space is not None:
+                            b.edge(third_state, third, space)
+                    else:
+                        b.edge(third_state, third, other)
+
+
+def _string_chars(b: _Builder, state: int, rest: int, escape: int, close: Optional[int]) -> None:
+    """Fill ``state`` with ordinary string-body edges; ``close`` None forbids ``"``."""
+    for byte in _PRINTABLE:
+        b.fill(state, byte, rest)
+    b.fill(state, _BACKSLASH, escape)
+    if close is not None:
+        b.fill(state, _QUOTE, close)
+    for lead in _UTF8_LEADS:
+        b.fill(state, lead, b.utf8_lead(lead, rest))
+
+
+def _string_value(b: _Builder, entry: int, after: int) -> None:
+    first, rest, escape = b.state(), b.state(), b.state()
+    b.edge(entry, _QUOTE, first)
+    b.edge(escape, _QUOTE, rest)
+    b.edge(escape, _BACKSLASH, rest)
+    _string_chars(b, rest, rest, escape, after)
+
+    for word in _STRING_KEYWORDS:
+        state = first
+        for byte in word:
+            state = b.path(state, bytes([byte]))
+        if word == b"Infinity":
+            # "Infinity" plus trailing whitespace is still Number(...) === Infinity.
+            trailing = b.state()
+            for state_ in (state, trailing):
+                b.edge(state_, _SPACE, trailing)
+                _utf8_char(b, state_, rest, trailing)
+            _string_chars(b, trailing, rest, escape, None)
+    # Keyword prefixes: ordinary bodies, but a complete keyword may not be closed.
+    prefixes = {word[:length]: word for word in _STRING_KEYWORDS for length in range(1, len(word) + 1)}
+    for prefix, word in prefixes.items():
+        state = b.path(first, prefix)
+        _string_chars(b, state, rest, escape, None if prefix == word else after)
+
+    b.edge(first, _QUOTE, after)  # "" stays a string
+    b.edge(first, _BACKSLASH, escape)
+    for byte in _PRINTABLE:
+        if byte not in _NUMERIC_START:
+            b.fill(first, byte, rest)
+    _utf8_char(b, first, rest, None)
+
+
+def _enum_value(b: _Builder, entry: int, after: int, members: list[str]) -> None:
+    opened = b.state()
+    b.edge(entry, _QUOTE, opened)
+    for member in members:
+        escaped = member.replace("\\", "\\\\").replace('"', '\\"')
+        b.edge(b.path(opened, escaped.encode("utf-8")), _QUOTE, after)
+
+
+def _number_value(b: _Builder, entry: int, after: int, spec: dict, integer: bool) -> None:
+    """Bare (and JSON) number: ``-?(0|[1-9][0-9]*)(.[0-9]+)?`` without ``-0``."""
+    low, high = spec.get("minimum"), spec.get("maximum")
+    if integer and low is not None and high is not None and floor(high) - ceil(low) < MAX_ENUMERATED_INTEGERS:
+        for value in range(ceil(low), floor(high) + 1):
+            b.copy(b.path(entry, str(value).encode("ascii")), after)
+        return
+
+    digits_cap = MAX_INTEGER_DIGITS
+    if high is not None and high >= 0:
+        digits_cap = min(digits_cap, len(str(int(high))))
+    terminals: list[int] = []
+
+    def integer_part(start: int, negative: bool) -> None:
+        digits = [b.state() for _ in range(digits_cap)]
+        for byte in b"123456789":
+            b.edge(start, byte, digits[0])
+        for current, following in zip(digits, digits[1:]):
+            for byte in b"0123456789":
+                b.edge(current, byte, following)
+        terminals.extend(digits)
+        if integer and negative:
+            return
+        zero = b.state()
+        b.edge(start, ord("0"), zero)
+        if integer:
+            terminals.append(zero)
+            return
+        fractions = [b.state() for _ in range(MAX_FRACTION_DIGITS)]
+        for current, following in zip(fractions, fractions[1:]):
+            for byte in b"0123456789":
+                b.edge(current, byte, following)
+        terminals.extend(fractions)
+        for state in digits:
+            dot = b.state()
+            b.edge(state, ord("."), dot)
+            for byte in b"0123456789":
+                b.edge(dot, byte, fractions[0])
+        # After "0." (or "-0.") at least one nonzero digit rules out -0 and keeps 0.x.
+        dot = b.state()
+        b.edge(zero, ord("."), dot)
+        if not negative:
+            terminals.append(zero)
+            for byte in b"0123456789":
+                b.edge(dot, byte, fractions[0])
+            return
+        zeros = [dot] + [b.state() for _ in range(MAX_FRACTION_DIGITS - 1)]
+        for index, state in enumerate(zeros):
+            if index + 1 < len(zeros):
+                b.edge(state, ord("0"), zeros[index + 1])
+            for byte in b"123456789":
+                b.edge(state, byte, fractions[index])
+
+    integer_part(entry, False)
+    if low is None or low < 0:
+        minus = b.state()
+        b.edge(entry, ord("-"), minus)
+        integer_part(minus, True)
+    for state in terminals:
+        b.copy(state, after)
+
+
+def _boolean_value(b: _Builder, entry: int, after: int) -> None:
+    for word in (b"true", b"false"):
+        b.copy(b.path(entry, word), after)
+
+
+def _array_value(b: _Builder, entry: int, after: int, spec: dict) -> None:
+    items = spec["items"]
+    opened, item, after_item, separator, spaced = (b.state() for _ in range(5))
+    b.edge(entry, ord("["), opened)
+    b.edge(opened, ord("]"), after)
+    b.edge(after_item, ord("]"), after)
+    b.edge(after_item, ord(","), separator)
+    b.edge(separator, _SPACE, spaced)
+    for state in (opened, separator, spaced):
+        b.copy(state, item)
+    if items["type"] == "boolean":
+        _boolean_value(b, item, after_item)
+    else:
+        _number_value(b, item, after_item, items, items["type"] == "integer")
+
+
+def _tool_call(b: _Builder, names: int, name: str, schema: dict, after_call: int, skipped: dict) -> None:
+    required = set(schema.get("required", []))
+    properties = []
+    for key, spec in schema.get("properties", {}).items():
+        spec = spec if isinstance(spec, dict) else {}
+        try:
+            properties.append((key, spec, _value_type(spec)))
+        except UnsupportedSchema as error:
+            if key in required:
+                raise UnsupportedSchema(f"required property {key}: {error}") from error
+            skipped[f"{name}.{key}"] = str(error)
+    if required - {key for key, _spec, _kind in properties}:
+        raise UnsupportedSchema(f"required properties missing from properties: {sorted(required)}")
+
+    count = len(properties)
+    opened = b.state()
+    b.edge(b.path(names, name.encode("utf-8")), ord("("), opened)
+    values = [b.state() for _ in range(count)]
+    afters = [opened] + [b.state() for _ in range(count)]
+
+    def skips_required(first: int, last: int) -> bool:
+        return any(properties[index][0] in required for index in range(first, last))
+
+    for index in range(count + 1):
+        if not skips_required(index, count):
+            b.edge(afters[index], ord(")"), after_call)
+        if index == count:
+            continue
+        # Keys allowed next: any later property, as long as no required one is skipped.
+        keys = b.state()
+        for following in range(index, count):
+            if skips_required(index, following):
+                break
+            b.edge(b.path(keys, properties[following][0].encode("utf-8")), ord("="), values[following])
+        if index == 0:
+            b.copy(opened, keys)
+        else:
+            separator, spaced = b.state(), b.state()
+            b.edge(afters[index], ord(","), separator)
+            b.edge(separator, _SPACE, spaced)
+            b.copy(separator, keys)
+            b.copy(spaced, keys)
+
+    for index, (_key, spec, kind) in enumerate(properties):
+        entry, after = values[index], afters[index + 1]
+        if kind == "enum":
+            _enum_value(b, entry, after, spec["enum"])
+        elif kind == "string":
+            _string_value(b, entry, after)
+        elif kind == "boolean":
+            _boolean_value(b, entry, after)
+        elif kind == "array":
+            _array_value(b, entry, after, spec)
+        else:
+            _number_value(b, entry, after, spec, kind == "integer")
+
+
+def _marker_step(matched: int, byte: int) -> int:
+    """Longest marker prefix that ends the text ``marker[:matched] + byte``."""
+    text = TOOL_CALL_MARKER[:matched] + bytes([byte])
+    for length in range(min(len(text), len(TOOL_CALL_MARKER)), 0, -1):
+        if text.endswith(TOOL_CALL_MARKER[:length]):
+            return length
+    return 0
+
+
+def compile_tool_grammar(
+    registry: Optional[ToolSchemaRegistry] = None,
+    tool_names: Optional[Iterable[str]] = None,
+    mode: str = "call",
+) -> ByteDFA:
+    """DFA for ``TOOL_CALL`` outputs over the registry's tools (or ``tool_names``)."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown tool grammar mode {mode!r}; expected one of {MODES}")
+    registry = registry or get_registry()
+    names = list(registry.tool_names if tool_names is None else tool_names)
+    b = _Builder()
+    start = b.state()
+    marker_end = b.state()
+    if mode == "call":
+        after_call = b.state()
+        b.accepting.add(after_call)
+        template, spaced = b.state(), b.state()
+        b.edge(b.path(template, TOOL_CALL_MARKER[:-1]), TOOL_CALL_MARKER[-1], marker_end)
+        b.edge(start, _SPACE, spaced)
+        b.copy(start, template)
+        b.copy(spaced, template)
+    else:
+        free = [start] + [b.state() for _ in range(len(TOOL_CALL_MARKER) - 1)]
+        b.accepting.update(free)
+        for matched, state in enumerate(free):
+            for byte in range(256):
+                following = _marker_step(matched, byte)
+                b.edge(state, byte, marker_end if following == len(TOOL_CALL_MARKER) else free[following])
+        after_call = start
+
+    name_template, spaced_names = b.state(), b.state()
+    b.edge(marker_end, _SPACE, spaced_names)
+    b.copy(marker_end, name_template)
+    b.copy(spaced_names, name_template)
+
+    tools, skipped = [], {}
+    for name in names:
+        validator = registry.get(name)
+        if validator is None:
+            skipped[name] = "no tool schema"
+            continue
+        try:
+            _tool_call(b, name_template, name, validator.schema, after_call, skipped)
+        except UnsupportedSchema as error:
+            skipped[name] = str(error)
+            continue
+        tools.append(name)
+    if not tools:
+        raise ValueError("No tool schema can be expressed in the tool grammar")
+    return b.finish(start, mode, tuple(tools), skipped)
+
+
+def sample_accepted(dfa: ByteDFA, rng, max_bytes: int = 160, stop_probability: float = 0.05) -> bytes:
+    """A random string of the DFA's language.
+
+    Each step picks a next state uniformly and then a byte leading to it, so
+    names, keys and value forms are all exercised; past ``max_bytes`` only
+    bytes that move closer to an accepting state are taken.
+    """
+    distance = dfa.distance_to_accept()
+    rows = dfa.transitions.tolist()
+    state, output = 0, bytearray()
+    while True:
+        targets: dict[int, list[int]] = {}
+        for byte, target in enumerate(rows[state]):
+            if target >= 0 and distance[target] >= 0:
+                if len(output) < max_bytes or distance[target] < distance[state]:
+                    targets.setdefault(target, []).append(byte)
+        if dfa.accepting[state] and (not targets or rng.random() < stop_probability):
+            return bytes(output)
+        target = rng.choice(sorted(targets))
+        output.append(rng.choice(targets[target]))
+        state = target
+
+
+# ---------------------------
+# Token masks
+# ---------------------------
+
+
+def _bytes_to_unicode() -> dict[int, str]:
+    """The GPT-2 byte-level BPE alphabet: byte value -> printable character."""
+    printable = [*range(ord("!"), ord("~") + 1), *range(ord("¡"), ord("¬") + 1), *range(ord("®"), ord("ÿ") + 1)]
+    mapping, extra = {}, 0
+    for byte in range(256):
+        if byte in printable:
+            mapping[byte] = chr(byte)
+        else:
+            mapping[byte] = chr(256 + extra)
+            extra += 1
+    return mapping
+
+
+_BYTE_FALLBACK_RE = re.compile(r"<0x([0-9A-Fa-f]{2})>")
+
+
+def tokenizer_token_bytes(tokenizer) -> list[Optional[bytes]]:
+    """Bytes each token id decodes to; None for special tokens."""
+    size = len(tokenizer)
+    special = set(tokenizer.all_special_ids)
+    added = {index: token for token, index in tokenizer.get_added_vocab().items()}
+    pieces = tokenizer.convert_ids_to_tokens(list(range(size)))
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    decoder = json.dumps(json.loads(backend.to_str()).get("decoder"), ensure_ascii=False) if backend else ""
+    byte_level = "ByteLevel" in decoder or hasattr(tokenizer, "byte_decoder")
+    metaspace = "▁" in decoder or "Metaspace" in decoder or hasattr(tokenizer, "sp_model")
+    unicode_to_byte = {char: byte for byte, char in _bytes_to_unicode().items()}
+
+    tokens: list[Optional[bytes]] = []
+    for index, piece in enumerate(pieces):
+        byte_fallback = _BYTE_FALLBACK_RE.fullmatch(piece) if metaspace and piece else None
+        if index in special or piece is None:
+            tokens.append(None)
+        elif byte_fallback:
+            tokens.append(bytes([int(byte_fallback.group(1), 16)]))
+        elif index in added:
+            tokens.append(added[index].encode("utf-8"))
+        elif byte_level and all(char in unicode_to_byte for char in piece):
+            tokens.append(bytes(unicode_to_byte[char] for char in piece))
+        elif metaspace:
+            tokens.append(piece.replace("▁", " ").encode("utf-8"))
+        else:
+            text = tokenizer.decode([index])
+            tokens.append(None if "�" in text else text.encode("utf-8"))
+    return tokens
+
+
+class TokenVocabulary:
+    """Token id -> bytes for one tokenizer (None for specials), plus its EOS ids."""
+
+    def __init__(self, tokens: list[Optional[bytes]], eos_ids: Iterable[int]):
+        self.tokens = tokens
+        self.eos_ids = tuple(sorted({int(token) for token in eos_ids}))
+        digest = hashlib.sha256()
+        for token in tokens:
+            digest.update(b"N" if token is None else b"T" + len(token).to_bytes(4, "little") + token)
+        digest.update(json.dumps(self.eos_ids).encode("ascii"))
+        self.sha256 = digest.hexdigest()
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, eos_ids: Optional[Iterable[int]] = None) -> "TokenVocabulary":
+        if eos_ids is None:
+            eos_ids = [] if tokenizer.eos_token_id is None else [tokenizer.eos_token_id]
+        return cls(tokenizer_token_bytes(tokenizer), eos_ids)
+
+
+class GrammarMasks:
+    """A ``ByteDFA`` with one deduplicated allowed-token bitmask per state."""
+
+    def __init__(self, dfa: ByteDFA, mask_index: np.ndarray, masks: np.ndarray, vocab_size: int, tokenizer_sha256: str):
+        self.dfa = dfa
+        self.mask_index = mask_index
+        self.masks = masks
+        self.vocab_size = vocab_size
+        self.tokenizer_sha256 = tokenizer_sha256
+
+    def allowed(self, state: int) -> np.ndarray:
+        packed = self.masks[self.mask_index[state]]
+        return np.unpackbits(packed, count=self.vocab_size, bitorder="little").astype(bool)
+
+    def dead_states(self) -> list[int]:
+        """States whose mask allows nothing; decoding there could not continue."""
+        empty = {index for index, packed in enumerate(self.masks) if not packed.any()}
+        return [state for state, index in enumerate(self.mask_index.tolist()) if index in empty]
+
+    def save(self, path: Path) -> int:
+        """Write the binary export (see module docstring); returns its size in bytes."""
+        byte_class, class_table = self.dfa.byte_classes()
+        width = (self.vocab_size + 7) // 8
+        blobs = []
+        for packed in self.masks:
+            allowed = np.flatnonzero(np.unpackbits(packed, count=self.vocab_size, bitorder="little"))
+            blocked_count = self.vocab_size - allowed.size
+            if allowed.size * 4 < width and allowed.size <= blocked_count:
+                blob = _MASK_HEADER.pack(_ALLOW, allowed.size) + allowed.astype("<u4").tobytes()
+            elif blocked_count * 4 < width:
+                blocked = np.setdiff1d(np.arange(self.vocab_size), allowed)
+                blob = _MASK_HEADER.pack(_BLOCK, blocked.size) + blocked.astype("<u4").tobytes()
+            else:
+                blob = _MASK_HEADER.pack(_DENSE, width) + packed.tobytes()
+            blobs.append(blob + b"\0" * (-len(blob) % 4))
+        offsets = np.cumsum([0] + [len(blob) for blob in blobs[:-1]], dtype=np.uint64)
+        state_dtype = "<i2" if self.dfa.num_states <= np.iinfo(np.int16).max else "<i4"
+        table = class_table.astype(state_dtype).tobytes()
+        header = _HEADER.pack(
+            _MAGIC,
+            _VERSION,
+            MODES.index(self.dfa.mode),
+            np.dtype(state_dtype).itemsize,
+            self.dfa.num_states,
+            class_table.shape[1],
+            self.vocab_size,
+            len(blobs),
+            bytes.fromhex(self.dfa.sha256),
+            bytes.fromhex(self.tokenizer_sha256),
+        )
+        payload = b"".join(
+            [
+                header,
+                byte_class.tobytes(),
+                self.dfa.accepting.astype(np.uint8).tobytes() + b"\0" * (-self.dfa.num_states % 4),
+                table + b"\0" * (-len(table) % 4),
+                self.mask_index.astype("<u4").tobytes(),
+                offsets.astype("<u4").tobytes(),
+                *blobs,
+            ]
+        )
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        temporary.write_bytes(payload)
+        os.replace(temporary, path)
+        return len(payload)
+
+    @classmethod
+    def load(cls, path: Path) -> "GrammarMasks":
+        data = Path(path).read_bytes()
+        magic, version, mode, width, states, classes, vocab_size, count, grammar_sha, tokenizer_sha = (
+            _HEADER.unpack_from(data)
+        )
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a version {_VERSION} tool grammar mask file")
+        cursor = _HEADER.size
+
+        def take(dtype: str, length: int) -> np.ndarray:
+            nonlocal cursor
+            array = np.frombuffer(data, dtype=dtype, count=length, offset=cursor)
+            cursor += array.nbytes
+            return array
+
+        byte_class = take("u1", 256)
+        accepting = take("u1", states).astype(bool)
+        cursor += -states % 4
+        class_table = take(f"<i{width}", states * classes).reshape(states, classes).astype(np.int32)
+        cursor += -(width * states * classes) % 4
+        mask_index = take("<u4", states).astype(np.uint32)
+        offsets = take("<u4", count)
+        width = (vocab_size + 7) // 8
+        masks = np.zeros((count, width), dtype=np.uint8)
+        for index, offset in enumerate(offsets.tolist()):
+            kind, length = _MASK_HEADER.unpack_from(data, cursor + offset)
+            start = cursor + offset + _MASK_HEADER.size
+            if kind == _DENSE:
+                masks[index] = np.frombuffer(data, dtype=np.uint8, count=width, offset=start)
+                continue
+            ids = np.frombuffer(data, dtype="<u4", count=length, offset=start)
+            allowed = np.zeros(vocab_size, dtype=bool) if kind == _ALLOW else np.ones(vocab_size, dtype=bool)
+            allowed[ids] = kind == _ALLOW
+            masks[index] = np.packbits(allowed, bitorder="little")
+        dfa = ByteDFA(np.ascontiguousarray(class_table[:, byte_class]), accepting, MODES[mode])
+        if dfa.sha256 != grammar_sha.hex():
+            raise ValueError(f"{path} grammar does not match its sha256")
+        return cls(dfa, mask_index, masks, vocab_size, tokenizer_sha.hex())
+
+
+def build_grammar_masks(dfa: ByteDFA, vocab: TokenVocabulary) -> GrammarMasks:
+    """Allowed tokens per DFA state: every token is stepped through the DFA at
+    once, longest first, and dropped as soon as it is rejected or complete."""
+    lengths = np.array([len(token) if token else 0 for token in vocab.tokens], dtype=np.int64)
+    order = np.argsort(-lengths, kind="stable")
+    order = order[lengths[order] > 0]
+    byte_class, class_table = dfa.byte_classes()
+    max_length = int(lengths.max()) if order.size else 0
+    classes = np.zeros((order.size, max_length), dtype=np.uint8)
+    for row, index in enumerate(order.tolist()):
+        token = vocab.tokens[index]
+        classes[row, : len(token)] = byte_class[np.frombuffer(token, dtype=np.uint8)]
+    ordered_lengths = lengths[order]
+    eos_ids = np.array(vocab.eos_ids, dtype=np.int64)
+
+    unique: dict[bytes, int] = {}
+    mask_index = np.zeros(dfa.num_states, dtype=np.uint32)
+    for state in range(dfa.num_states):
+        allowed = np.zeros(len(vocab), dtype=bool)
+        rows = np.arange(order.size)
+        current = np.full(order.size, state, dtype=np.int32)
+        for depth in range(max_length):
+            current = class_table[current, classes[rows, depth]]
+            alive = current >= 0
+            remaining = ordered_lengths[rows] > depth + 1
+            allowed[order[rows[alive & ~remaining]]] = True
+            keep = alive & remaining
+            rows, current = rows[keep], current[keep]
+            if not rows.size:
+                break
+        if dfa.accepting[state]:
+            allowed[eos_ids] = True
+        packed = np.packbits(allowed, bitorder="little").tobytes()
+        mask_index[state] = unique.setdefault(packed, len(unique))
+    masks = np.frombuffer(b"".join(unique), dtype=np.uint8).reshape(len(unique), -1).copy()
+    return GrammarMasks(dfa, mask_index, masks, len(vocab), vocab.sha256)
+
+
+def mask_cache_path(cache_dir: Path, dfa: ByteDFA, vocab: TokenVocabulary) -> Path:
+    return Path(cache_dir) / f"{dfa.sha256[:16]}-{vocab.sha256[:16]}.tcgm"
+
+
+def load_or_build_masks(dfa: ByteDFA, vocab: TokenVocabulary, cache_dir: Optional[Path] = DEFAULT_CACHE_DIR):
+    """(masks, cache_hit): the cached masks for this grammar and tokenizer, built on a miss."""
+    path = mask_cache_path(cache_dir, dfa, vocab) if cache_dir else None
+    if path is not None and path.exists():
+        try:
+            masks = GrammarMasks.load(path)
+        except (OSError, ValueError, struct.error):
+            masks = None
+        if masks is not None and masks.dfa.sha256 == dfa.sha256 and masks.tokenizer_sha256 == vocab.sha256:
+            masks.dfa = dfa
+            return masks, True
+    masks = build_grammar_masks(dfa, vocab)
+    if path is not None:
+        masks.save(path)
+    return masks, False
+
+
+# ---------------------------
+# Decoding
+# ---------------------------
+
+
+class ToolCallLogitsProcessor:
+    """Restricts each row's logits to the tokens its grammar state allows.
+
+    The reference generator calls ``mask_`` before picking a token and
+    ``advance`` after it. ``__call__`` is the transformers ``LogitsProcessor``
+    form and advances on the last token of ``input_ids``. A row is no longer
+    constrained once it emits an EOS token. Blocked-token tensors are kept
+    per mask in a small LRU.
+    """
+
+    def __init__(self, masks: GrammarMasks, vocab: TokenVocabulary, batch_size: int = 1, max_cached_masks: int = 256):
+        self.masks = masks
+        self.vocab = vocab
+        self.max_cached_masks = max_cached_masks
+        self._eos = frozenset(vocab.eos_ids)
+        self._blocked: OrderedDict[tuple, Any] = OrderedDict()
+        self._steps: dict[tuple[int, int], int] = {}
+        self.reset(batch_size)
+
+    def reset(self, batch_size: int) -> None:
+        self.states = [0] * batch_size
+        self._started = False
+
+    def _blocked_tokens(self, state: int, width: int, device):
+        key = (int(self.masks.mask_index[state]), width, str(device))
+        blocked = self._blocked.get(key)
+        if blocked is not None:
+            self._blocked.move_to_end(key)
+            return blocked
+        import torch
+
+        allowed = np.zeros(width, dtype=bool)
+        row = self.masks.allowed(state)[:width]
+        allowed[: row.size] = row
+        blocked = self._blocked[key] = torch.from_numpy(~allowed).to(device)
+        if len(self._blocked) > self.max_cached_masks:
+            self._blocked.popitem(last=False)
+        return blocked
+
+    def mask_(self, logits):
+        """Set disallowed logits to -inf in place; rows past EOS are left alone."""
+        width = logits.shape[-1]
+        for row, state in enumerate(self.states):
+            if state >= 0:
+                logits[row].masked_fill_(self._blocked_tokens(state, width, logits.device), float("-inf"))
+        return logits
+
+    def advance(self, tokens) -> None:
+        for row, token in enumerate(tokens):
+            state = self.states[row]
+            if state < 0:
+                continue
+            token = int(token)
+            if token in self._eos:
+                self.states[row] = REJECT
+                continue
+            following = self._steps.get((state, token))
+            if following is None:
+                data = self.vocab.tokens[token] if token < len(self.vocab) else None
+                following = REJECT if not data else self.masks.dfa.step(state, data)
+                self._steps[(state, token)] = following
+            if following < 0:
+                raise ValueError(f"Token {token} is not allowed in tool grammar state {state}")
+            self.states[row] = following
+
+    def __call__(self, input_ids, scores):
+        if self._started:
+            self.advance(input_ids[:, -1].tolist())
+        self._started = True
+        return self.mask_(scores)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compile the TOOL_CALL grammar and export its token masks.")
+    parser.add_argument("--tools-dir", default=str(DEFAULT_TOOL_SCHEMAS_DIR))
+    parser.add_argument("--tools", default=None, help="Comma-separated tool names (default: every schema).")
+    parser.add_argument("--mode", choices=MODES, default="call")
+    parser.add_argument("--tokenizer", default=None, help="HF tokenizer to build masks for.")
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help="Mask cache directory.")
+    parser.add_argument("--output", default=None, help="Also write the binary mask export here.")
+    parser.add_argument(
+        "--samples", type=int, default=0, help="Print this many random accepted outputs with their parsed calls."
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    registry = ToolSchemaRegistry(Path(args.tools_dir))
+    tool_names = [name.strip() for name in args.tools.split(",") if name.strip()] if args.tools else None
+    started = time.perf_counter()
+    dfa = compile_tool_grammar(registry, tool_names, args.mode)
+    report: dict[str, Any] = {
+        "mode": dfa.mode,
+        "tools": len(dfa.tools),
+        "skipped": dfa.skipped,
+        "states": dfa.num_states,
+        "byte_classes": int(dfa.byte_classes()[1].shape[1]),
+        "grammar_sha256": dfa.sha256,
+        "compile_s": round(time.perf_counter() - started, 4),
+    }
+
+    if args.samples:
+        import random
+
+        from scripts.eval.score_tool_calls import parse_tool_call_markers
+
+        rng = random.Random(args.seed)
+        samples = []
+        for _ in range(args.samples):
+            text = sample_accepted(dfa, rng).decode("utf-8", errors="replace")
+            calls, malformed = parse_tool_call_markers(text)
+            samples.append(
+                {
+                    "text": text,
+                    "calls": [{"name": name, "args": call_args} for name, call_args in calls],
+                    "valid": not malformed and all(registry.is_valid(name, call_args) for name, call_args in calls),
+                }
+            )
+        report["samples"] = samples
+
+    if args.tokenizer:
+        from transformers import AutoTokenizer
+
+        vocab = TokenVocabulary.from_tokenizer(AutoTokenizer.from_pretrained(args.tokenizer))
+        started = time.perf_counter()
+        masks, cache_hit = load_or_build_masks(dfa, vocab, Path(args.cache_dir) if args.cache_dir else None)
+        report.update(
+            {
+                "tokenizer_sha256": vocab.sha256,
+                "vocab_size": len(vocab),
+                "unique_masks": int(masks.masks.shape[0]),
+                "dead_states": len(masks.dead_states()),
+                "cache_hit": cache_hit,
+                "masks_s": round(time.perf_counter() - started, 4),
+            }
+        )
+        if args.output:
+            report["output"] = args.output
+            report["output_bytes"] = masks.save(Path(args.output))
+    elif args.output:
+        parser.error("--output needs --tokenizer")
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
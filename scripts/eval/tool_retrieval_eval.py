@@ -0,0 +1,152 @@
+"""
+Evaluate query-aware tool selection against logged tool calls.
+
+Queries from ``telemetry_to_tool_calls.py`` records are split by prompt hash
+into an index-building part and a held-out part (``--holdout``). For each
+held-out query and each ``--k``, the report gives:
+
+- recall: the share of logged calls whose tool was selected, and the share of
+  queries with every called tool selected (full_coverage);
+- prompt tokens: the runtime prompt rendered with all tools versus only the
+  selected ones (scripts/eval/prompt_builder.py), counted with ``--tokenizer``
+  or estimated as ceil(chars / 4) without one;
+- descriptions_only: recall of an index built without query history, to show
+  what the history adds.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import sys
+from pathlib import Path
+from typing import Callable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.eval.prompt_builder import build_runtime_prompt  # noqa: E402
+from scripts.mlops.tool_retrieval import (  # noqa: E402
+    DEFAULT_DIMS,
+    DEFAULT_MAX_FEATURES,
+    DEFAULT_QUERY_WEIGHT,
+    build_tool_index,
+    load_query_calls,
+    load_tool_catalog,
+    select_tools,
+)
+
+
+def is_holdout(prompt_hash: str, holdout: float) -> bool:
+    bucket = int(hashlib.sha256(prompt_hash.encode("utf-8")).hexdigest()[:8], 16)
+    return bucket / 0x100000000 < holdout
+
+
+def token_counter(tokenizer_name: Optional[str]) -> Callable[[str], int]:
+    if not tokenizer_name:
+        return lambda text: math.ceil(len(text) / 4)
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+    return lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def evaluate(
+    index: dict,
+    baseline: dict,
+    catalog: list[dict],
+    queries: list[dict],
+    ks: list[int],
+    count_tokens: Callable[[str], int],
+) -> dict:
+    by_name = {tool["name"]: tool for tool in catalog}
+    full_tokens = [count_tokens(build_runtime_prompt(entry["query"], catalog)) for entry in queries]
+    results = {}
+    for k in ks:
+        calls = covered = full_coverage = fallbacks = listed = 0
+        baseline_covered = 0
+        query_recall = 0.0
+        selected_tokens = []
+        for entry in queries:
+            selected, fallback = select_tools(index, entry["query"], k)
+            baseline_selected, _ = select_tools(baseline, entry["query"], k)
+            hits = sum(1 for name in entry["tools"] if name in selected)
+            calls += len(entry["tools"])
+            covered += hits
+            baseline_covered += sum(1 for name in entry["tools"] if name in baseline_selected)
+            query_recall += hits / len(entry["tools"])
+            full_coverage += hits == len(entry["tools"])
+            fallbacks += fallback
+            listed += len(selected)
+            subset = [by_name[name] for name in selected if name in by_name]
+            selected_tokens.append(count_tokens(build_runtime_prompt(entry["query"], subset)))
+        total_full = sum(full_tokens)
+        total_selected = sum(selected_tokens)
+        results[str(k)] = {
+            "recall": round(covered / calls, 6) if calls else 0.0,
+            "query_recall": round(query_recall / len(queries), 6) if queries else 0.0,
+            "full_coverage": round(full_coverage / len(queries), 6) if queries else 0.0,
+            "fallback_rate": round(fallbacks / len(queries), 6) if queries else 0.0,
+            "mean_tools_listed": round(listed / len(queries), 3) if queries else 0.0,
+            "prompt_tokens": {
+                "full_mean": round(total_full / len(queries), 2) if queries else 0.0,
+                "selected_mean": round(total_selected / len(queries), 2) if queries else 0.0,
+                "saved_mean": round((total_full - total_selected) / len(queries), 2) if queries else 0.0,
+                "saved_rate": round(1 - total_selected / total_full, 6) if total_full else 0.0,
+            },
+            "descriptions_only": {"recall": round(baseline_covered / calls, 6) if calls else 0.0},
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Evaluate tool selection recall and prompt tokens saved.")
+    parser.add_argument("--tool-calls", required=True, help="telemetry_to_tool_calls.py output with queries.")
+    parser.add_argument("--tools", default=None, help="Runtime tool catalog JSON (default: schemas/tools).")
+    parser.add_argument("--k", default="3,5,8", help="Comma-separated tool budgets.")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of prompts held out (0 = in-sample).")
+    parser.add_argument("--dims", type=int, default=DEFAULT_DIMS)
+    parser.add_argument("--max-features", type=int, default=DEFAULT_MAX_FEATURES)
+    parser.add_argument("--query-weight", type=float, default=DEFAULT_QUERY_WEIGHT)
+    parser.add_argument("--tokenizer", default=None, help="HF tokenizer for prompt token counts.")
+    parser.add_argument("--output", default=None, help="Optional JSON report path.")
+    args = parser.parse_args()
+
+    catalog = load_tool_catalog(Path(args.tools) if args.tools else None)
+    prompts = load_query_calls(Path(args.tool_calls))
+    if not prompts:
+        raise ValueError("No tool call records with queries; regenerate them with telemetry_to_tool_calls.py")
+    known = {tool["name"] for tool in catalog}
+    train, test = [], []
+    for prompt_hash, entry in prompts.items():
+        entry = {"query": entry["query"], "tools": [name for name in entry["tools"] if name in known]}
+        if not entry["tools"]:
+            continue
+        (test if args.holdout and is_holdout(prompt_hash, args.holdout) else train).append(entry)
+    if not args.holdout:
+        test = train
+    if not test:
+        raise ValueError("No held-out queries; raise --holdout or log more prompts")
+
+    options = {"dims": args.dims, "max_features": args.max_features}
+    index = build_tool_index(catalog, train, query_weight=args.query_weight, **options)
+    baseline = build_tool_index(catalog, (), query_weight=0.0, **options)
+    ks = [int(k) for k in args.k.split(",") if k.strip()]
+    report = {
+        "tools": len(catalog),
+        "train_queries": len(train),
+        "eval_queries": len(test),
+        "holdout": args.holdout,
+        "token_counter": args.tokenizer or "chars/4",
+        "index_bytes": len(json.dumps(index, separators=(",", ":")).encode("utf-8")),
+        "k": evaluate(index, baseline, catalog, test, ks, token_counter(args.tokenizer)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        output_path = Path(args.output)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        output_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -23,9 +23,12 @@ def require_fields(payload: dict[str, Any], fields: set[str], label: str) -> Non
 
 
 def compare_metric(
-    name: str, current: float | int | bool, baseline: float | int | bool
+    name: str, current: float | int | bool | None, baseline: float | int | bool | None
 ) -> dict[str, Any]:
-    if name in HIGHER_IS_BETTER:
+    if current is None or baseline is None:
+        # Not measured on one side (e.g. no tool calls attempted): nothing to compare.
+        regressed = False
+    elif name in HIGHER_IS_BETTER:
         regressed = current < baseline
     elif name in LOWER_IS_BETTER:
         regressed = current > baseline
@@ -1,7 +1,260 @@
+"""
+Merge a LoRA adapter into its base model.
+
+Two engines are available:
+
+* ``streaming`` walks the base model's safetensors shards one at a time,
+  reads every tensor through a memory map, applies the matching LoRA delta
+  and writes the merged shard incrementally. Peak memory is bounded by the
+  largest single tensor rather than the model size, which lets 8B models be
+  merged on 32 GB build agents.
+* ``peft`` loads the full model, wraps it in ``PeftModel`` and calls
+  ``merge_and_unload``. It needs more than twice the model size in RAM but
+  supports every adapter type PEFT knows about.
+
+``auto`` (the default) picks ``streaming`` whenever the base checkpoint is
+stored as safetensors.
+"""
+
 import argparse
+import json
+import math
+import mmap
+import os
+import re
+import resource
+import shutil
+import struct
+from pathlib import Path
+
+import torch
+from safetensors import safe_open
+
+WEIGHT_SUFFIXES = (".safetensors", ".bin", ".pt", ".pth", ".h5", ".msgpack", ".ckpt")
+ADAPTER_PREFIX = "base_model.model."
+COPY_CHUNK_BYTES = 64 * 1024 * 1024
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+}
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if os.uname().sysname == "Darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def resolve_model_dir(model: str) -> Path:
+    path = Path(model)
+    if path.is_dir():
+        return path
+    from huggingface_hub import snapshot_download
+
+    return Path(
+        snapshot_download(
+            repo_id=model,
+            allow_patterns=["*.json", "*.safetensors", "*.model", "*.txt", "*.tiktoken"],
+        )
+    )
+
+
+def list_shards(model_dir: Path) -> list[str]:
+    index_path = model_dir / "model.safetensors.index.json"
+    if index_path.exists():
+        with index_path.open("r", encoding="utf-8") as handle:
+            weight_map = json.load(handle)["weight_map"]
+        return sorted(set(weight_map.values()))
+    if (model_dir / "model.safetensors").exists():
+        return ["model.safetensors"]
+    return []
+
+
+def _pattern_key(patterns: dict, module_name: str) -> str | None:
+    for pattern in patterns:
+        if re.match(rf"(.*\.)?({pattern})$", module_name):
+            return pattern
+    return None
+
+
+class LoraAdapter:
+    """LoRA weights keyed by the base-model module they modify."""
+
+    def __init__(self, adapter_dir: Path):
+        config_path = adapter_dir / "adapter_config.json"
+        if not config_path.exists():
+            raise FileNotFoundError(f"Adapter config not found: {config_path}")
+        with config_path.open("r", encoding="utf-8") as handle:
+            self.config = json.load(handle)
+        if self.config.get("peft_type", "LORA") != "LORA":
+            raise ValueError(
+                f"Streaming merge only supports LoRA adapters, got {self.config.get('peft_type')}"
+            )
+        if self.config.get("use_dora"):
+            raise ValueError("Streaming merge does not support DoRA adapters; use --mode peft")
+
+        weights_path = adapter_dir / "adapter_model.safetensors"
+        if weights_path.exists():
+            self._handle = safe_open(str(weights_path), framework="pt")
+            keys = list(self._handle.keys())
+        else:
+            bin_path = adapter_dir / "adapter_model.bin"
+            if not bin_path.exists():
+                raise FileNotFoundError(f"Adapter weights not found in {adapter_dir}")
+            self._handle = torch.load(bin_path, map_location="cpu", mmap=True, weights_only=True)
+            keys = list(self._handle.keys())
+
+        # module name -> {"A": key, "B": key, "embedding": bool}
+        self.modules: dict[str, dict] = {}
+        # base tensor name -> adapter key (modules_to_save replacements)
+        self.replacements: dict[str, str] = {}
+        for key in keys:
+            name = key[len(ADAPTER_PREFIX) :] if key.startswith(ADAPTER_PREFIX) else key
+            match = re.match(r"(.+)\.(lora_A|lora_B|lora_embedding_A|lora_embedding_B)(\.weight)?$", name)
+            if match:
+                module, part, _ = match.groups()
+                entry = self.modules.setdefault(module, {"embedding": False})
+                entry[part[-1]] = key
+                entry["embedding"] = entry["embedding"] or part.startswith("lora_embedding")
+            elif "lora_magnitude_vector" in name:
+                raise ValueError("Streaming merge does not support DoRA adapters; use --mode peft")
+            else:
+                # modules_to_save copies and saved embedding layers replace the
+                # base tensor outright.
+                self.replacements[name.replace(".base_layer.", ".")] = key
+        for module, entry in self.modules.items():
+            if "A" not in entry or "B" not in entry:
+                raise ValueError(f"Adapter is missing lora_A/lora_B for {module}")
+
+    def get(self, key: str) -> torch.Tensor:
+        if isinstance(self._handle, dict):
+            return self._handle[key]
+        return self._handle.get_tensor(key)
+
+    def scaling(self, module: str) -> float:
+        rank = self.config.get("r", 8)
+        alpha = self.config.get("lora_alpha", 8)
+        rank_key = _pattern_key(self.config.get("rank_pattern") or {}, module)
+        if rank_key is not None:
+            rank = self.config["rank_pattern"][rank_key]
+        alpha_key = _pattern_key(self.config.get("alpha_pattern") or {}, module)
+        if alpha_key is not None:
+            alpha = self.config["alpha_pattern"][alpha_key]
+        if self.config.get("use_rslora"):
+            return alpha / math.sqrt(rank)
+        return alpha / rank
+
+    def merge_into(self, module: str, weight: torch.Tensor) -> torch.Tensor:
+        """Add the LoRA delta for ``module`` to ``weight`` exactly like PEFT does.
+
+        PEFT up-casts fp16/bf16 adapter weights to fp32 when loading
+        (``autocast_adapter_dtype``) and merges with an in-place add, so the
+        delta is computed in fp32 and rounded once into the base dtype. This
+        matches the peft release pinned by the fine-tune workflow.
+        """
+        entry = self.modules[module]
+        lora_dtype = weight.dtype
+        if lora_dtype in (torch.float16, torch.bfloat16):
+            lora_dtype = torch.float32
+        weight_a = self.get(entry["A"]).to(lora_dtype)
+        weight_b = self.get(entry["B"]).to(lora_dtype)
+        delta = weight_b @ weight_a
+        if entry["embedding"] or self.config.get("fan_in_fan_out"):
+            delta = delta.T
+        delta = delta * self.scaling(module)
+        weight += delta
+        return weight
+
+
+def _read_safetensors_header(handle) -> tuple[dict, int]:
+    (header_size,) = struct.unpack("<Q", handle.read(8))
+    header = json.loads(handle.read(header_size))
+    return header, 8 + header_size
 
-from peft import PeftModel
-from transformers import AutoModelForCausalLM, AutoTokenizer
+
+def _tensor_bytes(tensor: torch.Tensor) -> memoryview:
+    flat = tensor.contiguous().reshape(-1)
+    return memoryview(flat.view(torch.uint8).numpy())
+
+
+def merge_shard(source: Path, target: Path, adapter: LoraAdapter, pending: set[str]) -> None:
+    """Write ``source`` to ``target`` with LoRA deltas applied, one tensor at a time.
+
+    Merged tensors keep the base dtype and shape, so the original header is
+    reused verbatim and untouched tensors are copied straight from the mmap.
+    """
+    with source.open("rb") as handle:
+        header, data_start = _read_safetensors_header(handle)
+        header.pop("__metadata__", None)
+        names = sorted(header, key=lambda name: header[name]["data_offsets"][0])
+        tensors = safe_open(str(source), framework="pt")
+
+        with target.open("wb") as out, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            out.write(view[:data_start])
+            for name in names:
+                start, end = header[name]["data_offsets"]
+                module = name[: -len(".weight")] if name.endswith(".weight") else None
+                if name in adapter.replacements or module in adapter.modules:
+                    if name in adapter.replacements:
+                        tensor = adapter.get(adapter.replacements[name])
+                        if list(tensor.shape) != header[name]["shape"]:
+                            raise ValueError(f"Adapter tensor {name} does not match the base shape")
+                        tensor = tensor.to(SAFETENSORS_DTYPES.get(header[name]["dtype"], tensor.dtype))
+                        pending.discard(name)
+                    else:
+                        tensor = tensors.get_tensor(name)
+                    if module in adapter.modules:
+                        tensor = adapter.merge_into(module, tensor)
+                        pending.discard(module)
+                    out.write(_tensor_bytes(tensor))
+                    del tensor
+                    continue
+                for offset in range(data_start + start, data_start + end, COPY_CHUNK_BYTES):
+                    out.write(view[offset : min(offset + COPY_CHUNK_BYTES, data_start + end)])
+
+
+def merge_streaming(base_dir: Path, lora_dir: Path, output_dir: Path) -> dict:
+    shards = list_shards(base_dir)
+    if not shards:
+        raise FileNotFoundError(f"No safetensors checkpoint found in {base_dir}")
+    adapter = LoraAdapter(lora_dir)
+    pending = set(adapter.modules) | set(adapter.replacements)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for entry in base_dir.iterdir():
+        if entry.is_file() and not entry.name.endswith(WEIGHT_SUFFIXES) and entry.name != ".gitattributes":
+            shutil.copy2(entry, output_dir / entry.name)
+
+    for shard in shards:
+        merge_shard(base_dir / shard, output_dir / shard, adapter, pending)
+        print(f"Merged shard {shard} (peak RSS {peak_rss_mb():.0f} MB)")
+
+    if pending:
+        raise ValueError(
+            "Adapter modules not found in base checkpoint: " + ", ".join(sorted(pending))
+        )
+    return {"shards": len(shards), "lora_modules": len(adapter.modules), "peak_rss_mb": peak_rss_mb()}
+
+
+def merge_peft(base_model: str, lora_dir: str, output_dir: str) -> None:
+    from peft import PeftModel
+    from transformers import AutoModelForCausalLM, AutoTokenizer
+
+    model = AutoModelForCausalLM.from_pretrained(
+        base_model,
+        torch_dtype="auto",
+    )
+    merged_model = PeftModel.from_pretrained(model, lora_dir)
+    merged_model = merged_model.merge_and_unload()
+
+    tokenizer = AutoTokenizer.from_pretrained(base_model, use_fast=True)
+
+    merged_model.save_pretrained(output_dir)
+    tokenizer.save_pretrained(output_dir)
 
 
 def main() -> None:
@@ -9,23 +262,27 @@ def main() -> None:
     parser.add_argument("--base_model", required=True)
     parser.add_argument("--lora_dir", required=True)
     parser.add_argument("--output_dir", required=True)
-    args = parser.parse_args()
-
-    base_model = AutoModelForCausalLM.from_pretrained(
-        args.base_model,
-        torch_dtype="auto",
+    parser.add_argument(
+        "--mode",
+        choices=["auto", "streaming", "peft"],
+        default="auto",
+        help="Merge engine; auto streams safetensors shards when available.",
     )
-    merged_model = PeftModel.from_pretrained(base_model, args.lora_dir)
-    merged_model = merged_model.merge_and_unload()
+    args = parser.parse_args()
 
-    tokenizer = AutoTokenizer.from_pretrained(args.base_model, use_fast=True)
+    mode = args.mode
+    base_dir = None
+    if mode != "peft":
+        base_dir = resolve_model_dir(args.base_model)
+        if mode == "auto":
+            mode = "streaming" if list_shards(base_dir) else "peft"
 
-    merged_model.save_pretrained(args.output_dir)
-    tokenizer.save_pretrained(args.output_dir)
+    if mode == "streaming":
+        stats = merge_streaming(base_dir, Path(args.lora_dir), Path(args.output_dir))
+        print(json.dumps(stats, indent=2))
+    else:
+        merge_peft(args.base_model, args.lora_dir, args.output_dir)
 
 
 if __name__ == "__main__":
     main()
-
-
-
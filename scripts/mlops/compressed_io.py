@@ -0,0 +1,185 @@
+"""
+Transparent gzip/zstd for the telemetry and dataset files the scripts read and write.
+
+Reads detect compression from the magic bytes (falling back to the suffix for
+empty or missing files) and stream through a 1 MiB buffer, so a ``.jsonl.gz``
+or ``.jsonl.zst`` iterates line by line exactly like the plain file. Writes pick
+the codec from the suffix (``.gz``, ``.zst``/``.zstd``): ``--output
+train.jsonl.zst`` is all it takes. zstd needs the optional ``zstandard``
+package and compresses on every core; gzip uses the standard library, which is
+single-threaded, at level 6. Paths without a codec open as plain files, and
+``-`` means stdin (decompressed when it carries a gzip/zstd header) or plain
+stdout, so converters chain in shell pipelines.
+"""
+
+import gzip
+import io
+import os
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+from typing import IO, Iterator, Optional, Union
+
+PathLike = Union[str, Path]
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+STDIO = "-"
+SUFFIXES = {".gz": "gzip", ".gzip": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+JSONL_PATTERNS = ("*.jsonl", "*.jsonl.gz", "*.jsonl.zst", "*.jsonl.zstd")
+READ_BUFFER = 1 << 20
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def compression_for_suffix(path: PathLike) -> Optional[str]:
+    return SUFFIXES.get(Path(path).suffix.lower())
+
+
+def is_stdio(path: PathLike) -> bool:
+    return str(path) == STDIO
+
+
+def _codec_for_head(head: bytes) -> Optional[str]:
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def detect_compression(path: PathLike) -> Optional[str]:
+    """``"gzip"``, ``"zstd"`` or None, from the first bytes of ``path``."""
+    try:
+        with open(path, "rb") as handle:
+            head = handle.read(len(ZSTD_MAGIC))
+    except FileNotFoundError:
+        head = b""
+    return _codec_for_head(head) if head else compression_for_suffix(path)
+
+
+def strip_compression_suffix(path: PathLike) -> Path:
+    """``data.jsonl.gz`` -> ``data.jsonl``; other paths unchanged."""
+    path = Path(path)
+    return path.with_suffix("") if compression_for_suffix(path) else path
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError as error:
+        raise ImportError("zstd files need the zstandard package: pip install zstandard") from error
+    return zstandard
+
+
+def _open_file(path: PathLike, mode: str, codec: Optional[str], level: Optional[int]) -> IO[bytes]:
+    if codec is None:
+        return open(path, mode, buffering=READ_BUFFER)
+    if codec == "gzip":
+        if mode == "rb":
+            return io.BufferedReader(gzip.open(path, "rb"), READ_BUFFER)
+        return gzip.open(path, mode, compresslevel=GZIP_LEVEL if level is None else level)
+    zstandard = _zstandard()
+    raw = open(path, mode)
+    if mode == "rb":
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            raw, read_size=READ_BUFFER, read_across_frames=True, closefd=True
+        )
+        return io.BufferedReader(reader, READ_BUFFER)
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL if level is None else level, threads=-1)
+    return compressor.stream_writer(raw, closefd=True)
+
+
+def _open_stdio(mode: str) -> IO[bytes]:
+    """stdin (decompressed if it starts with a gzip/zstd header) or plain stdout, left open on close."""
+    if mode != "rb":
+        sys.stdout.flush()
+        return open(sys.stdout.fileno(), "wb", buffering=READ_BUFFER, closefd=False)
+    raw = open(sys.stdin.fileno(), "rb", buffering=READ_BUFFER, closefd=False)
+    codec = _codec_for_head(raw.peek(len(ZSTD_MAGIC))[: len(ZSTD_MAGIC)])
+    if codec == "gzip":
+        return io.BufferedReader(gzip.GzipFile(fileobj=raw, mode="rb"), READ_BUFFER)
+    if codec == "zstd":
+        reader = _zstandard().ZstdDecompressor().stream_reader(
+            raw, read_size=READ_BUFFER, read_across_frames=True, closefd=False
+        )
+        return io.BufferedReader(reader, READ_BUFFER)
+    return raw
+
+
+def open_binary(path: PathLike, mode: str = "rb", level: Optional[int] = None) -> IO[bytes]:
+    """Decompressing reader (``rb``) or compressing writer (``wb``/``ab``) for ``path``; ``-`` is stdin/stdout."""
+    if mode not in {"rb", "wb", "ab"}:
+        raise ValueError(f"Unsupported mode {mode!r}")
+    if is_stdio(path):
+        return _open_stdio(mode)
+    codec = detect_compression(path) if mode == "rb" else compression_for_suffix(path)
+    return _open_file(path, mode, codec, level)
+
+
+def skip_to(handle: IO[bytes], offset: int) -> None:
+    """Move a fresh reader to ``offset``, decompressing forward when it cannot seek."""
+    if handle.seekable():
+        handle.seek(offset)
+        return
+    remaining = offset
+    while remaining > 0:
+        chunk = handle.read(min(remaining, READ_BUFFER))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+
+
+def open_text(
+    path: PathLike,
+    mode: str = "r",
+    encoding: str = "utf-8",
+    errors: Optional[str] = None,
+    level: Optional[int] = None,
+) -> IO[str]:
+    """``open(path, mode, encoding=...)`` with compression chosen as in ``open_binary``."""
+    if mode not in {"r", "w", "a"}:
+        raise ValueError(f"Unsupported mode {mode!r}")
+    if not is_stdio(path):
+        codec = detect_compression(path) if mode == "r" else compression_for_suffix(path)
+        if codec is None:
+            return open(path, mode, encoding=encoding, errors=errors, buffering=READ_BUFFER)
+    return io.TextIOWrapper(open_binary(path, mode + "b", level), encoding=encoding, errors=errors)
+
+
+@contextmanager
+def open_output(path: PathLike, level: Optional[int] = None) -> Iterator[IO[str]]:
+    """
+    Text writer for a dataset at ``path``, or stdout for ``-``. Files are
+    written to a hidden ``.partial`` sibling and renamed into place when the
+    block exits cleanly, so a run that fails midway (a ``--max-records``
+    overflow, a strict-mode error) leaves no truncated dataset behind.
+
+    Stdout cannot be rolled back: lines written before such a failure stay in
+    the stream, and the nonzero exit status is the only sign that the output
+    is partial. Pipelines that write to ``-`` should run under ``set -o
+    pipefail``.
+    """
+    if is_stdio(path):
+        try:
+            with open_text(path, "w") as handle:
+                yield handle
+        except BrokenPipeError:
+            # The reader went away (``| head``): stop quietly, as Unix filters do.
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            raise SystemExit(1)
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(f".{path.name}.partial")
+    handle = io.TextIOWrapper(
+        _open_file(partial, "wb", compression_for_suffix(path), level), encoding="utf-8"
+    )
+    try:
+        yield handle
+        handle.close()
+        os.replace(partial, path)
+    except BaseException:
+        handle.close()
+        partial.unlink(missing_ok=True)
+        raise
@@ -0,0 +1,305 @@
+"""
+Stream several JSONL datasets as one weighted, shuffled training mixture.
+
+A mixture is a JSON file listing sources (harvested pretrain text, SFT
+records, tool-call traces; plain, ``.gz`` or ``.zst``) with relative weights::
+
+    {"seed": 13, "shuffle_buffer": 10000,
+     "sources": [
+       {"name": "fr_web", "path": "harvest/fr.jsonl.zst", "weight": 0.6},
+       {"name": "sft", "path": "sft.jsonl", "weight": 0.3, "repeat": true},
+       {"name": "tool_calls", "path": "tool_calls.jsonl.gz", "weight": 0.1, "repeat": true}]}
+
+Relative paths resolve against the mixture file. Each draw picks a source
+with probability proportional to its weight and reads that source's next
+line, so only one line per source is in flight. A ``repeat`` source rewinds
+when it runs out; the others drop out and the remaining weights renormalize.
+The mixture ends when every source is exhausted (never, if any repeats), and
+iterating again starts the next epoch. Drawn lines pass through a shuffle
+buffer of ``shuffle_buffer`` lines, so memory is bounded by the buffer and
+not by the datasets.
+
+Every random choice comes from one ``random.Random`` seeded by ``seed`` and
+the epoch, so a mixture is reproducible. ``state_dict()`` captures the
+per-source offsets (in decompressed bytes), the generator state and the
+buffered lines; ``load_state_dict()`` resumes at the exact next record.
+Trainers save it next to their checkpoints as ``mixture_state.json``. Records
+a data loader had already prefetched when the state was saved go into its
+``replay`` list and come out first after a resume, so none is skipped.
+
+``mixture_dataset.MixtureDataset`` wraps a mixer as a torch
+``IterableDataset``; this module does not need torch. The CLI writes a
+mixture to JSONL, e.g. to preview it::
+
+    dataset_mixer.py --mixture mix.json --output - --limit 1000 | head
+"""
+
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from typing import IO, Iterator, Optional, Sequence
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import PathLike, open_binary, open_output, skip_to  # noqa: E402
+
+MIXTURE_STATE_FORMAT = "mixture_state_v1"
+MIXTURE_STATE_FILE = "mixture_state.json"
+DEFAULT_SHUFFLE_BUFFER = 10_000
+DEFAULT_SEED = 13
+
+
+def load_mixture(path: PathLike) -> dict:
+    """Read and validate a mixture file, resolving source paths against it."""
+    path = Path(path)
+    if not path.is_file():
+        raise FileNotFoundError(f"Mixture not found: {path}")
+    config = json.loads(path.read_text(encoding="utf-8"))
+    sources = config.get("sources")
+    if not isinstance(sources, list) or not sources:
+        raise ValueError(f"Mixture {path} must list at least one source")
+    resolved = []
+    names = set()
+    for source in sources:
+        if not isinstance(source, dict) or not source.get("path"):
+            raise ValueError(f"Every mixture source needs a path: {source!r}")
+        source_path = Path(source["path"])
+        if not source_path.is_absolute():
+            source_path = path.parent / source_path
+        if not source_path.is_file():
+            raise FileNotFoundError(f"Mixture source not found: {source_path}")
+        name = source.get("name") or source_path.name
+        if name in names:
+            raise ValueError(f"Duplicate mixture source name: {name}")
+        names.add(name)
+        weight = source.get("weight", 1.0)
+        if not isinstance(weight, (int, float)) or weight <= 0:
+            raise ValueError(f"Weight for {name} must be a positive number")
+        resolved.append({"name": name, "path": str(source_path), "weight": float(weight), "repeat": bool(source.get("repeat", False))})
+    shuffle_buffer = config.get("shuffle_buffer", DEFAULT_SHUFFLE_BUFFER)
+    if not isinstance(shuffle_buffer, int) or shuffle_buffer < 1:
+        raise ValueError("shuffle_buffer must be a positive integer (1 disables shuffling)")
+    return {"sources": resolved, "shuffle_buffer": shuffle_buffer, "seed": config.get("seed", DEFAULT_SEED)}
+
+
+def record_kind(record: dict) -> Optional[str]:
+    """``"sft"``, ``"tool_call"`` or ``"text"`` from the fields a record carries."""
+    if "instruction" in record:
+        return "sft"
+    if "tool_name" in record:
+        return "tool_call"
+    if isinstance(record.get("text"), str):
+        return "text"
+    return None
+
+
+def record_text(record: dict) -> Optional[str]:
+    """Plain text for embedding training: the text, the SFT exchange, or the query of a tool call."""
+    kind = record_kind(record)
+    if kind == "text":
+        text = record["text"]
+    elif kind == "sft":
+        text = "\n".join(part for part in (record.get("instruction"), record.get("expected_answer")) if isinstance(part, str))
+    elif kind == "tool_call":
+        text = record.get("query")
+    else:
+        return None
+    return text if isinstance(text, str) and text.strip() else None
+
+
+class _SourceReader:
+    def __init__(self, spec: dict):
+        self.name = spec["name"]
+        self.path = spec["path"]
+        self.weight = spec["weight"]
+        self.repeat = spec["repeat"]
+        self.offset = 0
+        self.passes = 0
+        self.exhausted = False
+        self._handle: Optional[IO[bytes]] = None
+
+    def _read_line(self) -> bytes:
+        if self._handle is None:
+            self._handle = open_binary(self.path)
+            skip_to(self._handle, self.offset)
+        line = self._handle.readline()
+        self.offset += len(line)
+        return line
+
+    def next_line(self) -> Optional[str]:
+        """The next non-blank line, rewinding a ``repeat`` source once per call at most."""
+        rewound = False
+        while True:
+            line = self._read_line()
+            if not line:
+                if not self.repeat or rewound:
+                    # A repeat source that rewinds into nothing is empty.
+                    self.exhausted = True
+                    return None
+                self.close()
+                self.offset = 0
+                self.passes += 1
+                rewound = True
+                continue
+            if line.strip():
+                return line.decode("utf-8").rstrip("\r\n")
+
+    def reset(self) -> None:
+        self.close()
+        self.offset = 0
+        self.passes = 0
+        self.exhausted = False
+
+    def state(self) -> dict:
+        return {"offset": self.offset, "passes": self.passes, "exhausted": self.exhausted}
+
+    def load_state(self, state: dict) -> None:
+        self.close()
+        self.offset = int(state.get("offset", 0))
+        self.passes = int(state.get("passes", 0))
+        self.exhausted = bool(state.get("exhausted", False))
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+class DatasetMixer:
+    def __init__(self, config: dict):
+        self.config = config
+        self.shuffle_buffer = config["shuffle_buffer"]
+        self.seed = config["seed"]
+        self.sources = [_SourceReader(spec) for spec in config["sources"]]
+        self._by_name = {source.name: source for source in self.sources}
+        self._start_epoch(0)
+
+    def _start_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+        self.yielded = 0
+        self.rng = random.Random(f"{self.seed}:{epoch}")
+        self.buffer: list[tuple[str, str]] = []
+        self.replay: list[tuple[str, str]] = []
+        for source in self.sources:
+            source.reset()
+
+    def _draw(self) -> Optional[tuple[str, str]]:
+        while True:
+            active = [source for source in self.sources if not source.exhausted]
+            if not active:
+                return None
+            source = self.rng.choices(active, weights=[source.weight for source in active])[0]
+            line = source.next_line()
+            if line is not None:
+                return source.name, line
+
+    def _emit(self, name: str, line: str) -> tuple[str, dict]:
+        record = json.loads(line)
+        if not isinstance(record, dict):
+            raise ValueError(f"Mixture source {name} has a line that is not a JSON object")
+        self.yielded += 1
+        return name, record
+
+    def _take(self) -> tuple[str, dict]:
+        # Swap a random slot to the end so the pop is O(1).
+        index = self.rng.randrange(len(self.buffer))
+        self.buffer[index], self.buffer[-1] = self.buffer[-1], self.buffer[index]
+        return self._emit(*self.buffer.pop())
+
+    def __iter__(self) -> Iterator[tuple[str, dict]]:
+        """``(source name, record)`` pairs from the current position to the end of the epoch."""
+        try:
+            while self.replay:
+                yield self._emit(*self.replay.pop(0))
+            while True:
+                drawn = self._draw()
+                if drawn is None:
+                    break
+                self.buffer.append(drawn)
+                if len(self.buffer) >= self.shuffle_buffer:
+                    yield self._take()
+            while self.buffer:
+                yield self._take()
+            self._start_epoch(self.epoch + 1)
+        finally:
+            for source in self.sources:
+                source.close()
+
+    def state_dict(self, unconsumed: Sequence[tuple[str, dict]] = ()) -> dict:
+        """The current position, less ``unconsumed`` (the last records yielded, oldest first)."""
+        version, internal, gauss = self.rng.getstate()
+        replay = [[name, json.dumps(record, ensure_ascii=False)] for name, record in unconsumed]
+        return {
+            "format": MIXTURE_STATE_FORMAT,
+            "seed": self.seed,
+            "epoch": self.epoch,
+            "yielded": self.yielded - len(unconsumed),
+            "rng": [version, list(internal), gauss],
+            "sources": {source.name: source.state() for source in self.sources},
+            "buffer": [list(entry) for entry in self.buffer],
+            "replay": replay + [list(entry) for entry in self.replay],
+        }
+
+    def load_state_dict(self, state: dict) -> None:
+        if state.get("format") != MIXTURE_STATE_FORMAT:
+            raise ValueError(f"Unsupported mixture state format: {state.get('format')!r}")
+        unknown = set(state.get("sources", {})) - set(self._by_name)
+        if unknown:
+            raise ValueError(f"Mixture state names sources missing from the mixture: {', '.join(sorted(unknown))}")
+        self._start_epoch(int(state.get("epoch", 0)))
+        self.yielded = int(state.get("yielded", 0))
+        version, internal, gauss = state["rng"]
+        self.rng.setstate((version, tuple(internal), gauss))
+        # Sources added to the mixture since the state was saved start from the top.
+        for name, source_state in state.get("sources", {}).items():
+            self._by_name[name].load_state(source_state)
+        self.buffer = [(name, line) for name, line in state.get("buffer", [])]
+        self.replay = [(name, line) for name, line in state.get("replay", [])]
+
+    def save_state(self, path: PathLike, unconsumed: Sequence[tuple[str, dict]] = ()) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.state_dict(unconsumed)), encoding="utf-8")
+
+    def load_state(self, path: PathLike) -> None:
+        self.load_state_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Write a weighted, shuffled mixture of JSONL datasets.")
+    parser.add_argument("--mixture", required=True, help="Mixture JSON listing sources and weights.")
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many records (required when a source repeats).")
+    parser.add_argument("--state-in", default=None, help="Resume from a saved mixture state.")
+    parser.add_argument("--state-out", default=None, help="Write the mixture state after the last record.")
+    args = parser.parse_args()
+
+    config = load_mixture(args.mixture)
+    if args.limit is None and any(source["repeat"] for source in config["sources"]):
+        raise ValueError("--limit is required when a mixture source repeats")
+    mixer = DatasetMixer(config)
+    if args.state_in:
+        mixer.load_state(args.state_in)
+
+    counts = {source["name"]: 0 for source in config["sources"]}
+    written = 0
+    with open_output(args.output) as handle:
+        if args.limit is None or args.limit > 0:
+            for name, record in mixer:
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+                counts[name] += 1
+                written += 1
+                if written == args.limit:
+                    break
+
+    if args.state_out:
+        mixer.save_state(args.state_out)
+    summary = ", ".join(f"{name}={count}" for name, count in counts.items())
+    print(f"Wrote {written} mixed records to {args.output} ({summary})", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
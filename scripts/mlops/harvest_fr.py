@@ -2,6 +2,7 @@ import argparse
 import json
 import os
 import sys
+from pathlib import Path
 from typing import Dict, Iterable
 
 os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
@@ -10,6 +11,11 @@ os.environ.setdefault("MKL_NUM_THREADS", "1")
 
 from datasets import load_dataset
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import open_text  # noqa: E402
+
 
 def load_manifest(path: str) -> dict:
     if not os.path.isfile(path):
@@ -55,7 +61,7 @@ def harvest_sources(
     os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
 
     total_written = 0
-    with open(output_path, "w", encoding="utf-8") as handle:
+    with open_text(output_path, "w") as handle:
         for source in sources:
             written_for_source = 0
             for record in stream_source_records(source):
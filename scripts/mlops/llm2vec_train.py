@@ -19,6 +19,7 @@ import json
 import math
 import os
 import random
+import sys
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
@@ -32,6 +33,17 @@ from transformers import AutoTokenizer, AutoModelForCausalLM, BitsAndBytesConfig
 
 from peft import PeftModel
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.dataset_mixer import (  # noqa: E402
+    MIXTURE_STATE_FILE,
+    DatasetMixer,
+    load_mixture,
+    record_text,
+)
+from scripts.mlops.mixture_dataset import MixtureDataset  # noqa: E402
+
 
 def _bnb_available() -> bool:
     try:
@@ -214,6 +226,9 @@ def main() -> int:
 
     # Optional explicit data source (if not provided we infer from runs/<id>/datasets/)
     ap.add_argument("--train_file", default=None)
+    # Or stream a weighted mixture of JSONL sources with flat memory (see dataset_mixer.py)
+    ap.add_argument("--mixture", default=None)
+    ap.add_argument("--mixture_state", default=None, help="mixture_state.json from an earlier run to continue from")
 
     args = ap.parse_args()
 
@@ -229,8 +244,14 @@ def main() -> int:
     out_dir.mkdir(parents=True, exist_ok=True)
 
     lora_dir = Path(args.lora_dir).resolve()
-    train_file = Path(args.train_file).resolve() if args.train_file else _default_train_file_from_lora(lora_dir)
-    if train_file is None or not Path(train_file).exists():
+    mixture = load_mixture(args.mixture) if args.mixture else None
+    if mixture is not None:
+        train_file = None
+        if args.max_steps <= 0 and any(source["repeat"] for source in mixture["sources"]):
+            raise SystemExit("[llm2vec] A mixture with repeating sources never ends; set --max_steps > 0.")
+    else:
+        train_file = Path(args.train_file).resolve() if args.train_file else _default_train_file_from_lora(lora_dir)
+    if mixture is None and (train_file is None or not Path(train_file).exists()):
         raise SystemExit(f"[llm2vec] Could not find train_file. Provide --train_file or ensure runs/<id>/datasets/*.jsonl exists. lora_dir={lora_dir}")
 
     use_cuda = _cuda()
@@ -240,7 +261,7 @@ def main() -> int:
 
     print(f"[llm2vec] base={args.base_model}")
     print(f"[llm2vec] lora_dir={lora_dir}")
-    print(f"[llm2vec] train_file={train_file}")
+    print(f"[llm2vec] train_file={train_file}" if mixture is None else f"[llm2vec] mixture={args.mixture}")
     print(f"[llm2vec] cuda={use_cuda} bnb={bnb_ok} q4={use_4bit} dtype={dtype} cc={_cc()[0]}.{_cc()[1]}")
     print(f"[llm2vec] epochs={args.epochs} batch_size={args.batch_size} lr={args.lr} max_len={args.max_len} max_steps={args.max_steps}")
 
@@ -293,29 +314,36 @@ def main() -> int:
     device = torch.device("cuda:0" if use_cuda else "cpu")
     embedder.to(device)
 
-    # Load dataset
-    ds = load_dataset("json", data_files={"train": str(train_file)}, split="train")
-
-    # Expect "text" column (your normalized dataset has it), otherwise stringify record
-    texts: List[str] = []
-    if "text" in ds.column_names:
-        texts = [t for t in ds["text"] if isinstance(t, str)]
+    if mixture is not None:
+        # Streamed and shuffled by the mixer's buffer; texts are never all in memory.
+        mixer = DatasetMixer(mixture)
+        if args.mixture_state:
+            mixer.load_state(args.mixture_state)
+        data = MixtureDataset(mixer, record_text)
     else:
-        # fallback: stringify rows
-        for ex in ds:
-            try:
-                texts.append(ex.get("text") if isinstance(ex, dict) else str(ex))
-            except Exception:
-                texts.append(str(ex))
-
-    data = TextDataset(texts)
-    if len(data) < 2:
-        raise SystemExit(f"[llm2vec] Not enough training texts: {len(data)}")
+        # Load dataset
+        ds = load_dataset("json", data_files={"train": str(train_file)}, split="train")
+
+        # Expect "text" column (your normalized dataset has it), otherwise stringify record
+        texts: List[str] = []
+        if "text" in ds.column_names:
+            texts = [t for t in ds["text"] if isinstance(t, str)]
+        else:
+            # fallback: stringify rows
+            for ex in ds:
+                try:
+                    texts.append(ex.get("text") if isinstance(ex, dict) else str(ex))
+                except Exception:
+                    texts.append(str(ex))
+
+        data = TextDataset(texts)
+        if len(data) < 2:
+            raise SystemExit(f"[llm2vec] Not enough training texts: {len(data)}")
 
     loader = DataLoader(
         data,
         batch_size=args.batch_size,
-        shuffle=True,
+        shuffle=mixture is None,
         drop_last=True if args.batch_size > 1 else False,
         collate_fn=_collate_two_views(tokenizer, args.max_len),
     )
@@ -376,12 +404,16 @@ def main() -> int:
     tokenizer.save_pretrained(str(out_dir / "tokenizer"))
 
     torch.save(embedder.proj.state_dict(), str(out_dir / "projection.pt"))
+    if mixture is not None:
+        # The loader has no workers, so every example yielded so far was trained on.
+        mixer.save_state(out_dir / MIXTURE_STATE_FILE)
 
     cfg = {
         "base_model": args.base_model,
         "base_model_revision": args.base_model_revision,
         "lora_source": str(lora_dir),
-        "train_file": str(train_file),
+        "train_file": str(train_file) if train_file else None,
+        "mixture": str(Path(args.mixture).resolve()) if args.mixture else None,
         "proj_dim": args.proj_dim,
         "pooling": "mean_last_hidden",
         "normalize": True,
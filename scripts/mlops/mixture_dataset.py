@@ -0,0 +1,63 @@
+"""
+Torch ``IterableDataset`` over a ``dataset_mixer.DatasetMixer``, for the trainers.
+
+Kept apart from the mixer so its CLI runs without importing torch.
+"""
+
+import sys
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from torch.utils.data import IterableDataset, get_worker_info
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import PathLike  # noqa: E402
+from scripts.mlops.dataset_mixer import DatasetMixer  # noqa: E402
+
+# Yielded records remembered, to hand back those a trainer prefetched but never trained on.
+MAX_REPLAY = 4096
+
+
+class MixtureDataset(IterableDataset):
+    """
+    A mixer as a torch ``IterableDataset``. ``transform`` maps each record to a
+    training example; returning None skips the record. Use it with
+    ``num_workers=0``: the mixer state, ``examples`` and the replay buffer
+    must live in the trainer's process, and any worker process, even a single
+    one, advances its own copy instead. ``examples`` counts the examples
+    yielded so far, which lets a trainer tell how many of them it has not
+    consumed yet.
+    """
+
+    def __init__(self, mixer: DatasetMixer, transform: Optional[Callable[[dict], Any]] = None):
+        self.mixer = mixer
+        self.transform = transform
+        self.examples = 0
+        self._recent: deque[tuple[str, dict]] = deque(maxlen=MAX_REPLAY)
+
+    def __iter__(self) -> Iterator[Any]:
+        if get_worker_info() is not None:
+            raise ValueError("MixtureDataset needs num_workers=0; a worker process would advance a copy of the mixer")
+        for name, record in self.mixer:
+            example = self.transform(record) if self.transform else record
+            if example is not None:
+                self._recent.append((name, record))
+                self.examples += 1
+                yield example
+
+    def _unconsumed(self, pending: int) -> list[tuple[str, dict]]:
+        pending = max(0, min(pending, len(self._recent)))
+        return list(self._recent)[len(self._recent) - pending :]
+
+    def state_dict(self, pending: int = 0) -> dict:
+        """Mixer state with the last ``pending`` examples (prefetched, not yet trained on) queued for replay."""
+        return self.mixer.state_dict(self._unconsumed(pending))
+
+    def save_state(self, path: PathLike, pending: int = 0) -> None:
+        self.mixer.save_state(path, self._unconsumed(pending))
+
+    def load_state_dict(self, state: dict) -> None:
+        self.mixer.load_state_dict(state)
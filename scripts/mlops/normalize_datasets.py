@@ -1,8 +1,13 @@
 import argparse
 import json
-import os
+import sys
 from pathlib import Path
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import is_stdio, open_output, open_text  # noqa: E402
+
 
 def normalize_sft(record: dict) -> dict:
     required = {"instruction", "expected_answer"}
@@ -32,8 +37,8 @@ def normalize_pretrain(record: dict) -> dict:
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Normalize dataset JSONL files.")
-    parser.add_argument("--input", required=True)
-    parser.add_argument("--output", required=True)
+    parser.add_argument("--input", required=True, help="Input JSONL, or - for stdin.")
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
     parser.add_argument(
         "--mode",
         choices=["sft", "pretrain"],
@@ -43,15 +48,11 @@ def main() -> None:
     args = parser.parse_args()
 
     input_path = Path(args.input)
-    if not input_path.exists():
+    if not is_stdio(input_path) and not input_path.exists():
         raise FileNotFoundError(f"Input not found: {input_path}")
 
-    os.makedirs(Path(args.output).parent, exist_ok=True)
-
     normalizer = normalize_sft if args.mode == "sft" else normalize_pretrain
-    with input_path.open("r", encoding="utf-8") as source, open(
-        args.output, "w", encoding="utf-8"
-    ) as target:
+    with open_text(input_path) as source, open_output(args.output) as target:
         for line in source:
             if not line.strip():
                 continue
@@ -59,7 +60,7 @@ def main() -> None:
             normalized = normalizer(record)
             target.write(json.dumps(normalized, ensure_ascii=False) + "\n")
 
-    print(f"Normalized dataset written to {args.output}")
+    print(f"Normalized dataset written to {args.output}", file=sys.stderr)
 
 
 if __name__ == "__main__":
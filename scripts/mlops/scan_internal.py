@@ -1,9 +1,15 @@
 import argparse
 import json
 import os
+import sys
 from collections import Counter
 from pathlib import Path
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import JSONL_PATTERNS, open_text  # noqa: E402
+
 
 def scan_jsonl(path: Path, max_samples: int) -> dict:
     stats = {
@@ -15,7 +21,7 @@ def scan_jsonl(path: Path, max_samples: int) -> dict:
         "sample": [],
     }
     total_length = 0
-    with path.open("r", encoding="utf-8") as handle:
+    with open_text(path) as handle:
         for line in handle:
             if not line.strip():
                 continue
@@ -44,8 +50,9 @@ def main() -> None:
         raise FileNotFoundError(f"Data directory not found: {data_dir}")
 
     reports = []
-    for path in data_dir.rglob("*.jsonl"):
-        reports.append(scan_jsonl(path, args.max_samples))
+    for pattern in JSONL_PATTERNS:
+        for path in data_dir.rglob(pattern):
+            reports.append(scan_jsonl(path, args.max_samples))
 
     output_path = Path(args.output)
     os.makedirs(output_path.parent, exist_ok=True)
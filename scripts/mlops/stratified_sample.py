@@ -0,0 +1,219 @@
+"""
+Balance SFT or tool-call JSONL by reservoir-sampling each stratum to a quota.
+
+Records are grouped by ``--by`` fields (default ``tool_name,prompt_version,
+model_id,success``) and each group keeps a uniform sample of at most its quota
+(Algorithm R), in one pass. Only kept lines are held, so memory is bounded by
+the sum of quotas over the strata seen. Each stratum draws from its own
+generator seeded with ``--seed`` and the stratum key, so a stratum's sample
+does not depend on how other strata interleave with it. Kept lines are written
+unchanged in input order.
+
+SFT records have no top-level ``tool_name``/``success``; these come from
+``expected_tool_call.tools`` instead (names joined with ``+``, success when
+every call succeeded, ``(none)`` without tool calls).
+
+Quotas are ``--quota`` for every stratum, overridden by ``--quotas`` JSON::
+
+    {"default": 2000, "strata": {"tool_name=web_search": 500,
+                                 "tool_name=set_brightness,success=false": 0}}
+
+A stratum takes the matching override with the most conditions. Typical use
+after a converter::
+
+    telemetry_to_tool_calls.py --telemetry t.jsonl.gz --output - |
+        stratified_sample.py --input - --output balanced.jsonl --quotas q.json
+"""
+
+import argparse
+import json
+import random
+import sys
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import is_stdio, open_output, open_text  # noqa: E402
+
+DEFAULT_FIELDS = ("tool_name", "prompt_version", "model_id", "success")
+DEFAULT_QUOTA = 1000
+DEFAULT_SEED = 13
+MISSING = "(none)"
+
+
+def _sft_tools(record: dict) -> Optional[list]:
+    expected = record.get("expected_tool_call")
+    if isinstance(expected, dict) and isinstance(expected.get("tools"), list):
+        return [tool for tool in expected["tools"] if isinstance(tool, dict)]
+    return None
+
+
+def field_value(record: dict, field: str) -> str:
+    value = record.get(field)
+    if value is None and field in {"tool_name", "success"}:
+        tools = _sft_tools(record)
+        if tools:
+            if field == "tool_name":
+                value = "+".join(sorted({str(tool.get("name")) for tool in tools}))
+            else:
+                value = all(tool.get("success") is True for tool in tools)
+    if value is None:
+        return MISSING
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+
+
+def stratum_key(record: dict, fields: Iterable[str]) -> tuple[str, ...]:
+    return tuple(field_value(record, field) for field in fields)
+
+
+def _is_quota(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 0
+
+
+def parse_quotas(config: dict, fields: tuple[str, ...]) -> tuple[Optional[int], list[tuple[dict, int]]]:
+    """``(default, [(conditions, quota)])`` from a ``--quotas`` document."""
+    default = config.get("default")
+    if default is not None and not _is_quota(default):
+        raise ValueError("Default quota must be a non-negative integer")
+    overrides = []
+    for spec, quota in (config.get("strata") or {}).items():
+        conditions = {}
+        for part in spec.split(","):
+            field, sep, value = part.partition("=")
+            field = field.strip()
+            if not sep or field not in fields:
+                raise ValueError(f"Quota key {spec!r} must use field=value with fields from {', '.join(fields)}")
+            conditions[field] = value.strip()
+        if not _is_quota(quota):
+            raise ValueError(f"Quota for {spec!r} must be a non-negative integer")
+        overrides.append((conditions, quota))
+    # Most specific first; ties keep file order.
+    overrides.sort(key=lambda item: -len(item[0]))
+    return default, overrides
+
+
+class StratifiedReservoir:
+    def __init__(
+        self,
+        fields: tuple[str, ...] = DEFAULT_FIELDS,
+        default_quota: int = DEFAULT_QUOTA,
+        overrides: Optional[list[tuple[dict, int]]] = None,
+        seed: int = DEFAULT_SEED,
+    ):
+        self.fields = fields
+        self.default_quota = default_quota
+        self.overrides = overrides or []
+        self.seed = seed
+        self.strata: dict[tuple[str, ...], dict[str, Any]] = {}
+
+    def quota_for(self, key: tuple[str, ...]) -> int:
+        values = dict(zip(self.fields, key))
+        for conditions, quota in self.overrides:
+            if all(values[field] == value for field, value in conditions.items()):
+                return quota
+        return self.default_quota
+
+    def add(self, index: int, record: dict, line: str) -> None:
+        key = stratum_key(record, self.fields)
+        stratum = self.strata.get(key)
+        if stratum is None:
+            stratum = self.strata[key] = {
+                "quota": self.quota_for(key),
+                "seen": 0,
+                "kept": [],
+                "rng": random.Random(f"{self.seed}:{json.dumps(key)}"),
+            }
+        stratum["seen"] += 1
+        quota = stratum["quota"]
+        kept = stratum["kept"]
+        if len(kept) < quota:
+            kept.append((index, line))
+            return
+        slot = stratum["rng"].randrange(stratum["seen"])
+        if slot < quota:
+            kept[slot] = (index, line)
+
+    def sample(self) -> list[str]:
+        """Kept lines across strata, in input order."""
+        merged = [entry for stratum in self.strata.values() for entry in stratum["kept"]]
+        merged.sort()
+        return [line for _index, line in merged]
+
+    def report(self) -> dict:
+        rows = [
+            {
+                **dict(zip(self.fields, key)),
+                "seen": stratum["seen"],
+                "kept": len(stratum["kept"]),
+                "quota": stratum["quota"],
+            }
+            for key, stratum in sorted(self.strata.items())
+        ]
+        return {
+            "fields": list(self.fields),
+            "seed": self.seed,
+            "records": sum(row["seen"] for row in rows),
+            "kept": sum(row["kept"] for row in rows),
+            "strata": rows,
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reservoir-sample JSONL records to per-stratum quotas.")
+    parser.add_argument("--input", required=True, help="SFT or tool call JSONL, or - for stdin.")
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
+    parser.add_argument("--by", default=",".join(DEFAULT_FIELDS), help="Comma-separated stratum fields.")
+    parser.add_argument("--quota", type=int, default=None, help=f"Records kept per stratum (default {DEFAULT_QUOTA}).")
+    parser.add_argument("--quotas", default=None, help="JSON with a default quota and field=value overrides.")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--report", default=None, help="Optional JSON report of seen/kept counts per stratum.")
+    args = parser.parse_args()
+
+    fields = tuple(field.strip() for field in args.by.split(",") if field.strip())
+    if not fields:
+        raise ValueError("--by needs at least one field")
+    default_quota, overrides = None, []
+    if args.quotas:
+        default_quota, overrides = parse_quotas(json.loads(Path(args.quotas).read_text(encoding="utf-8")), fields)
+    if args.quota is not None:
+        default_quota = args.quota
+    if default_quota is None:
+        default_quota = DEFAULT_QUOTA
+    if default_quota < 0:
+        raise ValueError("--quota must be non-negative")
+
+    input_path = Path(args.input)
+    if not is_stdio(input_path) and not input_path.exists():
+        raise FileNotFoundError(f"Input not found: {input_path}")
+
+    reservoir = StratifiedReservoir(fields, default_quota, overrides, args.seed)
+    with open_text(input_path) as handle:
+        for index, line in enumerate(handle):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f"Line {index + 1} is not a JSON object")
+            reservoir.add(index, record, line if line.endswith("\n") else line + "\n")
+
+    lines = reservoir.sample()
+    with open_output(args.output) as handle:
+        handle.writelines(lines)
+
+    report = reservoir.report()
+    if args.report:
+        report_path = Path(args.report)
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        report_path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(
+        f"Kept {report['kept']} of {report['records']} records across {len(report['strata'])} strata",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
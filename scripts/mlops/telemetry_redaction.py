@@ -1,9 +1,15 @@
 import argparse
 import json
 import re
+import sys
 from pathlib import Path
 from typing import Any
 
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import is_stdio, open_output, open_text  # noqa: E402
+
 MAX_VALUE_LENGTH = 2000
 
 
@@ -120,8 +126,8 @@ def main() -> None:
     parser = argparse.ArgumentParser(
         description="Redact telemetry JSONL and validate against the schema."
     )
-    parser.add_argument("--input", required=True)
-    parser.add_argument("--output", required=True)
+    parser.add_argument("--input", required=True, help="Telemetry JSONL, or - for stdin.")
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
     parser.add_argument(
         "--strict",
         action="store_true",
@@ -130,18 +136,14 @@ def main() -> None:
     args = parser.parse_args()
 
     input_path = Path(args.input)
-    if not input_path.exists():
+    if not is_stdio(input_path) and not input_path.exists():
         raise FileNotFoundError(f"Telemetry not found: {input_path}")
 
     schema = load_telemetry_schema()
     patterns = load_redaction_patterns()
     errors = 0
-    output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    with input_path.open("r", encoding="utf-8") as handle, output_path.open(
-        "w", encoding="utf-8"
-    ) as out:
+    with open_text(input_path) as handle, open_output(args.output) as out:
         for line in handle:
             if not line.strip():
                 continue
@@ -158,9 +160,9 @@ def main() -> None:
                 continue
             out.write(stable_dumps(redacted) + "\n")
 
-    print(f"Wrote redacted telemetry to {output_path}")
+    print(f"Wrote redacted telemetry to {args.output}", file=sys.stderr)
     if errors:
-        print(f"Skipped {errors} invalid events")
+        print(f"Skipped {errors} invalid events", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,438 @@
+"""
+Local SQLite store of redacted telemetry for ad-hoc queries.
+
+``ingest`` redacts and schema-checks telemetry JSONL exactly like the
+``telemetry_to_*`` converters, then appends it to an ``events`` table with
+``prompt_hash``, ``query_hash``, ``event_type``, ``tool_name``, ``model_id``,
+``prompt_version`` and timestamp pulled into indexed columns next to the JSON
+payload. Inserts are batched, one transaction per batch, in WAL mode. Each
+source file's byte offset is committed with its batch, so re-running ingest
+appends only new lines; a file whose first bytes changed (rotated or rewritten)
+is read again from the start as a new source. A trailing line without a
+newline is left for the next run unless it already parses. gzip/zstd files
+(see compressed_io.py) are tracked by decompressed offset.
+
+``query`` filters on the indexed columns and prints matching events as JSONL,
+a count, or counts grouped by a column, e.g. failed ``web_search`` calls for
+prompt version v1 over the last week::
+
+    telemetry_store.py query --db build/telemetry.sqlite --tool-name web_search \\
+        --prompt-version v1 --failed --since 7d
+
+The converters take ``--store`` instead of ``--telemetry`` and read through
+``TelemetryStore.iter_events``, which pushes their event types and any
+``--since``/``--until``/``--model-id``/``--prompt-version`` filters into SQL.
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import detect_compression, is_stdio, open_binary, open_text, skip_to  # noqa: E402
+from scripts.mlops.telemetry_redaction import (  # noqa: E402
+    load_redaction_patterns,
+    load_telemetry_schema,
+    redact_event,
+    validate_event_schema,
+)
+
+DEFAULT_DB_PATH = Path("build") / "telemetry.sqlite"
+DEFAULT_BATCH_SIZE = 5000
+HEAD_BYTES = 4096
+INDEXED_COLUMNS = ("prompt_hash", "query_hash", "event_type", "tool_name", "model_id", "prompt_version", "ts_ms")
+FILTER_COLUMNS = ("event_type", "tool_name", "model_id", "prompt_version", "prompt_id", "prompt_hash", "query_hash")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    head_sha256 TEXT NOT NULL,
+    head_len INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    events INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    line_offset INTEGER NOT NULL,
+    ts TEXT,
+    ts_ms INTEGER,
+    event_type TEXT,
+    prompt_id TEXT,
+    prompt_version TEXT,
+    model_id TEXT,
+    prompt_hash TEXT,
+    query_hash TEXT,
+    tool_name TEXT,
+    success INTEGER,
+    latency_ms REAL,
+    payload TEXT NOT NULL,
+    UNIQUE (source_id, line_offset)
+);
+"""
+
+_RELATIVE_RE = re.compile(r"(\d+(?:\.\d+)?)([smhdw])")
+_RELATIVE_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+
+def parse_time_ms(value: Any, now: Optional[datetime] = None) -> Optional[int]:
+    """ISO-8601 timestamps (``Z`` allowed, naive means UTC) or ``7d``-style ages, as epoch ms."""
+    if not isinstance(value, str) or not value:
+        return None
+    relative = _RELATIVE_RE.fullmatch(value.strip())
+    if relative:
+        now = now or datetime.now(timezone.utc)
+        delta = timedelta(**{_RELATIVE_UNITS[relative.group(2)]: float(relative.group(1))})
+        return int((now - delta).timestamp() * 1000)
+    try:
+        parsed = datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
+def _number(value: Any) -> Optional[float]:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+
+
+def _text(value: Any) -> Optional[str]:
+    return value if isinstance(value, str) and value else None
+
+
+class TelemetryStore:
+    def __init__(self, path: Path = DEFAULT_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        with self.conn:
+            for column in INDEXED_COLUMNS:
+                self.conn.execute(f"CREATE INDEX IF NOT EXISTS events_{column} ON events ({column})")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "TelemetryStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    # ---------------------------
+    # Ingest
+    # ---------------------------
+
+    def _resume_source(self, path: Path) -> tuple[int, int]:
+        """(source id, byte offset) to continue ``path`` from."""
+        key = str(path.resolve())
+        # Offsets count decompressed bytes, so only plain files can be size-checked.
+        size = None if detect_compression(path) else path.stat().st_size
+        rows = self.conn.execute(
+            "SELECT id, head_sha256, head_len, offset FROM sources WHERE path = ? ORDER BY id DESC", (key,)
+        ).fetchall()
+        for source_id, head_sha256, head_len, offset in rows:
+            if size is not None and offset > size:
+                continue
+            with open_binary(path) as handle:
+                if hashlib.sha256(handle.read(head_len)).hexdigest() == head_sha256:
+                    return source_id, offset
+        now = datetime.now(timezone.utc).isoformat()
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO sources (path, head_sha256, head_len, offset, updated_at) VALUES (?, ?, 0, 0, ?)",
+                (key, hashlib.sha256(b"").hexdigest(), now),
+            )
+        return cursor.lastrowid, 0
+
+    def ingest(self, path: Path, strict: bool = False, batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+        path = Path(path)
+        patterns = load_redaction_patterns()
+        schema = load_telemetry_schema()
+        source_id, offset = self._resume_source(path)
+        counts = {"source_id": source_id, "start_offset": offset, "ingested": 0, "invalid": 0, "unreadable": 0}
+        batch: list[tuple] = []
+
+        def flush(end_offset: int) -> None:
+            with open_binary(path) as head_handle:
+                head = head_handle.read(min(end_offset, HEAD_BYTES))
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO events (source_id, line_offset, ts, ts_ms, event_type, prompt_id, "
+                    "prompt_version, model_id, prompt_hash, query_hash, tool_name, success, latency_ms, payload) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    batch,
+                )
+                self.conn.execute(
+                    "UPDATE sources SET head_sha256 = ?, head_len = ?, offset = ?, events = events + ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (
+                        hashlib.sha256(head).hexdigest(),
+                        len(head),
+                        end_offset,
+                        len(batch),
+                        datetime.now(timezone.utc).isoformat(),
+                        source_id,
+                    ),
+                )
+            batch.clear()
+
+        with open_binary(path) as handle:
+            skip_to(handle, offset)
+            position = offset
+            while True:
+                try:
+                    line = handle.readline()
+                except EOFError:
+                    break  # compressed stream still being written
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    try:
+                        json.loads(line)
+                    except ValueError:
+                        break  # still being written; picked up by the next run
+                line_offset = position
+                position += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    counts["unreadable"] += 1
+                    if strict:
+                        raise ValueError(f"Unreadable telemetry line at byte {line_offset} of {path}")
+                    continue
+                redacted = redact_event(event, patterns) if isinstance(event, dict) else None
+                errors = validate_event_schema(redacted, schema) if redacted is not None else ["not an object"]
+                if errors:
+                    counts["invalid"] += 1
+                    if strict:
+                        raise ValueError(f"Telemetry schema validation failed: {'; '.join(errors)}")
+                    continue
+                success = redacted.get("success")
+                # Index the raw timestamp: redaction patterns can match ISO dates.
+                timestamp = _text(event.get("timestamp"))
+                batch.append(
+                    (
+                        source_id,
+                        line_offset,
+                        timestamp,
+                        parse_time_ms(timestamp),
+                        _text(redacted.get("event_type")),
+                        _text(redacted.get("prompt_id")),
+                        _text(redacted.get("prompt_version")),
+                        _text(redacted.get("model_id")),
+                        _text(redacted.get("prompt_hash")),
+                        _text(redacted.get("query_hash")),
+                        _text(redacted.get("tool_name")),
+                        int(success) if isinstance(success, bool) else None,
+                        _number(redacted.get("latency_ms", redacted.get("latency"))),
+                        json.dumps(redacted, ensure_ascii=False),
+                    )
+                )
+                counts["ingested"] += 1
+                if len(batch) >= batch_size:
+                    flush(position)
+        flush(position)
+        counts["end_offset"] = position
+        return counts
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+
+    def _where(self, filters: dict[str, Any]) -> tuple[str, list]:
+        clauses: list[str] = []
+        params: list = []
+        for column in FILTER_COLUMNS:
+            values = filters.get(column)
+            if values is None:
+                continue
+            values = [values] if isinstance(values, str) else list(values)
+            clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        for key, operator in (("since", ">="), ("until", "<")):
+            bound = filters.get(key)
+            if bound is None:
+                continue
+            bound_ms = bound if isinstance(bound, int) else parse_time_ms(bound)
+            if bound_ms is None:
+                raise ValueError(f"--{key} must be an ISO timestamp or an age like 7d, got {bound!r}")
+            clauses.append(f"ts_ms {operator} ?")
+            params.append(bound_ms)
+        if filters.get("success") is not None:
+            clauses.append("success = ?")
+            params.append(int(bool(filters["success"])))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def iter_events(self, limit: Optional[int] = None, **filters: Any) -> Iterator[dict]:
+        """Stored (redacted) events matching ``filters``, in ingest order."""
+        where, params = self._where(filters)
+        sql = f"SELECT payload FROM events{where} ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for (payload,) in self.conn.execute(sql, params):
+            yield json.loads(payload)
+
+    def count(self, **filters: Any) -> int:
+        where, params = self._where(filters)
+        return self.conn.execute(f"SELECT COUNT(*) FROM events{where}", params).fetchone()[0]
+
+    def count_by(self, column: str, **filters: Any) -> dict[str, int]:
+        if column not in FILTER_COLUMNS + ("success",):
+            raise ValueError(f"cannot group by {column}")
+        where, params = self._where(filters)
+        rows = self.conn.execute(
+            f"SELECT {column}, COUNT(*) FROM events{where} GROUP BY {column} ORDER BY COUNT(*) DESC, {column}",
+            params,
+        )
+        return {str(value): count for value, count in rows}
+
+
+def iter_telemetry(
+    telemetry: Optional[Path] = None,
+    store: Optional[Path] = None,
+    event_types: Optional[Iterable[str]] = None,
+    **filters: Any,
+) -> Iterator[dict]:
+    """
+    Raw telemetry events from a JSONL file, or stored events from ``store``
+    with ``event_types`` and ``filters`` pushed down into SQL. File input is
+    not filtered; converters apply their own checks either way.
+    """
+    if store is not None:
+        if not Path(store).exists():
+            raise FileNotFoundError(f"Telemetry store not found: {store}")
+        with TelemetryStore(Path(store)) as db:
+            if event_types is not None:
+                filters["event_type"] = list(event_types)
+            yield from db.iter_events(**{key: value for key, value in filters.items() if value is not None})
+        return
+    if telemetry is None or not (is_stdio(telemetry) or Path(telemetry).exists()):
+        raise FileNotFoundError(f"Telemetry not found: {telemetry}")
+    with open_text(telemetry) as handle:
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+
+def add_source_args(parser: argparse.ArgumentParser) -> None:
+    """``--telemetry FILE`` or ``--store DB`` plus the filters pushed down into the store."""
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--telemetry", help="Telemetry JSONL, or - for stdin.")
+    source.add_argument("--store", help="SQLite store written by telemetry_store.py ingest.")
+    parser.add_argument("--since", default=None, help="With --store: events at or after an ISO time or age (7d).")
+    parser.add_argument("--until", default=None, help="With --store: events before an ISO time or age.")
+    parser.add_argument("--model-id", action="append", default=None, help="With --store: only these model ids.")
+    parser.add_argument("--prompt-version", action="append", default=None, help="With --store: only these versions.")
+
+
+def source_filters(args: argparse.Namespace) -> dict:
+    if not args.store and any((args.since, args.until, args.model_id, args.prompt_version)):
+        raise ValueError("--since/--until/--model-id/--prompt-version need --store")
+    return {
+        "telemetry": Path(args.telemetry) if args.telemetry else None,
+        "store": Path(args.store) if args.store else None,
+        "since": args.since,
+        "until": args.until,
+        "model_id": args.model_id,
+        "prompt_version": args.prompt_version,
+    }
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def ingest_main(args: argparse.Namespace) -> None:
+    with TelemetryStore(Path(args.db)) as store:
+        for telemetry in args.telemetry:
+            path = Path(telemetry)
+            if not path.exists():
+                raise FileNotFoundError(f"Telemetry not found: {path}")
+            counts = store.ingest(path, strict=args.strict, batch_size=args.batch_size)
+            print(json.dumps({"telemetry": str(path), **counts}))
+            if counts["invalid"] or counts["unreadable"]:
+                print(
+                    f"Warning: skipped {counts['invalid']} invalid and {counts['unreadable']} unreadable events",
+                    file=sys.stderr,
+                )
+
+
+def query_main(args: argparse.Namespace) -> None:
+    if not Path(args.db).exists():
+        raise FileNotFoundError(f"Telemetry store not found: {args.db}")
+    filters = {
+        "event_type": args.event_type,
+        "tool_name": args.tool_name,
+        "model_id": args.model_id,
+        "prompt_version": args.prompt_version,
+        "prompt_hash": args.prompt_hash,
+        "query_hash": args.query_hash,
+        "since": args.since,
+        "until": args.until,
+        "success": args.success,
+    }
+    filters = {key: value for key, value in filters.items() if value is not None}
+    with TelemetryStore(Path(args.db)) as store:
+        if args.group_by:
+            print(json.dumps(store.count_by(args.group_by, **filters), indent=2))
+        elif args.count:
+            print(store.count(**filters))
+        else:
+            for event in store.iter_events(limit=args.limit, **filters):
+                print(json.dumps(event, ensure_ascii=False, sort_keys=True))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Ingest and query redacted telemetry in a local SQLite store.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest = commands.add_parser("ingest", help="Append telemetry JSONL to the store.")
+    ingest.add_argument("--telemetry", action="append", required=True, help="Telemetry JSONL (repeatable).")
+    ingest.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    ingest.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    ingest.add_argument("--strict", action="store_true", help="Fail on unreadable or schema-invalid events.")
+
+    query = commands.add_parser("query", help="Print stored events matching filters.")
+    query.add_argument("--db", default=str(DEFAULT_DB_PATH))
+    query.add_argument("--event-type", action="append", default=None)
+    query.add_argument("--tool-name", action="append", default=None)
+    query.add_argument("--model-id", action="append", default=None)
+    query.add_argument("--prompt-version", action="append", default=None)
+    query.add_argument("--prompt-hash", action="append", default=None)
+    query.add_argument("--query-hash", action="append", default=None)
+    query.add_argument("--since", default=None, help="ISO timestamp or age such as 7d or 12h.")
+    query.add_argument("--until", default=None, help="ISO timestamp or age such as 1d.")
+    outcome = query.add_mutually_exclusive_group()
+    outcome.add_argument("--succeeded", dest="success", action="store_const", const=True, default=None)
+    outcome.add_argument("--failed", dest="success", action="store_const", const=False)
+    query.add_argument("--limit", type=int, default=None)
+    shape = query.add_mutually_exclusive_group()
+    shape.add_argument("--count", action="store_true", help="Print only the number of matches.")
+    shape.add_argument("--group-by", choices=FILTER_COLUMNS + ("success",), help="Print match counts per value.")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest_main(args)
+    else:
+        query_main(args)
+
+
+if __name__ == "__main__":
+    main()
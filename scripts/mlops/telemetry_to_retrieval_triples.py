@@ -1,11 +1,12 @@
 import argparse
-import json
 import sys
 from pathlib import Path
+from typing import Iterable, Iterator
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(REPO_ROOT))
 
+from scripts.mlops.compressed_io import open_output  # noqa: E402
 from scripts.mlops.telemetry_redaction import (  # noqa: E402
     load_redaction_patterns,
     load_telemetry_schema,
@@ -13,75 +14,75 @@ from scripts.mlops.telemetry_redaction import (  # noqa: E402
     stable_dumps,
     validate_event_schema,
 )
+from scripts.mlops.telemetry_store import add_source_args, iter_telemetry, source_filters  # noqa: E402
 
+EVENT_TYPES = ("retrieval",)
 
-def build_retrieval_triples(path: Path, strict_schema: bool) -> list[dict]:
+
+def build_retrieval_triples(events: Iterable[dict], strict_schema: bool) -> Iterator[dict]:
     patterns = load_redaction_patterns()
     schema = load_telemetry_schema()
-    triples = []
     invalid_events = 0
-    with path.open("r", encoding="utf-8") as handle:
-        for line in handle:
-            if not line.strip():
-                continue
-            event = json.loads(line)
-            redacted = redact_event(event, patterns)
-            errors = validate_event_schema(redacted, schema)
-            if errors:
-                invalid_events += 1
-                if strict_schema:
-                    raise ValueError(
-                        f"Telemetry schema validation failed: {'; '.join(errors)}"
-                    )
-                continue
-            if redacted.get("event_type") != "retrieval":
-                continue
-            query = redacted.get("query_preview")
-            if not query:
-                continue
-            retrieval_hits = redacted.get("retrieval_hits") or []
-            if not retrieval_hits:
-                continue
-            trace = redacted.get("retrieval_trace") or {}
-            candidate_ids = trace.get("candidate_ids") or []
-            candidate_scores = trace.get("candidate_scores") or []
-            candidate_ranked = sorted(
-                zip(candidate_ids, candidate_scores),
-                key=lambda pair: pair[1],
-                reverse=True,
-            )
-            negatives = [
-                candidate_id
-                for candidate_id, _score in candidate_ranked
-                if candidate_id not in retrieval_hits
-            ]
-            if not negatives:
-                continue
-            triples.append(
-                {
-                    "query": query,
-                    "positive": retrieval_hits[0],
-                    "hard_negative": negatives[0],
-                    "prompt_id": redacted.get("prompt_id"),
-                    "prompt_version": redacted.get("prompt_version"),
-                    "model_id": redacted.get("model_id"),
-                }
-            )
+    for event in events:
+        redacted = redact_event(event, patterns)
+        errors = validate_event_schema(redacted, schema)
+        if errors:
+            invalid_events += 1
+            if strict_schema:
+                raise ValueError(
+                    f"Telemetry schema validation failed: {'; '.join(errors)}"
+                )
+            continue
+        if redacted.get("event_type") != "retrieval":
+            continue
+        query = redacted.get("query_preview")
+        if not query:
+            continue
+        retrieval_hits = redacted.get("retrieval_hits") or []
+        if not retrieval_hits:
+            continue
+        trace = redacted.get("retrieval_trace") or {}
+        candidate_ids = trace.get("candidate_ids") or []
+        candidate_scores = trace.get("candidate_scores") or []
+        candidate_ranked = sorted(
+            zip(candidate_ids, candidate_scores),
+            key=lambda pair: pair[1],
+            reverse=True,
+        )
+        negatives = [
+            candidate_id
+            for candidate_id, _score in candidate_ranked
+            if candidate_id not in retrieval_hits
+        ]
+        if not negatives:
+            continue
+        yield {
+            "query": query,
+            "positive": retrieval_hits[0],
+            "hard_negative": negatives[0],
+            "prompt_id": redacted.get("prompt_id"),
+            "prompt_version": redacted.get("prompt_version"),
+            "model_id": redacted.get("model_id"),
+        }
     if invalid_events:
         print(
             f"Warning: skipped {invalid_events} invalid telemetry events",
             file=sys.stderr,
         )
-    return triples
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Generate retrieval triples from telemetry JSONL."
     )
-    parser.add_argument("--telemetry", required=True)
-    parser.add_argument("--output", required=True)
-    parser.add_argument("--max-records", type=int, default=500000)
+    add_source_args(parser)
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
+    parser.add_argument(
+        "--max-records",
+        type=int,
+        default=500000,
+        help="Fail when more records would be written. With --output -, records already on stdout stay there.",
+    )
     parser.add_argument(
         "--strict",
         action="store_true",
@@ -89,23 +90,18 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    telemetry_path = Path(args.telemetry)
-    if not telemetry_path.exists():
-        raise FileNotFoundError(f"Telemetry not found: {telemetry_path}")
-
-    triples = build_retrieval_triples(telemetry_path, args.strict)
-    if not triples:
-        raise ValueError("No retrieval triples produced")
-    if len(triples) > args.max_records:
-        raise ValueError(f"Retrieval triple dataset too large: {len(triples)}")
-
-    output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as handle:
-        for triple in triples:
+    events = iter_telemetry(event_types=EVENT_TYPES, **source_filters(args))
+    written = 0
+    with open_output(args.output) as handle:
+        for triple in build_retrieval_triples(events, args.strict):
+            written += 1
+            if written > args.max_records:
+                raise ValueError(f"Retrieval triple dataset too large: over {args.max_records} records")
             handle.write(stable_dumps(triple) + "\n")
+        if not written:
+            raise ValueError("No retrieval triples produced")
 
-    print(f"Wrote {len(triples)} retrieval triples to {output_path}")
+    print(f"Wrote {written} retrieval triples to {args.output}", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,10 @@
 import argparse
-import json
 import os
 import sys
-from collections import defaultdict
-from typing import Optional
-from pathlib import Path
+from collections import OrderedDict
+from typing import Iterable, Iterator, Optional
 
+from scripts.mlops.compressed_io import open_output
 from scripts.mlops.telemetry_redaction import (
     load_redaction_patterns,
     load_telemetry_schema,
@@ -13,6 +12,10 @@ from scripts.mlops.telemetry_redaction import (
     stable_dumps,
     validate_event_schema,
 )
+from scripts.mlops.telemetry_store import add_source_args, iter_telemetry, source_filters
+
+EVENT_TYPES = ("prompt_received", "tool_invocation", "final_response")
+MAX_PENDING_PROMPTS = 100_000
 
 
 def load_tool_schema(path: str) -> str:
@@ -33,54 +36,62 @@ def normalize_event_type(event: dict, strict_schema: bool) -> Optional[str]:
     return event_type
 
 
-def parse_events(path: Path, strict_schema: bool) -> dict:
-    grouped = defaultdict(lambda: {"tool_calls": []})
+def parse_events(events: Iterable[dict], strict_schema: bool) -> Iterator[dict]:
+    """
+    Per-prompt groups of redacted events, yielded as each prompt's
+    final_response arrives; at most MAX_PENDING_PROMPTS unfinished prompts are
+    held, oldest dropped first.
+    """
+    pending: OrderedDict[str, dict] = OrderedDict()
     patterns = load_redaction_patterns()
     schema = load_telemetry_schema()
     missing_event_type = 0
     missing_prompt_hash = 0
     invalid_schema = 0
-    with path.open("r", encoding="utf-8") as handle:
-        for line in handle:
-            if not line.strip():
-                continue
-            event = json.loads(line)
-            redacted = redact_event(event, patterns)
-            errors = validate_event_schema(redacted, schema)
-            if errors:
-                invalid_schema += 1
-                if strict_schema:
-                    raise ValueError(
-                        f"Telemetry schema validation failed: {'; '.join(errors)}"
-                    )
-                continue
-            event_type = normalize_event_type(redacted, strict_schema)
-            if not event_type:
-                missing_event_type += 1
-                continue
-            prompt_hash = redacted.get("prompt_hash")
-            if event_type in {"prompt_received", "tool_invocation", "final_response"}:
-                if not prompt_hash and strict_schema:
-                    raise ValueError("Telemetry event missing prompt_hash")
-            if not prompt_hash:
-                missing_prompt_hash += 1
-                continue
-            bucket = grouped[prompt_hash]
-            bucket["prompt_id"] = redacted.get("prompt_id")
-            bucket["prompt_version"] = redacted.get("prompt_version")
-            bucket["model_id"] = redacted.get("model_id")
-            if event_type == "prompt_received":
-                bucket["instruction"] = redacted.get("prompt_preview", "")
-            elif event_type == "tool_invocation":
-                bucket["tool_calls"].append(
-                    {
-                        "name": redacted.get("tool_name"),
-                        "args": redacted.get("tool_args_preview", {}),
-                        "success": redacted.get("success"),
-                    }
+    dropped = 0
+    for event in events:
+        redacted = redact_event(event, patterns)
+        errors = validate_event_schema(redacted, schema)
+        if errors:
+            invalid_schema += 1
+            if strict_schema:
+                raise ValueError(
+                    f"Telemetry schema validation failed: {'; '.join(errors)}"
                 )
-            elif event_type == "final_response":
-                bucket["expected_answer"] = redacted.get("response_preview", "")
+            continue
+        event_type = normalize_event_type(redacted, strict_schema)
+        if not event_type:
+            missing_event_type += 1
+            continue
+        prompt_hash = redacted.get("prompt_hash")
+        if event_type in {"prompt_received", "tool_invocation", "final_response"}:
+            if not prompt_hash and strict_schema:
+                raise ValueError("Telemetry event missing prompt_hash")
+        if not prompt_hash:
+            missing_prompt_hash += 1
+            continue
+        bucket = pending.get(prompt_hash)
+        if bucket is None:
+            bucket = pending[prompt_hash] = {"tool_calls": []}
+            if len(pending) > MAX_PENDING_PROMPTS:
+                pending.popitem(last=False)
+                dropped += 1
+        bucket["prompt_id"] = redacted.get("prompt_id")
+        bucket["prompt_version"] = redacted.get("prompt_version")
+        bucket["model_id"] = redacted.get("model_id")
+        if event_type == "prompt_received":
+            bucket["instruction"] = redacted.get("prompt_preview", "")
+        elif event_type == "tool_invocation":
+            bucket["tool_calls"].append(
+                {
+                    "name": redacted.get("tool_name"),
+                    "args": redacted.get("tool_args_preview", {}),
+                    "success": redacted.get("success"),
+                }
+            )
+        elif event_type == "final_response":
+            bucket["expected_answer"] = redacted.get("response_preview", "")
+            yield pending.pop(prompt_hash)
     if not strict_schema:
         if missing_event_type:
             print(
@@ -97,54 +108,52 @@ def parse_events(path: Path, strict_schema: bool) -> dict:
                 f"Warning: skipped {invalid_schema} events that failed schema validation",
                 file=sys.stderr,
             )
-    return grouped
+    if dropped or pending:
+        print(
+            f"Warning: skipped {dropped + len(pending)} prompts without final_response",
+            file=sys.stderr,
+        )
 
 
-def build_records(grouped: dict, tool_schema: str) -> list[dict]:
-    records = []
-    for prompt_hash in sorted(grouped.keys()):
-        data = grouped[prompt_hash]
-        instruction = data.get("instruction")
-        expected_answer = data.get("expected_answer")
-        if not instruction or not expected_answer:
-            continue
-        tool_calls = data.get("tool_calls", [])
-        tool_calls_sorted = sorted(
-            tool_calls,
-            key=lambda call: stable_dumps({"name": call.get("name"), "args": call.get("args")}),
-        )
-        expected_tool_call = {
-            "tools": [
-                {
-                    "name": call.get("name"),
-                    "args": call.get("args", {}),
-                    "success": call.get("success"),
-                }
-                for call in tool_calls_sorted
-                if call.get("name")
-            ]
-        }
-        records.append(
+def build_record(data: dict, tool_schema: str) -> Optional[dict]:
+    instruction = data.get("instruction")
+    expected_answer = data.get("expected_answer")
+    if not instruction or not expected_answer:
+        return None
+    tool_calls = data.get("tool_calls", [])
+    tool_calls_sorted = sorted(
+        tool_calls,
+        key=lambda call: stable_dumps({"name": call.get("name"), "args": call.get("args")}),
+    )
+    expected_tool_call = {
+        "tools": [
             {
-                "instruction": instruction,
-                "context": "",
-                "prompt_id": data.get("prompt_id"),
-                "prompt_version": data.get("prompt_version"),
-                "model_id": data.get("model_id"),
-                "tool_schema": tool_schema,
-                "expected_tool_call": expected_tool_call,
-                "expected_answer": expected_answer,
+                "name": call.get("name"),
+                "args": call.get("args", {}),
+                "success": call.get("success"),
             }
-        )
-    return records
+            for call in tool_calls_sorted
+            if call.get("name")
+        ]
+    }
+    return {
+        "instruction": instruction,
+        "context": "",
+        "prompt_id": data.get("prompt_id"),
+        "prompt_version": data.get("prompt_version"),
+        "model_id": data.get("model_id"),
+        "tool_schema": tool_schema,
+        "expected_tool_call": expected_tool_call,
+        "expected_answer": expected_answer,
+    }
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Convert telemetry JSONL into SFT-ready JSONL."
     )
-    parser.add_argument("--telemetry", required=True)
-    parser.add_argument("--output", required=True)
+    add_source_args(parser)
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
     parser.add_argument("--tool-schema", default="")
     parser.add_argument(
         "--strict-schema",
@@ -153,20 +162,18 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    telemetry_path = Path(args.telemetry)
-    if not telemetry_path.exists():
-        raise FileNotFoundError(f"Telemetry not found: {telemetry_path}")
-
     tool_schema = load_tool_schema(args.tool_schema)
-    grouped = parse_events(telemetry_path, args.strict_schema)
-    records = build_records(grouped, tool_schema)
-
-    os.makedirs(Path(args.output).parent, exist_ok=True)
-    with open(args.output, "w", encoding="utf-8") as handle:
-        for record in records:
+    events = iter_telemetry(event_types=EVENT_TYPES, **source_filters(args))
+    written = 0
+    with open_output(args.output) as handle:
+        for group in parse_events(events, args.strict_schema):
+            record = build_record(group, tool_schema)
+            if record is None:
+                continue
             handle.write(stable_dumps(record) + "\n")
+            written += 1
 
-    print(f"Wrote {len(records)} records to {args.output}")
+    print(f"Wrote {written} records to {args.output}", file=sys.stderr)
 
 
 if __name__ == "__main__":
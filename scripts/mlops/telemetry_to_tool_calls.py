@@ -1,12 +1,13 @@
 import argparse
-import json
 import sys
+from collections import OrderedDict
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 REPO_ROOT = Path(__file__).resolve().parents[2]
 sys.path.insert(0, str(REPO_ROOT))
 
+from scripts.mlops.compressed_io import open_output  # noqa: E402
 from scripts.mlops.telemetry_redaction import (  # noqa: E402
     load_redaction_patterns,
     load_telemetry_schema,
@@ -14,121 +15,89 @@ from scripts.mlops.telemetry_redaction import (  # noqa: E402
     stable_dumps,
     validate_event_schema,
 )
+from scripts.mlops.telemetry_store import add_source_args, iter_telemetry, source_filters  # noqa: E402
+from scripts.mlops.tool_schema_registry import get_registry  # noqa: E402
 
+EVENT_TYPES = ("prompt_received", "tool_invocation")
+# Queries are remembered for the most recent prompts only, so memory stays flat.
+MAX_RECENT_QUERIES = 100_000
 
-def load_tool_schema(tool_name: str) -> dict:
-    schema_path = (
-        Path(__file__).resolve().parents[2]
-        / "schemas"
-        / "tools"
-        / f"{tool_name}.schema.json"
-    )
-    if not schema_path.exists():
-        raise FileNotFoundError(f"Tool schema not found: {schema_path}")
-    with schema_path.open("r", encoding="utf-8") as handle:
-        return json.load(handle)
 
-
-def _matches_type(value: Any, expected: Any) -> bool:
-    if isinstance(expected, list):
-        return any(_matches_type(value, entry) for entry in expected)
-    if expected == "string":
-        return isinstance(value, str)
-    if expected == "number":
-        return isinstance(value, (int, float)) and not isinstance(value, bool)
-    if expected == "integer":
-        return isinstance(value, int) and not isinstance(value, bool)
-    if expected == "boolean":
-        return isinstance(value, bool)
-    if expected == "object":
-        return isinstance(value, dict)
-    if expected == "array":
-        return isinstance(value, list)
-    if expected == "null":
-        return value is None
-    return True
+def load_tool_schema(tool_name: str) -> dict:
+    return get_registry().schema(tool_name)
 
 
 def validate_tool_args(tool_name: str, args: Any) -> list[str]:
-    if not isinstance(args, dict):
-        return [f"{tool_name} args must be an object"]
-    schema = load_tool_schema(tool_name)
-    errors: list[str] = []
-    properties = schema.get("properties", {})
-    required = schema.get("required", [])
-    for field in required:
-        if field not in args:
-            errors.append(f"{tool_name} missing required field: {field}")
-    for key, value in args.items():
-        expected_type = properties.get(key, {}).get("type")
-        if expected_type and not _matches_type(value, expected_type):
-            errors.append(f"{tool_name} field {key} has invalid type")
-    if schema.get("additionalProperties") is False:
-        allowed = set(properties.keys())
-        extras = [key for key in args.keys() if key not in allowed]
-        for extra in extras:
-            errors.append(f"{tool_name} has unknown field: {extra}")
-    return errors
+    return get_registry().validate(tool_name, args)
 
 
-def build_tool_call_records(path: Path, strict_schema: bool) -> list[dict]:
+def build_tool_call_records(events: Iterable[dict], strict_schema: bool) -> Iterator[dict]:
     patterns = load_redaction_patterns()
     schema = load_telemetry_schema()
-    records = []
+    # prompt_received precedes the tool invocations it triggers; keep its
+    # redacted preview so each call record carries the query that led to it.
+    queries: OrderedDict[str, str] = OrderedDict()
     invalid_events = 0
     invalid_tools = 0
-    with path.open("r", encoding="utf-8") as handle:
-        for line in handle:
-            if not line.strip():
-                continue
-            event = json.loads(line)
-            redacted = redact_event(event, patterns)
-            errors = validate_event_schema(redacted, schema)
-            if errors:
-                invalid_events += 1
-                if strict_schema:
-                    raise ValueError(
-                        f"Telemetry schema validation failed: {'; '.join(errors)}"
-                    )
-                continue
-            if redacted.get("event_type") != "tool_invocation":
-                continue
-            tool_name = redacted.get("tool_name")
-            tool_args = redacted.get("tool_args_preview")
-            if not tool_name:
-                continue
-            tool_errors = validate_tool_args(tool_name, tool_args)
-            if tool_errors:
-                invalid_tools += 1
-                if strict_schema:
-                    raise ValueError("; ".join(tool_errors))
-                continue
-            records.append(
-                {
-                    "prompt_id": redacted.get("prompt_id"),
-                    "prompt_version": redacted.get("prompt_version"),
-                    "model_id": redacted.get("model_id"),
-                    "prompt_hash": redacted.get("prompt_hash"),
-                    "tool_name": tool_name,
-                    "tool_args": tool_args,
-                    "success": redacted.get("success"),
-                    "error": redacted.get("error"),
-                }
-            )
+    for event in events:
+        redacted = redact_event(event, patterns)
+        errors = validate_event_schema(redacted, schema)
+        if errors:
+            invalid_events += 1
+            if strict_schema:
+                raise ValueError(
+                    f"Telemetry schema validation failed: {'; '.join(errors)}"
+                )
+            continue
+        event_type = redacted.get("event_type")
+        if event_type == "prompt_received":
+            if redacted.get("prompt_hash") and redacted.get("prompt_preview"):
+                queries[redacted["prompt_hash"]] = redacted["prompt_preview"]
+                queries.move_to_end(redacted["prompt_hash"])
+                if len(queries) > MAX_RECENT_QUERIES:
+                    queries.popitem(last=False)
+            continue
+        if event_type != "tool_invocation":
+            continue
+        tool_name = redacted.get("tool_name")
+        tool_args = redacted.get("tool_args_preview")
+        if not tool_name:
+            continue
+        tool_errors = validate_tool_args(tool_name, tool_args)
+        if tool_errors:
+            invalid_tools += 1
+            if strict_schema:
+                raise ValueError("; ".join(tool_errors))
+            continue
+        yield {
+            "prompt_id": redacted.get("prompt_id"),
+            "prompt_version": redacted.get("prompt_version"),
+            "model_id": redacted.get("model_id"),
+            "prompt_hash": redacted.get("prompt_hash"),
+            "query": queries.get(redacted.get("prompt_hash")),
+            "tool_name": tool_name,
+            "tool_args": tool_args,
+            "success": redacted.get("success"),
+            "error": redacted.get("error"),
+        }
     if invalid_events:
         print(f"Warning: skipped {invalid_events} invalid telemetry events", file=sys.stderr)
     if invalid_tools:
         print(f"Warning: skipped {invalid_tools} invalid tool calls", file=sys.stderr)
-    return records
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(
         description="Generate tool call traces from telemetry JSONL."
     )
-    parser.add_argument("--telemetry", required=True)
-    parser.add_argument("--output", required=True)
-    parser.add_argument("--max-records", type=int, default=500000)
+    add_source_args(parser)
+    parser.add_argument("--output", required=True, help="Output JSONL, or - for stdout.")
+    parser.add_argument(
+        "--max-records",
+        type=int,
+        default=500000,
+        help="Fail when more records would be written. With --output -, records already on stdout stay there.",
+    )
     parser.add_argument(
         "--strict",
         action="store_true",
@@ -136,23 +105,18 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    telemetry_path = Path(args.telemetry)
-    if not telemetry_path.exists():
-        raise FileNotFoundError(f"Telemetry not found: {telemetry_path}")
-
-    records = build_tool_call_records(telemetry_path, args.strict)
-    if not records:
-        raise ValueError("No tool call records produced")
-    if len(records) > args.max_records:
-        raise ValueError(f"Tool call dataset too large: {len(records)}")
-
-    output_path = Path(args.output)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    with output_path.open("w", encoding="utf-8") as handle:
-        for record in records:
+    events = iter_telemetry(event_types=EVENT_TYPES, **source_filters(args))
+    written = 0
+    with open_output(args.output) as handle:
+        for record in build_tool_call_records(events, args.strict):
+            written += 1
+            if written > args.max_records:
+                raise ValueError(f"Tool call dataset too large: over {args.max_records} records")
             handle.write(stable_dumps(record) + "\n")
+        if not written:
+            raise ValueError("No tool call records produced")
 
-    print(f"Wrote {len(records)} tool call records to {output_path}")
+    print(f"Wrote {written} tool call records to {args.output}", file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,307 @@
+"""
+Query-aware tool selection for the runtime prompt.
+
+Every tool in the runtime prompt costs its ``Tool: name - description (Params:
+...)`` line on every turn, whether or not the query needs it. This module builds
+a small sparse index offline that ranks tools for a query, so the app only
+lists the top-k in the prompt:
+
+- tool names (split on ``_`` and camelCase), descriptions, parameter names,
+  parameter descriptions and enum values form one document per tool;
+- historical queries come from ``telemetry_to_tool_calls.py`` records (their
+  ``query`` field) and are folded into a per-tool centroid, so wording users
+  actually type ("torch", "text mom") pulls in the tool that served it;
+- text is embedded as feature-hashed TF-IDF: lowercased alphanumeric words plus
+  character trigrams of each word, hashed with 32-bit FNV-1a over UTF-8 into
+  ``dims`` buckets. There is no vocabulary or model to ship, and
+  src/core/tools/toolIndex.js reproduces the query side bit for bit.
+
+Each tool vector keeps its ``max_features`` heaviest buckets with the IDF folded
+in, so scoring a query is a sparse dot product of its raw feature counts. A
+query that shares no bucket with any tool falls back to the full tool list.
+"""
+
+import argparse
+import json
+import math
+import re
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.compressed_io import open_text  # noqa: E402
+from scripts.mlops.tool_schema_registry import DEFAULT_TOOL_SCHEMAS_DIR, ToolSchemaRegistry  # noqa: E402
+
+INDEX_FORMAT = "tool_index_v1"
+DEFAULT_DIMS = 4096
+DEFAULT_MAX_FEATURES = 128
+DEFAULT_QUERY_WEIGHT = 0.5
+DEFAULT_K = 5
+
+# Runs of Unicode letters and digits, as /[\p{L}\p{N}]+/gu in JS.
+_WORD_RE = re.compile(r"[^\W_]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+_FNV_OFFSET = 0x811C9DC5
+_FNV_PRIME = 0x01000193
+
+
+def fnv1a_32(text: str) -> int:
+    value = _FNV_OFFSET
+    for byte in text.encode("utf-8"):
+        value = ((value ^ byte) * _FNV_PRIME) & 0xFFFFFFFF
+    return value
+
+
+def text_features(text: str, dims: int = DEFAULT_DIMS) -> dict[int, float]:
+    """
+    Hashed feature counts of ``text``: 1.0 per word occurrence, plus 1.0 spread
+    evenly over the word's ``^word$`` character trigrams. Insertion order is
+    first occurrence, which the JS scorer relies on to sum in the same order.
+    """
+    mask = dims - 1
+    counts: dict[int, float] = {}
+    for word in _WORD_RE.findall(text.lower()):
+        bucket = fnv1a_32("w:" + word) & mask
+        counts[bucket] = counts.get(bucket, 0.0) + 1.0
+        padded = f"^{word}$"
+        grams = len(padded) - 2
+        for i in range(grams):
+            bucket = fnv1a_32("c:" + padded[i : i + 3]) & mask
+            counts[bucket] = counts.get(bucket, 0.0) + 1.0 / grams
+    return counts
+
+
+def split_identifier(name: str) -> str:
+    return _CAMEL_RE.sub(" ", name).replace("_", " ").replace("-", " ")
+
+
+def _parameter_specs(parameters: Any) -> dict:
+    if not isinstance(parameters, dict):
+        return {}
+    # JSON-schema tools nest their fields under "properties"; runtime tools don't.
+    properties = parameters.get("properties")
+    return properties if isinstance(properties, dict) else parameters
+
+
+def tool_text(tool: dict) -> str:
+    parts = [split_identifier(str(tool["name"])), str(tool.get("description") or "")]
+    for key, spec in _parameter_specs(tool.get("parameters")).items():
+        parts.append(split_identifier(str(key)))
+        if isinstance(spec, dict):
+            if isinstance(spec.get("description"), str):
+                parts.append(spec["description"])
+            if isinstance(spec.get("enum"), list):
+                parts.extend(str(value) for value in spec["enum"])
+    return " ".join(part for part in parts if part)
+
+
+def load_tool_catalog(path: Optional[Path] = None) -> list[dict]:
+    """
+    Runtime tools as ``[{name, description, parameters}]`` (a bare list or
+    ``{"tools": [...]}``, the shape golden cases and PromptBuilder use). Without
+    a path, ``schemas/tools`` stands in, with the split tool name as description.
+    """
+    if path is not None:
+        data = json.loads(Path(path).read_text(encoding="utf-8"))
+        tools = data.get("tools", []) if isinstance(data, dict) else data
+        return [tool for tool in tools if isinstance(tool, dict) and tool.get("name")]
+    registry = ToolSchemaRegistry(DEFAULT_TOOL_SCHEMAS_DIR)
+    return [
+        {
+            "name": name,
+            "description": split_identifier(name),
+            "parameters": registry.schema(name).get("properties", {}),
+        }
+        for name in registry.tool_names
+    ]
+
+
+def load_query_calls(path: Path) -> dict[str, dict]:
+    """
+    ``{prompt_hash: {"query": text, "tools": [names]}}`` from tool call records;
+    records without a query (older converter output) are skipped.
+    """
+    prompts: dict[str, dict] = {}
+    with open_text(path) as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get("query")
+            tool_name = record.get("tool_name")
+            if not query or not tool_name:
+                continue
+            key = record.get("prompt_hash") or query
+            entry = prompts.setdefault(key, {"query": query, "tools": []})
+            if tool_name not in entry["tools"]:
+                entry["tools"].append(tool_name)
+    return prompts
+
+
+def _normalize(vector: dict[int, float]) -> dict[int, float]:
+    norm = math.sqrt(sum(value * value for value in vector.values()))
+    return {key: value / norm for key, value in vector.items()} if norm else {}
+
+
+def build_tool_index(
+    tools: list[dict],
+    queries: Iterable[dict] = (),
+    dims: int = DEFAULT_DIMS,
+    max_features: int = DEFAULT_MAX_FEATURES,
+    query_weight: float = DEFAULT_QUERY_WEIGHT,
+    k: int = DEFAULT_K,
+    always: Iterable[str] = (),
+) -> dict:
+    """
+    The exported index for ``tools``, with ``queries`` (``{"query", "tools"}``
+    dicts as from ``load_query_calls``) as historical evidence per tool.
+    """
+    if dims <= 0 or dims & (dims - 1):
+        raise ValueError(f"dims must be a power of two, got {dims}")
+    names = [str(tool["name"]) for tool in tools]
+    tool_docs = {str(tool["name"]): text_features(tool_text(tool), dims) for tool in tools}
+    query_docs: list[tuple[dict[int, float], list[str]]] = []
+    for entry in queries:
+        called = [name for name in entry["tools"] if name in tool_docs]
+        if called:
+            query_docs.append((text_features(entry["query"], dims), called))
+
+    document_frequency: dict[int, int] = defaultdict(int)
+    for features in list(tool_docs.values()) + [features for features, _ in query_docs]:
+        for bucket in features:
+            document_frequency[bucket] += 1
+    documents = len(tool_docs) + len(query_docs)
+    idf = {bucket: math.log((1 + documents) / (1 + df)) + 1.0 for bucket, df in document_frequency.items()}
+
+    def tfidf(features: dict[int, float]) -> dict[int, float]:
+        return _normalize({bucket: count * idf[bucket] for bucket, count in features.items()})
+
+    centroids: dict[str, dict[int, float]] = defaultdict(lambda: defaultdict(float))
+    query_counts: dict[str, int] = defaultdict(int)
+    for features, called in query_docs:
+        vector = tfidf(features)
+        for name in called:
+            query_counts[name] += 1
+            for bucket, value in vector.items():
+                centroids[name][bucket] += value
+
+    index_tools = {}
+    for name in names:
+        vector = {bucket: (1.0 - query_weight) * value for bucket, value in tfidf(tool_docs[name]).items()}
+        if name in centroids:
+            for bucket, value in _normalize(centroids[name]).items():
+                vector[bucket] = vector.get(bucket, 0.0) + query_weight * value
+        vector = _normalize(vector)
+        # Fold the IDF in so the runtime only needs raw query feature counts.
+        weighted = sorted(
+            ((bucket, value * idf[bucket]) for bucket, value in vector.items()),
+            key=lambda item: (-abs(item[1]), item[0]),
+        )[:max_features]
+        weighted.sort()
+        index_tools[name] = {
+            "buckets": [bucket for bucket, _ in weighted],
+            "weights": [round(value, 6) for _, value in weighted],
+        }
+
+    return {
+        "format": INDEX_FORMAT,
+        "dims": dims,
+        "k": k,
+        "always": [name for name in always if name in tool_docs],
+        "tools": index_tools,
+        "stats": {
+            "tools": len(names),
+            "queries": len(query_docs),
+            "tools_with_queries": len(query_counts),
+            "max_features": max_features,
+            "query_weight": query_weight,
+        },
+    }
+
+
+def score_tools(index: dict, query: str) -> dict[str, float]:
+    features = text_features(query, index["dims"])
+    scores = {}
+    for name, entry in index["tools"].items():
+        weights = dict(zip(entry["buckets"], entry["weights"]))
+        score = 0.0
+        for bucket, count in features.items():
+            weight = weights.get(bucket)
+            if weight is not None:
+                score += count * weight
+        scores[name] = score
+    return scores
+
+
+def select_tools(index: dict, query: str, k: Optional[int] = None) -> tuple[list[str], bool]:
+    """
+    The tool names to list for ``query`` (best first, then ``always`` tools) and
+    whether the query had no signal and fell back to every tool.
+    """
+    k = index["k"] if k is None else k
+    scores = score_tools(index, query)
+    ranked = sorted((name for name, score in scores.items() if score > 0), key=lambda name: (-scores[name], name))
+    if not ranked:
+        return sorted(index["tools"]), True
+    selected = ranked[:k]
+    selected.extend(name for name in index.get("always", []) if name not in selected)
+    return selected, False
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or query the runtime tool selection index.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Build and export an index.")
+    build.add_argument("--tool-calls", default=None, help="telemetry_to_tool_calls.py output with queries.")
+    build.add_argument("--tools", default=None, help="Runtime tool catalog JSON (default: schemas/tools).")
+    build.add_argument("--output", required=True)
+    build.add_argument("--dims", type=int, default=DEFAULT_DIMS)
+    build.add_argument("--max-features", type=int, default=DEFAULT_MAX_FEATURES)
+    build.add_argument("--query-weight", type=float, default=DEFAULT_QUERY_WEIGHT)
+    build.add_argument("--k", type=int, default=DEFAULT_K)
+    build.add_argument("--always", action="append", default=[], help="Tool to list for every query (repeatable).")
+
+    select = commands.add_parser("select", help="Print the selection and scores for queries.")
+    select.add_argument("--index", required=True)
+    select.add_argument("--query", action="append", required=True)
+    select.add_argument("--k", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "select":
+        index = json.loads(Path(args.index).read_text(encoding="utf-8"))
+        results = []
+        for query in args.query:
+            selected, fallback = select_tools(index, query, args.k)
+            results.append({"query": query, "selected": selected, "fallback": fallback, "scores": score_tools(index, query)})
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+
+    tools = load_tool_catalog(Path(args.tools) if args.tools else None)
+    queries = load_query_calls(Path(args.tool_calls)).values() if args.tool_calls else ()
+    index = build_tool_index(
+        tools,
+        queries,
+        dims=args.dims,
+        max_features=args.max_features,
+        query_weight=args.query_weight,
+        k=args.k,
+        always=args.always,
+    )
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = json.dumps(index, separators=(",", ":"), ensure_ascii=False)
+    output_path.write_text(payload, encoding="utf-8")
+    stats = index["stats"]
+    print(
+        f"Wrote tool index for {stats['tools']} tools ({stats['queries']} queries, "
+        f"{len(payload.encode('utf-8'))} bytes) to {output_path}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Compiled validators for the tool argument schemas in ``schemas/tools``.
+
+``ToolSchemaRegistry`` reads every ``<tool>.schema.json`` once and compiles it
+into a ``ToolValidator`` holding the ``required`` fields, per-property type
+checks and the allowed field set, so validating a call is a few dict and
+isinstance lookups instead of a file open and JSON parse. Unknown tool names
+are a dict miss and never touch the disk, and nothing is stored for them, so
+a stream of made-up names cannot grow the registry. ``get_registry()``
+returns a process-wide instance shared by the telemetry converters and the
+eval scorers.
+"""
+
+import json
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+DEFAULT_TOOL_SCHEMAS_DIR = Path(__file__).resolve().parents[2] / "schemas" / "tools"
+SCHEMA_SUFFIX = ".schema.json"
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_integer(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+_TYPE_CHECKS: dict[str, Callable[[Any], bool]] = {
+    "string": lambda value: isinstance(value, str),
+    "number": _is_number,
+    "integer": _is_integer,
+    "boolean": lambda value: isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "null": lambda value: value is None,
+}
+
+
+def _compile_type_check(expected: Any) -> Optional[Callable[[Any], bool]]:
+    """A predicate for a JSON-schema ``type``, or None when it accepts anything."""
+    if isinstance(expected, list):
+        checks = [_compile_type_check(entry) for entry in expected]
+        if any(check is None for check in checks):
+            return None
+        return lambda value: any(check(value) for check in checks)
+    return _TYPE_CHECKS.get(expected) if isinstance(expected, str) else None
+
+
+class ToolValidator:
+    """Validation state precomputed from one tool schema."""
+
+    __slots__ = ("name", "schema", "required", "properties", "type_checks", "closed")
+
+    def __init__(self, name: str, schema: dict):
+        self.name = name
+        self.schema = schema
+        properties = schema.get("properties", {})
+        self.required = tuple(schema.get("required", []))
+        self.properties = frozenset(properties)
+        self.type_checks: dict[str, Callable[[Any], bool]] = {}
+        for key, spec in properties.items():
+            expected = spec.get("type") if isinstance(spec, dict) else None
+            check = _compile_type_check(expected) if expected else None
+            if check is not None:
+                self.type_checks[key] = check
+        self.closed = schema.get("additionalProperties") is False
+
+    def is_valid(self, args: Any) -> bool:
+        if not isinstance(args, dict):
+            return False
+        for field in self.required:
+            if field not in args:
+                return False
+        type_checks = self.type_checks
+        for key, value in args.items():
+            check = type_checks.get(key)
+            if check is not None and not check(value):
+                return False
+        return not (self.closed and not self.properties.issuperset(args))
+
+    def errors(self, args: Any) -> list[str]:
+        name = self.name
+        if not isinstance(args, dict):
+            return [f"{name} args must be an object"]
+        if self.is_valid(args):
+            return []
+        errors = [f"{name} missing required field: {field}" for field in self.required if field not in args]
+        for key, value in args.items():
+            check = self.type_checks.get(key)
+            if check is not None and not check(value):
+                errors.append(f"{name} field {key} has invalid type")
+        if self.closed:
+            errors.extend(f"{name} has unknown field: {key}" for key in args if key not in self.properties)
+        return errors
+
+
+class ToolSchemaRegistry:
+    """All tool schemas of a directory, compiled once; lookups never hit the disk."""
+
+    def __init__(self, schemas_dir: Path = DEFAULT_TOOL_SCHEMAS_DIR):
+        self.schemas_dir = Path(schemas_dir)
+        self._validators: dict[str, ToolValidator] = {}
+        for path in sorted(self.schemas_dir.glob(f"*{SCHEMA_SUFFIX}")):
+            name = path.name[: -len(SCHEMA_SUFFIX)]
+            with path.open("r", encoding="utf-8") as handle:
+                self._validators[name] = ToolValidator(name, json.load(handle))
+        self.tool_names = tuple(self._validators)
+
+    def __contains__(self, tool_name: str) -> bool:
+        return self.get(tool_name) is not None
+
+    def __len__(self) -> int:
+        return len(self.tool_names)
+
+    def get(self, tool_name: str) -> Optional[ToolValidator]:
+        try:
+            return self._validators.get(tool_name)
+        except TypeError:
+            return None  # unhashable name
+
+    def schema(self, tool_name: str) -> dict:
+        validator = self.get(tool_name)
+        if validator is None:
+            raise FileNotFoundError(f"Tool schema not found: {self.schemas_dir / f'{tool_name}{SCHEMA_SUFFIX}'}")
+        return validator.schema
+
+    def validate(self, tool_name: str, args: Any) -> list[str]:
+        """Error messages for a call; empty when ``args`` satisfies the tool schema."""
+        if not isinstance(args, dict):
+            return [f"{tool_name} args must be an object"]
+        validator = self.get(tool_name)
+        if validator is None:
+            return [f"{tool_name} has no tool schema"]
+        return validator.errors(args)
+
+    def is_valid(self, tool_name: str, args: Any) -> bool:
+        validator = self.get(tool_name)
+        return validator is not None and validator.is_valid(args)
+
+
+@lru_cache(maxsize=None)
+def _shared_registry(schemas_dir: Path) -> ToolSchemaRegistry:
+    return ToolSchemaRegistry(schemas_dir)
+
+
+def get_registry(schemas_dir: Optional[Path] = None) -> ToolSchemaRegistry:
+    """The process-wide registry for ``schemas_dir`` (default ``schemas/tools``)."""
+    return _shared_registry(Path(schemas_dir or DEFAULT_TOOL_SCHEMAS_DIR).resolve())
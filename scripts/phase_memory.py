@@ -0,0 +1,98 @@
+"""
+Per-phase resident memory for the Core ML export.
+
+``ru_maxrss`` and ``VmHWM`` only ever grow, so once the model load sets the
+high-water mark every later phase would report it too. ``PhaseMemoryMonitor``
+samples the current RSS in a background thread and measures each phase from
+the RSS it started at. Current RSS comes from psutil, or from procfs on Linux
+when psutil is not installed.
+"""
+
+import contextlib
+import threading
+import time
+
+
+def _proc_status_mb(field: str) -> float | None:
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as handle:
+            for line in handle:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process right now, in MiB."""
+    try:
+        import psutil
+    except ImportError:
+        rss = _proc_status_mb("VmRSS")
+        if rss is None:
+            raise ImportError("Reading the current RSS needs psutil on this platform: pip install psutil")
+        return rss
+    return psutil.Process().memory_info().rss / (1024 * 1024)
+
+
+class PhaseMemoryMonitor:
+    """Sample this process's RSS in the background and attribute peaks to phases.
+
+    Each phase records the RSS when it started (``baseline_rss_mb``), the
+    highest sample while it ran (``peak_rss_mb``) and the difference
+    (``peak_delta_mb``), which is the memory that phase itself added. Phases
+    measured in a worker process are copied in with ``record``.
+    """
+
+    def __init__(self, interval_s: float = 0.05):
+        self.interval_s = interval_s
+        self.phases: dict[str, dict] = {}
+        self._peak = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self) -> "PhaseMemoryMonitor":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def start(self) -> "PhaseMemoryMonitor":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            rss = current_rss_mb()
+            with self._lock:
+                self._peak = max(self._peak, rss)
+
+    @contextlib.contextmanager
+    def phase(self, name: str, process: str = "main"):
+        baseline = current_rss_mb()
+        with self._lock:
+            self._peak = baseline
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            rss = current_rss_mb()
+            with self._lock:
+                peak = max(self._peak, rss)
+            self.phases[name] = {
+                "process": process,
+                "baseline_rss_mb": round(baseline, 1),
+                "peak_rss_mb": round(peak, 1),
+                "peak_delta_mb": round(peak - baseline, 1),
+                "wall_time_s": round(time.perf_counter() - started, 3),
+            }
+
+    def record(self, name: str, stats: dict) -> None:
+        """Add a phase measured elsewhere, e.g. the ``phases`` entry a worker returned."""
+        self.phases[name] = dict(stats)
@@ -0,0 +1,218 @@
+"""
+Per-layer quantization sensitivity sweep for the Core ML export.
+
+Each weight is fake-quantized on its own (int4 per-block and int8 per-channel,
+matching the converter's quantizers) and the next-token logits on a fixed
+prompt set are compared with the unquantized model using
+``scripts/eval/export_equivalence.compare_logits``. Layers are evaluated in
+parallel worker processes, each holding one copy of the model.
+
+Layers are then ranked by sensitivity and the smallest mixed-precision
+assignment is searched: everything at int4, promoting the most sensitive
+layers to int8 (and, if that is not enough, to fp16) until the combined
+``max_delta`` fits under ``--max-delta``. The output's ``op_name_bits`` maps
+Core ML weight const names to bit-widths and is consumed by
+``convert_to_coreml.py --weight_bits`` as ``op_name_configs``.
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from activation_calibration import fake_quantize, load_calibration_texts  # noqa: E402
+from coreml_weight_names import coreml_weight_bits  # noqa: E402
+from scripts.eval.export_equivalence import compare_logits  # noqa: E402
+
+_WORKER: dict = {}
+
+
+def quantize_weight(weight: torch.Tensor, nbits: int) -> torch.Tensor:
+    if nbits == 8:
+        # linear_symmetric int8 is per output channel.
+        return fake_quantize(weight, nbits=8, block_size=weight.shape[1]).to(weight.dtype)
+    if nbits == 4:
+        return fake_quantize(weight, nbits=4, block_size=32).to(weight.dtype)
+    raise ValueError(f"Unsupported bit-width {nbits}")
+
+
+def quantizable_modules(model) -> dict[str, int]:
+    """Module name -> weight element count, one entry per distinct weight tensor."""
+    seen = set()
+    modules = {}
+    for name, module in model.named_modules():
+        if not isinstance(module, (torch.nn.Linear, torch.nn.Embedding)):
+            continue
+        # Tied embeddings share one tensor (and one Core ML const).
+        if id(module.weight) in seen:
+            continue
+        seen.add(id(module.weight))
+        modules[name] = module.weight.numel()
+    return modules
+
+
+def load_model(hf_model: str, dtype: str):
+    model = AutoModelForCausalLM.from_pretrained(hf_model, torch_dtype=getattr(torch, dtype))
+    model.eval()
+    return model
+
+
+@torch.inference_mode()
+def next_token_logits(model, batch: dict) -> list[float]:
+    logits = model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+    last = batch["attention_mask"].sum(dim=1) - 1
+    return logits[torch.arange(logits.shape[0]), last].float().reshape(-1).tolist()
+
+
+@torch.inference_mode()
+def evaluate_assignment(model, batch: dict, reference: list[float], module_bits: dict) -> dict:
+    originals = {}
+    try:
+        for name, nbits in module_bits.items():
+            if nbits >= 16:
+                continue
+            module = model.get_submodule(name)
+            originals[name] = module.weight.detach().clone()
+            module.weight.copy_(quantize_weight(originals[name], nbits))
+        return compare_logits(reference, next_token_logits(model, batch))
+    finally:
+        for name, weight in originals.items():
+            model.get_submodule(name).weight.copy_(weight)
+
+
+def _init_worker(hf_model: str, dtype: str, batch: dict, reference: list[float], threads: int) -> None:
+    torch.set_num_threads(threads)
+    _WORKER.update(model=load_model(hf_model, dtype), batch=batch, reference=reference)
+
+
+def _evaluate_layer(name: str, nbits: int) -> dict:
+    metrics = evaluate_assignment(_WORKER["model"], _WORKER["batch"], _WORKER["reference"], {name: nbits})
+    return {"module": name, "nbits": nbits, **metrics}
+
+
+def weight_bytes(modules: dict[str, int], module_bits: dict) -> int:
+    return sum(count * module_bits.get(name, 16) // 8 for name, count in modules.items())
+
+
+def _promote(model, batch, reference, names, ranking, base_bits, promoted_bits, max_delta):
+    """Fewest top-ranked layers moved to ``promoted_bits`` so the combined delta fits.
+
+    Promotion is monotone in practice, so bisecting the count needs only
+    ``log2(len(ranking))`` combined evaluations. The last flag is False when
+    even promoting every layer exceeds ``max_delta``.
+    """
+
+    def assignment(count: int) -> dict:
+        bits = {name: base_bits for name in names}
+        bits.update({name: promoted_bits for name in ranking[:count]})
+        return bits
+
+    best_bits = assignment(len(ranking))
+    best_metrics = evaluate_assignment(model, batch, reference, best_bits)
+    if best_metrics["max_delta"] > max_delta:
+        return best_bits, best_metrics, False
+    low, high = 0, len(ranking)
+    while low < high:
+        middle = (low + high) // 2
+        bits = assignment(middle)
+        metrics = evaluate_assignment(model, batch, reference, bits)
+        if metrics["max_delta"] <= max_delta:
+            best_bits, best_metrics, high = bits, metrics, middle
+        else:
+            low = middle + 1
+    return best_bits, best_metrics, True
+
+
+def search_mixed_precision(model, batch, reference, modules, sensitivity, max_delta) -> tuple[dict, dict]:
+    names = list(modules)
+    rank4 = sorted(names, key=lambda name: sensitivity[name][4]["max_delta"], reverse=True)
+    bits, metrics, fits = _promote(model, batch, reference, names, rank4, 4, 8, max_delta)
+    if fits:
+        return bits, metrics
+    # int8 everywhere is still too lossy: keep int8 as the floor and move the
+    # layers most sensitive at int8 to fp16.
+    rank8 = sorted(names, key=lambda name: sensitivity[name][8]["max_delta"], reverse=True)
+    bits, metrics, _fits = _promote(model, batch, reference, names, rank8, 8, 16, max_delta)
+    return bits, metrics
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Find a per-layer mixed-precision map for Core ML export.")
+    parser.add_argument("--hf_model", required=True)
+    parser.add_argument("--prompts", required=True, help="telemetry_to_sft JSONL used as the fixed prompt set.")
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--num-prompts", type=int, default=16)
+    parser.add_argument("--max-length", type=int, default=256)
+    parser.add_argument("--max-delta", type=float, default=0.15)
+    parser.add_argument("--dtype", choices=["float32", "float16", "bfloat16"], default="float32")
+    parser.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Tokenization happens before the worker pool forks.
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    tokenizer = AutoTokenizer.from_pretrained(args.hf_model)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "right"
+    texts = load_calibration_texts(args.prompts, args.num_prompts, seed=args.seed)
+    encoded = tokenizer(texts, return_tensors="pt", padding=True, truncation=True, max_length=args.max_length)
+    batch = {"input_ids": encoded["input_ids"], "attention_mask": encoded["attention_mask"]}
+
+    model = load_model(args.hf_model, args.dtype)
+    reference = next_token_logits(model, batch)
+    modules = quantizable_modules(model)
+
+    threads = max(1, (os.cpu_count() or 1) // args.jobs)
+    tasks = [(name, nbits) for name in modules for nbits in (4, 8)]
+    with ProcessPoolExecutor(
+        max_workers=args.jobs,
+        initializer=_init_worker,
+        initargs=(args.hf_model, args.dtype, batch, reference, threads),
+    ) as pool:
+        results = list(pool.map(_evaluate_layer, *zip(*tasks)))
+
+    sensitivity = {name: {} for name in modules}
+    for result in results:
+        sensitivity[result["module"]][result["nbits"]] = {
+            key: result[key] for key in ("max_delta", "mean_delta", "rmse")
+        }
+
+    module_bits, metrics = search_mixed_precision(model, batch, reference, modules, sensitivity, args.max_delta)
+    report = {
+        "hf_model": args.hf_model,
+        "max_delta": args.max_delta,
+        "prompts": len(texts),
+        "within_threshold": metrics["max_delta"] <= args.max_delta,
+        "metrics": metrics,
+        "weight_bytes": {
+            "fp16": weight_bytes(modules, {}),
+            "int8": weight_bytes(modules, {name: 8 for name in modules}),
+            "int4": weight_bytes(modules, {name: 4 for name in modules}),
+            "mixed": weight_bytes(modules, module_bits),
+        },
+        "module_bits": module_bits,
+        "op_name_bits": coreml_weight_bits(module_bits),
+        "sensitivity": {
+            name: {str(nbits): values for nbits, values in per_bits.items()} for name, per_bits in sensitivity.items()
+        },
+    }
+
+    os.makedirs(Path(args.output).parent, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(json.dumps({key: report[key] for key in ("within_threshold", "metrics", "weight_bytes")}, indent=2))
+    if not report["within_threshold"]:
+        raise SystemExit(f"No assignment stays within max delta {args.max_delta}")
+
+
+if __name__ == "__main__":
+    main()
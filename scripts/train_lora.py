@@ -3,6 +3,8 @@ import json
 import os
 import subprocess
 import sys
+from pathlib import Path
+from typing import Optional
 
 import torch
 from datasets import load_dataset
@@ -12,9 +14,21 @@ from transformers import (
     AutoTokenizer,
     DataCollatorForLanguageModeling,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
 )
 
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.mlops.dataset_mixer import (  # noqa: E402
+    MIXTURE_STATE_FILE,
+    DatasetMixer,
+    load_mixture,
+    record_kind,
+)
+from scripts.mlops.mixture_dataset import MixtureDataset  # noqa: E402
+
 
 def load_prompt_registry(registry_path: str) -> dict:
     if not os.path.isfile(registry_path):
@@ -58,13 +72,91 @@ def format_example(example: dict, training_template: dict) -> str:
     return f"<s>[SYSTEM]{system_prompt}\n[USER]{user_prompt}\n[ASSISTANT]{assistant}</s>"
 
 
+def validate_record(record: dict) -> dict:
+    required_keys = {"instruction", "expected_tool_call", "expected_answer"}
+    missing_keys = required_keys - record.keys()
+    if missing_keys:
+        raise ValueError(
+            "Each JSONL record must include 'instruction', 'expected_tool_call', and 'expected_answer'. "
+            f"Missing: {missing_keys}"
+        )
+    if not isinstance(record["instruction"], str):
+        raise ValueError(
+            "Value for 'instruction' must be a string, "
+            f"got {type(record['instruction']).__name__}."
+        )
+    tool_value = record["expected_tool_call"]
+    if not isinstance(tool_value, (str, dict)):
+        raise ValueError(
+            "Value for 'expected_tool_call' must be a string or object, "
+            f"got {type(tool_value).__name__}."
+        )
+    if not isinstance(record["expected_answer"], str):
+        raise ValueError(
+            "Value for 'expected_answer' must be a string, "
+            f"got {type(record['expected_answer']).__name__}."
+        )
+    return record
+
+
+def mixture_example(record: dict, training_template: dict) -> Optional[str]:
+    """Training text for a mixture record: raw pretrain text, an SFT example, or a tool call as SFT."""
+    kind = record_kind(record)
+    if kind == "text":
+        return record["text"] if record["text"].strip() else None
+    if kind == "sft":
+        return format_example(validate_record(record), training_template)
+    if kind == "tool_call":
+        if not record.get("query"):
+            return None
+        example = {
+            "instruction": record["query"],
+            "expected_tool_call": {"tools": [{"name": record["tool_name"], "args": record.get("tool_args") or {}}]},
+            "expected_answer": "",
+        }
+        return format_example(example, training_template)
+    raise ValueError(f"Mixture record is not pretrain text, SFT or a tool call: {sorted(record)}")
+
+
+class MixtureStateCallback(TrainerCallback):
+    """Saves the mixer position into each checkpoint so a resumed run reads on from there."""
+
+    def __init__(self, dataset: MixtureDataset):
+        self.dataset = dataset
+        self.start_step = 0
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.start_step = state.global_step
+        return control
+
+    def on_save(self, args, state, control, **kwargs):
+        # The dataloader runs a batch ahead; those examples are replayed on resume.
+        trained = (state.global_step - self.start_step) * args.train_batch_size * args.gradient_accumulation_steps
+        checkpoint_dir = os.path.join(args.output_dir, f"checkpoint-{state.global_step}")
+        self.dataset.save_state(
+            os.path.join(checkpoint_dir, MIXTURE_STATE_FILE),
+            pending=self.dataset.examples - trained,
+        )
+        return control
+
+
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("--base_model", required=True)
-    parser.add_argument("--train_file", required=True)
+    data_source = parser.add_mutually_exclusive_group(required=True)
+    data_source.add_argument("--train_file")
+    data_source.add_argument(
+        "--mixture",
+        help="Mixture JSON of weighted JSONL sources, streamed instead of --train_file.",
+    )
     parser.add_argument("--output_dir", required=True)
     parser.add_argument("--max_steps", type=int, default=50)
     parser.add_argument("--prompt_template", default=None)
+    parser.add_argument(
+        "--resume_from_checkpoint",
+        default=None,
+        help="Checkpoint directory to resume from; a --mixture also resumes its position.",
+    )
     parser.add_argument(
         "--manifest-out",
         default=os.path.join("export", "manifest.json"),
@@ -72,8 +164,9 @@ def main() -> None:
     )
     args = parser.parse_args()
 
-    if not os.path.isfile(args.train_file):
+    if args.train_file and not os.path.isfile(args.train_file):
         raise FileNotFoundError(f"Dataset not found: {args.train_file}")
+    mixture = load_mixture(args.mixture) if args.mixture else None
 
     default_registry_path = os.path.abspath(
         os.path.join(
@@ -93,38 +186,13 @@ def main() -> None:
     if tokenizer.pad_token is None:
         tokenizer.pad_token = tokenizer.eos_token
 
-    dataset = load_dataset("json", data_files=args.train_file, split="train")
-
-    def _validate(record: dict) -> dict:
-        required_keys = {"instruction", "expected_tool_call", "expected_answer"}
-        missing_keys = required_keys - record.keys()
-        if missing_keys:
-            raise ValueError(
-                "Each JSONL record must include 'instruction', 'expected_tool_call', and 'expected_answer'. "
-                f"Missing: {missing_keys}"
-            )
-        if not isinstance(record["instruction"], str):
-            raise ValueError(
-                "Value for 'instruction' must be a string, "
-                f"got {type(record['instruction']).__name__}."
-            )
-        tool_value = record["expected_tool_call"]
-        if not isinstance(tool_value, (str, dict)):
-            raise ValueError(
-                "Value for 'expected_tool_call' must be a string or object, "
-                f"got {type(tool_value).__name__}."
-            )
-        if not isinstance(record["expected_answer"], str):
-            raise ValueError(
-                "Value for 'expected_answer' must be a string, "
-                f"got {type(record['expected_answer']).__name__}."
-            )
-        return record
-
-    dataset = dataset.map(_validate)
-    dataset = dataset.map(
-        lambda record: {"text": format_example(record, training_template)}
-    )
+    if mixture is None:
+        dataset = load_dataset("json", data_files=args.train_file, split="train")
+
+        dataset = dataset.map(validate_record)
+        dataset = dataset.map(
+            lambda record: {"text": format_example(record, training_template)}
+        )
 
     model = AutoModelForCausalLM.from_pretrained(
         args.base_model,
@@ -159,11 +227,29 @@ def main() -> None:
             padding="max_length",
         )
 
-    tokenized_dataset = dataset.map(
-        tokenize_batch,
-        batched=True,
-        remove_columns=dataset.column_names,
-    )
+    callbacks = []
+    if mixture is None:
+        tokenized_dataset = dataset.map(
+            tokenize_batch,
+            batched=True,
+            remove_columns=dataset.column_names,
+        )
+    else:
+        mixer = DatasetMixer(mixture)
+        if args.resume_from_checkpoint:
+            state_path = os.path.join(args.resume_from_checkpoint, MIXTURE_STATE_FILE)
+            if os.path.isfile(state_path):
+                mixer.load_state(state_path)
+
+        def tokenize_record(record: dict) -> Optional[dict]:
+            text = mixture_example(record, training_template)
+            if text is None:
+                return None
+            return dict(tokenize_batch({"text": text}))
+
+        # Records are tokenized as the trainer pulls them, so memory stays flat.
+        tokenized_dataset = MixtureDataset(mixer, tokenize_record)
+        callbacks.append(MixtureStateCallback(tokenized_dataset))
     collator = DataCollatorForLanguageModeling(tokenizer, mlm=False)
 
     training_args = TrainingArguments(
@@ -179,6 +265,8 @@ def main() -> None:
         save_steps=args.max_steps,
         save_total_limit=1,
         report_to=[],
+        # The mixer restores its own position; replaying batches would skip data twice.
+        ignore_data_skip=mixture is not None,
     )
 
     trainer = Trainer(
@@ -186,20 +274,25 @@ def main() -> None:
         args=training_args,
         train_dataset=tokenized_dataset,
         data_collator=collator,
+        callbacks=callbacks,
     )
-    trainer.train()
+    trainer.train(resume_from_checkpoint=args.resume_from_checkpoint)
     model.save_pretrained(args.output_dir)
     tokenizer.save_pretrained(args.output_dir)
 
     manifest_script = os.path.join(
         os.path.dirname(__file__), "mlops", "write_export_manifest.py"
     )
+    if mixture is None:
+        dataset_paths = [os.path.abspath(args.train_file)]
+    else:
+        dataset_paths = [os.path.abspath(source["path"]) for source in mixture["sources"]]
+    dataset_args = [arg for path in dataset_paths for arg in ("--datasets", path)]
     subprocess.run(
         [
             sys.executable,
             manifest_script,
-            "--datasets",
-            os.path.abspath(args.train_file),
+            *dataset_args,
             "--model-path",
             os.path.abspath(args.output_dir),
             "--output",
@@ -1,12 +1,27 @@
 import { buildPrompt, formatToolDescription } from "./promptTemplate";
+import { filterToolsForQuery } from "../tools/toolIndex";
 
 export default class PromptBuilder {
-  constructor(toolRegistry) {
+  // toolIndex: optional tool_index_v1 export (scripts/mlops/tool_retrieval.py);
+  // when set, only the tools selected for the user prompt are listed.
+  constructor(toolRegistry, { toolIndex = null, maxTools } = {}) {
     this.toolRegistry = toolRegistry;
+    this.toolIndex = toolIndex;
+    this.maxTools = maxTools;
   }
 
   build(userPrompt, context = []) {
-    const tools = (this.toolRegistry.getAvailableTools() || [])
+    const available = this.toolRegistry.getAvailableTools() || [];
+    const tools = (
+      this.toolIndex
+        ? filterToolsForQuery(
+            this.toolIndex,
+            userPrompt,
+            available,
+            this.maxTools,
+          )
+        : available
+    )
       .filter((tool) => tool?.name && tool?.description)
       .map((tool) => ({
         name: tool.name,
@@ -0,0 +1,117 @@
+// Runtime side of scripts/mlops/tool_retrieval.py: scores tools for a query
+// against the exported tool_index_v1 so the prompt only lists the top-k.
+// Feature hashing must stay identical to text_features() in the Python builder.
+
+export const TOOL_INDEX_FORMAT = "tool_index_v1";
+
+const WORD_RE = /[\p{L}\p{N}]+/gu;
+const FNV_OFFSET = 0x811c9dc5;
+const FNV_PRIME = 0x01000193;
+
+const fnv1a32 = (text) => {
+  let hash = FNV_OFFSET;
+  for (const char of text) {
+    const codePoint = char.codePointAt(0);
+    let bytes;
+    if (codePoint < 0x80) {
+      bytes = [codePoint];
+    } else if (codePoint < 0x800) {
+      bytes = [0xc0 | (codePoint >> 6), 0x80 | (codePoint & 0x3f)];
+    } else if (codePoint < 0x10000) {
+      bytes = [
+        0xe0 | (codePoint >> 12),
+        0x80 | ((codePoint >> 6) & 0x3f),
+        0x80 | (codePoint & 0x3f),
+      ];
+    } else {
+      bytes = [
+        0xf0 | (codePoint >> 18),
+        0x80 | ((codePoint >> 12) & 0x3f),
+        0x80 | ((codePoint >> 6) & 0x3f),
+        0x80 | (codePoint & 0x3f),
+      ];
+    }
+    for (const byte of bytes) {
+      hash = Math.imul(hash ^ byte, FNV_PRIME) >>> 0;
+    }
+  }
+  return hash;
+};
+
+export const textFeatures = (text, dims) => {
+  const mask = dims - 1;
+  const counts = new Map();
+  const add = (bucket, value) => {
+    counts.set(bucket, (counts.get(bucket) || 0) + value);
+  };
+  for (const word of String(text || "").toLowerCase().match(WORD_RE) || []) {
+    add(fnv1a32(`w:${word}`) & mask, 1);
+    const padded = Array.from(`^${word}$`);
+    const grams = padded.length - 2;
+    for (let i = 0; i < grams; i += 1) {
+      add(fnv1a32(`c:${padded.slice(i, i + 3).join("")}`) & mask, 1 / grams);
+    }
+  }
+  return counts;
+};
+
+const weightMaps = new WeakMap();
+
+const getWeights = (index) => {
+  let weights = weightMaps.get(index);
+  if (!weights) {
+    weights = new Map(
+      Object.entries(index.tools).map(([name, entry]) => [
+        name,
+        new Map(entry.buckets.map((bucket, i) => [bucket, entry.weights[i]])),
+      ]),
+    );
+    weightMaps.set(index, weights);
+  }
+  return weights;
+};
+
+export const scoreTools = (index, query) => {
+  const features = textFeatures(query, index.dims);
+  const scores = {};
+  getWeights(index).forEach((weights, name) => {
+    let score = 0;
+    features.forEach((count, bucket) => {
+      const weight = weights.get(bucket);
+      if (weight !== undefined) score += count * weight;
+    });
+    scores[name] = score;
+  });
+  return scores;
+};
+
+// Returns { selected, fallback }; a query sharing no feature with any tool
+// falls back to every indexed tool.
+export const selectTools = (index, query, k = index.k) => {
+  const scores = scoreTools(index, query);
+  const byName = (a, b) => (a < b ? -1 : a > b ? 1 : 0);
+  const ranked = Object.keys(scores)
+    .filter((name) => scores[name] > 0)
+    .sort((a, b) => scores[b] - scores[a] || byName(a, b));
+  if (!ranked.length) {
+    return { selected: Object.keys(index.tools).sort(byName), fallback: true };
+  }
+  const selected = ranked.slice(0, k);
+  (index.always || []).forEach((name) => {
+    if (!selected.includes(name)) selected.push(name);
+  });
+  return { selected, fallback: false };
+};
+
+// Filters runtime tools to the selection; tools the index has never seen are
+// kept so a stale index cannot hide newly registered tools.
+export const filterToolsForQuery = (index, query, tools, k) => {
+  if (!index || index.format !== TOOL_INDEX_FORMAT) return tools;
+  const selected = new Set(selectTools(index, query, k).selected);
+  return tools.filter(
+    (tool) =>
+      tool?.name &&
+      (selected.has(tool.name) ||
+        !Object.prototype.hasOwnProperty.call(index.tools, tool.name)),
+  );
+};
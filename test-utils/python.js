@@ -0,0 +1,36 @@
+const { execFileSync, spawnSync } = require("child_process");
+
+const TINY_LLAMA = "__tests__/fixtures/tiny_llama.py";
+
+const pythonHas = (...modules) => {
+  const imports = modules.map((name) => `import ${name}`).join("; ");
+  return spawnSync("python", ["-c", imports]).status === 0;
+};
+
+// describe when every module imports, describe.skip otherwise.
+const describeWithPython = (...modules) =>
+  pythonHas(...modules) ? describe : describe.skip;
+
+// stdout of a Python run. Conversions and model loads are chatty on stderr,
+// so it is dropped unless options.stdio says otherwise.
+const runPython = (args, options = {}) =>
+  execFileSync("python", args, {
+    encoding: "utf-8",
+    stdio: ["ignore", "pipe", "ignore"],
+    ...options,
+  });
+
+const runPythonJson = (args, options) => JSON.parse(runPython(args, options));
+
+// Writes the tiny random Llama checkpoint (see fixtures/tiny_llama.py).
+const buildTinyLlama = (outDir, ...extraArgs) => {
+  runPython([TINY_LLAMA, outDir, ...extraArgs]);
+};
+
+module.exports = {
+  buildTinyLlama,
+  describeWithPython,
+  pythonHas,
+  runPython,
+  runPythonJson,
+};